@@ -0,0 +1,454 @@
+import asyncio
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import logging
+import time
+import traceback
+from dataclasses import dataclass, asdict, field
+from typing import Optional, List, Dict, Iterable, Set, TextIO, Tuple
+
+from browser_pool import BrowserPool, DOWNLOADS_ROOT
+from bundle import BundleWriter, BundleEntry, entry_name
+from downloads_watcher import sha256_file
+from fixture_server import FixtureServer, make_self_signed_context
+from postprocess import PostProcessor
+from profile_template import ensure_template
+from telemetry import telemetry, TELEMETRY_ROOT
+from rate_limit import (
+    FetchScheduler, HostLimiter, RetryPolicy, report_metrics, DEFAULT_RATE, DEFAULT_BURST
+)
+from test_download import (
+    create_test_context, cleanup_context, download_subtitles, video_id_from_url,
+    DownloadOutcome, SUBTITLE_TYPE_IDS, SUBTITLE_FORMATS
+)
+
+logger = logging.getLogger(__name__)
+
+# 批量下载的默认输出目录
+BATCH_ROOT = os.path.join(DOWNLOADS_ROOT, 'batch')
+
+# 每完成多少个视频报告一次吞吐量
+REPORT_EVERY = 10
+
+# 扩展没有拿到响应头时，从状态文本中识别限流和服务器错误
+STATUS_CODE_RE = re.compile(r'\b(429|5\d\d)\b')
+
+
+@dataclass
+class JournalRecord:
+    """日志中的一条记录：一个视频在指定字幕类型和格式下的下载结果"""
+    url: str
+    subtitle_type: str
+    format: str
+    ok: bool
+    path: Optional[str] = None
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+    status_text: str = ''
+    status_class: str = ''
+    elapsed: float = 0.0
+    timings: Dict[str, float] = field(default_factory=dict)
+    finished: str = ''
+    attempts: int = 1
+    http_status: Optional[int] = None
+
+    @property
+    def key(self) -> str:
+        return journal_key(self.url, self.subtitle_type, self.format)
+
+
+def journal_key(url: str, subtitle_type: str, fmt: str) -> str:
+    """同一个视频换了字幕类型或格式需要重新下载"""
+    return f'{url}\t{subtitle_type}\t{fmt}'
+
+
+class Journal:
+    """只追加的 JSONL 日志，每条结果写完立即落盘，被杀掉的运行可以从中恢复"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[TextIO] = None
+
+    def load(self) -> List[JournalRecord]:
+        """读取已有记录，忽略进程被杀时写了一半的最后一行"""
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    records.append(JournalRecord(**json.loads(line)))
+                except (ValueError, TypeError) as e:
+                    logger.warning(f"⚠️ 跳过日志第 {line_number} 行: {e}")
+        return records
+
+    def completed(self, include_failed: bool = False) -> Set[str]:
+        """已经完成的任务；默认只算成功的，失败的任务在恢复时重试"""
+        done = set()
+        for record in self.load():
+            if record.ok or include_failed:
+                done.add(record.key)
+            else:
+                done.discard(record.key)
+        return done
+
+    def open(self) -> 'Journal':
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # 上次运行被杀时最后一行可能没有换行，先补上，避免新记录接在半行后面
+        needs_newline = False
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if needs_newline:
+            self._file.write('\n')
+        return self
+
+    def append(self, record: JournalRecord):
+        """追加一条记录并刷新到磁盘"""
+        self._file.write(json.dumps(asdict(record), ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_urls(lines: Iterable[str]) -> List[str]:
+    """读取视频URL列表：忽略空行和 # 注释，保持顺序去重"""
+    urls = []
+    seen = set()
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith('#') and url not in seen:
+            seen.add(url)
+            urls.append(url)
+    return urls
+
+
+def store_download(path: str, output_dir: str, sha256: Optional[str] = None) -> str:
+    """把下载的文件从借用的下载目录移到输出目录，重名且内容不同时添加序号"""
+    os.makedirs(output_dir, exist_ok=True)
+    name, ext = os.path.splitext(os.path.basename(path))
+    destination = os.path.join(output_dir, name + ext)
+    counter = 1
+    while os.path.exists(destination):
+        if sha256 is not None and sha256_file(destination) == sha256:
+            break
+        destination = os.path.join(output_dir, f'{name} ({counter}){ext}')
+        counter += 1
+    os.replace(path, destination)
+    return destination
+
+
+def bundle_journal(journal: Journal, bundle_path: str) -> List[BundleEntry]:
+    """把日志中成功下载的文件按条目名排序，流式写入一个带清单的压缩包"""
+    latest: Dict[str, JournalRecord] = {}
+    for record in journal.load():
+        if record.ok:
+            latest[record.key] = record
+
+    records: Dict[str, Tuple[str, JournalRecord]] = {}
+    for record in latest.values():
+        video_id = video_id_from_url(record.url) or re.sub(r'[^\w-]+', '_', record.url)
+        name = entry_name(video_id, record.subtitle_type, record.format)
+        if name in records:
+            logger.warning(f"⚠️ {record.url} 与 {records[name][1].url} 是同一个视频，跳过")
+            continue
+        if not record.path or not os.path.exists(record.path):
+            logger.warning(f"⚠️ {record.url} 的文件不存在: {record.path}")
+            continue
+        records[name] = (video_id, record)
+
+    with BundleWriter(bundle_path) as bundle:
+        for name in sorted(records):
+            video_id, record = records[name]
+            bundle.add_file(record.path, video_id, record.subtitle_type, record.format)
+    return bundle.entries
+
+
+def outcome_status(outcome: DownloadOutcome) -> Optional[int]:
+    """下载失败时的 HTTP 状态码：优先使用监听到的响应，其次从状态文本中识别"""
+    if outcome.http_status is not None:
+        return outcome.http_status
+    if outcome.success:
+        return None
+    match = STATUS_CODE_RE.search(outcome.status_text or '')
+    return int(match.group(1)) if match else None
+
+
+class Throughput:
+    """统计已完成的视频数和每分钟视频数"""
+
+    def __init__(self, total: int, report_every: int = REPORT_EVERY):
+        self.total = total
+        self.report_every = report_every
+        self.ok = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    @property
+    def done(self) -> int:
+        return self.ok + self.failed
+
+    @property
+    def per_minute(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed * 60 if elapsed > 0 else 0.0
+
+    def record(self, ok: bool):
+        if ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+        if self.done % self.report_every == 0 or self.done == self.total:
+            logger.info(f"进度 {self.done}/{self.total} (成功 {self.ok}, 失败 {self.failed}), "
+                        f"{self.per_minute:.1f} 视频/分钟")
+
+    def summary(self) -> Dict:
+        return {
+            'total': self.total,
+            'ok': self.ok,
+            'failed': self.failed,
+            'wall_time': time.perf_counter() - self.started,
+            'videos_per_minute': self.per_minute,
+        }
+
+
+async def _worker(pool: BrowserPool, scheduler: FetchScheduler, journal: Journal,
+                  throughput: Throughput, subtitle_type: str, fmt: str,
+                  output_dir: str, timeout: float,
+                  postprocessor: Optional[PostProcessor] = None):
+    """一个页面依次处理调度器分配的URL，选项页只在首次和出错后重新打开"""
+    context = None
+    page_ready = False
+    try:
+        while True:
+            job = await scheduler.next()
+            if job is None:
+                return
+            url = job.url
+            if context is None:
+                context = await create_test_context(pool=pool)
+                page_ready = False
+            started = time.perf_counter()
+            try:
+                outcome = await download_subtitles(context, url, subtitle_type, fmt, timeout,
+                                                   open_page=not page_ready)
+                page_ready = True
+            except Exception as e:
+                logger.warning(f"⚠️ {url} 下载流程出错: {e}")
+                outcome = DownloadOutcome(success=False, status_text=str(e))
+                # 页面可能处于异常状态，换一个新的页面
+                await cleanup_context(context)
+                context = None
+
+            ok = outcome.success and outcome.path is not None
+            status = outcome_status(outcome)
+            delay = scheduler.finish(job, ok, status, outcome.retry_after)
+            if delay is not None:
+                # 中间失败不写日志，最终结果才算数
+                logger.warning(f"⚠️ {url}: HTTP {status}，{delay:.1f}s 后第 {job.attempt} 次重试")
+                telemetry.emit('retry', labels={'url': url, 'subtitle_type': subtitle_type, 'format': fmt},
+                               http_status=status, attempt=job.attempt, delay=round(delay, 3))
+                if outcome.path is not None and os.path.exists(outcome.path):
+                    os.remove(outcome.path)
+                continue
+
+            record = JournalRecord(
+                url=url, subtitle_type=subtitle_type, format=fmt,
+                ok=ok,
+                status_text=outcome.status_text, status_class=outcome.status_class,
+                elapsed=time.perf_counter() - started, timings=outcome.timings,
+                finished=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                attempts=job.attempt + 1, http_status=status)
+            if record.ok:
+                record.path = store_download(outcome.path, output_dir, outcome.sha256)
+                record.size = os.path.getsize(record.path)
+                record.sha256 = outcome.sha256 or sha256_file(record.path)
+                logger.info(f"✓ {url} -> {os.path.basename(record.path)}")
+            else:
+                logger.warning(f"❌ {url}: {outcome.status_text}")
+            journal.append(record)
+            throughput.record(record.ok)
+            if record.ok and postprocessor is not None:
+                # 后处理队列满时在这里等待，下载随之减速
+                await postprocessor.submit(record.path)
+    finally:
+        if context is not None:
+            await cleanup_context(context)
+
+
+async def run_batch(urls: List[str],
+                    journal_path: str,
+                    output_dir: str = BATCH_ROOT,
+                    subtitle_type: str = 'auto',
+                    fmt: str = 'txt',
+                    concurrency: int = 4,
+                    browsers: Optional[int] = None,
+                    timeout: float = 60.0,
+                    retry_failed: bool = True,
+                    headless: bool = True,
+                    offline: bool = False,
+                    use_template: bool = True,
+                    pool: Optional[BrowserPool] = None,
+                    rate: float = DEFAULT_RATE,
+                    burst: int = DEFAULT_BURST,
+                    max_attempts: int = 5,
+                    limiter: Optional[HostLimiter] = None,
+                    postprocess_dir: Optional[str] = None,
+                    postprocess_workers: Optional[int] = None,
+                    telemetry_dir: Optional[str] = None) -> Dict:
+    """把URL分配到多个页面并发下载，结果写入日志，已完成的URL会被跳过
+
+    所有页面共用按域名的令牌桶（rate 请求/秒，遇到限流自动减速），429 / 5xx 按 Retry-After 和指数退避重试，
+    最多尝试 max_attempts 次。postprocess_dir 不为空时，下载完成的文件同时在进程池中后处理并写入该目录；
+    telemetry_dir 不为空时把各阶段事件和指标写入该目录。
+    browsers 默认与 concurrency 相同：下载目录是浏览器级的设置，同一浏览器的页面只能在点击到下载开始之间排队使用它。
+    """
+    journal = Journal(journal_path)
+    done = journal.completed(include_failed=not retry_failed)
+    pending = [url for url in urls if journal_key(url, subtitle_type, fmt) not in done]
+    logger.info(f"共 {len(urls)} 个视频，日志中已完成 {len(urls) - len(pending)} 个，待处理 {len(pending)} 个")
+
+    throughput = Throughput(len(pending))
+    if not pending:
+        return throughput.summary()
+    if telemetry_dir:
+        telemetry.configure(telemetry_dir)
+
+    scheduler = FetchScheduler(limiter or HostLimiter(rate, burst), RetryPolicy(max_attempts=max_attempts))
+    for url in pending:
+        scheduler.submit(url)
+    concurrency = max(1, min(concurrency, len(pending)))
+
+    fixture_server = None
+    own_pool = pool is None
+    if own_pool:
+        if offline:
+            fixture_server = await FixtureServer(ssl_context=make_self_signed_context()).start()
+        browsers = max(1, min(browsers or concurrency, concurrency))
+        pool = BrowserPool(size=browsers, headless=headless,
+                           pages_per_browser=math.ceil(concurrency / browsers),
+                           fixture_server=fixture_server,
+                           profile_template=await ensure_template(headless=headless) if use_template else None)
+    reporter = None
+    postprocessor = PostProcessor(postprocess_dir, workers=postprocess_workers) if postprocess_dir else None
+    postprocess_summary = None
+    try:
+        with journal:
+            await pool.start()
+            reporter = asyncio.ensure_future(report_metrics(scheduler))
+            if postprocessor is not None:
+                postprocessor.start()
+            await asyncio.gather(*(
+                _worker(pool, scheduler, journal, throughput, subtitle_type, fmt, output_dir, timeout,
+                        postprocessor)
+                for _ in range(concurrency)))
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        if postprocessor is not None:
+            # 等待已经提交的文件处理完
+            postprocess_summary = await postprocessor.close()
+        if own_pool:
+            await pool.close()
+        if fixture_server is not None:
+            await fixture_server.close()
+        if telemetry_dir:
+            telemetry.close()
+
+    summary = throughput.summary()
+    summary['scheduler'] = asdict(scheduler.metrics())
+    if postprocess_summary is not None:
+        summary['postprocess'] = postprocess_summary
+    logger.info(f"批量下载完成: 成功 {summary['ok']}, 失败 {summary['failed']}, "
+                f"耗时 {summary['wall_time']:.1f}s, {summary['videos_per_minute']:.1f} 视频/分钟")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='通过扩展选项页批量下载字幕，支持中断后恢复')
+    parser.add_argument('urls', help="视频URL列表文件，每行一个；'-' 表示从标准输入读取")
+    parser.add_argument('--output', default=BATCH_ROOT, help='字幕文件输出目录')
+    parser.add_argument('--journal', help='结果日志路径，默认为输出目录下的 journal.jsonl')
+    parser.add_argument('--type', dest='subtitle_type', default='auto', choices=list(SUBTITLE_TYPE_IDS))
+    parser.add_argument('--format', dest='fmt', default='txt', choices=list(SUBTITLE_FORMATS))
+    parser.add_argument('--concurrency', type=int, default=4, help='同时使用的页面数')
+    parser.add_argument('--browsers', type=int,
+                        help='页面分布到几个浏览器进程，默认每个页面一个（同一浏览器的页面下载时需要排队）')
+    parser.add_argument('--timeout', type=float, default=60.0, help='单个视频的超时时间（秒）')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help='每个域名的最大请求速率（请求/秒），遇到限流时自动降低')
+    parser.add_argument('--burst', type=int, default=DEFAULT_BURST, help='令牌桶容量')
+    parser.add_argument('--max-attempts', type=int, default=5, help='429 / 5xx 时最多尝试几次')
+    parser.add_argument('--skip-failed', action='store_true', help='恢复时不重试日志中失败的视频')
+    parser.add_argument('--headed', action='store_true', help='显示浏览器窗口')
+    parser.add_argument('--offline', action='store_true', help='使用本地夹具服务器代替 YouTube')
+    parser.add_argument('--no-template', action='store_true', help='不使用预构建的配置文件模板')
+    parser.add_argument('--postprocess', metavar='DIR',
+                        help='下载的同时在进程池中校验、规范化并转换为所有格式，写入这个目录')
+    parser.add_argument('--postprocess-workers', type=int, help='后处理进程数，默认为 CPU 核数')
+    parser.add_argument('--telemetry', nargs='?', const=TELEMETRY_ROOT, metavar='DIR',
+                        help=f'把各阶段事件写入 JSONL、指标写成 Prometheus 文本格式（默认目录 {TELEMETRY_ROOT}）')
+    parser.add_argument('--bundle', help='结束后把日志中成功下载的文件写入一个 ZIP（附带清单）')
+    args = parser.parse_args(argv)
+    journal_path = args.journal or os.path.join(args.output, 'journal.jsonl')
+
+    if args.urls == '-':
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.urls, encoding='utf-8') as f:
+            urls = read_urls(f)
+
+    try:
+        summary = asyncio.run(run_batch(
+            urls,
+            journal_path=journal_path,
+            output_dir=args.output,
+            subtitle_type=args.subtitle_type,
+            fmt=args.fmt,
+            concurrency=args.concurrency,
+            browsers=args.browsers,
+            timeout=args.timeout,
+            retry_failed=not args.skip_failed,
+            headless=not args.headed,
+            offline=args.offline,
+            use_template=not args.no_template,
+            rate=args.rate,
+            burst=args.burst,
+            max_attempts=args.max_attempts,
+            postprocess_dir=args.postprocess,
+            postprocess_workers=args.postprocess_workers,
+            telemetry_dir=args.telemetry,
+        ))
+    except KeyboardInterrupt:
+        logger.info("批量下载被中断，重新运行同样的命令即可从日志恢复")
+        return 130
+    except Exception as e:
+        logger.error(f"批量下载出错: {e}")
+        logger.error(traceback.format_exc())
+        return 1
+    if args.bundle:
+        bundle_journal(Journal(journal_path), args.bundle)
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,324 @@
+import asyncio
+import argparse
+import itertools
+import json
+import os
+import platform
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict
+
+from browser_pool import BrowserPool
+from fixture_server import FixtureServer, FIXTURES_DIR, make_self_signed_context
+from network_cache import NetworkCache, CACHE_ROOT, MODES as CACHE_MODES
+from perf_profiles import PROFILES, get_profile
+from stats import percentile
+from telemetry import telemetry, TELEMETRY_ROOT
+from test_download import (
+    create_test_context, cleanup_context, download_subtitles,
+    SUBTITLE_TYPE_IDS, SUBTITLE_FORMATS
+)
+
+logger = logging.getLogger(__name__)
+
+# 记录的阶段：打开选项页、点击到下载开始、点击到文件落盘、打开选项页到文件落盘
+PHASES = ('page_open', 'download_begin', 'download_complete', 'time_to_file')
+
+# 每次测量记录的选项页交互性指标（毫秒）
+INTERACTIVITY_METRICS = ('total_blocking_time_ms', 'max_long_task_ms', 'max_frame_gap_ms', 'max_input_delay_ms')
+
+# 对比时比较的统计量
+COMPARED_STATS = ('p50', 'p95')
+
+# 小于这个绝对差值（秒）的变化视为噪声
+MIN_REGRESSION_DELTA = 0.05
+
+RESULTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'benchmarks'))
+
+
+@dataclass
+class Scenario:
+    """一个基准场景：视频 × 字幕类型 × 格式 × 性能配置"""
+    video_id: str
+    subtitle_type: str
+    fmt: str
+    # 性能配置名，None 表示不做任何模拟
+    profile: Optional[str] = None
+    samples: Dict[str, List[float]] = field(default_factory=dict)
+    failures: int = 0
+    # 开启堆采样时每次测量的堆峰值（MB）、每 MB 输出的堆增长和输出大小
+    heap_peaks: List[float] = field(default_factory=list)
+    heap_per_output_mb: List[float] = field(default_factory=list)
+    output_bytes: Optional[int] = None
+    interactivity: Dict[str, List[float]] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        name = f'{self.video_id}/{self.subtitle_type}/{self.fmt}'
+        # 不带配置的场景名保持不变，旧的基线仍然可以对比
+        return f'{name}@{self.profile}' if self.profile else name
+
+    @property
+    def url(self) -> str:
+        return f'https://www.youtube.com/watch?v={self.video_id}'
+
+
+def summarize(samples: List[float]) -> Dict[str, Optional[float]]:
+    """计算一个阶段的 p50 / p95 / max"""
+    return {
+        'n': len(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'max': max(samples) if samples else None,
+    }
+
+
+def fixture_track_bytes(video_id: str, fixtures_dir: str = FIXTURES_DIR) -> int:
+    """夹具中一个视频所有字幕文件的总大小"""
+    timedtext = os.path.join(fixtures_dir, video_id, 'timedtext')
+    if not os.path.isdir(timedtext):
+        return 0
+    return sum(os.path.getsize(os.path.join(timedtext, name)) for name in os.listdir(timedtext))
+
+
+def fixture_videos(fixtures_dir: str = FIXTURES_DIR) -> List[str]:
+    """夹具目录中的视频，按字幕文件总大小从小到大排序"""
+    videos = [name for name in os.listdir(fixtures_dir)
+              if os.path.exists(os.path.join(fixtures_dir, name, 'player.json'))]
+    return sorted(videos, key=lambda video_id: fixture_track_bytes(video_id, fixtures_dir))
+
+
+async def run_scenario(pool: BrowserPool, scenario: Scenario,
+                       warmup: int, repeat: int, timeout: float,
+                       trace_dir: Optional[str] = None,
+                       network_cache: Optional[NetworkCache] = None,
+                       cache_mode: str = 'passthrough',
+                       heap_profile_dir: Optional[str] = None):
+    """运行单个场景：先预热，再重复测量"""
+    for iteration in range(warmup + repeat):
+        # 预热轮次不记录 trace
+        context = await create_test_context(pool=pool, trace_dir=trace_dir if iteration >= warmup else None,
+                                            network_cache=network_cache, cache_mode=cache_mode,
+                                            perf_profile=scenario.profile)
+        context.heap_profile_dir = heap_profile_dir
+        try:
+            outcome = await download_subtitles(context, scenario.url,
+                                               scenario.subtitle_type, scenario.fmt, timeout)
+        finally:
+            await cleanup_context(context)
+        if iteration < warmup:
+            continue
+        if not outcome.success:
+            scenario.failures += 1
+            logger.warning(f"⚠️ {scenario.name} 失败: {outcome.status_text}")
+            continue
+        for phase in PHASES:
+            if phase in outcome.timings:
+                scenario.samples.setdefault(phase, []).append(outcome.timings[phase])
+        if outcome.interactivity is not None:
+            for metric in INTERACTIVITY_METRICS:
+                scenario.interactivity.setdefault(metric, []).append(outcome.interactivity[metric])
+        if outcome.memory is not None:
+            scenario.heap_peaks.append(outcome.memory.peak_bytes / 1024 / 1024)
+            scenario.output_bytes = outcome.memory.output_bytes
+            if outcome.memory.growth_per_output_mb is not None:
+                scenario.heap_per_output_mb.append(outcome.memory.growth_per_output_mb)
+
+
+async def run_benchmark(videos: List[str],
+                        subtitle_types: List[str],
+                        formats: List[str],
+                        warmup: int = 1,
+                        repeat: int = 5,
+                        pool_size: int = 1,
+                        offline: bool = True,
+                        timeout: float = 60.0,
+                        headless: bool = False,
+                        fixture_server: Optional[FixtureServer] = None,
+                        trace_dir: Optional[str] = None,
+                        cache_mode: str = 'passthrough',
+                        cache_dir: str = CACHE_ROOT,
+                        heap_profile_dir: Optional[str] = None,
+                        fixtures_dir: str = FIXTURES_DIR,
+                        profiles: Optional[List[Optional[str]]] = None,
+                        telemetry_dir: Optional[str] = None) -> Dict:
+    """遍历 视频 × 字幕类型 × 格式 × 性能配置 矩阵并返回结果"""
+    profiles = profiles or [None]
+    for profile in profiles:
+        # 提前检查配置名，避免跑到一半才失败
+        get_profile(profile)
+    if telemetry_dir:
+        telemetry.configure(telemetry_dir)
+    own_server = offline and fixture_server is None
+    if own_server:
+        fixture_server = await FixtureServer(fixtures_dir, ssl_context=make_self_signed_context()).start()
+    pool = BrowserPool(size=pool_size, headless=headless,
+                       fixture_server=fixture_server if offline else None)
+    network_cache = NetworkCache(cache_dir) if cache_mode != 'passthrough' else None
+    scenarios = [Scenario(video_id, subtitle_type, fmt, profile)
+                 for video_id, subtitle_type, fmt, profile
+                 in itertools.product(videos, subtitle_types, formats, profiles)]
+    started = time.perf_counter()
+    try:
+        await pool.start()
+        queue = asyncio.Queue()
+        for scenario in scenarios:
+            queue.put_nowait(scenario)
+
+        async def worker():
+            while not queue.empty():
+                scenario = queue.get_nowait()
+                logger.info(f"基准场景: {scenario.name}")
+                await run_scenario(pool, scenario, warmup, repeat, timeout, trace_dir,
+                                   network_cache, cache_mode, heap_profile_dir)
+
+        await asyncio.gather(*(worker() for _ in range(pool_size)))
+    finally:
+        await pool.close()
+        if own_server:
+            await fixture_server.close()
+        if network_cache is not None:
+            network_cache.close()
+        if telemetry_dir:
+            telemetry.close()
+
+    return {
+        'meta': {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'platform': platform.platform(),
+            'offline': offline,
+            'fixtures_dir': fixtures_dir,
+            'cache_mode': cache_mode,
+            'warmup': warmup,
+            'repeat': repeat,
+            'pool_size': pool_size,
+            'profiles': [profile for profile in profiles if profile],
+            'wall_time': time.perf_counter() - started,
+        },
+        'scenarios': {
+            scenario.name: {
+                'video_id': scenario.video_id,
+                'subtitle_type': scenario.subtitle_type,
+                'format': scenario.fmt,
+                'profile': scenario.profile,
+                # 用于绘制耗时 / 内存与字幕长度的关系
+                'track_bytes': fixture_track_bytes(scenario.video_id, fixtures_dir) if offline else None,
+                'failures': scenario.failures,
+                'phases': {phase: summarize(scenario.samples.get(phase, [])) for phase in PHASES},
+                'memory': {
+                    'output_bytes': scenario.output_bytes,
+                    'heap_peak_mb': summarize(scenario.heap_peaks),
+                    'heap_growth_per_output_mb': summarize(scenario.heap_per_output_mb),
+                } if scenario.heap_peaks else None,
+                'interactivity': {metric: summarize(scenario.interactivity.get(metric, []))
+                                  for metric in INTERACTIVITY_METRICS} if scenario.interactivity else None,
+            }
+            for scenario in scenarios
+        },
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.2,
+            min_delta: float = MIN_REGRESSION_DELTA) -> List[str]:
+    """与基线对比，返回超过阈值的回退"""
+    regressions = []
+    for name, scenario in current['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        if scenario['failures'] > base['failures']:
+            regressions.append(f"{name}: 失败次数 {base['failures']} -> {scenario['failures']}")
+        for phase, stats in scenario['phases'].items():
+            base_stats = base['phases'].get(phase, {})
+            for stat in COMPARED_STATS:
+                now, before = stats.get(stat), base_stats.get(stat)
+                if now is None or before is None:
+                    continue
+                if now - before > min_delta and now > before * (1 + threshold):
+                    regressions.append(
+                        f"{name} {phase} {stat}: {before:.3f}s -> {now:.3f}s "
+                        f"(+{(now / before - 1) * 100 if before else float('inf'):.0f}%)")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='扩展端到端下载基准测试')
+    parser.add_argument('--videos', nargs='+', help='视频ID，默认使用夹具目录中的所有视频')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='夹具目录，例如 corpus.py 生成的合成语料')
+    parser.add_argument('--types', nargs='+', default=list(SUBTITLE_TYPE_IDS), choices=list(SUBTITLE_TYPE_IDS))
+    parser.add_argument('--formats', nargs='+', default=list(SUBTITLE_FORMATS), choices=list(SUBTITLE_FORMATS))
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--pool-size', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--online', action='store_true', help='通过代理访问真实的 YouTube')
+    parser.add_argument('--cache-mode', choices=CACHE_MODES, default='passthrough',
+                        help='record: 在线运行并录制响应; replay: 只用录制的响应，不访问网络')
+    parser.add_argument('--cache-dir', default=CACHE_ROOT)
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--trace', metavar='DIR', help='为每次测量记录 CDP trace 和阶段汇总')
+    parser.add_argument('--profiles', nargs='+', metavar='PROFILE',
+                        help=f"依次在这些性能配置下运行每个场景: {', '.join(PROFILES)}")
+    parser.add_argument('--telemetry', nargs='?', const=TELEMETRY_ROOT, metavar='DIR',
+                        help='把各阶段事件写入 JSONL、指标写成 Prometheus 文本格式')
+    parser.add_argument('--heap-profile', metavar='DIR', help='采样扩展的 JS 堆并记录每次测量的峰值')
+    parser.add_argument('--output', help='结果 JSON 路径')
+    parser.add_argument('--compare', metavar='BASELINE', help='与基线 JSON 对比，回退时返回非零')
+    parser.add_argument('--threshold', type=float, default=0.2, help='允许的相对回退比例')
+    parser.add_argument('--current', metavar='RESULTS', help='不运行基准，直接对比已有结果')
+    args = parser.parse_args(argv)
+
+    if args.current:
+        with open(args.current, encoding='utf-8') as f:
+            results = json.load(f)
+    else:
+        results = asyncio.run(run_benchmark(
+            videos=args.videos or fixture_videos(args.fixtures),
+            subtitle_types=args.types,
+            formats=args.formats,
+            warmup=args.warmup,
+            repeat=args.repeat,
+            pool_size=args.pool_size,
+            offline=not args.online,
+            timeout=args.timeout,
+            headless=args.headless,
+            trace_dir=args.trace,
+            cache_mode=args.cache_mode,
+            cache_dir=args.cache_dir,
+            heap_profile_dir=args.heap_profile,
+            fixtures_dir=args.fixtures,
+            profiles=args.profiles,
+            telemetry_dir=args.telemetry,
+        ))
+        output = args.output or os.path.join(RESULTS_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        logger.info(f"基准结果已写入: {output}")
+
+    for name, scenario in results['scenarios'].items():
+        phases = ', '.join(
+            f"{phase} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s max={stats['max']:.3f}s"
+            for phase, stats in scenario['phases'].items() if stats['n'])
+        logger.info(f"{name}: {phases or '无数据'} (失败 {scenario['failures']})")
+        interactivity = scenario.get('interactivity')
+        if interactivity:
+            logger.info("  交互性: " + ', '.join(
+                f"{metric} p95={stats['p95']:.0f}" for metric, stats in interactivity.items() if stats['n']))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            logger.error(f"❌ 性能回退: {regression}")
+        if regressions:
+            return 1
+        logger.info("✓ 没有超过阈值的性能回退")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,446 @@
+import asyncio
+import argparse
+import hashlib
+import json
+import os
+import signal
+import logging
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass, asdict
+from typing import Optional, Any, List, Tuple
+from urllib.parse import urlsplit
+
+from pyppeteer import connect
+
+from browser_pool import BrowserPool, DEFAULT_PROXY, EXTENSION_PATH, DOWNLOADS_ROOT
+from extension_id import resolve_extension_id
+
+logger = logging.getLogger(__name__)
+
+# 守护进程的状态文件和客户端锁所在目录
+DAEMON_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'daemon'))
+STATE_NAME = 'state.json'
+LOCK_NAME = 'client.lock'
+
+# 设置后 create_test_context 不连接守护进程，总是自己启动浏览器
+DISABLE_ENV = 'YTSD_NO_DAEMON'
+
+# 健康检查和源码变化检查的间隔（秒）
+DEFAULT_CHECK_INTERVAL = 2.0
+
+# 单次健康检查的超时（秒）
+HEALTH_TIMEOUT = 5.0
+
+# 持有者刷新客户端锁修改时间的间隔（秒）
+LOCK_HEARTBEAT_SECONDS = 10.0
+
+# 客户端锁超过这个时间（秒）没有刷新视为持有者已经退出
+STALE_LOCK_SECONDS = 120.0
+
+# 重启失败后第一次重试前等待的时间（秒），之后每次翻倍，最长 RESTART_BACKOFF_MAX
+RESTART_BACKOFF = 5.0
+RESTART_BACKOFF_MAX = 300.0
+
+# 重置时清理这些站点的 Cookie 和存储
+RESET_ORIGINS = ('https://www.youtube.com', 'https://m.youtube.com', 'https://youtube.com')
+
+
+@dataclass
+class DaemonState:
+    """守护进程发布的状态"""
+    ws_endpoint: str
+    pid: int
+    extension_path: str
+    src_fingerprint: str
+    headless: bool
+    started: float
+    restarts: int = 0
+
+
+def src_fingerprint(path: str = EXTENSION_PATH) -> str:
+    """扩展源码的指纹：所有文件的相对路径、大小和修改时间"""
+    entries = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            full = os.path.join(root, name)
+            try:
+                stat = os.stat(full)
+            except OSError:
+                continue
+            entries.append(f'{os.path.relpath(full, path)}:{stat.st_size}:{stat.st_mtime_ns}')
+    return hashlib.sha256('\n'.join(entries).encode('utf-8')).hexdigest() if entries else ''
+
+
+def read_state(root: str = DAEMON_ROOT) -> Optional[DaemonState]:
+    try:
+        with open(os.path.join(root, STATE_NAME), encoding='utf-8') as f:
+            return DaemonState(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def write_state(state: DaemonState, root: str = DAEMON_ROOT):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, STATE_NAME)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(asdict(state), f, indent=2)
+    os.replace(f'{path}.tmp', path)
+
+
+def endpoint_alive(ws_endpoint: str, timeout: float = 1.0) -> bool:
+    """通过 /json/version 确认 DevTools 端点仍然属于同一个浏览器"""
+    parts = urlsplit(ws_endpoint)
+    try:
+        with urllib.request.urlopen(f'http://{parts.netloc}/json/version', timeout=timeout) as response:
+            return json.load(response).get('webSocketDebuggerUrl') == ws_endpoint
+    except (OSError, ValueError):
+        return False
+
+
+class ClientLock:
+    """同一时间只允许一个客户端使用守护进程的浏览器（下载目录是浏览器级别的设置）
+
+    用 O_EXCL 创建锁文件，跨平台；持有期间由后台线程定期刷新锁文件的修改时间，
+    持有者异常退出后锁不再刷新，超过 STALE_LOCK_SECONDS 后失效。
+    用线程而不是事件循环中的任务刷新，pytest 运行同步测试时事件循环不运行。
+    """
+
+    def __init__(self, root: str = DAEMON_ROOT, heartbeat: float = LOCK_HEARTBEAT_SECONDS):
+        self.path = os.path.join(root, LOCK_NAME)
+        self.heartbeat = heartbeat
+        self.held = False
+        self._released = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def _stale(self) -> bool:
+        try:
+            return time.time() - os.path.getmtime(self.path) > STALE_LOCK_SECONDS
+        except OSError:
+            return False
+
+    def acquire(self) -> bool:
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._stale():
+                    return False
+                logger.warning(f"⚠️ 清除过期的客户端锁: {self.path}")
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    return False
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            self.held = True
+            self._released.clear()
+            self._heartbeat_thread = threading.Thread(target=self._keep_alive, name='client-lock-heartbeat',
+                                                      daemon=True)
+            self._heartbeat_thread.start()
+            return True
+        return False
+
+    def _keep_alive(self):
+        while not self._released.wait(self.heartbeat):
+            try:
+                os.utime(self.path)
+            except OSError as e:
+                logger.warning(f"⚠️ 刷新客户端锁失败: {e}")
+
+    def locked(self) -> bool:
+        return os.path.exists(self.path) and not self._stale()
+
+    def release(self):
+        if self.held:
+            self._released.set()
+            if self._heartbeat_thread is not None:
+                self._heartbeat_thread.join()
+                self._heartbeat_thread = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.held = False
+
+
+async def reset_browser_state(browser: Any, keep: Optional[List[Any]] = None):
+    """把浏览器恢复到干净状态：关闭多余的页面，清除 Cookie、缓存和 YouTube 站点数据"""
+    keep = keep or []
+    pages = await browser.pages()
+    for page in pages:
+        if page in keep or page.isClosed():
+            continue
+        try:
+            await page.close()
+        except Exception as e:
+            logger.warning(f"⚠️ 关闭页面时出错: {e}")
+    page = keep[0] if keep else await browser.newPage()
+    try:
+        session = page._client
+        await session.send('Network.clearBrowserCookies')
+        await session.send('Network.clearBrowserCache')
+        for origin in RESET_ORIGINS:
+            await session.send('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+    finally:
+        if not keep:
+            await page.close()
+
+
+def daemon_available(root: str = DAEMON_ROOT, extension_path: str = EXTENSION_PATH) -> bool:
+    """守护进程正在运行、加载的是同一份扩展，并且没有被其他客户端占用"""
+    if os.environ.get(DISABLE_ENV):
+        return False
+    state = read_state(root)
+    return (state is not None
+            and os.path.abspath(state.extension_path) == os.path.abspath(extension_path)
+            and not ClientLock(root).locked()
+            and endpoint_alive(state.ws_endpoint))
+
+
+async def attach(root: str = DAEMON_ROOT,
+                 extension_path: str = EXTENSION_PATH) -> Optional[Tuple[Any, ClientLock]]:
+    """守护进程可用且空闲时连接到它的浏览器，否则返回 None 由调用方自己启动浏览器"""
+    if os.environ.get(DISABLE_ENV):
+        return None
+    state = read_state(root)
+    if state is None or os.path.abspath(state.extension_path) != os.path.abspath(extension_path):
+        return None
+    if not endpoint_alive(state.ws_endpoint):
+        logger.info("守护进程的浏览器不可用，自己启动浏览器")
+        return None
+    lock = ClientLock(root)
+    if not lock.acquire():
+        logger.info("守护进程的浏览器正被其他客户端使用，自己启动浏览器")
+        return None
+    try:
+        browser = await connect(browserWSEndpoint=state.ws_endpoint,
+                                defaultViewport={'width': 1280, 'height': 800})
+    except Exception as e:
+        lock.release()
+        logger.warning(f"⚠️ 连接守护进程失败: {e}")
+        return None
+    logger.info(f"✓ 已连接到守护进程的浏览器: {state.ws_endpoint}")
+    return browser, lock
+
+
+async def detach(browser: Any, lock: ClientLock):
+    """重置浏览器状态后断开连接（不关闭浏览器），并释放客户端锁"""
+    try:
+        await reset_browser_state(browser)
+    except Exception as e:
+        logger.warning(f"⚠️ 重置浏览器状态时出错: {e}")
+    finally:
+        try:
+            await browser.disconnect()
+        finally:
+            lock.release()
+
+
+class BrowserDaemon:
+    """长期运行的加载扩展的浏览器：发布 wsEndpoint，定期健康检查，扩展源码变化时重启"""
+
+    def __init__(self,
+                 root: str = DAEMON_ROOT,
+                 headless: bool = False,
+                 extension_path: str = EXTENSION_PATH,
+                 proxy_server: Optional[str] = DEFAULT_PROXY,
+                 profile_template: Optional[str] = None,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.root = root
+        self.headless = headless
+        self.extension_path = extension_path
+        self.check_interval = check_interval
+        self.pool = BrowserPool(size=1, headless=headless, extension_path=extension_path,
+                                downloads_root=os.path.join(DOWNLOADS_ROOT, 'daemon'),
+                                proxy_server=proxy_server, profile_template=profile_template)
+        self.state: Optional[DaemonState] = None
+        self.restarts = 0
+        # 等待执行的重启原因；客户端持有锁或重启失败后在之后的检查中重试
+        self.pending_restart: Optional[str] = None
+        self.restart_failures = 0
+        self._retry_at = 0.0
+        self._stopping = asyncio.Event()
+
+    @property
+    def browser(self) -> Any:
+        return self.pool.browsers[0].browser
+
+    async def start(self) -> DaemonState:
+        fingerprint = src_fingerprint(self.extension_path)
+        await self.pool.start()
+        self.state = DaemonState(ws_endpoint=self.browser.wsEndpoint, pid=os.getpid(),
+                                 extension_path=self.extension_path, src_fingerprint=fingerprint,
+                                 headless=self.headless, started=time.time(), restarts=self.restarts)
+        write_state(self.state, self.root)
+        logger.info(f"✓ 浏览器守护进程已启动: {self.state.ws_endpoint}")
+        return self.state
+
+    async def restart(self, reason: str):
+        logger.info(f"重启浏览器: {reason}")
+        await self.pool.close()
+        self.restarts += 1
+        await self.start()
+
+    async def healthy(self) -> bool:
+        """浏览器能响应 CDP 命令，并且能打开扩展的 manifest.json
+
+        MV3 扩展的 service worker 空闲约 30 秒后会被终止，它的 target 随之消失，
+        所以不能用 target 是否存在判断扩展是否仍然加载。
+        """
+        try:
+            await asyncio.wait_for(self.browser._connection.send('Browser.getVersion'), HEALTH_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"⚠️ 健康检查失败: {e}")
+            return False
+        if not await self._extension_loaded():
+            logger.warning("⚠️ 健康检查失败: 扩展没有加载")
+            return False
+        return True
+
+    async def _extension_loaded(self) -> bool:
+        """在临时页面中打开 chrome-extension://<ID>/manifest.json，扩展未加载时 Chrome 会拒绝导航"""
+        manifest_url = f'chrome-extension://{resolve_extension_id(self.extension_path)}/manifest.json'
+        page = None
+        try:
+            page = await asyncio.wait_for(self.browser.newPage(), HEALTH_TIMEOUT)
+            await asyncio.wait_for(page.goto(manifest_url), HEALTH_TIMEOUT)
+            text = await asyncio.wait_for(
+                page.evaluate('() => document.body ? document.body.innerText : ""'), HEALTH_TIMEOUT)
+            manifest = json.loads(text)
+            return isinstance(manifest, dict) and 'manifest_version' in manifest
+        except Exception as e:
+            logger.debug(f"打开 {manifest_url} 失败: {e}")
+            return False
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+
+    async def check(self):
+        """一次检查：源码变化或不健康时重启
+
+        客户端持有锁时不重启（会关掉它正在使用的浏览器），推迟到锁释放后的检查；
+        重启失败时记录错误，按指数退避在之后的检查中重试，守护进程不退出。
+        """
+        if self.pending_restart is None:
+            if src_fingerprint(self.extension_path) != self.state.src_fingerprint:
+                self.pending_restart = '扩展源码已变化'
+            elif not await self.healthy():
+                self.pending_restart = '健康检查失败'
+            else:
+                return
+        if ClientLock(self.root).locked():
+            logger.debug(f"客户端正在使用浏览器，推迟重启: {self.pending_restart}")
+            return
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            await self.restart(self.pending_restart)
+        except Exception as e:
+            self.restart_failures += 1
+            delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2 ** (self.restart_failures - 1))
+            self._retry_at = time.monotonic() + delay
+            logger.error(f"❌ 重启浏览器失败（第 {self.restart_failures} 次），{delay:.0f}s 后重试: {e}")
+            return
+        self.pending_restart = None
+        self.restart_failures = 0
+        self._retry_at = 0.0
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        await self.start()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.check_interval)
+                except asyncio.TimeoutError:
+                    await self.check()
+        finally:
+            await self.pool.close()
+            try:
+                os.remove(os.path.join(self.root, STATE_NAME))
+            except OSError:
+                pass
+            logger.info("浏览器守护进程已退出")
+
+
+async def reset(root: str = DAEMON_ROOT) -> bool:
+    """连接守护进程，重置浏览器状态后断开"""
+    state = read_state(root)
+    attached = await attach(root, state.extension_path if state else EXTENSION_PATH)
+    if attached is None:
+        return False
+    await detach(*attached)
+    return True
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='常驻的加载扩展的浏览器，测试和命令行工具通过 DevTools websocket 连接')
+    parser.add_argument('--root', default=DAEMON_ROOT, help='状态文件目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    start = commands.add_parser('start', help='在前台运行守护进程，Ctrl+C 退出')
+    start.add_argument('--headless', action='store_true')
+    start.add_argument('--proxy', default=DEFAULT_PROXY)
+    start.add_argument('--template', action='store_true', help='使用预构建的配置文件模板')
+    start.add_argument('--interval', type=float, default=DEFAULT_CHECK_INTERVAL, help='检查间隔（秒）')
+
+    commands.add_parser('status', help='显示守护进程状态')
+    commands.add_parser('reset', help='重置浏览器状态')
+    commands.add_parser('stop', help='停止守护进程')
+    args = parser.parse_args(argv)
+
+    if args.command == 'start':
+        async def run():
+            template = None
+            if args.template:
+                from profile_template import ensure_template
+                template = await ensure_template(headless=args.headless)
+            daemon = BrowserDaemon(args.root, args.headless, proxy_server=args.proxy or None,
+                                   profile_template=template, check_interval=args.interval)
+            loop = asyncio.get_event_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, daemon.stop)
+                except (NotImplementedError, RuntimeError):
+                    # Windows 不支持 add_signal_handler，Ctrl+C 以 KeyboardInterrupt 结束
+                    pass
+            await daemon.run()
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    state = read_state(args.root)
+    if state is None:
+        logger.info("守护进程没有运行")
+        return 1
+    if args.command == 'status':
+        alive = endpoint_alive(state.ws_endpoint)
+        busy = ClientLock(args.root).locked()
+        logger.info(f"{'✓ 运行中' if alive else '❌ 无响应'}: pid {state.pid}, {state.ws_endpoint}, "
+                    f"重启 {state.restarts} 次, {'使用中' if busy else '空闲'}")
+        return 0 if alive else 1
+    if args.command == 'reset':
+        ok = asyncio.run(reset(args.root))
+        logger.info("✓ 浏览器状态已重置" if ok else "❌ 无法连接守护进程（未运行或正被使用）")
+        return 0 if ok else 1
+    if args.command == 'stop':
+        os.kill(state.pid, signal.SIGTERM)
+        logger.info(f"已向守护进程 {state.pid} 发送停止信号")
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    exit(main())
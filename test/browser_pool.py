@@ -0,0 +1,275 @@
+import asyncio
+import os
+import logging
+import shutil
+import itertools
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Any, List
+
+from pyppeteer import launch
+
+logger = logging.getLogger(__name__)
+
+# Chrome 可执行文件路径
+CHROME_PATH = "C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe"
+
+# 扩展源码目录和默认下载目录
+EXTENSION_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+DOWNLOADS_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'downloads'))
+
+# 默认代理服务器
+DEFAULT_PROXY = '192.168.1.16:10811'
+
+
+def build_launch_args(extension_path: str,
+                      user_data_dir: str,
+                      proxy_server: Optional[str] = DEFAULT_PROXY,
+                      extra_args: Optional[List[str]] = None) -> List[str]:
+    """生成加载扩展的 Chrome 启动参数"""
+    args = [
+        '--no-sandbox',
+        f'--disable-extensions-except={extension_path}',
+        f'--load-extension={extension_path}',
+        '--disable-web-security',  # 允许跨源请求
+        f'--user-data-dir={user_data_dir}',
+    ]
+    if proxy_server:
+        args.append(f'--proxy-server={proxy_server}')
+    if extra_args:
+        args.extend(extra_args)
+    return args
+
+
+def extension_worker_target(browser: Any) -> Optional[Any]:
+    """扩展的 service worker（MV2 为后台页面）target；空闲被终止时返回 None"""
+    for target in browser.targets():
+        if target.type in ('service_worker', 'background_page') and \
+                target.url.startswith('chrome-extension://'):
+            return target
+    return None
+
+
+async def wait_for_extension_target(browser: Any, timeout: float = 10.0) -> Optional[Any]:
+    """等待扩展的 service worker / 后台页面出现，代替固定的 sleep"""
+    def find_target():
+        for target in browser.targets():
+            if target.url.startswith('chrome-extension://'):
+                return target
+        return None
+
+    target = find_target()
+    if target:
+        return target
+
+    loop = asyncio.get_event_loop()
+    future = loop.create_future()
+
+    def on_target_created(new_target):
+        if new_target.url.startswith('chrome-extension://') and not future.done():
+            future.set_result(new_target)
+
+    browser.on('targetcreated', on_target_created)
+    try:
+        # 注册监听后再检查一次，避免错过事件
+        target = find_target()
+        if target:
+            return target
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"等待扩展加载超时 ({timeout}s)")
+        return None
+    finally:
+        browser.remove_listener('targetcreated', on_target_created)
+
+
+async def set_download_folder(browser: Any, downloads_folder: str,
+                              browser_context_id: Optional[str] = None):
+    """设置浏览器（或指定上下文）的下载目录"""
+    params = {
+        'behavior': 'allow',
+        'downloadPath': downloads_folder,
+        'eventsEnabled': True,
+    }
+    if browser_context_id:
+        params['browserContextId'] = browser_context_id
+    await browser._connection.send('Browser.setDownloadBehavior', params)
+
+
+@dataclass
+class PooledBrowser:
+    """池中的一个浏览器实例"""
+    browser: Any
+    index: int
+    user_data_dir: str
+    # 默认上下文的下载目录是浏览器级的，同一浏览器的页面在点击到下载开始之间排队使用
+    download_lane: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+@dataclass
+class Lease:
+    """从浏览器池借出的隔离上下文"""
+    pooled: PooledBrowser
+    page: Any
+    downloads_folder: str
+    browser_context: Optional[Any] = None
+
+    @property
+    def browser(self) -> Any:
+        return self.pooled.browser
+
+
+class BrowserPool:
+    """浏览器池：每个会话只启动一次加载了扩展的 Chrome，测试按需借用页面"""
+
+    def __init__(self,
+                 size: int = 1,
+                 headless: bool = False,
+                 extension_path: str = EXTENSION_PATH,
+                 downloads_root: str = DOWNLOADS_ROOT,
+                 pages_per_browser: int = 1,
+                 incognito: bool = False,
+                 proxy_server: Optional[str] = DEFAULT_PROXY,
+                 extra_args: Optional[List[str]] = None,
+                 extension_timeout: float = 10.0,
+                 fixture_server: Optional[Any] = None,
+                 profile_template: Optional[str] = None):
+        self.size = size
+        self.headless = headless
+        self.extension_path = extension_path
+        self.downloads_root = downloads_root
+        self.pages_per_browser = pages_per_browser
+        # 注意：未开启“在无痕模式下启用”的扩展页面无法在无痕上下文中打开，
+        # 因此默认在默认上下文中为每次借用新建页面
+        self.incognito = incognito
+        self.proxy_server = proxy_server
+        self.extra_args = list(extra_args or [])
+        if fixture_server is not None:
+            # 离线模式：不走代理，通过 host resolver rules 指向本地夹具服务器
+            self.proxy_server = None
+            self.extra_args.extend(fixture_server.chrome_args())
+        self.extension_timeout = extension_timeout
+        # 预先构建的配置文件模板，每个浏览器使用它的克隆，关闭时只删除克隆
+        self.profile_template = profile_template
+        self.browsers: List[PooledBrowser] = []
+        self._slots: Optional[asyncio.Queue] = None
+        self._lease_counter = itertools.count()
+        self._started = False
+
+    async def start(self):
+        """启动池中的所有浏览器"""
+        if self._started:
+            return self
+        os.makedirs(self.downloads_root, exist_ok=True)
+        self._slots = asyncio.Queue()
+        self.browsers = await asyncio.gather(*(self._launch(i) for i in range(self.size)))
+        for pooled in self.browsers:
+            for _ in range(self.pages_per_browser):
+                self._slots.put_nowait(pooled)
+        self._started = True
+        logger.info(f"浏览器池已启动: {self.size} 个浏览器, 每个 {self.pages_per_browser} 个页面")
+        return self
+
+    async def _launch(self, index: int) -> PooledBrowser:
+        """启动单个加载扩展的浏览器"""
+        user_data_dir = os.path.join(self.downloads_root, f'user_data_{index}')
+        if self.profile_template:
+            from profile_template import clone_profile
+            clone_profile(self.profile_template, user_data_dir)
+        browser = await launch(
+            headless=self.headless,
+            executablePath=CHROME_PATH,
+            args=build_launch_args(self.extension_path, user_data_dir,
+                                   self.proxy_server, self.extra_args),
+            defaultViewport={
+                'width': 1280,
+                'height': 800
+            }
+        )
+        # 等待插件加载；失败时关闭浏览器，重试启动时不会留下多余的 Chrome 进程
+        try:
+            await wait_for_extension_target(browser, self.extension_timeout)
+        except BaseException:
+            await browser.close()
+            raise
+        return PooledBrowser(browser=browser, index=index, user_data_dir=user_data_dir)
+
+    async def acquire(self) -> Lease:
+        """借出一个页面和干净的下载目录"""
+        if not self._started:
+            await self.start()
+        pooled = await self._slots.get()
+        try:
+            lease_id = next(self._lease_counter)
+            downloads_folder = os.path.join(self.downloads_root, f'lease_{pooled.index}_{lease_id}')
+            shutil.rmtree(downloads_folder, ignore_errors=True)
+            os.makedirs(downloads_folder, exist_ok=True)
+
+            browser_context = None
+            if self.incognito:
+                browser_context = await pooled.browser.createIncognitoBrowserContext()
+                page = await browser_context.newPage()
+                await set_download_folder(pooled.browser, downloads_folder, browser_context._id)
+            else:
+                page = await pooled.browser.newPage()
+                await set_download_folder(pooled.browser, downloads_folder)
+
+            return Lease(pooled=pooled, page=page,
+                         downloads_folder=downloads_folder,
+                         browser_context=browser_context)
+        except Exception:
+            self._slots.put_nowait(pooled)
+            raise
+
+    async def release(self, lease: Lease, keep_downloads: bool = False):
+        """归还借出的页面，并清理下载目录"""
+        try:
+            if lease.browser_context is not None:
+                await lease.browser_context.close()
+            elif not lease.page.isClosed():
+                await lease.page.close()
+        except Exception as e:
+            logger.warning(f"归还页面时出错: {e}")
+        finally:
+            if not keep_downloads:
+                shutil.rmtree(lease.downloads_folder, ignore_errors=True)
+            self._slots.put_nowait(lease.pooled)
+
+    @asynccontextmanager
+    async def download_lane(self, lease: Lease):
+        """独占借出页面所在浏览器的下载目录，并把它切换到这次借用的目录
+
+        无痕上下文有自己的下载目录，不需要排队。
+        """
+        if lease.browser_context is not None:
+            yield
+            return
+        async with lease.pooled.download_lane:
+            await set_download_folder(lease.browser, lease.downloads_folder)
+            yield
+
+    @asynccontextmanager
+    async def lease(self):
+        """以上下文管理器的方式借用页面"""
+        lease = await self.acquire()
+        try:
+            yield lease
+        finally:
+            await self.release(lease)
+
+    async def close(self):
+        """关闭池中所有浏览器并删除其用户数据目录"""
+        for pooled in self.browsers:
+            try:
+                await pooled.browser.close()
+            except Exception as e:
+                logger.warning(f"关闭浏览器时出错: {e}")
+            shutil.rmtree(pooled.user_data_dir, ignore_errors=True)
+        self.browsers = []
+        self._started = False
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,281 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import logging
+import zipfile
+from dataclasses import dataclass, asdict, field
+from typing import Optional, List, Dict, Set, Iterable, IO
+
+from browser_pool import DOWNLOADS_ROOT
+from subtitle_engine import Cue, READERS, WRITERS, TIMED_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# 打包输出的默认目录
+BUNDLE_ROOT = os.path.join(DOWNLOADS_ROOT, 'bundles')
+
+# 清单在压缩包中的文件名，总是最后一个条目
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# 所有条目使用固定的修改时间，同样的内容按同样的顺序写入时得到逐字节相同的压缩包
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+# 流式复制和校验时每次读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+
+def entry_name(video_id: str, track: str, fmt: str) -> str:
+    """确定性的条目名：<视频ID>.<轨道>.<格式>"""
+    return f'{video_id}.{track}.{fmt}'
+
+
+@dataclass
+class BundleEntry:
+    """清单中的一个条目"""
+    name: str
+    video_id: str
+    track: str
+    format: str
+    sha256: str
+    size: int
+    cue_count: Optional[int] = None
+
+
+class HashingWriter:
+    """把文本编码为 UTF-8 写入二进制流，同时计算 SHA-256 和字节数"""
+
+    def __init__(self, fp: IO[bytes]):
+        self.fp = fp
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, text: str):
+        data = text.encode('utf-8')
+        self.digest.update(data)
+        self.size += len(data)
+        self.fp.write(data)
+
+
+class _HashingReader(io.RawIOBase):
+    """读取时计算 SHA-256 和字节数，用于边解析边校验压缩包条目"""
+
+    def __init__(self, fp: IO[bytes]):
+        self.fp = fp
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.fp.read(len(buffer))
+        self.digest.update(data)
+        self.size += len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def drain(self):
+        for _ in iter(lambda: self.read(CHUNK_SIZE), b''):
+            pass
+
+
+class BundleWriter:
+    """把多个字幕文件流式写入一个 ZIP，最后写入清单
+
+    条目逐个压缩写出，内存占用与条目数量和大小无关；压缩包先写到临时文件，
+    close() 时才替换目标路径，中途失败不会留下不完整的压缩包。
+    """
+
+    def __init__(self, path: str, compresslevel: int = 6):
+        self.path = path
+        self.compresslevel = compresslevel
+        self.entries: List[BundleEntry] = []
+        # 已写入压缩包的条目名（包括保留的清单名），用于 O(1) 查重
+        self._names: Set[str] = {MANIFEST_NAME}
+        self._tmp_path = f'{path}.tmp'
+        self._zip: Optional[zipfile.ZipFile] = None
+
+    def open(self) -> 'BundleWriter':
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._zip = zipfile.ZipFile(self._tmp_path, 'w', zipfile.ZIP_DEFLATED,
+                                    compresslevel=self.compresslevel)
+        return self
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _open_entry(self, name: str) -> IO[bytes]:
+        if self._zip is None:
+            raise RuntimeError('压缩包尚未打开')
+        if name in self._names:
+            raise ValueError(f'重复的条目名: {name}')
+        self._names.add(name)
+        info = zipfile.ZipInfo(name, ZIP_EPOCH)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        return self._zip.open(info, 'w')
+
+    def write_cues(self, video_id: str, track: str, fmt: str, cues: Iterable[Cue]) -> BundleEntry:
+        """把字幕逐条写为一个条目"""
+        name = entry_name(video_id, track, fmt)
+        with self._open_entry(name) as raw:
+            writer = HashingWriter(raw)
+            count = WRITERS[fmt](cues, writer)
+        entry = BundleEntry(name, video_id, track, fmt, writer.digest.hexdigest(), writer.size, count)
+        self.entries.append(entry)
+        return entry
+
+    def add_file(self, path: str, video_id: str, track: str, fmt: str) -> BundleEntry:
+        """把已有的字幕文件流式复制为一个条目"""
+        name = entry_name(video_id, track, fmt)
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as src, self._open_entry(name) as dst:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                dst.write(chunk)
+        entry = BundleEntry(name, video_id, track, fmt, digest.hexdigest(), size)
+        self.entries.append(entry)
+        return entry
+
+    def close(self) -> str:
+        """写入清单并完成压缩包"""
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'entries': [asdict(entry) for entry in self.entries],
+        }
+        info = zipfile.ZipInfo(MANIFEST_NAME, ZIP_EPOCH)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        self._zip.writestr(info, json.dumps(manifest, ensure_ascii=False, indent=2))
+        self._zip.close()
+        self._zip = None
+        os.replace(self._tmp_path, self.path)
+        logger.info(f"✓ 压缩包已写入: {self.path} ({len(self.entries)} 个文件)")
+        return self.path
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+@dataclass
+class BundleReport:
+    """压缩包的校验结果"""
+    path: str
+    entries: int = 0
+    cues: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def read_manifest(path: str) -> Dict:
+    with zipfile.ZipFile(path) as zf:
+        with zf.open(MANIFEST_NAME) as f:
+            return json.load(f)
+
+
+def verify_bundle(path: str, parse: bool = True) -> BundleReport:
+    """不解压到磁盘，逐个流式读取条目，核对清单中的哈希和大小，并用参考实现解析字幕"""
+    report = BundleReport(path=path)
+    try:
+        zf = zipfile.ZipFile(path)
+    except (OSError, zipfile.BadZipFile) as e:
+        report.errors.append(f"无法打开压缩包: {e}")
+        return report
+
+    with zf:
+        names = [info.filename for info in zf.infolist()]
+        if MANIFEST_NAME not in names:
+            report.errors.append('缺少清单')
+            return report
+        with zf.open(MANIFEST_NAME) as f:
+            manifest = {entry['name']: entry for entry in json.load(f)['entries']}
+        for name in sorted(set(manifest) - set(names)):
+            report.errors.append(f"{name}: 清单中有但压缩包中没有")
+
+        for name in names:
+            if name == MANIFEST_NAME:
+                continue
+            expected = manifest.get(name)
+            if expected is None:
+                report.errors.append(f"{name}: 不在清单中")
+                continue
+            report.entries += 1
+            try:
+                with zf.open(name) as raw:
+                    reader = _HashingReader(raw)
+                    fmt = expected['format']
+                    count = None
+                    if parse and fmt in READERS:
+                        count = _count_cues(reader, fmt)
+                    reader.drain()
+            except (zipfile.BadZipFile, ValueError, SyntaxError, UnicodeDecodeError) as e:
+                # 条目 CRC 不符时 zipfile 会抛出 BadZipFile
+                report.errors.append(f"{name}: 读取失败: {e}")
+                continue
+            if reader.digest.hexdigest() != expected['sha256']:
+                report.errors.append(f"{name}: SHA-256 与清单不一致")
+            if reader.size != expected['size']:
+                report.errors.append(f"{name}: 大小 {reader.size} 与清单中的 {expected['size']} 不一致")
+            if count is not None:
+                report.cues += count
+                if count == 0:
+                    report.errors.append(f"{name}: 没有字幕")
+                elif expected.get('cue_count') is not None and count != expected['cue_count'] \
+                        and fmt in TIMED_FORMATS:
+                    report.errors.append(f"{name}: 字幕条数 {count} 与清单中的 {expected['cue_count']} 不一致")
+    return report
+
+
+def _count_cues(reader: _HashingReader, fmt: str) -> int:
+    parse, binary = READERS[fmt]
+    buffered = io.BufferedReader(reader, CHUNK_SIZE)
+    stream = buffered if binary else io.TextIOWrapper(buffered, encoding='utf-8-sig', newline='')
+    count = sum(1 for _ in parse(stream))
+    # 分离包装层而不是关闭，调用方还要读完剩余内容
+    if stream is not buffered:
+        stream.detach()
+    buffered.detach()
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='流式校验字幕压缩包：核对清单中的哈希并解析每个条目')
+    parser.add_argument('bundles', nargs='+', help='压缩包路径')
+    parser.add_argument('--no-parse', action='store_true', help='只核对哈希和大小')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for path in args.bundles:
+        report = verify_bundle(path, parse=not args.no_parse)
+        if report.ok:
+            logger.info(f"✓ {path}: {report.entries} 个文件, {report.cues} 条字幕")
+        else:
+            failed += 1
+            logger.error(f"❌ {path}:")
+            for error in report.errors:
+                logger.error(f"  {error}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,331 @@
+import asyncio
+import os
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Any, Dict, List, Pattern
+
+from browser_pool import extension_worker_target
+from downloads_watcher import DownloadsWatcher, SUBTITLE_RE, sha256_file
+from http_status import retryable_status, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+
+class WaitTimeout(asyncio.TimeoutError):
+    """等待超时，携带实际等待的时间"""
+
+    def __init__(self, what: str, elapsed: float):
+        super().__init__(f"等待{what}超时 ({elapsed:.2f}s)")
+        self.what = what
+        self.elapsed = elapsed
+
+
+@dataclass
+class WaitResult:
+    """一次等待的结果和实际耗时（秒）"""
+    value: Any
+    elapsed: float
+
+
+@dataclass
+class DownloadInfo:
+    """一次下载的 CDP 事件信息"""
+    guid: str
+    suggested_filename: str
+    url: str = ''
+    state: str = 'inProgress'
+    received_bytes: int = 0
+    total_bytes: int = 0
+    path: Optional[str] = None
+    sha256: Optional[str] = None
+    began_after: Optional[float] = None
+    completed_after: Optional[float] = None
+
+
+class DownloadWaiter:
+    """基于 Browser.downloadWillBegin / Browser.downloadProgress 的下载等待器
+
+    同时用 DownloadsWatcher 监视下载目录，文件改名为最终文件名时立即完成。
+    需要在点击下载按钮之前调用 start()，之后再调用 wait()。
+    传入 frame_id 时忽略同一浏览器中其他页面发起的下载（事件没有 frameId 时无法区分，照常接受）。
+    """
+
+    def __init__(self, browser: Any, downloads_folder: str, pattern: Pattern = SUBTITLE_RE,
+                 frame_id: Optional[str] = None):
+        self.browser = browser
+        self.downloads_folder = downloads_folder
+        self.pattern = pattern
+        self.frame_id = frame_id
+        self.downloads: Dict[str, DownloadInfo] = {}
+        self.watcher = DownloadsWatcher(downloads_folder, pattern)
+        self._began: Optional[asyncio.Future] = None
+        self._completed: Optional[asyncio.Future] = None
+        self._started_at = 0.0
+        self._sealed = False
+        self._listening = False
+
+    def start(self):
+        """注册 CDP 事件监听和目录监视，记录起始时间"""
+        loop = asyncio.get_event_loop()
+        self._began = loop.create_future()
+        self._completed = loop.create_future()
+        self._started_at = time.perf_counter()
+        self.watcher.start()
+        self.watcher.mark_click(self._started_at)
+        connection = self.browser._connection
+        connection.on('Browser.downloadWillBegin', self._on_will_begin)
+        connection.on('Browser.downloadProgress', self._on_progress)
+        self._listening = True
+        return self
+
+    def stop(self):
+        """移除 CDP 事件监听并停止目录监视；可以重复调用，未启动时什么也不做"""
+        if self._listening:
+            connection = self.browser._connection
+            connection.remove_listener('Browser.downloadWillBegin', self._on_will_begin)
+            connection.remove_listener('Browser.downloadProgress', self._on_progress)
+            self._listening = False
+        self.watcher.close()
+
+    def seal(self):
+        """之后开始的下载不再属于这个等待器（同一浏览器的其他页面可能正在下载）"""
+        self._sealed = True
+
+    def _elapsed(self) -> float:
+        return time.perf_counter() - self._started_at
+
+    def _on_will_begin(self, event: Dict):
+        if self._sealed:
+            return
+        if self.frame_id and event.get('frameId') and event['frameId'] != self.frame_id:
+            return
+        filename = event.get('suggestedFilename', '')
+        if not self.pattern.search(filename):
+            return
+        info = DownloadInfo(
+            guid=event['guid'],
+            suggested_filename=filename,
+            url=event.get('url', ''),
+            began_after=self._elapsed()
+        )
+        self.downloads[info.guid] = info
+        if not self._began.done():
+            self._began.set_result(info)
+
+    def _on_progress(self, event: Dict):
+        info = self.downloads.get(event.get('guid'))
+        if info is None:
+            return
+        info.state = event.get('state', info.state)
+        info.received_bytes = int(event.get('receivedBytes', info.received_bytes))
+        info.total_bytes = int(event.get('totalBytes', info.total_bytes))
+        if info.state == 'completed':
+            info.completed_after = self._elapsed()
+            info.path = os.path.join(self.downloads_folder, info.suggested_filename)
+            if not self._completed.done():
+                self._completed.set_result(info)
+        elif info.state == 'canceled' and not self._completed.done():
+            self._completed.set_exception(RuntimeError(f"下载被取消: {info.suggested_filename}"))
+
+    async def wait_began(self, timeout: float = 30.0) -> WaitResult:
+        """等待匹配的下载开始"""
+        try:
+            info = await asyncio.wait_for(asyncio.shield(self._began), timeout)
+        except asyncio.TimeoutError:
+            raise WaitTimeout('下载开始', self._elapsed())
+        return WaitResult(info, info.began_after)
+
+    async def _watch_folder(self) -> DownloadInfo:
+        """等待目录监视器报告最终文件"""
+        completed = await self.watcher.next()
+        began = next((info for info in self.downloads.values()
+                      if info.suggested_filename == completed.name), None)
+        return DownloadInfo(
+            guid=began.guid if began else '',
+            suggested_filename=completed.name,
+            url=began.url if began else '',
+            state='completed',
+            received_bytes=completed.size,
+            total_bytes=completed.size,
+            path=completed.path,
+            sha256=completed.sha256,
+            began_after=began.began_after if began else None,
+            completed_after=completed.since_click
+        )
+
+    async def wait(self, timeout: float = 30.0) -> WaitResult:
+        """等待字幕文件写入磁盘，返回 DownloadInfo（含大小和 SHA-256）和实际耗时"""
+        watch_task = asyncio.ensure_future(self._watch_folder())
+        try:
+            done, _ = await asyncio.wait(
+                [asyncio.shield(self._completed), watch_task],
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise WaitTimeout('下载完成', self._elapsed())
+            info = done.pop().result()
+            if not os.path.exists(info.path):
+                # CDP 报告完成时文件可能尚未改名（或因重名被加上 " (1)" 后缀），交给目录监视器确认
+                try:
+                    info = await asyncio.wait_for(watch_task, max(0.0, timeout - self._elapsed()))
+                except asyncio.TimeoutError:
+                    raise WaitTimeout('文件落盘', self._elapsed())
+            if info.sha256 is None:
+                info.sha256 = await asyncio.get_event_loop().run_in_executor(None, sha256_file, info.path)
+                info.received_bytes = info.total_bytes = os.path.getsize(info.path)
+            if info.completed_after is None:
+                info.completed_after = self._elapsed()
+            logger.info(f"下载完成: {info.suggested_filename}, 耗时 {info.completed_after:.2f}s")
+            return WaitResult(info, info.completed_after)
+        finally:
+            watch_task.cancel()
+            self.stop()
+
+
+# 表示操作结束的状态 class / 文本
+TERMINAL_CLASS_PATTERN = 'success|error'
+TERMINAL_TEXT_PATTERN = '成功|错误|无效|失败|找不到'
+
+# 在页面中安装 #status 的 MutationObserver，进入结束状态时 resolve
+_ARM_STATUS_JS = '''(classPattern, textPattern) => {
+    const el = document.querySelector('#status');
+    if (!el) {
+        window.__statusChange = Promise.reject(new Error('no #status'));
+        window.__statusChange.catch(() => {});
+        return false;
+    }
+    const classRe = new RegExp(classPattern);
+    const textRe = new RegExp(textPattern);
+    window.__statusChange = new Promise((resolve) => {
+        const observer = new MutationObserver(() => {
+            const now = {text: el.textContent, className: el.className};
+            if (now.text && (classRe.test(now.className) || textRe.test(now.text))) {
+                observer.disconnect();
+                resolve(now);
+            }
+        });
+        observer.observe(el, {attributes: true, attributeFilter: ['class'],
+                              childList: true, characterData: true, subtree: true});
+    });
+    return true;
+}'''
+
+
+class StatusWatcher:
+    """监听 #status 元素的 class / 文本变化，直到进入结束状态
+
+    需要在触发操作之前调用 arm()，之后再调用 wait()。
+    """
+
+    def __init__(self, page: Any,
+                 class_pattern: str = TERMINAL_CLASS_PATTERN,
+                 text_pattern: str = TERMINAL_TEXT_PATTERN):
+        self.page = page
+        self.class_pattern = class_pattern
+        self.text_pattern = text_pattern
+        self._armed_at = 0.0
+
+    async def arm(self):
+        """在页面中安装 MutationObserver"""
+        armed = await self.page.evaluate(_ARM_STATUS_JS, self.class_pattern, self.text_pattern)
+        if not armed:
+            raise RuntimeError("无法找到状态元素")
+        self._armed_at = time.perf_counter()
+        return self
+
+    async def wait(self, timeout: float = 30.0) -> WaitResult:
+        """等待状态变化，返回 {'text', 'className'} 和实际耗时"""
+        try:
+            status = await asyncio.wait_for(
+                self.page.evaluate('() => window.__statusChange'), timeout)
+        except asyncio.TimeoutError:
+            raise WaitTimeout('状态变化', time.perf_counter() - self._armed_at)
+        elapsed = time.perf_counter() - self._armed_at
+        logger.info(f"状态变化: {status.get('text')}, 耗时 {elapsed:.2f}s")
+        return WaitResult(status, elapsed)
+
+
+@dataclass
+class HttpError:
+    """一次需要退避的响应：429 / 5xx 和 Retry-After（秒）"""
+    url: str
+    status: int
+    retry_after: Optional[float] = None
+
+
+class ResponseWatcher:
+    """记录选项页和扩展 service worker 收到的 429 / 5xx 响应
+
+    扩展的请求可能由 service worker 发出，需要单独附加到它的 target。
+    """
+
+    def __init__(self, browser: Any, page: Any):
+        self.browser = browser
+        self.page = page
+        self.errors: List[HttpError] = []
+        self._worker_session = None
+
+    def _on_response(self, event: Dict):
+        response = event.get('response', {})
+        status = response.get('status')
+        if not retryable_status(status):
+            return
+        headers = {name.lower(): value for name, value in response.get('headers', {}).items()}
+        self.errors.append(HttpError(response.get('url', ''), status,
+                                     parse_retry_after(headers.get('retry-after'))))
+
+    async def start(self) -> 'ResponseWatcher':
+        client = self.page._client
+        client.on('Network.responseReceived', self._on_response)
+        await client.send('Network.enable')
+        target = extension_worker_target(self.browser)
+        if target is not None:
+            try:
+                self._worker_session = await target.createCDPSession()
+                self._worker_session.on('Network.responseReceived', self._on_response)
+                await self._worker_session.send('Network.enable')
+            except Exception as e:
+                logger.warning(f"⚠️ 无法附加到扩展 service worker: {e}")
+                self._worker_session = None
+        return self
+
+    async def stop(self) -> Optional[HttpError]:
+        """停止监听，返回等待时间最长的错误（没有则返回 None）"""
+        self.page._client.remove_listener('Network.responseReceived', self._on_response)
+        if self._worker_session is not None:
+            try:
+                await self._worker_session.detach()
+            except Exception:
+                pass
+            self._worker_session = None
+        if not self.errors:
+            return None
+        return max(self.errors, key=lambda error: (error.retry_after or 0, error.status == 429))
+
+
+async def navigate_and_wait_load(page: Any, url: str, timeout: float = 10.0) -> WaitResult:
+    """导航到 url 并等待 Page.loadEventFired，返回响应是否成功和实际耗时"""
+    loop = asyncio.get_event_loop()
+    loaded = loop.create_future()
+
+    def on_load(event):
+        if not loaded.done():
+            loaded.set_result(event)
+
+    client = page._client
+    client.on('Page.loadEventFired', on_load)
+    started = time.perf_counter()
+    try:
+        result = await client.send('Page.navigate', {'url': url})
+        if result.get('errorText'):
+            raise RuntimeError(f"打开页面失败: {result['errorText']}")
+        await asyncio.wait_for(loaded, timeout)
+    except asyncio.TimeoutError:
+        raise WaitTimeout(f'页面加载 {url}', time.perf_counter() - started)
+    finally:
+        client.remove_listener('Page.loadEventFired', on_load)
+    elapsed = time.perf_counter() - started
+    logger.info(f"页面加载完成: {url}, 耗时 {elapsed:.2f}s")
+    return WaitResult(url, elapsed)
@@ -0,0 +1,117 @@
+import os
+from dataclasses import dataclass, field
+from typing import List
+
+import pytest
+import pytest_asyncio
+
+from browser_pool import BrowserPool, CHROME_PATH
+from fixture_server import FixtureServer, make_self_signed_context
+from profile_template import ensure_template
+from scenarios import DEFAULT_WORKERS, DEFAULT_CASE_TIMEOUT, run_cases
+from test_download import create_test_context, cleanup_context
+
+# test_download.py 是 run_tests 和各个工具使用的下载流程，不是 pytest 测试模块
+collect_ignore = ['test_download.py']
+
+# 本次会话选中的场景ID，收集结束后记录，由 scenario_results 一次性并行运行
+SELECTED_CASES = pytest.StashKey[list]()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('ytsd', '扩展端到端测试')
+    group.addoption('--workers', type=int, default=DEFAULT_WORKERS,
+                    help='并行运行场景的页面数（环境变量 YTSD_WORKERS）')
+    group.addoption('--case-timeout', type=float, default=DEFAULT_CASE_TIMEOUT,
+                    help='单个场景的超时（秒）')
+    group.addoption('--offline', action='store_true', default=os.environ.get('YTSD_OFFLINE') == '1',
+                    help='使用本地夹具服务器代替 YouTube（环境变量 YTSD_OFFLINE=1）')
+    group.addoption('--run-manual', action='store_true', help='运行需要人工观察的测试')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'manual: 需要人工观察的测试，默认跳过（--run-manual 运行）')
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getoption('run_manual'):
+        skip_manual = pytest.mark.skip(reason='需要人工观察，使用 --run-manual 运行')
+        for item in items:
+            if 'manual' in item.keywords:
+                item.add_marker(skip_manual)
+    config.stash[SELECTED_CASES] = [item.callspec.params['case'] for item in items
+                                    if 'case' in getattr(getattr(item, 'callspec', None), 'params', {})]
+
+
+@dataclass
+class FakeContexts:
+    """假上下文的借用记录：当前借出的上下文和同时借出的最大数量"""
+    active: List[int] = field(default_factory=list)
+    peak: int = 0
+    created: int = 0
+
+
+@pytest.fixture
+def fake_downloads(monkeypatch):
+    """用给定的假下载函数替换模块中的上下文创建、清理和下载，不启动浏览器
+
+    返回 install(module, download)，调用后返回记录上下文借用情况的 FakeContexts。
+    """
+    contexts = FakeContexts()
+
+    async def fake_create_test_context(pool=None, **kwargs):
+        contexts.created += 1
+        contexts.active.append(contexts.created)
+        contexts.peak = max(contexts.peak, len(contexts.active))
+        return contexts.created
+
+    async def fake_cleanup_context(context):
+        contexts.active.remove(context)
+
+    def install(module, download) -> FakeContexts:
+        monkeypatch.setattr(module, 'create_test_context', fake_create_test_context)
+        monkeypatch.setattr(module, 'cleanup_context', fake_cleanup_context)
+        monkeypatch.setattr(module, 'download_subtitles', download)
+        return contexts
+
+    return install
+
+
+@pytest_asyncio.fixture(scope='session', loop_scope='session')
+async def fixture_server(request):
+    """离线模式下的本地夹具服务器，否则为 None"""
+    if not request.config.getoption('offline'):
+        yield None
+        return
+    server = await FixtureServer(ssl_context=make_self_signed_context()).start()
+    yield server
+    await server.close()
+
+
+@pytest_asyncio.fixture(scope='session', loop_scope='session')
+async def browser_pool(request, fixture_server):
+    """整个会话共用的一个浏览器，页面数与 --workers 相同"""
+    if not os.path.exists(CHROME_PATH):
+        pytest.skip(f'未找到 Chrome: {CHROME_PATH}')
+    pool = BrowserPool(size=1, headless=False, fixture_server=fixture_server,
+                       pages_per_browser=max(1, request.config.getoption('workers')),
+                       profile_template=await ensure_template())
+    await pool.start()
+    yield pool
+    await pool.close()
+
+
+@pytest_asyncio.fixture(scope='session', loop_scope='session')
+async def scenario_results(request, browser_pool):
+    """第一次使用时并行运行所有选中的场景，返回按场景ID索引的结果"""
+    return await run_cases(browser_pool, request.config.stash.get(SELECTED_CASES, []),
+                           workers=request.config.getoption('workers'),
+                           timeout=request.config.getoption('case_timeout'))
+
+
+@pytest_asyncio.fixture(loop_scope='session')
+async def context(browser_pool):
+    """从会话的浏览器池借用一个页面"""
+    context = await create_test_context(pool=browser_pool)
+    yield context
+    await cleanup_context(context)
@@ -0,0 +1,377 @@
+import argparse
+import base64
+import hashlib
+import html
+import json
+import os
+import random
+import shutil
+import logging
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Iterator, IO, Tuple
+
+from subtitle_engine import Cue, format_timestamp, iter_cues, WRITERS as ENGINE_WRITERS
+
+logger = logging.getLogger(__name__)
+
+# 合成字幕夹具的默认目录，结构与 fixtures/youtube 相同，可以直接交给 FixtureServer
+CORPUS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'synthetic'))
+
+# 字幕风格：
+#   rolling      自动字幕风格，短行、无标点
+#   manual       手动字幕风格，完整句子
+#   cjk          中日文，无空格
+#   rtl          阿拉伯文 / 希伯来文
+#   pathological 零长度字幕、重叠、超长单条字幕、需要转义的字符和 emoji
+STYLES = ('rolling', 'manual', 'cjk', 'rtl', 'pathological')
+
+# 生成的 timedtext 格式
+FORMATS = ('json3', 'srv3', 'vtt')
+
+# 每种风格的语言代码
+STYLE_LANGS = {'rolling': 'en', 'manual': 'en', 'cjk': 'zh-Hans', 'rtl': 'ar', 'pathological': 'en'}
+
+_EN_WORDS = (
+    'the video shows how we can build a small tool that downloads subtitles from any channel '
+    'and converts them into plain text so you can read search and translate every word later '
+    'today we are going to look at the options page the service worker and the download flow '
+    'first make sure the extension is loaded then paste a link and press the button'
+).split()
+_ZH_CHARS = '我们今天来看一下这个扩展如何下载字幕并转换为文本格式然后保存到本地文件夹里面每一个视频都有自动生成的字幕'
+_JA_WORDS = ('字幕', 'を', 'ダウンロード', 'します', '自動', '生成', 'された', 'テキスト', 'です', '。')
+_AR_WORDS = ('هذا', 'الفيديو', 'يشرح', 'كيفية', 'تنزيل', 'الترجمة', 'من', 'يوتيوب', 'إلى', 'ملف', 'نصي')
+_HE_WORDS = ('הסרטון', 'מסביר', 'איך', 'להוריד', 'כתוביות', 'לקובץ', 'טקסט')
+_TRICKY = ('<b>bold</b>', 'AT&T', '&amp;', 'a --> b', '"quoted"', "it's", '😀', '👩‍💻', '​', '𝒳')
+
+# 超长单条字幕的大小（字符）
+HUGE_CUE_CHARS = 64 * 1024
+
+
+@dataclass
+class CorpusSpec:
+    """一个合成视频的参数"""
+    style: str
+    duration_s: int
+    cues_per_minute: float = 20.0
+    seed: int = 0
+
+    @property
+    def video_id(self) -> str:
+        """由参数决定的 11 位视频ID"""
+        digest = hashlib.sha1(json.dumps(asdict(self), sort_keys=True).encode('utf-8')).digest()
+        return 'S' + base64.urlsafe_b64encode(digest).decode('ascii')[:10]
+
+    @property
+    def lang(self) -> str:
+        return STYLE_LANGS[self.style]
+
+    @property
+    def cue_count(self) -> int:
+        return max(1, int(self.duration_s / 60 * self.cues_per_minute))
+
+
+def _line(rng: random.Random, style: str) -> str:
+    if style == 'rolling':
+        return ' '.join(rng.choice(_EN_WORDS) for _ in range(rng.randint(3, 8)))
+    if style == 'cjk':
+        if rng.random() < 0.3:
+            return ''.join(rng.choice(_JA_WORDS) for _ in range(rng.randint(4, 10)))
+        return ''.join(rng.choice(_ZH_CHARS) for _ in range(rng.randint(6, 18))) + '。'
+    if style == 'rtl':
+        words = _AR_WORDS if rng.random() < 0.7 else _HE_WORDS
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(4, 10)))
+        # 偶尔混入从左到右的数字和拉丁文
+        return text + (f' {rng.randint(1, 2024)} YouTube' if rng.random() < 0.2 else '')
+    words = [rng.choice(_EN_WORDS) for _ in range(rng.randint(5, 14))]
+    if style == 'pathological' and rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice(_TRICKY))
+    sentence = ' '.join(words)
+    if style == 'manual' and rng.random() < 0.25:
+        # 手动字幕偶尔分两行
+        middle = len(words) // 2
+        sentence = ' '.join(words[:middle]) + '\n' + ' '.join(words[middle:])
+    return sentence[0].upper() + sentence[1:] + '.'
+
+
+def generate_cues(spec: CorpusSpec) -> Iterator[Cue]:
+    """按参数确定性地生成字幕，开始时间单调不减"""
+    rng = random.Random(f'{spec.style}:{spec.duration_s}:{spec.cues_per_minute}:{spec.seed}')
+    count = spec.cue_count
+    interval = spec.duration_s * 1000 / count
+    huge_index = count // 2 if spec.style == 'pathological' else -1
+    for index in range(count):
+        start = int(index * interval)
+        text = _line(rng, spec.style)
+        if spec.style == 'rolling':
+            # 自动字幕相邻两条互相重叠
+            end = int(start + interval * 1.6)
+        else:
+            end = int(start + interval * rng.uniform(0.6, 0.95))
+        if spec.style == 'pathological':
+            roll = rng.random()
+            if index == huge_index:
+                text = '\n'.join(_line(rng, 'manual') for _ in range(HUGE_CUE_CHARS // 60))
+                end = start + int(interval * 3)
+            elif roll < 0.1:
+                end = start
+            elif roll < 0.2:
+                end = int(start + interval * rng.uniform(1.5, 4))
+            elif roll < 0.25 and index:
+                # 与上一条开始时间相同
+                start = int((index - 1) * interval)
+        yield Cue(start, max(start, end), text)
+
+
+# ---- 写出 ----
+
+def _json_events_plain(cues: Iterator[Cue]) -> Iterator[Dict]:
+    for cue in cues:
+        yield {'tStartMs': cue.start_ms, 'dDurationMs': cue.end_ms - cue.start_ms,
+               'segs': [{'utf8': cue.text}]}
+
+
+def _word_offsets(cue: Cue, words: List[str]) -> List[int]:
+    step = max(1, (cue.end_ms - cue.start_ms) // max(1, len(words)) // 2)
+    return [i * step for i in range(len(words))]
+
+
+def _json_events_rolling(cues: Iterator[Cue]) -> Iterator[Dict]:
+    """自动字幕的 json3：逐词 segs + tOffsetMs，行之间插入 aAppend 换行事件"""
+    yield {'tStartMs': 0, 'dDurationMs': 0, 'id': 1, 'wpWinPosId': 1, 'wsWinStyleId': 1}
+    for index, cue in enumerate(cues):
+        if index:
+            # 新的一行开始时上一行上移
+            yield {'tStartMs': cue.start_ms, 'dDurationMs': 10, 'wWinId': 1, 'aAppend': 1,
+                   'segs': [{'utf8': '\n'}]}
+        words = cue.text.split()
+        offsets = _word_offsets(cue, words)
+        segs = [{'utf8': words[0], 'acAsrConf': 0}] + [
+            {'utf8': f' {word}', 'tOffsetMs': offset, 'acAsrConf': 0}
+            for word, offset in zip(words[1:], offsets[1:])]
+        yield {'tStartMs': cue.start_ms, 'dDurationMs': cue.end_ms - cue.start_ms, 'wWinId': 1, 'segs': segs}
+
+
+def write_json3(cues: Iterator[Cue], fp: IO, rolling: bool = False) -> int:
+    """逐条写出 YouTube json3"""
+    fp.write('{"wireMagic":"pb3","pens":[{}],"wsWinStyles":[{}],"wpWinPositions":[{}],"events":[\n')
+    count = 0
+    events = _json_events_rolling(cues) if rolling else _json_events_plain(cues)
+    for index, event in enumerate(events):
+        fp.write((',\n' if index else '') + json.dumps(event, ensure_ascii=False, separators=(',', ':')))
+        count += 'segs' in event and not event.get('aAppend')
+    fp.write('\n]}\n')
+    return count
+
+
+def write_srv3(cues: Iterator[Cue], fp: IO, rolling: bool = False) -> int:
+    """逐条写出 YouTube srv3 XML"""
+    fp.write('<?xml version="1.0" encoding="utf-8" ?><timedtext format="3">\n<body>\n')
+    count = 0
+    for cue in cues:
+        duration = cue.end_ms - cue.start_ms
+        if rolling:
+            words = cue.text.split()
+            offsets = _word_offsets(cue, words)
+            spans = ''.join(
+                f'<s ac="0">{html.escape(word, quote=False)}</s>' if i == 0 else
+                f'<s t="{offset}" ac="0"> {html.escape(word, quote=False)}</s>'
+                for i, (word, offset) in enumerate(zip(words, offsets)))
+            if count:
+                fp.write(f'<p t="{cue.start_ms}" d="10" w="1" a="1">\n</p>\n')
+            fp.write(f'<p t="{cue.start_ms}" d="{duration}" w="1">{spans}</p>\n')
+        else:
+            fp.write(f'<p t="{cue.start_ms}" d="{duration}">{html.escape(cue.text, quote=False)}</p>\n')
+        count += 1
+    fp.write('</body>\n</timedtext>\n')
+    return count
+
+
+def _vtt_escape(text: str) -> str:
+    # WebVTT 字幕文本中 & < > 必须转义，否则 "-->" 会被当成时间行
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def write_vtt(cues: Iterator[Cue], fp: IO, rolling: bool = False) -> int:
+    """逐条写出 WebVTT；自动字幕使用 YouTube 的两行滚动窗口（上一行 + 当前行）"""
+    fp.write('WEBVTT\nKind: captions\nLanguage: en\n\n' if rolling else 'WEBVTT\n\n')
+    count = 0
+    previous = ''
+    for cue in cues:
+        text = _vtt_escape(cue.text).replace('\n\n', '\n')
+        if rolling:
+            text, previous = (f'{previous}\n{text}' if previous else text), text
+        fp.write(f'{format_timestamp(cue.start_ms)} --> {format_timestamp(cue.end_ms)}\n{text}\n\n')
+        count += 1
+    return count
+
+
+WRITERS = {'json3': write_json3, 'srv3': write_srv3, 'vtt': write_vtt}
+
+
+def _track(video_id: str, lang: str, asr: bool) -> Dict:
+    kind = '&kind=asr' if asr else ''
+    name = f'{lang} (auto-generated)' if asr else lang
+    return {
+        'baseUrl': (f'https://www.youtube.com/api/timedtext?v={video_id}&caps=asr&xoaf=5&hl=en'
+                    f'&expire=4102444800&sparams=ip%2Cipbits%2Cexpire%2Cv%2Ccaps%2Cxoaf'
+                    f'&signature=SYNTHETIC&key=yt8&lang={lang}{kind}'),
+        'name': {'simpleText': name},
+        'vssId': f'a.{lang}' if asr else f'.{lang}',
+        'languageCode': lang,
+        **({'kind': 'asr'} if asr else {}),
+        'isTranslatable': True,
+    }
+
+
+def generate_video(spec: CorpusSpec, root: str = CORPUS_DIR,
+                   formats: Tuple[str, ...] = FORMATS) -> str:
+    """生成一个合成视频的夹具：player.json、自动和手动两条轨道的各种格式，以及 corpus.json"""
+    video_id = spec.video_id
+    video_dir = os.path.join(root, video_id)
+    metadata_path = os.path.join(video_dir, 'corpus.json')
+    if os.path.exists(metadata_path):
+        return video_dir
+    tmp_dir = f'{video_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, 'timedtext'))
+
+    started = time.perf_counter()
+    sizes = {}
+    for asr in (True, False):
+        for fmt in formats:
+            name = f"{spec.lang}{'.asr' if asr else ''}.{fmt}"
+            with open(os.path.join(tmp_dir, 'timedtext', name), 'w', encoding='utf-8', newline='\n') as f:
+                WRITERS[fmt](generate_cues(spec), f, rolling=asr)
+            sizes[name] = os.path.getsize(os.path.join(tmp_dir, 'timedtext', name))
+
+    player = {
+        'playabilityStatus': {'status': 'OK'},
+        'videoDetails': {'videoId': video_id, 'title': f'Synthetic {spec.style} {spec.duration_s}s',
+                         'lengthSeconds': str(spec.duration_s), 'author': 'corpus'},
+        'captions': {'playerCaptionsTracklistRenderer': {
+            'captionTracks': [_track(video_id, spec.lang, True), _track(video_id, spec.lang, False)],
+            'audioTracks': [{'captionTrackIndices': [0, 1]}],
+            'translationLanguages': [{'languageCode': 'en', 'languageName': {'simpleText': 'English'}}],
+            'defaultAudioTrackIndex': 0,
+        }},
+    }
+    with open(os.path.join(tmp_dir, 'player.json'), 'w', encoding='utf-8') as f:
+        json.dump(player, f, ensure_ascii=False, indent=1)
+    with open(os.path.join(tmp_dir, 'corpus.json'), 'w', encoding='utf-8') as f:
+        json.dump({**asdict(spec), 'video_id': video_id, 'cue_count': spec.cue_count, 'sizes': sizes},
+                  f, ensure_ascii=False, indent=2)
+    shutil.rmtree(video_dir, ignore_errors=True)
+    os.replace(tmp_dir, video_dir)
+    logger.info(f"生成合成视频 {video_id} ({spec.style}, {spec.duration_s}s, {spec.cue_count} 条), "
+                f"耗时 {time.perf_counter() - started:.2f}s")
+    return video_dir
+
+
+def generate_corpus(styles: Tuple[str, ...] = STYLES,
+                    base_duration_s: int = 360,
+                    factors: Tuple[int, ...] = (1, 10, 100),
+                    cues_per_minute: float = 20.0,
+                    seed: int = 0,
+                    root: str = CORPUS_DIR) -> List[CorpusSpec]:
+    """生成 风格 × 时长倍数 的合成语料"""
+    specs = [CorpusSpec(style, base_duration_s * factor, cues_per_minute, seed)
+             for style in styles for factor in factors]
+    for spec in specs:
+        generate_video(spec, root)
+    return specs
+
+
+# ---- 规模测试 ----
+
+def measure_conversion(path: str, dst_format: str = 'srt') -> Dict:
+    """用参考实现转换一次，记录耗时和 Python 内存峰值"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, 'w', encoding='utf-8') as sink:
+            count = ENGINE_WRITERS[dst_format](iter_cues(path), sink)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'cues': count, 'bytes': os.path.getsize(path), 'seconds': elapsed, 'peak_bytes': peak}
+
+
+def linearity(points: List[Dict], key: str = 'seconds', size_key: str = 'cues') -> Optional[float]:
+    """最大输入与最小输入的单位成本之比，接近 1 说明线性扩展"""
+    points = [p for p in points if p[size_key]]
+    if len(points) < 2:
+        return None
+    smallest = min(points, key=lambda p: p[size_key])
+    largest = max(points, key=lambda p: p[size_key])
+    unit_small = smallest[key] / smallest[size_key]
+    return (largest[key] / largest[size_key]) / unit_small if unit_small else None
+
+
+def scaling_report(specs: List[CorpusSpec], root: str = CORPUS_DIR,
+                   src_format: str = 'json3', dst_format: str = 'srt', asr: bool = True) -> Dict:
+    """对每种风格测量不同长度下的转换时间和内存，并计算线性度"""
+    report = {}
+    for style in sorted({spec.style for spec in specs}):
+        points = []
+        for spec in sorted((s for s in specs if s.style == style), key=lambda s: s.duration_s):
+            name = f"{spec.lang}{'.asr' if asr else ''}.{src_format}"
+            point = measure_conversion(os.path.join(root, spec.video_id, 'timedtext', name), dst_format)
+            points.append({'video_id': spec.video_id, 'duration_s': spec.duration_s, **point})
+        report[style] = {
+            'points': points,
+            # 时间应与条数成正比；流式转换的内存峰值应基本不随长度增长
+            'time_linearity': linearity(points),
+            'memory_growth': (points[-1]['peak_bytes'] / points[0]['peak_bytes']
+                              if len(points) > 1 and points[0]['peak_bytes'] else None),
+        }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='生成合成字幕夹具并测量转换的规模扩展')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('generate', 'scaling'):
+        command = sub.add_parser(name)
+        command.add_argument('--styles', nargs='+', default=list(STYLES), choices=STYLES)
+        command.add_argument('--base-duration', type=int, default=360, help='1 倍长度（秒）')
+        command.add_argument('--factors', nargs='+', type=int, default=[1, 10, 100])
+        command.add_argument('--density', type=float, default=20.0, help='每分钟字幕条数')
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--root', default=CORPUS_DIR)
+    scaling = sub.choices['scaling']
+    scaling.add_argument('--to', dest='dst_format', default='srt', choices=['vtt', 'srt', 'txt'])
+    scaling.add_argument('--output', help='结果 JSON 路径')
+    scaling.add_argument('--max-ratio', type=float, default=1.5, help='单位耗时之比超过该值时返回非零')
+    args = parser.parse_args(argv)
+
+    specs = generate_corpus(tuple(args.styles), args.base_duration, tuple(args.factors),
+                            args.density, args.seed, args.root)
+    if args.command == 'generate':
+        for spec in specs:
+            logger.info(f"{spec.video_id}: {spec.style} {spec.duration_s}s {spec.cue_count} 条")
+        return 0
+
+    report = scaling_report(specs, args.root, dst_format=args.dst_format)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    failed = False
+    for style, result in report.items():
+        ratio = result['time_linearity']
+        for point in result['points']:
+            logger.info(f"{style} {point['duration_s']}s: {point['cues']} 条, {point['bytes'] / 1024:.0f}KB, "
+                        f"{point['seconds']:.3f}s, 峰值 {point['peak_bytes'] / 1024:.0f}KB")
+        if ratio is not None and ratio > args.max_ratio:
+            logger.error(f"❌ {style} 不是线性扩展: 单位耗时之比 {ratio:.2f}")
+            failed = True
+        else:
+            logger.info(f"✓ {style} 单位耗时之比 {ratio if ratio is None else round(ratio, 2)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    exit(main())
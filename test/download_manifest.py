@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# 刷新时输出文件的状态
+ADDED = 'added'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outputs (
+    video_id TEXT NOT NULL,
+    track TEXT NOT NULL,
+    format TEXT NOT NULL,
+    source_sha256 TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    output_path TEXT NOT NULL,
+    output_sha256 TEXT NOT NULL,
+    output_size INTEGER NOT NULL,
+    cue_count INTEGER NOT NULL,
+    checked_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (video_id, track, format)
+);
+'''
+
+
+@dataclass
+class ManifestRow:
+    """一个输出文件的记录：上游字幕的指纹和写出的文件"""
+    video_id: str
+    track: str
+    format: str
+    source_sha256: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    output_path: str
+    output_sha256: str
+    output_size: int
+    cue_count: int
+    checked_at: int = 0
+    updated_at: int = 0
+
+    def output_intact(self) -> bool:
+        """输出文件仍然存在且大小未变（不重新计算哈希）"""
+        try:
+            return os.path.getsize(self.output_path) == self.output_size
+        except OSError:
+            return False
+
+
+class DownloadManifest:
+    """本地 SQLite 清单，按 (视频ID, 轨道, 格式) 记录上游指纹和输出文件，用于增量刷新"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def get(self, video_id: str, track: str) -> Dict[str, ManifestRow]:
+        """一条轨道所有格式的记录，按格式索引"""
+        rows = self._db.execute(
+            'SELECT video_id, track, format, source_sha256, etag, last_modified, output_path, '
+            'output_sha256, output_size, cue_count, checked_at, updated_at '
+            'FROM outputs WHERE video_id = ? AND track = ?', (video_id, track)).fetchall()
+        return {row[2]: ManifestRow(*row) for row in rows}
+
+    def put(self, row: ManifestRow):
+        now = time.time_ns()
+        row.checked_at = row.updated_at = now
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO outputs(video_id, track, format, source_sha256, etag, last_modified, '
+                'output_path, output_sha256, output_size, cue_count, checked_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (row.video_id, row.track, row.format, row.source_sha256, row.etag, row.last_modified,
+                 row.output_path, row.output_sha256, row.output_size, row.cue_count, now, now))
+
+    def touch(self, video_id: str, track: str, formats: Iterable[str], source_sha256: str,
+              etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """上游内容没有变化：更新这些格式中内容哈希与 source_sha256 一致的记录的检查时间和验证信息
+
+        其他格式或仍是旧内容的记录不更新，否则它们会带着新的验证信息在下次刷新时被误判为未变化。
+        """
+        formats = list(formats)
+        if not formats:
+            return
+        with self._db:
+            self._db.execute(
+                'UPDATE outputs SET checked_at = ?, etag = COALESCE(?, etag), '
+                'last_modified = COALESCE(?, last_modified) WHERE video_id = ? AND track = ? '
+                f"AND source_sha256 = ? AND format IN ({', '.join('?' * len(formats))})",
+                (time.time_ns(), etag, last_modified, video_id, track, source_sha256, *formats))
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM outputs').fetchone()[0]
+
+    def rows(self) -> List[ManifestRow]:
+        return [ManifestRow(*row) for row in self._db.execute(
+            'SELECT video_id, track, format, source_sha256, etag, last_modified, output_path, '
+            'output_sha256, output_size, cue_count, checked_at, updated_at '
+            'FROM outputs ORDER BY video_id, track, format')]
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
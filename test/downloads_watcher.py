@@ -0,0 +1,200 @@
+import asyncio
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import re
+import struct
+import sys
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Set, Pattern, List
+
+logger = logging.getLogger(__name__)
+
+# 字幕文件名，兼容 Chrome 处理重名时添加的 " (1)" 后缀
+SUBTITLE_RE = re.compile(r'_subtitles(?: \(\d+\))?\.[A-Za-z0-9]+$')
+
+# Chrome 下载中的临时文件后缀
+PARTIAL_SUFFIXES = ('.crdownload', '.tmp', '.part')
+
+# 计算哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+@dataclass
+class CompletedDownload:
+    """一个已经改名为最终文件名的下载"""
+    path: str
+    size: int
+    sha256: str
+    since_click: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+
+def sha256_file(path: str) -> str:
+    """流式计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def subtitle_files(folder: str, pattern: Pattern = SUBTITLE_RE) -> List[str]:
+    """列出目录中已完成的字幕文件（含重名后缀的文件，不含 .crdownload）"""
+    with os.scandir(folder) as entries:
+        return [entry.path for entry in entries
+                if entry.is_file() and not entry.name.endswith(PARTIAL_SUFFIXES)
+                and pattern.search(entry.name)]
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DownloadsWatcher:
+    """下载目录监视器：Linux 上使用 inotify，其他平台轮询
+
+    Chrome 把 .crdownload 改名为最终文件名（或直接写完文件）时立即产生完成事件，
+    事件中包含文件大小、SHA-256 和距离点击的时间，不需要反复扫描整个目录。
+    """
+
+    def __init__(self, folder: str,
+                 pattern: Pattern = SUBTITLE_RE,
+                 use_inotify: Optional[bool] = None,
+                 poll_interval: float = 0.1):
+        self.folder = folder
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self._libc = _load_libc() if use_inotify in (None, True) else None
+        if use_inotify and self._libc is None:
+            raise OSError("当前平台不支持 inotify")
+        self._fd: Optional[int] = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._seen: Set[str] = set()
+        self._clicked_at: Optional[float] = None
+        self._loop = None
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def start(self):
+        """开始监视，已有的文件不会产生事件"""
+        self._loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue()
+        os.makedirs(self.folder, exist_ok=True)
+        self._seen = set(self._matching_names())
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0 or self._libc.inotify_add_watch(
+                    fd, os.fsencode(self.folder), IN_CLOSE_WRITE | IN_MOVED_TO | IN_Q_OVERFLOW) < 0:
+                errno = ctypes.get_errno()
+                if fd >= 0:
+                    os.close(fd)
+                logger.warning(f"inotify 初始化失败 (errno={errno})，改用轮询")
+            else:
+                self._fd = fd
+                self._loop.add_reader(fd, self._on_readable)
+        if self._fd is None:
+            self._poll_task = asyncio.ensure_future(self._poll())
+        return self
+
+    def close(self):
+        """停止监视"""
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def mark_click(self, at: Optional[float] = None):
+        """记录点击下载按钮的时间，之后的事件会报告距离点击的耗时"""
+        self._clicked_at = time.perf_counter() if at is None else at
+
+    def _is_final(self, name: str) -> bool:
+        return not name.endswith(PARTIAL_SUFFIXES) and bool(self.pattern.search(name))
+
+    def _matching_names(self):
+        with os.scandir(self.folder) as entries:
+            return [entry.name for entry in entries if entry.is_file() and self._is_final(entry.name)]
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出时才补扫一次目录
+                logger.warning("inotify 事件队列溢出，补扫下载目录")
+                for missed in self._matching_names():
+                    self._found(missed)
+            elif name:
+                self._found(name)
+
+    async def _poll(self):
+        while True:
+            for name in self._matching_names():
+                self._found(name)
+            await asyncio.sleep(self.poll_interval)
+
+    def _found(self, name: str):
+        if name in self._seen or not self._is_final(name):
+            return
+        self._seen.add(name)
+        since_click = None if self._clicked_at is None else time.perf_counter() - self._clicked_at
+        asyncio.ensure_future(self._complete(os.path.join(self.folder, name), since_click))
+
+    async def _complete(self, path: str, since_click: Optional[float]):
+        try:
+            size = os.path.getsize(path)
+            digest = await self._loop.run_in_executor(None, sha256_file, path)
+        except OSError as e:
+            logger.warning(f"读取下载文件失败: {path}: {e}")
+            return
+        self._queue.put_nowait(CompletedDownload(path, size, digest, since_click))
+
+    async def next(self, timeout: Optional[float] = None) -> CompletedDownload:
+        """等待下一个完成的下载"""
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> CompletedDownload:
+        return await self.next()
@@ -0,0 +1,68 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import logging
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _id_from_bytes(data: bytes) -> str:
+    """Chrome 的扩展ID算法：SHA-256 的前 16 字节，每个十六进制位映射到 a-p"""
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    return ''.join(chr(ord('a') + int(c, 16)) for c in digest)
+
+
+def id_from_key(key: str) -> str:
+    """根据 manifest.json 中的 key（base64 编码的公钥）计算扩展ID"""
+    return _id_from_bytes(base64.b64decode(key))
+
+
+def id_from_path(extension_path: str, platform: str = sys.platform) -> str:
+    """根据解压扩展的绝对路径计算扩展ID（与 Chrome 加载 --load-extension 时一致）"""
+    # Chrome 会先把 --load-extension 的路径解析为真实的绝对路径（展开符号链接）
+    path = os.path.realpath(extension_path) if platform == sys.platform else extension_path
+    if platform.startswith('win'):
+        # Windows 上 Chrome 会把盘符转成大写，并对 UTF-16 路径做哈希
+        if len(path) > 1 and path[1] == ':':
+            path = path[0].upper() + path[1:]
+        return _id_from_bytes(path.encode('utf-16-le'))
+    return _id_from_bytes(path.encode('utf-8'))
+
+
+def load_manifest(extension_path: str) -> dict:
+    """读取扩展的 manifest.json"""
+    with open(os.path.join(extension_path, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def resolve_extension_id(extension_path: str) -> str:
+    """计算扩展ID：优先使用 manifest 中固定的 key，否则使用解压路径；每个会话只计算一次"""
+    manifest = load_manifest(extension_path)
+    if manifest.get('key'):
+        extension_id = id_from_key(manifest['key'])
+        logger.info(f"根据 manifest key 计算扩展ID: {extension_id}")
+    else:
+        extension_id = id_from_path(extension_path)
+        logger.info(f"根据扩展路径计算扩展ID: {extension_id}")
+    return extension_id
+
+
+@lru_cache(maxsize=None)
+def options_page_path(extension_path: str) -> Optional[str]:
+    """manifest 中声明的选项页面路径"""
+    manifest = load_manifest(extension_path)
+    return manifest.get('options_ui', {}).get('page') or manifest.get('options_page')
+
+
+def options_page_url(extension_path: str, extension_id: Optional[str] = None) -> str:
+    """扩展选项页面的完整 URL"""
+    extension_id = extension_id or resolve_extension_id(extension_path)
+    page = options_page_path(extension_path)
+    if not page:
+        raise ValueError(f"manifest 中没有声明选项页面: {extension_path}")
+    return f'chrome-extension://{extension_id}/{page.lstrip("/")}'
@@ -0,0 +1,462 @@
+import asyncio
+import argparse
+import hashlib
+import json
+import os
+import re
+import ssl
+import logging
+import subprocess
+import tempfile
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Dict, List, Tuple
+from urllib.parse import urlsplit, parse_qs, quote, urlencode
+
+logger = logging.getLogger(__name__)
+
+# 默认的夹具目录：每个视频一个子目录，包含 player.json 和 timedtext/<lang>[.asr].<fmt>
+FIXTURES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'fixtures', 'youtube'))
+
+# 需要被映射到本地服务器的域名
+YOUTUBE_HOSTS = ['www.youtube.com', 'youtube.com', 'm.youtube.com', 'video.google.com',
+                 'youtu.be', 'www.youtu.be']
+
+# 短链接域名：/<视频ID> 像 YouTube 一样重定向到观看页
+SHORT_LINK_HOSTS = ('youtu.be', 'www.youtu.be')
+
+# 支持的 timedtext 格式及其 Content-Type
+TIMEDTEXT_FORMATS = {
+    'json3': 'application/json; charset=UTF-8',
+    'vtt': 'text/vtt; charset=UTF-8',
+    'srv3': 'text/xml; charset=UTF-8',
+}
+
+REASONS = {200: 'OK', 204: 'No Content', 303: 'See Other', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           429: 'Too Many Requests', 500: 'Internal Server Error', 502: 'Bad Gateway',
+           503: 'Service Unavailable'}
+
+
+@dataclass
+class RouteBehavior:
+    """单个路由的网络行为：延迟、带宽限制和错误注入"""
+    latency: float = 0.0                 # 首字节前的延迟（秒）
+    bandwidth: Optional[int] = None      # 每秒字节数，None 表示不限速
+    status: Optional[int] = None         # 注入的错误状态码，例如 429 / 503
+    fail_times: Optional[int] = None     # 只让前 N 次请求失败，None 表示一直失败
+    retry_after: Optional[float] = None  # 错误响应中的 Retry-After 头
+    truncate: Optional[float] = None     # 只发送响应体的这一比例后断开连接
+    hits: int = 0
+
+    def should_fail(self) -> bool:
+        """本次请求是否应注入错误"""
+        if self.status is None:
+            return False
+        return self.fail_times is None or self.hits <= self.fail_times
+
+
+@dataclass
+class Response:
+    """待发送的响应"""
+    status: int
+    body: bytes
+    content_type: str = 'text/plain; charset=UTF-8'
+    headers: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Request:
+    """解析后的 HTTP 请求"""
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+
+
+def track_filename(lang: str, kind: Optional[str], fmt: str) -> str:
+    """timedtext 夹具文件名，例如 en.asr.json3"""
+    return f"{lang}{'.asr' if kind == 'asr' else ''}.{fmt}"
+
+
+class FixtureServer:
+    """离线的 YouTube 替身服务器，从夹具目录提供观看页、字幕轨道列表和 timedtext"""
+
+    def __init__(self,
+                 fixtures_dir: str = FIXTURES_DIR,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 ssl_context: Optional[ssl.SSLContext] = None):
+        self.fixtures_dir = fixtures_dir
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.routes: Dict[str, RouteBehavior] = {}
+        self.request_log: List[Tuple[float, str, str, int]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    # ---- 配置 ----
+
+    def configure(self, route: str, **kwargs) -> RouteBehavior:
+        """设置路由行为，route 为 'watch' / 'player' / 'tracklist' / 'timedtext' 或 '*'"""
+        behavior = RouteBehavior(**kwargs)
+        self.routes[route] = behavior
+        return behavior
+
+    def reset(self):
+        """清除所有路由行为和请求记录"""
+        self.routes.clear()
+        self.request_log.clear()
+
+    def behavior_for(self, route: str) -> RouteBehavior:
+        return self.routes.get(route) or self.routes.get('*') or RouteBehavior()
+
+    @property
+    def scheme(self) -> str:
+        return 'https' if self.ssl_context else 'http'
+
+    @property
+    def origin(self) -> str:
+        return f'{self.scheme}://{self.host}:{self.port}'
+
+    def chrome_args(self) -> List[str]:
+        """让 Chrome 把 YouTube 域名解析到本服务器的启动参数"""
+        rules = ','.join(f'MAP {host} {self.host}:{self.port}' for host in YOUTUBE_HOSTS)
+        args = [f'--host-resolver-rules={rules}']
+        if self.ssl_context:
+            args.append('--ignore-certificate-errors')
+        return args
+
+    # ---- 生命周期 ----
+
+    async def start(self):
+        """启动服务器，port 为 0 时自动分配端口"""
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"夹具服务器已启动: {self.origin} ({self.fixtures_dir})")
+        return self
+
+    async def close(self):
+        """关闭服务器"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # ---- 夹具读取 ----
+
+    def _video_dir(self, video_id: str) -> Optional[str]:
+        if not video_id or not re.fullmatch(r'[\w-]+', video_id):
+            return None
+        path = os.path.join(self.fixtures_dir, video_id)
+        return path if os.path.isdir(path) else None
+
+    def load_player(self, video_id: str) -> Optional[dict]:
+        """读取视频的 player response 夹具"""
+        video_dir = self._video_dir(video_id)
+        if not video_dir:
+            return None
+        with open(os.path.join(video_dir, 'player.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def caption_tracks(self, video_id: str) -> List[dict]:
+        player = self.load_player(video_id) or {}
+        return (player.get('captions', {})
+                .get('playerCaptionsTracklistRenderer', {})
+                .get('captionTracks', []))
+
+    # ---- 路由 ----
+
+    def _route(self, request: Request) -> Tuple[str, Response]:
+        if request.headers.get('host', '').split(':')[0] in SHORT_LINK_HOSTS:
+            return 'short-link', self._short_link(request)
+        if request.path == '/watch':
+            return 'watch', self._watch(request.query.get('v', ''))
+        if request.path == '/youtubei/v1/player':
+            try:
+                payload = json.loads(request.body or b'{}')
+            except ValueError:
+                return 'player', Response(400, b'bad json')
+            if not isinstance(payload, dict):
+                return 'player', Response(400, b'request body must be a JSON object')
+            video_id = payload.get('videoId', '')
+            player = self.load_player(video_id)
+            if player is None:
+                return 'player', Response(404, b'unknown video')
+            return 'player', Response(200, json.dumps(player).encode('utf-8'),
+                                      'application/json; charset=UTF-8')
+        if request.path == '/api/timedtext':
+            if request.query.get('type') == 'list':
+                return 'tracklist', self._tracklist(request.query.get('v', ''))
+            return 'timedtext', self._timedtext(request.query, request.headers)
+        return 'other', Response(404, b'not found')
+
+    def _short_link(self, request: Request) -> Response:
+        """youtu.be/<视频ID>?t=42 重定向到 www.youtube.com/watch?v=<视频ID>&t=42"""
+        video_id = request.path.strip('/')
+        if not self._video_dir(video_id):
+            return Response(404, b'unknown video')
+        query = urlencode({'v': video_id, **{k: v for k, v in request.query.items() if k != 'v'}})
+        return Response(303, b'', headers={'Location': f'https://www.youtube.com/watch?{query}'})
+
+    def _watch(self, video_id: str) -> Response:
+        """观看页：优先使用录制的 watch.html，否则根据 player.json 生成"""
+        video_dir = self._video_dir(video_id)
+        if not video_dir:
+            return Response(404, b'unknown video')
+        watch_path = os.path.join(video_dir, 'watch.html')
+        if os.path.exists(watch_path):
+            with open(watch_path, 'rb') as f:
+                return Response(200, f.read(), 'text/html; charset=UTF-8')
+        player = self.load_player(video_id)
+        title = player.get('videoDetails', {}).get('title', video_id)
+        html = (
+            '<!DOCTYPE html><html><head><meta charset="UTF-8">'
+            f'<title>{title} - YouTube</title></head><body>'
+            f'<script>var ytInitialPlayerResponse = {json.dumps(player)};</script>'
+            '</body></html>'
+        )
+        return Response(200, html.encode('utf-8'), 'text/html; charset=UTF-8')
+
+    def _tracklist(self, video_id: str) -> Response:
+        """旧版 type=list 字幕轨道列表"""
+        if not self._video_dir(video_id):
+            return Response(404, b'unknown video')
+        items = []
+        for i, track in enumerate(self.caption_tracks(video_id)):
+            name = track.get('name', {}).get('simpleText', '')
+            kind = track.get('kind', '')
+            items.append(
+                f'<track id="{i}" name="" lang_code="{track.get("languageCode", "")}" '
+                f'lang_original="{name}" lang_translated="{name}" kind="{kind}"/>')
+        xml = '<?xml version="1.0" encoding="utf-8" ?><transcript_list docid="0">' \
+              + ''.join(items) + '</transcript_list>'
+        return Response(200, xml.encode('utf-8'), TIMEDTEXT_FORMATS['srv3'])
+
+    def _timedtext(self, query: Dict[str, str], headers: Optional[Dict[str, str]] = None) -> Response:
+        """字幕内容，带 ETag / Last-Modified，支持条件请求"""
+        headers = headers or {}
+        video_dir = self._video_dir(query.get('v', ''))
+        if not video_dir:
+            return Response(404, b'unknown video')
+        fmt = query.get('fmt', 'srv3')
+        if fmt not in TIMEDTEXT_FORMATS:
+            return Response(400, f'unsupported fmt {fmt}'.encode('utf-8'))
+        path = os.path.join(video_dir, 'timedtext',
+                            track_filename(query.get('lang', 'en'), query.get('kind'), fmt))
+        if not os.path.exists(path):
+            # 与 YouTube 一致：没有对应轨道时返回 200 和空响应体
+            return Response(200, b'', TIMEDTEXT_FORMATS[fmt])
+        with open(path, 'rb') as f:
+            body = f.read()
+        mtime = int(os.path.getmtime(path))
+        validators = {
+            'ETag': f'"{hashlib.sha256(body).hexdigest()[:16]}"',
+            'Last-Modified': formatdate(mtime, usegmt=True),
+        }
+        if 'if-none-match' in headers:
+            not_modified = validators['ETag'] in [tag.strip() for tag in headers['if-none-match'].split(',')]
+        elif 'if-modified-since' in headers:
+            try:
+                not_modified = mtime <= parsedate_to_datetime(headers['if-modified-since']).timestamp()
+            except (TypeError, ValueError):
+                not_modified = False
+        else:
+            not_modified = False
+        if not_modified:
+            return Response(304, b'', TIMEDTEXT_FORMATS[fmt], validators)
+        return Response(200, body, TIMEDTEXT_FORMATS[fmt], validators)
+
+    # ---- HTTP ----
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        body = b''
+        length = int(headers.get('content-length', 0) or 0)
+        if length:
+            body = await reader.readexactly(length)
+        parts = urlsplit(target)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        return Request(method, parts.path, query, headers, body)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await self._read_request(reader)
+        except (asyncio.IncompleteReadError, ValueError, ConnectionError):
+            writer.close()
+            return
+
+        started = time.perf_counter()
+        if request.method == 'OPTIONS':
+            route, response = 'preflight', Response(204, b'')
+        else:
+            try:
+                route, response = self._route(request)
+            except Exception as e:
+                # 夹具缺失或损坏等：返回 500，仍然记录请求并关闭连接
+                logger.error(f"❌ 处理 {request.method} {request.path} 时出错: {type(e).__name__}: {e}")
+                route, response = 'error', Response(500, f'{type(e).__name__}: {e}'.encode('utf-8'))
+        behavior = self.behavior_for(route)
+        behavior.hits += 1
+
+        if behavior.latency:
+            await asyncio.sleep(behavior.latency)
+        if behavior.should_fail():
+            headers = {}
+            if behavior.retry_after is not None:
+                headers['Retry-After'] = f'{behavior.retry_after:g}'
+            response = Response(behavior.status, REASONS.get(behavior.status, '').encode('utf-8'),
+                                headers=headers)
+
+        try:
+            await self._write_response(writer, response, behavior)
+        except ConnectionError:
+            pass
+        finally:
+            self.request_log.append((started, route, request.path, response.status))
+            writer.close()
+
+    async def _write_response(self, writer: asyncio.StreamWriter,
+                              response: Response, behavior: RouteBehavior):
+        headers = {
+            'Content-Type': response.content_type,
+            'Content-Length': str(len(response.body)),
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': '*',
+            'Connection': 'close',
+        }
+        headers.update(response.headers)
+        head = f'HTTP/1.1 {response.status} {REASONS.get(response.status, "")}\r\n' + \
+            ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) + '\r\n'
+        writer.write(head.encode('latin-1'))
+
+        body = response.body
+        if behavior.truncate is not None and response.status == 200:
+            body = body[:int(len(body) * behavior.truncate)]
+
+        if behavior.bandwidth:
+            # 按 100ms 切片发送以模拟带宽限制
+            chunk = max(1, behavior.bandwidth // 10)
+            for offset in range(0, len(body), chunk):
+                writer.write(body[offset:offset + chunk])
+                await writer.drain()
+                await asyncio.sleep(0.1)
+        else:
+            writer.write(body)
+        await writer.drain()
+
+
+def make_self_signed_context(cert_dir: Optional[str] = None,
+                             hosts: List[str] = YOUTUBE_HOSTS) -> ssl.SSLContext:
+    """用 openssl 生成自签名证书（Chrome 通过 --ignore-certificate-errors 接受）"""
+    cert_dir = cert_dir or tempfile.mkdtemp(prefix='fixture_tls_')
+    cert_path = os.path.join(cert_dir, 'cert.pem')
+    key_path = os.path.join(cert_dir, 'key.pem')
+    if not os.path.exists(cert_path):
+        san = ','.join(f'DNS:{host}' for host in hosts) + ',IP:127.0.0.1'
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+            '-keyout', key_path, '-out', cert_path, '-days', '1',
+            '-subj', f'/CN={hosts[0]}', '-addext', f'subjectAltName={san}'
+        ], check=True, capture_output=True)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def extract_player_response(html: str) -> dict:
+    """从观看页中提取 ytInitialPlayerResponse"""
+    start = html.index('ytInitialPlayerResponse = ') + len('ytInitialPlayerResponse = ')
+    decoder = json.JSONDecoder()
+    player, _ = decoder.raw_decode(html[start:])
+    return player
+
+
+def record_fixture(video_id: str,
+                   fixtures_dir: str = FIXTURES_DIR,
+                   proxy_server: Optional[str] = None,
+                   formats: List[str] = list(TIMEDTEXT_FORMATS)) -> str:
+    """从真实的 YouTube 录制一个视频的夹具"""
+    handlers = []
+    if proxy_server:
+        handlers.append(urllib.request.ProxyHandler({
+            'http': f'http://{proxy_server}', 'https': f'http://{proxy_server}'}))
+    opener = urllib.request.build_opener(*handlers)
+    opener.addheaders = [('User-Agent', 'Mozilla/5.0'), ('Accept-Language', 'en-US,en')]
+
+    video_dir = os.path.join(fixtures_dir, video_id)
+    os.makedirs(os.path.join(video_dir, 'timedtext'), exist_ok=True)
+
+    html = opener.open(f'https://www.youtube.com/watch?v={quote(video_id)}').read().decode('utf-8')
+    player = extract_player_response(html)
+    with open(os.path.join(video_dir, 'player.json'), 'w', encoding='utf-8') as f:
+        json.dump(player, f, ensure_ascii=False, indent=1)
+
+    tracks = (player.get('captions', {})
+              .get('playerCaptionsTracklistRenderer', {})
+              .get('captionTracks', []))
+    for track in tracks:
+        for fmt in formats:
+            body = opener.open(f"{track['baseUrl']}&fmt={fmt}").read()
+            name = track_filename(track['languageCode'], track.get('kind'), fmt)
+            with open(os.path.join(video_dir, 'timedtext', name), 'wb') as f:
+                f.write(body)
+            logger.info(f"已录制: {video_id}/{name} ({len(body)} 字节)")
+    return video_dir
+
+
+async def serve_forever(fixtures_dir: str, port: int, tls: bool):
+    """命令行：持续运行夹具服务器"""
+    server = FixtureServer(fixtures_dir, port=port,
+                           ssl_context=make_self_signed_context() if tls else None)
+    await server.start()
+    logger.info(f"Chrome 参数: {' '.join(server.chrome_args())}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='离线 YouTube 夹具服务器')
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help='运行夹具服务器')
+    serve.add_argument('--fixtures', default=FIXTURES_DIR)
+    serve.add_argument('--port', type=int, default=8443)
+    serve.add_argument('--no-tls', action='store_true')
+    record = sub.add_parser('record', help='从 YouTube 录制夹具')
+    record.add_argument('video_ids', nargs='+')
+    record.add_argument('--fixtures', default=FIXTURES_DIR)
+    record.add_argument('--proxy', default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(serve_forever(args.fixtures, args.port, not args.no_tls))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    for video_id in args.video_ids:
+        record_fixture(video_id, args.fixtures, args.proxy)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import re
+import logging
+import shutil
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+from typing import Optional, List, Dict, Tuple, Iterable
+
+from bundle import entry_name
+from downloads_watcher import sha256_file
+from subtitle_engine import Cue, WRITERS, TIMED_FORMATS, detect_format, iter_cues
+
+logger = logging.getLogger(__name__)
+
+# 开始 / 结束时间相差不超过这个值（毫秒）视为相同
+DEFAULT_TOLERANCE_MS = 50
+
+# 对齐时向前查找相同文本的字幕条数，用于识别插入和删除
+LOOKAHEAD = 3
+
+# 每个文件对最多记录的差异条数（计数不受限制）
+MAX_DIFFERENCES = 50
+
+# 多轨导出和压缩包条目的文件名：<视频ID>.<轨道>.<格式>
+_ENTRY_RE = re.compile(r'^([\w-]{11})\.(.+)\.([a-z0-9]+)$')
+
+# 差异类型
+MISSING = 'missing'
+EXTRA = 'extra'
+SHIFTED = 'shifted'
+REWORDED = 'reworded'
+
+# 文件对的状态
+IDENTICAL = 'identical'
+EQUIVALENT = 'equivalent'
+CHANGED = 'changed'
+NO_OUTPUT = 'no_output'
+NEW = 'new'
+ERROR = 'error'
+
+FAILING_STATUSES = {CHANGED, NO_OUTPUT, ERROR}
+
+
+@dataclass
+class Difference:
+    """一处语义差异；shifted 的 delta_ms 为新文件开始时间减去基准开始时间"""
+    kind: str
+    golden: Optional[Tuple[int, int, str]] = None
+    new: Optional[Tuple[int, int, str]] = None
+    delta_ms: Optional[int] = None
+
+
+@dataclass
+class PairResult:
+    """一对文件的比较结果"""
+    key: str
+    golden_path: Optional[str]
+    new_path: Optional[str]
+    status: str = IDENTICAL
+    golden_cues: int = 0
+    new_cues: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)
+    differences: List[Difference] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def pair_key(path: str, root: str) -> str:
+    """文件对的键：<视频ID>/<轨道>/<格式>，其他文件使用相对路径"""
+    name = os.path.basename(path)
+    match = _ENTRY_RE.match(name)
+    if match:
+        return '/'.join(match.groups())
+    return os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def collect(root: str) -> Dict[str, str]:
+    """目录中所有字幕文件，按文件对的键索引"""
+    extensions = tuple(f'.{fmt}' for fmt in WRITERS)
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(extensions):
+                path = os.path.join(directory, name)
+                files[pair_key(path, root)] = path
+    return files
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def align_cues(golden: List[Cue], new: List[Cue], tolerance_ms: int = DEFAULT_TOLERANCE_MS,
+               timed: bool = True) -> List[Difference]:
+    """线性时间对齐两组字幕，返回语义差异
+
+    两个指针同时前进：文本相同则比较时间（超出容差为 shifted），时间相同而文本不同为 reworded；
+    否则在 LOOKAHEAD 条以内查找相同文本以识别插入（extra）和删除（missing），
+    都找不到时开始时间较早的一侧记为缺失或多余。
+    """
+    golden_text = [_normalize(cue.text) for cue in golden]
+    new_text = [_normalize(cue.text) for cue in new]
+
+    def same_time(a: Cue, b: Cue) -> bool:
+        return not timed or (abs(a.start_ms - b.start_ms) <= tolerance_ms
+                             and abs(a.end_ms - b.end_ms) <= tolerance_ms)
+
+    differences = []
+    i = j = 0
+    while i < len(golden) and j < len(new):
+        g, n = golden[i], new[j]
+        if golden_text[i] == new_text[j]:
+            if not same_time(g, n):
+                differences.append(Difference(SHIFTED, tuple(g), tuple(n), n.start_ms - g.start_ms))
+            i += 1
+            j += 1
+            continue
+        if timed and same_time(g, n):
+            differences.append(Difference(REWORDED, tuple(g), tuple(n)))
+            i += 1
+            j += 1
+            continue
+        skip_new = next((k for k in range(1, LOOKAHEAD + 1)
+                         if j + k < len(new) and new_text[j + k] == golden_text[i]), None)
+        skip_golden = next((k for k in range(1, LOOKAHEAD + 1)
+                            if i + k < len(golden) and golden_text[i + k] == new_text[j]), None)
+        if skip_new is not None and (skip_golden is None or skip_new <= skip_golden):
+            differences.extend(Difference(EXTRA, new=tuple(cue)) for cue in new[j:j + skip_new])
+            j += skip_new
+        elif skip_golden is not None:
+            differences.extend(Difference(MISSING, golden=tuple(cue)) for cue in golden[i:i + skip_golden])
+            i += skip_golden
+        elif not timed:
+            differences.append(Difference(REWORDED, tuple(g), tuple(n)))
+            i += 1
+            j += 1
+        elif abs(g.start_ms - n.start_ms) <= tolerance_ms:
+            # 开始时间相同、结束时间和文本都变了
+            differences.append(Difference(REWORDED, tuple(g), tuple(n)))
+            i += 1
+            j += 1
+        elif g.start_ms < n.start_ms:
+            differences.append(Difference(MISSING, golden=tuple(g)))
+            i += 1
+        else:
+            differences.append(Difference(EXTRA, new=tuple(n)))
+            j += 1
+    differences.extend(Difference(MISSING, golden=tuple(cue)) for cue in golden[i:])
+    differences.extend(Difference(EXTRA, new=tuple(cue)) for cue in new[j:])
+    return differences
+
+
+def compare_files(golden_path: str, new_path: str, tolerance_ms: int = DEFAULT_TOLERANCE_MS,
+                  key: Optional[str] = None) -> PairResult:
+    """比较一对文件：大小和 SHA-256 相同时直接判定为相同，否则解析为字幕后对齐"""
+    result = PairResult(key or os.path.basename(new_path), golden_path, new_path)
+    try:
+        if os.path.getsize(golden_path) == os.path.getsize(new_path) and \
+                sha256_file(golden_path) == sha256_file(new_path):
+            return result
+        fmt = detect_format(golden_path)
+        golden = list(iter_cues(golden_path, fmt))
+        new = list(iter_cues(new_path, detect_format(new_path)))
+    except (OSError, ValueError, SyntaxError, UnicodeDecodeError) as e:
+        result.status = ERROR
+        result.error = str(e)
+        return result
+    result.golden_cues, result.new_cues = len(golden), len(new)
+    differences = align_cues(golden, new, tolerance_ms, timed=fmt in TIMED_FORMATS)
+    for difference in differences:
+        result.counts[difference.kind] = result.counts.get(difference.kind, 0) + 1
+    result.differences = differences[:MAX_DIFFERENCES]
+    result.status = CHANGED if differences else EQUIVALENT
+    return result
+
+
+def _compare_pair(args: Tuple[str, str, str, int]) -> PairResult:
+    key, golden_path, new_path, tolerance_ms = args
+    return compare_files(golden_path, new_path, tolerance_ms, key)
+
+
+def compare_trees(golden_root: str, new_root: str, tolerance_ms: int = DEFAULT_TOLERANCE_MS,
+                  workers: Optional[int] = None) -> List[PairResult]:
+    """按键配对两个目录中的文件并在进程池中比较"""
+    golden_files, new_files = collect(golden_root), collect(new_root)
+    results = [PairResult(key, path, None, NO_OUTPUT) for key, path in golden_files.items()
+               if key not in new_files]
+    results += [PairResult(key, None, path, NEW) for key, path in new_files.items()
+                if key not in golden_files]
+    pairs = [(key, golden_files[key], new_files[key], tolerance_ms)
+             for key in sorted(golden_files) if key in new_files]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(pairs) < 2:
+        results += map(_compare_pair, pairs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results += executor.map(_compare_pair, pairs, chunksize=max(1, len(pairs) // (workers * 8)))
+    return sorted(results, key=lambda result: result.key)
+
+
+def summarize(results: Iterable[PairResult]) -> Dict[str, int]:
+    summary: Dict[str, int] = {}
+    for result in results:
+        summary[result.status] = summary.get(result.status, 0) + 1
+    return summary
+
+
+def format_difference(difference: Difference) -> str:
+    def cue(value):
+        start, end, text = value
+        return f"[{start}-{end}] {text!r}"
+    if difference.kind == MISSING:
+        return f"缺失 {cue(difference.golden)}"
+    if difference.kind == EXTRA:
+        return f"多出 {cue(difference.new)}"
+    if difference.kind == SHIFTED:
+        return f"偏移 {difference.delta_ms:+d}ms {cue(difference.golden)} -> {cue(difference.new)}"
+    return f"改写 {cue(difference.golden)} -> {cue(difference.new)}"
+
+
+def check_golden(path: str, golden_dir: str, video_id: str, track: str, fmt: str,
+                 tolerance_ms: int = DEFAULT_TOLERANCE_MS) -> PairResult:
+    """把一个下载结果与基准目录中的 <视频ID>.<轨道>.<格式> 比较；还没有基准时把它记录为基准
+
+    基准通过硬链接原子地创建：并发运行时只有一个结果成为基准，其他结果与它比较。
+    """
+    name = entry_name(video_id, track, fmt)
+    key = pair_key(name, golden_dir)
+    golden_path = os.path.join(golden_dir, name)
+    if not os.path.exists(golden_path):
+        os.makedirs(golden_dir, exist_ok=True)
+        tmp_path = f'{golden_path}.{uuid.uuid4().hex[:8]}.tmp'
+        shutil.copyfile(path, tmp_path)
+        try:
+            os.link(tmp_path, golden_path)
+        except FileExistsError:
+            # 其他运行刚刚记录了基准，与它比较
+            pass
+        else:
+            logger.info(f"已记录基准文件: {golden_path}")
+            return PairResult(key, None, path, NEW)
+        finally:
+            os.remove(tmp_path)
+    return compare_files(golden_path, path, tolerance_ms, key)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='按字幕比较新的下载结果与基准文件，只报告语义差异')
+    parser.add_argument('golden', help='基准目录')
+    parser.add_argument('new', help='新输出目录')
+    parser.add_argument('--tolerance-ms', type=int, default=DEFAULT_TOLERANCE_MS, help='时间容差（毫秒）')
+    parser.add_argument('--workers', type=int, help='进程数，默认为 CPU 核数')
+    parser.add_argument('--report', help='把完整结果写入 JSON')
+    parser.add_argument('--update', action='store_true', help='把有变化和新增的文件复制为新的基准')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = compare_trees(args.golden, args.new, args.tolerance_ms, args.workers)
+    for result in results:
+        if result.status == CHANGED:
+            counts = ', '.join(f'{kind} {count}' for kind, count in sorted(result.counts.items()))
+            logger.error(f"❌ {result.key}: {counts}")
+            for difference in result.differences[:5]:
+                logger.error(f"    {format_difference(difference)}")
+        elif result.status == NO_OUTPUT:
+            logger.error(f"❌ {result.key}: 没有新的输出")
+        elif result.status == ERROR:
+            logger.error(f"❌ {result.key}: {result.error}")
+        elif result.status == NEW:
+            logger.warning(f"⚠️ {result.key}: 没有基准文件")
+    summary = summarize(results)
+    logger.info(f"比较 {len(results)} 个文件, 耗时 {time.perf_counter() - started:.2f}s: "
+                + ', '.join(f'{status} {count}' for status, count in sorted(summary.items())))
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'results': [asdict(result) for result in results]},
+                      f, ensure_ascii=False, indent=2)
+    if args.update:
+        for result in results:
+            if result.status in (CHANGED, EQUIVALENT, NEW) and result.new_path:
+                destination = os.path.join(args.golden, os.path.relpath(result.new_path, args.new))
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copyfile(result.new_path, destination)
+        logger.info("✓ 基准文件已更新")
+        return 0
+    return 1 if any(result.status in FAILING_STATUSES for result in results) else 0
+
+
+if __name__ == '__main__':
+    exit(main())
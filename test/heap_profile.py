@@ -0,0 +1,211 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Any, Dict, List, Tuple
+
+from browser_pool import extension_worker_target
+
+logger = logging.getLogger(__name__)
+
+# 采样结果和 .heapprofile 输出目录
+PROFILES_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'heap_profiles'))
+
+# Runtime.getHeapUsage 的轮询间隔（秒）
+DEFAULT_POLL_INTERVAL = 0.05
+
+# HeapProfiler 采样间隔（字节）
+DEFAULT_SAMPLING_INTERVAL = 32 * 1024
+
+# 输出太小时每 MB 的堆增长没有意义，不检查这一项预算
+MIN_OUTPUT_BYTES = 256 * 1024
+
+MB = 1024 * 1024
+
+_profile_counter = itertools.count()
+
+
+class MemoryBudgetExceeded(AssertionError):
+    """下载过程中的 JS 堆超过了配置的预算"""
+
+    def __init__(self, violations: List[str]):
+        super().__init__('; '.join(violations))
+        self.violations = violations
+
+
+@dataclass
+class MemoryBudget:
+    """内存预算：堆峰值上限，以及每 MB 字幕输出允许的堆增长"""
+    peak_mb: Optional[float] = None
+    growth_per_output_mb: Optional[float] = None
+    min_output_bytes: int = MIN_OUTPUT_BYTES
+
+    def check(self, report: 'MemoryReport') -> List[str]:
+        """返回超出预算的项目"""
+        violations = []
+        for source, peak in report.peaks.items():
+            if self.peak_mb is not None and peak > self.peak_mb * MB:
+                violations.append(f"{source} 堆峰值 {peak / MB:.1f}MB 超过预算 {self.peak_mb:.1f}MB")
+        ratio = report.growth_per_output_mb
+        if self.growth_per_output_mb is not None and ratio is not None and \
+                report.output_bytes >= self.min_output_bytes and ratio > self.growth_per_output_mb:
+            violations.append(f"每 MB 输出的堆增长 {ratio:.1f}MB 超过预算 {self.growth_per_output_mb:.1f}MB")
+        return violations
+
+
+@dataclass
+class MemoryReport:
+    """一次下载的堆使用情况（字节）"""
+    baselines: Dict[str, int] = field(default_factory=dict)
+    peaks: Dict[str, int] = field(default_factory=dict)
+    samples: List[Tuple[float, str, int, int]] = field(default_factory=list)
+    output_bytes: int = 0
+    profiles: Dict[str, str] = field(default_factory=dict)
+    violations: List[str] = field(default_factory=list)
+
+    @property
+    def peak_bytes(self) -> int:
+        return max(self.peaks.values(), default=0)
+
+    @property
+    def growth_bytes(self) -> int:
+        """下载过程中堆相对开始时的最大增长"""
+        return max((peak - self.baselines.get(source, 0) for source, peak in self.peaks.items()), default=0)
+
+    @property
+    def growth_per_output_mb(self) -> Optional[float]:
+        """每 MB 字幕输出对应的堆增长（MB）"""
+        if not self.output_bytes:
+            return None
+        return (self.growth_bytes / MB) / (self.output_bytes / MB)
+
+    def to_dict(self) -> Dict:
+        return {
+            'peak_mb': {source: round(peak / MB, 3) for source, peak in self.peaks.items()},
+            'baseline_mb': {source: round(value / MB, 3) for source, value in self.baselines.items()},
+            'growth_mb': round(self.growth_bytes / MB, 3),
+            'output_bytes': self.output_bytes,
+            'growth_per_output_mb': self.growth_per_output_mb,
+            'profiles': self.profiles,
+            'violations': self.violations,
+            'samples': [{'t': round(t, 4), 'source': source, 'used': used, 'total': total}
+                        for t, source, used, total in self.samples],
+        }
+
+
+class HeapProfiler:
+    """在扩展 service worker 和选项页上轮询 Runtime.getHeapUsage 并记录 HeapProfiler 采样
+
+    service worker 可能在下载过程中被浏览器终止，对应的会话出错后只停止该来源的采样。
+    """
+
+    def __init__(self, browser: Any, page: Any, label: str = 'download',
+                 output_dir: str = PROFILES_ROOT,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 sampling_interval: int = DEFAULT_SAMPLING_INTERVAL):
+        self.browser = browser
+        self.page = page
+        self.label = re.sub(r'[^\w.-]+', '_', label)
+        self.output_dir = output_dir
+        self.poll_interval = poll_interval
+        self.sampling_interval = sampling_interval
+        self.report = MemoryReport()
+        self._sessions: Dict[str, Any] = {}
+        self._worker_session = None
+        self._poll_task: Optional[asyncio.Task] = None
+        self._started = 0.0
+
+    async def start(self) -> 'HeapProfiler':
+        """附加到 service worker 和选项页，记录基线并开始采样"""
+        target = extension_worker_target(self.browser)
+        if target is not None:
+            try:
+                self._worker_session = await target.createCDPSession()
+                self._sessions['service_worker'] = self._worker_session
+            except Exception as e:
+                logger.warning(f"⚠️ 无法附加到扩展 service worker: {e}")
+        else:
+            logger.warning("⚠️ 没有找到扩展的 service worker target")
+        self._sessions['options_page'] = self.page._client
+
+        self._started = time.perf_counter()
+        for source, session in list(self._sessions.items()):
+            try:
+                await session.send('HeapProfiler.enable')
+                await session.send('HeapProfiler.startSampling', {'samplingInterval': self.sampling_interval})
+                usage = await session.send('Runtime.getHeapUsage')
+                self.report.baselines[source] = usage['usedSize']
+                self._record(source, usage)
+            except Exception as e:
+                logger.warning(f"⚠️ 无法在 {source} 上开启堆采样: {e}")
+                del self._sessions[source]
+        self._poll_task = asyncio.ensure_future(self._poll())
+        return self
+
+    def _record(self, source: str, usage: Dict):
+        used = int(usage['usedSize'])
+        self.report.samples.append((time.perf_counter() - self._started, source, used, int(usage['totalSize'])))
+        if used > self.report.peaks.get(source, 0):
+            self.report.peaks[source] = used
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for source, session in list(self._sessions.items()):
+                try:
+                    self._record(source, await session.send('Runtime.getHeapUsage'))
+                except Exception as e:
+                    logger.warning(f"⚠️ {source} 堆采样中断（可能已被终止）: {e}")
+                    self._sessions.pop(source, None)
+
+    async def stop(self, output_path: Optional[str] = None,
+                   budget: Optional[MemoryBudget] = None) -> MemoryReport:
+        """停止采样，写出 .heapprofile 和汇总，并按预算检查"""
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.join(self.output_dir,
+                            f"{self.label}_{time.strftime('%Y%m%d_%H%M%S')}_{next(_profile_counter)}")
+        for source, session in list(self._sessions.items()):
+            try:
+                self._record(source, await session.send('Runtime.getHeapUsage'))
+                result = await session.send('HeapProfiler.stopSampling')
+                path = f'{stem}.{source}.heapprofile'
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(result['profile'], f)
+                self.report.profiles[source] = path
+                await session.send('HeapProfiler.disable')
+            except Exception as e:
+                logger.warning(f"⚠️ 停止 {source} 堆采样时出错: {e}")
+        if self._worker_session is not None:
+            try:
+                await self._worker_session.detach()
+            except Exception:
+                pass
+            self._worker_session = None
+        self._sessions = {}
+
+        if output_path and os.path.exists(output_path):
+            self.report.output_bytes = os.path.getsize(output_path)
+        if budget is not None:
+            self.report.violations = budget.check(self.report)
+        with open(f'{stem}.memory.json', 'w', encoding='utf-8') as f:
+            json.dump(self.report.to_dict(), f, ensure_ascii=False, indent=2)
+
+        ratio = self.report.growth_per_output_mb
+        peaks = ', '.join(f'{source} {peak / MB:.1f}MB' for source, peak in self.report.peaks.items())
+        logger.info(f"堆峰值: {peaks or '无数据'}, 增长 {self.report.growth_bytes / MB:.1f}MB"
+                    + (f", 每 MB 输出 {ratio:.1f}MB" if ratio is not None else ''))
+        for violation in self.report.violations:
+            logger.error(f"❌ 内存预算: {violation}")
+        return self.report
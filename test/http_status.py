@@ -0,0 +1,22 @@
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+def retryable_status(status: Optional[int]) -> bool:
+    """429 和 5xx 需要退避后重试"""
+    return status is not None and (status == 429 or 500 <= status < 600)
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """解析 Retry-After 头：秒数或 HTTP 日期，返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
@@ -0,0 +1,363 @@
+import asyncio
+import argparse
+import hashlib
+import io
+import os
+import ssl
+import logging
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Iterable, Tuple
+from urllib.parse import urlsplit, urlunsplit, quote
+
+from browser_pool import DEFAULT_PROXY, DOWNLOADS_ROOT
+from bundle import BundleWriter, HashingWriter, entry_name
+from download_manifest import DownloadManifest, ManifestRow, ADDED, UPDATED, UNCHANGED
+from fixture_server import extract_player_response
+from subtitle_engine import CueStore, WRITERS, read_json3, merge_rolling
+from test_download import video_id_from_url
+
+logger = logging.getLogger(__name__)
+
+# 多轨导出的默认输出目录
+EXPORT_ROOT = os.path.join(DOWNLOADS_ROOT, 'tracks')
+
+# 字幕类型：自动生成（asr）和手动添加
+KINDS = ('asr', 'manual')
+
+# 同时进行的请求数
+DEFAULT_CONCURRENCY = 4
+
+
+@dataclass
+class CaptionTrack:
+    """player response 中的一条字幕轨道"""
+    language: str
+    kind: str
+    name: str
+    base_url: str
+
+    @property
+    def key(self) -> str:
+        """轨道标识，例如 en.asr / de"""
+        return f"{self.language}{'.asr' if self.kind == 'asr' else ''}"
+
+
+@dataclass
+class ExportedFile:
+    """导出的一个字幕文件"""
+    video_id: str
+    track: str
+    language: str
+    kind: str
+    format: str
+    path: str
+    sha256: str
+    cue_count: int
+    status: Optional[str] = None  # 使用清单刷新时：added / updated / unchanged
+
+
+@dataclass
+class TrackFetch:
+    """一次字幕请求的结果；status 为 304 时 body 为空"""
+    status: int
+    body: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def caption_tracks(player: Dict) -> List[CaptionTrack]:
+    """从 player response 中取出所有字幕轨道"""
+    tracks = (player.get('captions', {})
+              .get('playerCaptionsTracklistRenderer', {})
+              .get('captionTracks', []))
+    return [CaptionTrack(language=track['languageCode'],
+                         kind='asr' if track.get('kind') == 'asr' else 'manual',
+                         name=track.get('name', {}).get('simpleText', ''),
+                         base_url=track['baseUrl'])
+            for track in tracks]
+
+
+def _language_matches(language: str, wanted: str) -> bool:
+    # 'en' 同时匹配 'en-US'、'en-GB'
+    return wanted == '*' or language == wanted or language.startswith(f'{wanted}-')
+
+
+def select_tracks(tracks: List[CaptionTrack],
+                  languages: Optional[Iterable[str]] = None,
+                  kinds: Iterable[str] = KINDS) -> List[CaptionTrack]:
+    """按语言和类型筛选轨道，languages 为空表示全部语言"""
+    languages = list(languages or ['*'])
+    kinds = set(kinds)
+    return [track for track in tracks
+            if track.kind in kinds and any(_language_matches(track.language, lang) for lang in languages)]
+
+
+def export_filename(video_id: str, track: CaptionTrack, fmt: str) -> str:
+    """确定性的文件名：<视频ID>.<语言>[.asr].<格式>"""
+    return entry_name(video_id, track.key, fmt)
+
+
+class YouTubeClient:
+    """获取 player response 和 timedtext 的简单客户端，可以指向本地夹具服务器"""
+
+    def __init__(self, origin: str = 'https://www.youtube.com',
+                 proxy_server: Optional[str] = DEFAULT_PROXY,
+                 insecure: bool = False,
+                 concurrency: int = DEFAULT_CONCURRENCY):
+        self.origin = origin.rstrip('/')
+        handlers = []
+        if proxy_server:
+            handlers.append(urllib.request.ProxyHandler({
+                'http': f'http://{proxy_server}', 'https': f'http://{proxy_server}'}))
+        if insecure:
+            # 夹具服务器使用自签名证书
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            handlers.append(urllib.request.HTTPSHandler(context=context))
+        self._opener = urllib.request.build_opener(*handlers)
+        self._opener.addheaders = [('User-Agent', 'Mozilla/5.0'), ('Accept-Language', 'en-US,en')]
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.player_fetches = 0
+        self.track_fetches = 0
+        self.not_modified = 0
+
+    def _rewrite(self, url: str) -> str:
+        """把轨道 baseUrl 的域名换成当前 origin"""
+        parts = urlsplit(url)
+        origin = urlsplit(self.origin)
+        return urlunsplit((origin.scheme, origin.netloc, parts.path, parts.query, ''))
+
+    def _request(self, url: str, headers: Dict[str, str]) -> Tuple[int, bytes, Dict[str, str]]:
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with self._opener.open(request, timeout=30) as response:
+                return response.status, response.read(), dict(response.headers)
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 304, b'', dict(e.headers)
+            raise
+
+    async def request(self, url: str,
+                      headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes, Dict[str, str]]:
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, self._request, url, headers or {})
+
+    async def get(self, url: str) -> bytes:
+        _, body, _ = await self.request(url)
+        return body
+
+    async def fetch_player(self, video_id: str) -> Dict:
+        """从观看页中取出 player response"""
+        self.player_fetches += 1
+        html = await self.get(f'{self.origin}/watch?v={quote(video_id)}')
+        return extract_player_response(html.decode('utf-8'))
+
+    async def fetch_track(self, track: CaptionTrack, fmt: str = 'json3',
+                          etag: Optional[str] = None,
+                          last_modified: Optional[str] = None) -> TrackFetch:
+        """获取字幕；给出上次的 ETag / Last-Modified 时发送条件请求"""
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        self.track_fetches += 1
+        status, body, response_headers = await self.request(f'{self._rewrite(track.base_url)}&fmt={fmt}', headers)
+        if status == 304:
+            self.not_modified += 1
+        return TrackFetch(status, body, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+
+
+def write_track(store: CueStore, video_id: str, track: CaptionTrack,
+                formats: Iterable[str], output_dir: str,
+                bundle: Optional[BundleWriter] = None) -> List[ExportedFile]:
+    """把已解析的一条轨道一次写出为所有请求的格式；指定 bundle 时写入压缩包，path 为条目名"""
+    files = []
+    for fmt in formats:
+        if bundle is not None:
+            entry = bundle.write_cues(video_id, track.key, fmt, iter(store))
+            files.append(ExportedFile(video_id, track.key, track.language, track.kind,
+                                      fmt, entry.name, entry.sha256, entry.cue_count))
+            continue
+        path = os.path.join(output_dir, export_filename(video_id, track, fmt))
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            writer = HashingWriter(f)
+            count = WRITERS[fmt](iter(store), writer)
+        os.replace(tmp_path, path)
+        files.append(ExportedFile(video_id, track.key, track.language, track.kind,
+                                  fmt, path, writer.digest.hexdigest(), count))
+    return files
+
+
+async def _fetch_track(client: YouTubeClient, video_id: str, track: CaptionTrack, formats: List[str],
+                       manifest: Optional[DownloadManifest]) -> Tuple[Dict[str, ManifestRow], TrackFetch]:
+    """所有格式都有记录、输出文件完好且记录的是同一份上游内容时用记录中的验证信息发送条件请求
+
+    各格式的记录可能不同步（例如上次只刷新了其中一种格式），这时 304 不能说明所有格式都是最新的，
+    只能发送普通请求再按内容哈希逐个比较。
+    """
+    rows = manifest.get(video_id, track.key) if manifest is not None else {}
+    if rows and all(fmt in rows and rows[fmt].output_intact() for fmt in formats):
+        validators = {(rows[fmt].source_sha256, rows[fmt].etag, rows[fmt].last_modified) for fmt in formats}
+        if len(validators) == 1:
+            row = rows[formats[0]]
+            return rows, await client.fetch_track(track, etag=row.etag, last_modified=row.last_modified)
+    return rows, await client.fetch_track(track)
+
+
+def _unchanged(row: ManifestRow, track: CaptionTrack) -> ExportedFile:
+    return ExportedFile(row.video_id, row.track, track.language, track.kind, row.format,
+                        row.output_path, row.output_sha256, row.cue_count, UNCHANGED)
+
+
+async def export_video(client: YouTubeClient,
+                       video_id: str,
+                       languages: Optional[Iterable[str]] = None,
+                       kinds: Iterable[str] = KINDS,
+                       formats: Iterable[str] = ('srt',),
+                       output_dir: str = EXPORT_ROOT,
+                       dedupe: bool = False,
+                       bundle: Optional[BundleWriter] = None,
+                       manifest: Optional[DownloadManifest] = None) -> List[ExportedFile]:
+    """一次获取 player response，并发获取选中的轨道，每条轨道只解析一次并写出所有格式
+
+    指定 manifest 时增量刷新：上游返回 304 或内容哈希与记录一致时不解析、不写文件。
+    """
+    formats = list(formats)
+    if bundle is not None and manifest is not None:
+        raise ValueError('增量刷新只支持写出单独的文件')
+    if bundle is None:
+        os.makedirs(output_dir, exist_ok=True)
+    player = await client.fetch_player(video_id)
+    tracks = select_tracks(caption_tracks(player), languages, kinds)
+    if not tracks:
+        logger.warning(f"⚠️ {video_id} 没有符合条件的字幕轨道")
+        return []
+
+    results = await asyncio.gather(*(_fetch_track(client, video_id, track, formats, manifest)
+                                     for track in tracks), return_exceptions=True)
+    files = []
+    for track, result in zip(tracks, results):
+        if isinstance(result, Exception):
+            logger.warning(f"⚠️ {video_id} {track.key} 获取失败: {result}")
+            continue
+        rows, fetched = result
+        if fetched.status == 304:
+            manifest.touch(video_id, track.key, formats, rows[formats[0]].source_sha256,
+                           fetched.etag, fetched.last_modified)
+            files.extend(_unchanged(rows[fmt], track) for fmt in formats)
+            continue
+        if not fetched.body:
+            logger.warning(f"⚠️ {video_id} {track.key} 没有字幕内容")
+            continue
+
+        source_sha256 = hashlib.sha256(fetched.body).hexdigest()
+        stale = [fmt for fmt in formats if fmt not in rows or rows[fmt].source_sha256 != source_sha256
+                 or not rows[fmt].output_intact()]
+        if manifest is not None and len(stale) < len(formats):
+            unchanged = [fmt for fmt in formats if fmt not in stale]
+            manifest.touch(video_id, track.key, unchanged, source_sha256, fetched.etag, fetched.last_modified)
+            files.extend(_unchanged(rows[fmt], track) for fmt in unchanged)
+        if not stale:
+            continue
+
+        cues = read_json3(io.BytesIO(fetched.body))
+        if dedupe and track.kind == 'asr':
+            # 自动字幕去掉滚动重复
+            cues = merge_rolling(cues)
+        store = CueStore.from_cues(cues)
+        for exported in write_track(store, video_id, track, stale, output_dir, bundle):
+            if manifest is not None:
+                exported.status = UPDATED if exported.format in rows else ADDED
+                manifest.put(ManifestRow(
+                    video_id, track.key, exported.format, source_sha256, fetched.etag, fetched.last_modified,
+                    exported.path, exported.sha256, os.path.getsize(exported.path), exported.cue_count))
+            files.append(exported)
+    logger.info(f"✓ {video_id}: {len(tracks)} 条轨道 × {len(formats)} 种格式, 共 {len(files)} 个文件")
+    return files
+
+
+async def export_videos(video_ids: List[str], client: Optional[YouTubeClient] = None,
+                        **kwargs) -> Tuple[List[ExportedFile], Dict[str, str]]:
+    """并发导出多个视频，视频之间共享请求并发上限
+
+    一个视频失败（例如视频ID无效）时记录并跳过，不影响其他视频；返回导出的文件和按视频ID索引的失败原因。
+    """
+    client = client or YouTubeClient()
+    results = await asyncio.gather(*(export_video(client, video_id, **kwargs) for video_id in video_ids),
+                                   return_exceptions=True)
+    files, failed = [], {}
+    for video_id, result in zip(video_ids, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            logger.warning(f"⚠️ {video_id} 导出失败: {type(result).__name__}: {result}")
+            failed[video_id] = f'{type(result).__name__}: {result}'
+            continue
+        files.extend(result)
+    return files, failed
+
+
+def video_id_of(value: str) -> str:
+    """接受视频ID或视频URL；无法从中取出视频ID时原样作为视频ID"""
+    return video_id_from_url(value) or value
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='一次获取视频的所有字幕轨道并导出为多种格式')
+    parser.add_argument('videos', nargs='+', help='视频ID或URL')
+    parser.add_argument('--langs', nargs='+', help="语言代码，默认全部；'en' 匹配 en-US 等")
+    parser.add_argument('--kinds', nargs='+', default=list(KINDS), choices=KINDS)
+    parser.add_argument('--formats', nargs='+', default=['srt'], choices=list(WRITERS))
+    parser.add_argument('--output', default=EXPORT_ROOT)
+    parser.add_argument('--origin', default='https://www.youtube.com', help='例如本地夹具服务器的地址')
+    parser.add_argument('--proxy', default=DEFAULT_PROXY)
+    parser.add_argument('--insecure', action='store_true', help='不校验证书（夹具服务器）')
+    parser.add_argument('--dedupe', action='store_true', help='合并自动字幕的滚动重复')
+    parser.add_argument('--bundle', help='把所有文件写入一个 ZIP（附带清单），不再写出单独的文件')
+    parser.add_argument('--manifest', help='增量刷新使用的 SQLite 清单，例如 downloads/tracks/manifest.sqlite')
+    args = parser.parse_args(argv)
+    if args.bundle and args.manifest:
+        parser.error('--bundle 和 --manifest 不能同时使用')
+
+    client = YouTubeClient(args.origin, args.proxy or None, args.insecure)
+    started = time.perf_counter()
+    bundle = BundleWriter(args.bundle).open() if args.bundle else None
+    manifest = DownloadManifest(args.manifest) if args.manifest else None
+    try:
+        files, failed = asyncio.run(export_videos(
+            [video_id_of(video) for video in args.videos], client,
+            languages=args.langs, kinds=args.kinds, formats=args.formats,
+            output_dir=args.output, dedupe=args.dedupe, bundle=bundle, manifest=manifest))
+    except BaseException:
+        if bundle is not None:
+            bundle.abort()
+        raise
+    finally:
+        if manifest is not None:
+            manifest.close()
+    if bundle is not None:
+        bundle.close()
+    for exported in files:
+        logger.info(f"{exported.path}: {exported.cue_count} 条, sha256 {exported.sha256[:12]}")
+    logger.info(f"共 {len(files)} 个文件, player 请求 {client.player_fetches} 次, "
+                f"字幕请求 {client.track_fetches} 次, 耗时 {time.perf_counter() - started:.2f}s")
+    if manifest is not None:
+        counts = Counter(exported.status for exported in files)
+        logger.info(f"增量刷新: 新增 {counts[ADDED]}, 更新 {counts[UPDATED]}, 未变化 {counts[UNCHANGED]} "
+                    f"(其中 304 未修改的轨道 {client.not_modified} 条)")
+    if failed:
+        logger.error(f"❌ {len(failed)} 个视频导出失败: {', '.join(failed)}")
+    return 0 if files and not failed else 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,357 @@
+import asyncio
+import base64
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional, Any, Dict, List, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from browser_pool import extension_worker_target
+
+logger = logging.getLogger(__name__)
+
+# 默认缓存目录
+CACHE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'network_cache'))
+
+# 缓存默认大小上限
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 三种模式：录制（走网络并写入缓存）、回放（只用缓存，不走网络）、直通（不拦截）
+MODES = ('record', 'replay', 'passthrough')
+
+# 拦截的请求
+URL_PATTERNS = ('*://www.youtube.com/*', '*://m.youtube.com/*', '*://youtube.com/*')
+
+# 每次请求都会变化、但不影响响应内容的查询参数
+VOLATILE_PARAMS = {
+    'cpn', 'ei', 'expire', 'signature', 'sig', 'sparams', 'key', 'pot', 'potc',
+    'xorb', 'xobt', 'xovt', 'cbr', 'cbrver', 'c', 'cver', 'cplayer', 'cos', 'cosver',
+    'cplatform', 'opi', 'xoaf', 'caps', 'prettyPrint', 'alt', '_',
+}
+
+# 参与缓存键的请求头
+KEY_HEADERS = ('accept-language',)
+
+# POST JSON 请求体中决定响应内容的字段（player 接口）
+KEY_BODY_FIELDS = ('videoId', 'params')
+
+# 回放时不应带回去的响应头：请求体已解压，长度也会重新计算
+DROPPED_RESPONSE_HEADERS = {
+    'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive',
+    'alt-svc', 'set-cookie', 'report-to', 'nel',
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries(digest);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta(name, value) VALUES ('total_bytes', 0);
+'''
+
+
+def normalize_url(url: str) -> str:
+    """规范化URL：小写 scheme/host，去掉片段和易变参数，查询参数排序"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k not in VOLATILE_PARAMS)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(query), ''))
+
+
+def _body_key(post_data: Optional[str]) -> str:
+    if not post_data:
+        return ''
+    try:
+        body = json.loads(post_data)
+    except ValueError:
+        return hashlib.sha256(post_data.encode('utf-8')).hexdigest()
+    if isinstance(body, dict):
+        return json.dumps({name: body.get(name) for name in KEY_BODY_FIELDS if name in body}, sort_keys=True)
+    return hashlib.sha256(post_data.encode('utf-8')).hexdigest()
+
+
+def cache_key(method: str, url: str, headers: Optional[Dict[str, str]] = None,
+              post_data: Optional[str] = None) -> str:
+    """根据方法、规范化URL、相关请求头和请求体计算缓存键"""
+    lowered = {name.lower(): value for name, value in (headers or {}).items()}
+    material = '\n'.join([
+        method.upper(),
+        normalize_url(url),
+        *(f'{name}:{lowered.get(name, "")}' for name in KEY_HEADERS),
+        _body_key(post_data),
+    ])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class CachedResponse:
+    """缓存中的一个响应"""
+    url: str
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+
+class NetworkCache:
+    """按内容寻址的磁盘缓存，SQLite 索引，按大小上限做 LRU 淘汰
+
+    响应体按 SHA-256 存放在 blobs/ 下，相同内容只存一份；索引是 SQLite 数据库，
+    启动时只打开文件，不需要把整个索引读进内存。
+    """
+
+    def __init__(self, root: str = CACHE_ROOT, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(root, 'blobs'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite'))
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'blobs', digest[:2], digest)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._db.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """读取缓存并更新最近使用时间"""
+        row = self._db.execute('SELECT url, status, headers, digest FROM entries WHERE key = ?',
+                               (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        url, status, headers, digest = row
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            logger.warning(f"⚠️ 缓存文件丢失，删除索引项: {url}")
+            self._delete(key)
+            self._db.commit()
+            self.misses += 1
+            return None
+        with self._db:
+            self._db.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time_ns(), key))
+        self.hits += 1
+        return CachedResponse(url, status, [tuple(h) for h in json.loads(headers)], body)
+
+    def put(self, key: str, url: str, status: int, headers: List[Tuple[str, str]], body: bytes):
+        """写入一个响应，超过大小上限时淘汰最久未使用的项"""
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(digest)
+        with self._db:
+            if self._db.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone() is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+                self._db.execute('INSERT INTO blobs(digest, size) VALUES (?, ?)', (digest, len(body)))
+                self._db.execute("UPDATE meta SET value = value + ? WHERE name = 'total_bytes'", (len(body),))
+            previous = self._db.execute('SELECT digest FROM entries WHERE key = ?', (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries(key, url, status, headers, digest, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, url, status, json.dumps(headers, ensure_ascii=False), digest, time.time_ns()))
+            if previous is not None and previous[0] != digest:
+                self._release_blob(previous[0])
+            self._evict()
+
+    def _delete(self, key: str):
+        row = self._db.execute('SELECT digest FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self._db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._release_blob(row[0])
+
+    def _release_blob(self, digest: str):
+        """没有索引项引用时删除内容文件"""
+        if self._db.execute('SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)).fetchone():
+            return
+        row = self._db.execute('SELECT size FROM blobs WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            return
+        self._db.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+        self._db.execute("UPDATE meta SET value = value - ? WHERE name = 'total_bytes'", (row[0],))
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            row = self._db.execute('SELECT key, url FROM entries ORDER BY last_used LIMIT 1').fetchone()
+            if row is None:
+                break
+            logger.info(f"缓存超过上限，淘汰: {row[1]}")
+            self._delete(row[0])
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class NetworkInterceptor:
+    """在页面和扩展 service worker 的 CDP 会话上用 Fetch 域拦截请求，录制或回放"""
+
+    def __init__(self, cache: NetworkCache, mode: str = 'replay',
+                 url_patterns: Tuple[str, ...] = URL_PATTERNS):
+        if mode not in MODES:
+            raise ValueError(f"未知的缓存模式: {mode}")
+        self.cache = cache
+        self.mode = mode
+        self.url_patterns = url_patterns
+        self.recorded = 0
+        self.replayed = 0
+        self.missed: List[str] = []
+        self._sessions: List[Tuple[Any, Any]] = []
+        self._tasks = set()
+
+    async def attach(self, session: Any) -> 'NetworkInterceptor':
+        """在一个 CDP 会话上开启拦截，直通模式下什么也不做"""
+        if self.mode == 'passthrough':
+            return self
+        stage = 'Response' if self.mode == 'record' else 'Request'
+
+        def on_paused(event):
+            task = asyncio.ensure_future(self._on_paused(session, event))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        session.on('Fetch.requestPaused', on_paused)
+        self._sessions.append((session, on_paused))
+        await session.send('Fetch.enable', {
+            'patterns': [{'urlPattern': pattern, 'requestStage': stage} for pattern in self.url_patterns],
+        })
+        return self
+
+    async def _on_paused(self, session: Any, event: Dict):
+        request_id = event['requestId']
+        request = event['request']
+        key = cache_key(request['method'], request['url'], request.get('headers'), request.get('postData'))
+        try:
+            if self.mode == 'record':
+                await self._record(session, event, key)
+            else:
+                await self._replay(session, request_id, request['url'], key)
+        except Exception as e:
+            logger.warning(f"⚠️ 处理拦截请求失败: {request['url']}: {e}")
+            try:
+                await session.send('Fetch.continueRequest', {'requestId': request_id})
+            except Exception:
+                pass
+
+    async def _record(self, session: Any, event: Dict, key: str):
+        request_id = event['requestId']
+        status = event.get('responseStatusCode')
+        if status is not None and 'responseErrorReason' not in event and status < 400:
+            response = await session.send('Fetch.getResponseBody', {'requestId': request_id})
+            body = response.get('body', '')
+            body = base64.b64decode(body) if response.get('base64Encoded') else body.encode('utf-8')
+            headers = [(h['name'], h['value']) for h in event.get('responseHeaders', [])
+                       if h['name'].lower() not in DROPPED_RESPONSE_HEADERS]
+            self.cache.put(key, event['request']['url'], status, headers, body)
+            self.recorded += 1
+        await session.send('Fetch.continueRequest', {'requestId': request_id})
+
+    async def _replay(self, session: Any, request_id: str, url: str, key: str):
+        cached = self.cache.get(key)
+        if cached is None:
+            # 回放模式下不走网络，未命中直接失败，保证结果可重复
+            logger.warning(f"⚠️ 缓存未命中: {url}")
+            self.missed.append(url)
+            await session.send('Fetch.failRequest', {'requestId': request_id,
+                                                     'errorReason': 'InternetDisconnected'})
+            return
+        await session.send('Fetch.fulfillRequest', {
+            'requestId': request_id,
+            'responseCode': cached.status,
+            'responseHeaders': [{'name': name, 'value': value} for name, value in cached.headers],
+            'body': base64.b64encode(cached.body).decode('ascii'),
+        })
+        self.replayed += 1
+
+    async def detach(self):
+        """关闭所有会话上的拦截"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for session, handler in self._sessions:
+            session.remove_listener('Fetch.requestPaused', handler)
+            try:
+                await session.send('Fetch.disable')
+            except Exception:
+                pass
+        self._sessions = []
+        if self.mode != 'passthrough':
+            logger.info(f"网络缓存 ({self.mode}): 录制 {self.recorded}, 回放 {self.replayed}, "
+                        f"未命中 {len(self.missed)}")
+
+
+async def attach_network_cache(browser: Any, page: Any, cache: NetworkCache,
+                               mode: str) -> NetworkInterceptor:
+    """在选项页和扩展 service worker 上开启录制或回放"""
+    interceptor = NetworkInterceptor(cache, mode)
+    if mode == 'passthrough':
+        return interceptor
+    await interceptor.attach(page._client)
+    target = extension_worker_target(browser)
+    if target is not None:
+        await interceptor.attach(await target.createCDPSession())
+    else:
+        logger.warning("⚠️ 没有找到扩展的 service worker target，只拦截页面请求")
+    return interceptor
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='查看或清理网络录制缓存')
+    parser.add_argument('command', choices=['stats', 'trim', 'clear'])
+    parser.add_argument('--cache-dir', default=CACHE_ROOT)
+    parser.add_argument('--max-mb', type=float, help='trim 时使用的大小上限（MB）')
+    args = parser.parse_args(argv)
+
+    if args.command == 'clear':
+        shutil.rmtree(args.cache_dir, ignore_errors=True)
+        logger.info(f"已删除缓存: {args.cache_dir}")
+        return 0
+    with NetworkCache(args.cache_dir) as cache:
+        if args.command == 'trim' and args.max_mb is not None:
+            cache.max_bytes = int(args.max_mb * 1024 * 1024)
+            with cache._db:
+                cache._evict()
+        logger.info(f"缓存 {args.cache_dir}: {len(cache)} 项, {cache.total_bytes / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,231 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional, Any, Dict, Union
+
+from browser_pool import extension_worker_target
+from stats import percentile
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class NetworkConditions:
+    """Network.emulateNetworkConditions 的参数（延迟毫秒，带宽 kbps）"""
+    latency_ms: float
+    download_kbps: float
+    upload_kbps: float
+
+    def to_cdp(self) -> Dict:
+        return {
+            'offline': False,
+            'latency': self.latency_ms,
+            'downloadThroughput': self.download_kbps * 1000 / 8,
+            'uploadThroughput': self.upload_kbps * 1000 / 8,
+        }
+
+
+# 与 DevTools / Lighthouse 的预设一致
+NETWORK_CONDITIONS = {
+    'slow-4g': NetworkConditions(150, 1638.4, 750),
+    '3g': NetworkConditions(562.5, 1474.56, 675),
+    'slow-3g': NetworkConditions(2000, 400, 400),
+}
+
+# 取消网络限制
+NO_THROTTLING = {'offline': False, 'latency': 0, 'downloadThroughput': -1, 'uploadThroughput': -1}
+
+KIWI_USER_AGENT = ('Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 '
+                   '(KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36')
+
+DESKTOP_VIEWPORT = {'width': 1280, 'height': 800}
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """一个性能配置：视口、UA、CPU 降速倍数和网络条件"""
+    name: str
+    viewport: Dict
+    user_agent: Optional[str] = None
+    cpu_throttling_rate: float = 1.0
+    network: Optional[str] = None
+
+    @property
+    def network_conditions(self) -> Optional[NetworkConditions]:
+        return NETWORK_CONDITIONS[self.network] if self.network else None
+
+
+PROFILES = {
+    'desktop': PerformanceProfile('desktop', DESKTOP_VIEWPORT),
+    # 中端安卓手机上的 Kiwi 浏览器（与 Lighthouse 移动端默认值相同：4 倍 CPU 降速、慢速 4G）
+    'kiwi-midrange': PerformanceProfile(
+        'kiwi-midrange',
+        {'width': 412, 'height': 823, 'deviceScaleFactor': 1.75, 'isMobile': True, 'hasTouch': True},
+        KIWI_USER_AGENT, 4.0, 'slow-4g'),
+    'kiwi-lowend': PerformanceProfile(
+        'kiwi-lowend',
+        {'width': 360, 'height': 640, 'deviceScaleFactor': 2, 'isMobile': True, 'hasTouch': True},
+        KIWI_USER_AGENT, 6.0, '3g'),
+    '3G': PerformanceProfile('3G', DESKTOP_VIEWPORT, network='3g'),
+    'slow-3G': PerformanceProfile('slow-3G', DESKTOP_VIEWPORT, network='slow-3g'),
+}
+
+
+def get_profile(profile: Union[str, PerformanceProfile, None]) -> Optional[PerformanceProfile]:
+    """按名称查找配置，名称不区分大小写"""
+    if profile is None or isinstance(profile, PerformanceProfile):
+        return profile
+    for name, value in PROFILES.items():
+        if name.lower() == profile.lower():
+            return value
+    raise ValueError(f"未知的性能配置: {profile}（可用: {', '.join(PROFILES)}）")
+
+
+class ProfileSession:
+    """在选项页和扩展 service worker 上应用性能配置
+
+    CPU 降速和视口只作用于选项页；网络限制同时作用于 service worker，
+    因为扩展的请求可能由 service worker 发出。service worker 被浏览器终止后会以新的 target 重启，
+    每次下载前调用 refresh_worker() 重新附加。
+    """
+
+    def __init__(self, browser: Any, page: Any, profile: PerformanceProfile):
+        self.browser = browser
+        self.page = page
+        self.profile = profile
+        self._worker_target = None
+        self._worker_session = None
+
+    async def apply(self) -> 'ProfileSession':
+        profile = self.profile
+        await self.page.setViewport(profile.viewport)
+        if profile.user_agent:
+            await self.page.setUserAgent(profile.user_agent)
+        client = self.page._client
+        await client.send('Emulation.setCPUThrottlingRate', {'rate': profile.cpu_throttling_rate})
+        if profile.network_conditions is not None:
+            await client.send('Network.emulateNetworkConditions', profile.network_conditions.to_cdp())
+        await self.refresh_worker()
+        logger.info(f"性能配置: {profile.name} (CPU {profile.cpu_throttling_rate:g}x, "
+                    f"网络 {profile.network or '不限速'}, 视口 {profile.viewport['width']}×{profile.viewport['height']})")
+        return self
+
+    async def refresh_worker(self):
+        """service worker 换了 target 时重新附加并应用网络限制"""
+        if self.profile.network_conditions is None:
+            return
+        target = extension_worker_target(self.browser)
+        if target is None or target is self._worker_target:
+            return
+        await self._detach_worker()
+        try:
+            session = await target.createCDPSession()
+            await session.send('Network.enable')
+            await session.send('Network.emulateNetworkConditions', self.profile.network_conditions.to_cdp())
+            self._worker_target, self._worker_session = target, session
+        except Exception as e:
+            logger.warning(f"⚠️ 无法在扩展 service worker 上限制网络: {e}")
+
+    async def _detach_worker(self):
+        if self._worker_session is None:
+            return
+        try:
+            await self._worker_session.send('Network.emulateNetworkConditions', NO_THROTTLING)
+            await self._worker_session.detach()
+        except Exception:
+            # service worker 可能已经被终止
+            pass
+        self._worker_target = self._worker_session = None
+
+    async def clear(self):
+        """取消所有限制"""
+        await self._detach_worker()
+        if self.page.isClosed():
+            return
+        try:
+            client = self.page._client
+            await client.send('Emulation.setCPUThrottlingRate', {'rate': 1})
+            await client.send('Network.emulateNetworkConditions', NO_THROTTLING)
+        except Exception as e:
+            logger.warning(f"⚠️ 取消性能限制时出错: {e}")
+
+
+# 在选项页上记录长任务、帧间隔和事件循环延迟
+JANK_PROBE_INSTALL = '''() => {
+    const state = {longTasks: [], frameGaps: [], lags: [], started: performance.now(), stopped: false};
+    try {
+        state.observer = new PerformanceObserver(list => {
+            for (const entry of list.getEntries()) state.longTasks.push(entry.duration);
+        });
+        state.observer.observe({entryTypes: ['longtask']});
+    } catch (e) {
+        state.observer = null;
+    }
+    let lastFrame = performance.now();
+    const onFrame = t => {
+        state.frameGaps.push(t - lastFrame);
+        lastFrame = t;
+        if (!state.stopped) requestAnimationFrame(onFrame);
+    };
+    requestAnimationFrame(onFrame);
+    let expected = performance.now() + 16;
+    state.timer = setInterval(() => {
+        const now = performance.now();
+        state.lags.push(Math.max(0, now - expected));
+        expected = now + 16;
+    }, 16);
+    window.__ytsdJankProbe = state;
+}'''
+
+JANK_PROBE_COLLECT = '''() => {
+    const state = window.__ytsdJankProbe;
+    if (!state) return null;
+    state.stopped = true;
+    clearInterval(state.timer);
+    if (state.observer) state.observer.disconnect();
+    delete window.__ytsdJankProbe;
+    return {longTasks: state.longTasks, frameGaps: state.frameGaps, lags: state.lags,
+            elapsed: performance.now() - state.started, longTaskSupported: state.observer !== null};
+}'''
+
+# 超过这个时长（毫秒）的任务计入阻塞时间
+LONG_TASK_MS = 50
+
+# 超过这个间隔（毫秒）的帧视为卡顿
+JANK_FRAME_MS = 50
+
+
+def summarize_interactivity(raw: Optional[Dict]) -> Optional[Dict]:
+    """把探针数据汇总为交互性指标（毫秒）"""
+    if not raw:
+        return None
+    long_tasks = raw.get('longTasks', [])
+    frame_gaps = raw.get('frameGaps', [])
+    lags = raw.get('lags', [])
+    return {
+        'elapsed_ms': round(raw.get('elapsed', 0), 1),
+        'long_tasks': len(long_tasks),
+        'total_blocking_time_ms': round(sum(max(0.0, d - LONG_TASK_MS) for d in long_tasks), 1),
+        'max_long_task_ms': round(max(long_tasks, default=0), 1),
+        'max_frame_gap_ms': round(max(frame_gaps, default=0), 1),
+        'p95_frame_gap_ms': round(percentile(frame_gaps, 95) or 0, 1),
+        'janky_frames': sum(1 for gap in frame_gaps if gap > JANK_FRAME_MS),
+        'max_input_delay_ms': round(max(lags, default=0), 1),
+        'long_task_supported': raw.get('longTaskSupported', True),
+    }
+
+
+async def install_jank_probe(page: Any) -> bool:
+    try:
+        await page.evaluate(JANK_PROBE_INSTALL)
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ 无法安装交互性探针: {e}")
+        return False
+
+
+async def collect_jank_probe(page: Any) -> Optional[Dict]:
+    try:
+        return summarize_interactivity(await page.evaluate(JANK_PROBE_COLLECT))
+    except Exception as e:
+        logger.warning(f"⚠️ 无法读取交互性探针: {e}")
+        return None
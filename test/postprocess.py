@@ -0,0 +1,242 @@
+import asyncio
+import argparse
+import json
+import os
+import logging
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+from typing import Optional, List, Dict, Iterable, Iterator, TextIO
+
+from browser_pool import DOWNLOADS_ROOT
+from downloads_watcher import subtitle_files
+from subtitle_engine import (
+    Cue, CueStore, WRITERS, TIMED_FORMATS, detect_format, iter_cues, write_cues, merge_rolling
+)
+
+logger = logging.getLogger(__name__)
+
+# 后处理的默认输出目录
+POSTPROCESS_ROOT = os.path.join(DOWNLOADS_ROOT, 'processed')
+
+# 每个输出目录中的逐文件结果日志
+REPORT_NAME = 'postprocess.jsonl'
+
+
+@dataclass
+class PostprocessResult:
+    """一个下载文件的后处理结果"""
+    source: str
+    format: str
+    ok: bool = False
+    cues_in: int = 0
+    cues_out: int = 0
+    # 格式 -> 输出路径
+    outputs: Dict[str, str] = field(default_factory=dict)
+    # 结束时间早于开始时间、被修正为开始时间的字幕数
+    fixed_timings: int = 0
+    # 开始时间倒退、需要重新排序
+    reordered: bool = False
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+def normalize_text(text: str) -> str:
+    """NFC 规范化，折叠每行内的空白并去掉空行"""
+    lines = (' '.join(line.split()) for line in unicodedata.normalize('NFC', text).splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+def normalize_cues(cues: Iterable[Cue], result: PostprocessResult) -> Iterator[Cue]:
+    """规范化文本、丢弃空字幕、把结束早于开始的时间修正为零时长"""
+    for cue in cues:
+        result.cues_in += 1
+        text = normalize_text(cue.text)
+        if not text:
+            continue
+        end_ms = cue.end_ms
+        if end_ms < cue.start_ms:
+            end_ms = cue.start_ms
+            result.fixed_timings += 1
+        yield Cue(cue.start_ms, end_ms, text)
+
+
+def output_stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def process_file(path: str, output_dir: str, formats: Iterable[str] = tuple(WRITERS),
+                 dedupe: bool = True) -> PostprocessResult:
+    """校验、规范化、去重一个字幕文件，并以 UTF-8（无 BOM）写出为每种输出格式
+
+    结束早于开始的时间和倒退的开始时间会被修正并记为警告，无法解析的文件记为错误。
+    在进程池的 worker 中运行，只使用可序列化的参数和返回值。
+    没有时间信息的 TXT 只能输出 TXT。
+    """
+    started = time.perf_counter()
+    fmt = detect_format(path)
+    result = PostprocessResult(source=path, format=fmt)
+    cues = []
+    try:
+        cues = normalize_cues(iter_cues(path, fmt), result)
+        if dedupe:
+            cues = merge_rolling(cues)
+        cues = list(cues)
+    except (ValueError, SyntaxError, UnicodeDecodeError) as e:
+        result.errors.append(f"解析失败（第 {result.cues_in + 1} 条附近）: {e}")
+    if not result.errors and not cues:
+        result.errors.append("文件中没有字幕")
+    if result.errors:
+        result.elapsed = time.perf_counter() - started
+        return result
+    if result.fixed_timings:
+        result.warnings.append(f"{result.fixed_timings} 条字幕结束时间早于开始时间，已修正")
+    if fmt in TIMED_FORMATS and any(b.start_ms < a.start_ms for a, b in zip(cues, cues[1:])):
+        result.reordered = True
+        result.warnings.append("字幕开始时间倒退，已按开始时间排序")
+        cues.sort(key=lambda cue: cue.start_ms)
+    store = CueStore.from_cues(cues)
+    result.cues_out = len(store)
+
+    targets = list(formats)
+    if fmt not in TIMED_FORMATS and targets != ['txt']:
+        targets = [target for target in targets if target == 'txt']
+        result.warnings.append('TXT 没有时间信息，只输出 TXT')
+    os.makedirs(output_dir, exist_ok=True)
+    stem = output_stem(path)
+    for target in targets:
+        destination = os.path.join(output_dir, f'{stem}.{target}')
+        tmp_path = f'{destination}.tmp'
+        write_cues(store, tmp_path, target)
+        os.replace(tmp_path, destination)
+        result.outputs[target] = destination
+    result.ok = True
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+class PostProcessor:
+    """把下载完成的文件分发到进程池后处理，与下载并行进行
+
+    submit() 在队列满时等待，下载跑得比后处理快时自动减速；
+    每个结果完成后立即追加到输出目录中的 postprocess.jsonl。
+    """
+
+    def __init__(self, output_dir: str = POSTPROCESS_ROOT,
+                 formats: Iterable[str] = tuple(WRITERS),
+                 dedupe: bool = True,
+                 workers: Optional[int] = None,
+                 queue_size: Optional[int] = None):
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        self.dedupe = dedupe
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size or self.workers * 2
+        self.results: List[PostprocessResult] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._dispatchers: List[asyncio.Future] = []
+        self._report: Optional[TextIO] = None
+        self._started = 0.0
+
+    def start(self) -> 'PostProcessor':
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._report = open(os.path.join(self.output_dir, REPORT_NAME), 'a', encoding='utf-8')
+        self._dispatchers = [asyncio.ensure_future(self._dispatch()) for _ in range(self.workers)]
+        self._started = time.perf_counter()
+        logger.info(f"后处理: {self.workers} 个进程，队列上限 {self.queue_size}")
+        return self
+
+    async def submit(self, path: str):
+        """提交一个下载完成的文件，队列满时等待"""
+        await self._queue.put(path)
+
+    async def _dispatch(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            path = await self._queue.get()
+            if path is None:
+                return
+            try:
+                result = await loop.run_in_executor(self._executor, process_file, path, self.output_dir,
+                                                    self.formats, self.dedupe)
+            except Exception as e:
+                # worker 进程崩溃等，不影响其他文件
+                result = PostprocessResult(source=path, format='', errors=[f"后处理出错: {e}"])
+            self._record(result)
+
+    def _record(self, result: PostprocessResult):
+        self.results.append(result)
+        self._report.write(json.dumps(asdict(result), ensure_ascii=False) + '\n')
+        self._report.flush()
+        if result.ok:
+            logger.info(f"✓ 后处理 {os.path.basename(result.source)}: {result.cues_in} -> {result.cues_out} 条, "
+                        f"{', '.join(result.outputs)}")
+        else:
+            logger.warning(f"❌ 后处理 {os.path.basename(result.source)}: {'; '.join(result.errors)}")
+
+    async def close(self) -> Dict:
+        """等待队列中的文件处理完，关闭进程池，返回汇总"""
+        if self._executor is None:
+            return self.summary()
+        for _ in self._dispatchers:
+            await self._queue.put(None)
+        await asyncio.gather(*self._dispatchers)
+        self._executor.shutdown()
+        self._executor = None
+        self._report.close()
+        summary = self.summary()
+        logger.info(f"后处理完成: 成功 {summary['ok']}, 失败 {summary['failed']}, "
+                    f"修正时间 {summary['fixed_timings']} 条, 耗时 {summary['wall_time']:.1f}s")
+        return summary
+
+    def summary(self) -> Dict:
+        return {
+            'output_dir': self.output_dir,
+            'workers': self.workers,
+            'files': len(self.results),
+            'ok': sum(1 for result in self.results if result.ok),
+            'failed': sum(1 for result in self.results if not result.ok),
+            'cues_in': sum(result.cues_in for result in self.results),
+            'cues_out': sum(result.cues_out for result in self.results),
+            'fixed_timings': sum(result.fixed_timings for result in self.results),
+            'reordered': sum(1 for result in self.results if result.reordered),
+            'wall_time': time.perf_counter() - self._started if self._started else 0.0,
+        }
+
+
+async def postprocess_paths(paths: Iterable[str], output_dir: str = POSTPROCESS_ROOT, **kwargs) -> Dict:
+    """后处理已有的文件"""
+    processor = PostProcessor(output_dir, **kwargs).start()
+    try:
+        for path in paths:
+            await processor.submit(path)
+    finally:
+        summary = await processor.close()
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='并行后处理下载的字幕：校验、规范化、去重并转换为其他格式')
+    parser.add_argument('inputs', nargs='+', help='字幕文件，或包含 *_subtitles.* 文件的目录')
+    parser.add_argument('--output', default=POSTPROCESS_ROOT, help='输出目录')
+    parser.add_argument('--formats', nargs='+', default=list(WRITERS), choices=list(WRITERS))
+    parser.add_argument('--workers', type=int, help='进程数，默认为 CPU 核数')
+    parser.add_argument('--no-dedupe', action='store_true', help='不合并滚动字幕')
+    args = parser.parse_args(argv)
+
+    paths = []
+    for item in args.inputs:
+        paths.extend(sorted(subtitle_files(item)) if os.path.isdir(item) else [item])
+    summary = asyncio.run(postprocess_paths(paths, args.output, formats=args.formats,
+                                            dedupe=not args.no_dedupe, workers=args.workers))
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,199 @@
+import asyncio
+import argparse
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+import logging
+import time
+from typing import Optional, List
+
+from pyppeteer import launch
+
+from browser_pool import CHROME_PATH, EXTENSION_PATH, build_launch_args, wait_for_extension_target
+from extension_id import resolve_extension_id, options_page_url
+
+logger = logging.getLogger(__name__)
+
+# 预先构建的 Chrome 配置文件模板目录
+TEMPLATE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), 'profiles', 'template'))
+
+# 模板元数据文件
+METADATA_FILE = 'template.json'
+
+# 模板中不需要保留的缓存和锁文件
+EXCLUDED_NAMES = {
+    'Cache', 'Code Cache', 'GPUCache', 'GrShaderCache', 'ShaderCache', 'DawnCache',
+    'Crashpad', 'BrowserMetrics', 'SingletonLock', 'SingletonSocket', 'SingletonCookie',
+    'DevToolsActivePort', 'lockfile', 'LOCK',
+}
+
+# LevelDB 的 SST 文件写入后不再修改，可以安全地硬链接
+IMMUTABLE_SUFFIXES = ('.ldb', '.sst')
+
+# Linux FICLONE ioctl，用于 btrfs / xfs 等文件系统的 reflink 写时复制
+FICLONE = 0x40049409
+
+
+def extension_fingerprint(extension_path: str = EXTENSION_PATH) -> str:
+    """扩展源码的指纹（文件路径、大小、修改时间），源码变化后模板需要重新构建"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(extension_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f'{os.path.relpath(path, extension_path)}|{stat.st_size}|{stat.st_mtime_ns}\n'
+                          .encode('utf-8'))
+    return digest.hexdigest()
+
+
+def read_metadata(template_dir: str = TEMPLATE_DIR) -> Optional[dict]:
+    """读取模板元数据，模板不存在时返回 None"""
+    path = os.path.join(template_dir, METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_template_current(template_dir: str = TEMPLATE_DIR,
+                        extension_path: str = EXTENSION_PATH) -> bool:
+    """模板是否存在且与当前扩展源码、Chrome 路径一致"""
+    metadata = read_metadata(template_dir)
+    return bool(metadata) and \
+        metadata.get('fingerprint') == extension_fingerprint(extension_path) and \
+        metadata.get('extension_path') == extension_path and \
+        metadata.get('chrome_path') == CHROME_PATH
+
+
+async def bake_template(template_dir: str = TEMPLATE_DIR,
+                        extension_path: str = EXTENSION_PATH,
+                        headless: bool = False,
+                        timeout: float = 30.0) -> str:
+    """一次性构建配置文件模板：安装扩展、等待 service worker 注册、打开一次选项页"""
+    started = time.perf_counter()
+    shutil.rmtree(template_dir, ignore_errors=True)
+    os.makedirs(template_dir)
+
+    browser = await launch(
+        headless=headless,
+        executablePath=CHROME_PATH,
+        args=build_launch_args(extension_path, template_dir, proxy_server=None),
+    )
+    try:
+        target = await wait_for_extension_target(browser, timeout)
+        if target is None:
+            raise RuntimeError("扩展没有在模板浏览器中加载")
+        # 打开一次选项页，让扩展的首次运行逻辑和存储初始化写入配置文件
+        page = await browser.newPage()
+        await page.goto(options_page_url(extension_path), {'waitUntil': 'load', 'timeout': timeout * 1000})
+        await page.close()
+    finally:
+        await browser.close()
+
+    # 去掉缓存和锁文件，缩小模板
+    for root, dirs, files in os.walk(template_dir):
+        for name in list(dirs):
+            if name in EXCLUDED_NAMES:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                dirs.remove(name)
+        for name in files:
+            if name in EXCLUDED_NAMES:
+                os.remove(os.path.join(root, name))
+
+    metadata = {
+        'fingerprint': extension_fingerprint(extension_path),
+        'extension_path': extension_path,
+        'extension_id': resolve_extension_id(extension_path),
+        'chrome_path': CHROME_PATH,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(os.path.join(template_dir, METADATA_FILE), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    logger.info(f"配置文件模板已构建: {template_dir}, 耗时 {time.perf_counter() - started:.2f}s")
+    return template_dir
+
+
+async def ensure_template(template_dir: str = TEMPLATE_DIR,
+                          extension_path: str = EXTENSION_PATH,
+                          headless: bool = False) -> str:
+    """模板不存在或已过期时重新构建"""
+    if not is_template_current(template_dir, extension_path):
+        logger.info("配置文件模板不存在或已过期，重新构建...")
+        await bake_template(template_dir, extension_path, headless)
+    return template_dir
+
+
+class _Cloner:
+    """逐个文件复制：优先 reflink，其次对不可变文件硬链接，最后普通复制"""
+
+    def __init__(self):
+        self.reflink_supported = sys.platform.startswith('linux')
+        self.stats = {'reflink': 0, 'hardlink': 0, 'copy': 0}
+
+    def _reflink(self, src: str, dst: str) -> bool:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return True
+            except OSError as e:
+                if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                    self.reflink_supported = False
+                    return False
+                raise
+
+    def copy(self, src: str, dst: str):
+        if self.reflink_supported and self._reflink(src, dst):
+            self.stats['reflink'] += 1
+            return
+        if src.endswith(IMMUTABLE_SUFFIXES):
+            try:
+                if os.path.exists(dst):
+                    os.remove(dst)
+                os.link(src, dst)
+                self.stats['hardlink'] += 1
+                return
+            except OSError:
+                pass
+        shutil.copy2(src, dst)
+        self.stats['copy'] += 1
+
+
+def clone_profile(template_dir: str, dest_dir: str) -> str:
+    """把模板克隆为一次运行使用的配置文件目录（写时复制或普通复制）"""
+    started = time.perf_counter()
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    cloner = _Cloner()
+    shutil.copytree(template_dir, dest_dir, copy_function=cloner.copy,
+                    ignore=shutil.ignore_patterns(METADATA_FILE))
+    logger.info(f"克隆配置文件模板: {dest_dir} ({cloner.stats}), "
+                f"耗时 {time.perf_counter() - started:.3f}s")
+    return dest_dir
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='构建预装扩展的 Chrome 配置文件模板')
+    parser.add_argument('command', choices=['bake', 'status'])
+    parser.add_argument('--template', default=TEMPLATE_DIR)
+    parser.add_argument('--force', action='store_true', help='即使模板是最新的也重新构建')
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        current = is_template_current(args.template)
+        logger.info(f"模板 {args.template}: {'最新' if current else '不存在或已过期'}")
+        return 0 if current else 1
+    if args.force:
+        asyncio.run(bake_template(args.template, headless=args.headless))
+    else:
+        asyncio.run(ensure_template(args.template, headless=args.headless))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
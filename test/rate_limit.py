@@ -0,0 +1,275 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Tuple, Callable
+from urllib.parse import urlparse
+
+from http_status import retryable_status
+
+logger = logging.getLogger(__name__)
+
+# 每个域名的默认速率（请求/秒）和突发容量
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 2
+
+# 统计实际请求速率的滑动窗口（秒）
+RATE_WINDOW = 10.0
+
+# 这些写法的URL都由扩展向 www.youtube.com 请求字幕，共用一个令牌桶
+HOST_ALIASES = {
+    'youtube.com': 'www.youtube.com',
+    'm.youtube.com': 'www.youtube.com',
+    'music.youtube.com': 'www.youtube.com',
+    'youtu.be': 'www.youtube.com',
+    'www.youtube-nocookie.com': 'www.youtube.com',
+}
+
+
+def host_of(url: str) -> str:
+    """限速使用的域名：输入URL的域名，YouTube 的各种别名归一为实际请求的 www.youtube.com"""
+    host = urlparse(url).hostname or ''
+    return HOST_ALIASES.get(host, host)
+
+
+class TokenBucket:
+    """令牌桶，速率按 AIMD 调整：成功时线性增加，被限流时减半
+
+    令牌可以预支为负数，acquire() 按欠下的令牌数等待，调用方之间不需要加锁。
+    pause() 把下一次补充令牌的时间推迟到 Retry-After 之后。
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 min_rate: Optional[float] = None, max_rate: Optional[float] = None,
+                 increase: float = 0.05, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else rate / 8
+        self.max_rate = max_rate if max_rate is not None else rate
+        self.increase = increase
+        self.clock = clock
+        self.tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self.tokens = min(float(self.burst), self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self) -> float:
+        """取一个令牌，返回需要等待的秒数"""
+        now = self.clock()
+        self._refill(now)
+        self.tokens -= 1
+        wait = max(0.0, self._updated - now)
+        if self.tokens < 0:
+            wait += -self.tokens / self.rate
+        return wait
+
+    async def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float):
+        """在 seconds 秒内不再发放令牌"""
+        now = self.clock()
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self._updated = max(self._updated, now + seconds)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttled(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+
+class HostLimiter:
+    """按域名共享的令牌桶，所有 worker 使用同一个实例"""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 min_rate: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.clock = clock
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst, self.min_rate, clock=self.clock)
+        return self.buckets[host]
+
+    async def acquire(self, url: str) -> float:
+        return await self.bucket(host_of(url)).acquire()
+
+
+@dataclass
+class RetryPolicy:
+    """带抖动的指数退避，Retry-After 给出的等待时间是下限"""
+    max_attempts: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None,
+              rng: Callable[[], float] = random.random) -> float:
+        """第 attempt 次重试前等待的秒数（attempt 从 1 开始）"""
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        # 等额抖动：至少等一半，避免所有 worker 同时重试
+        jittered = backoff / 2 + rng() * backoff / 2
+        return max(jittered, retry_after or 0.0)
+
+
+@dataclass
+class Job:
+    """调度中的一个URL，attempt 为已经失败的次数"""
+    url: str
+    attempt: int = 0
+    seq: int = 0
+    ready_at: float = 0.0
+    last_status: Optional[int] = None
+
+
+@dataclass
+class SchedulerMetrics:
+    """调度器的实时状态"""
+    in_flight: int
+    queued: int
+    retrying: int
+    completed: int
+    failed: int
+    retries: int
+    throttled: int
+    requests_per_second: float
+    host_rates: Dict[str, float] = field(default_factory=dict)
+
+
+class FetchScheduler:
+    """在 worker 和页面之间调度下载：按域名限速，429 / 5xx 退避重试
+
+    就绪的任务按 (已失败次数, 提交顺序) 出队，新URL优先于重试；
+    等待退避的任务不占用 worker，到期后才回到就绪队列。
+    """
+
+    def __init__(self, limiter: Optional[HostLimiter] = None, policy: Optional[RetryPolicy] = None,
+                 clock: Callable[[], float] = time.monotonic, window: float = RATE_WINDOW):
+        self.limiter = limiter or HostLimiter(clock=clock)
+        self.policy = policy or RetryPolicy()
+        self.clock = clock
+        self.window = window
+        self._ready: List[Tuple[int, int, Job]] = []
+        self._delayed: List[Tuple[float, int, Job]] = []
+        self._seq = 0
+        # 已经出队但还没有 finish() 的任务，包括等待令牌的
+        self._leased = 0
+        self._in_flight = 0
+        self._changed = asyncio.Event()
+        self._starts = deque()
+        self._started = clock()
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+
+    def submit(self, url: str):
+        self._seq += 1
+        heapq.heappush(self._ready, (0, self._seq, Job(url, seq=self._seq)))
+        self._changed.set()
+
+    def _promote(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, job = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (job.attempt, job.seq, job))
+
+    async def next(self) -> Optional[Job]:
+        """取下一个任务并等待令牌；所有任务都结束后返回 None"""
+        while True:
+            now = self.clock()
+            self._promote(now)
+            if self._ready:
+                _, _, job = heapq.heappop(self._ready)
+                self._leased += 1
+                try:
+                    await self.limiter.acquire(job.url)
+                except BaseException:
+                    self._leased -= 1
+                    raise
+                self._in_flight += 1
+                self._starts.append(self.clock())
+                return job
+            if not self._delayed and self._leased == 0:
+                return None
+            # 等待退避到期，或者其他 worker 完成任务（可能重新排队）
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def finish(self, job: Job, ok: bool, status: Optional[int] = None,
+               retry_after: Optional[float] = None) -> Optional[float]:
+        """报告任务结果；需要重试时重新排队并返回等待秒数，否则返回 None"""
+        self._leased -= 1
+        self._in_flight -= 1
+        bucket = self.limiter.bucket(host_of(job.url))
+        job.last_status = status
+        try:
+            if not ok and retryable_status(status):
+                self.throttled += 1
+                bucket.on_throttled()
+                if retry_after:
+                    # Retry-After 对整个域名生效，而不只是这一个任务
+                    bucket.pause(retry_after)
+                if job.attempt + 1 < self.policy.max_attempts:
+                    job.attempt += 1
+                    delay = self.policy.delay(job.attempt, retry_after)
+                    job.ready_at = self.clock() + delay
+                    heapq.heappush(self._delayed, (job.ready_at, job.seq, job))
+                    self.retries += 1
+                    return delay
+            elif ok:
+                bucket.on_success()
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+            return None
+        finally:
+            self._changed.set()
+
+    def requests_per_second(self) -> float:
+        now = self.clock()
+        while self._starts and self._starts[0] < now - self.window:
+            self._starts.popleft()
+        span = min(self.window, now - self._started)
+        return len(self._starts) / span if span > 0 else 0.0
+
+    def metrics(self) -> SchedulerMetrics:
+        return SchedulerMetrics(
+            in_flight=self._in_flight,
+            queued=len(self._ready),
+            retrying=len(self._delayed),
+            completed=self.completed,
+            failed=self.failed,
+            retries=self.retries,
+            throttled=self.throttled,
+            requests_per_second=round(self.requests_per_second(), 3),
+            host_rates={host: round(bucket.rate, 3) for host, bucket in self.limiter.buckets.items()},
+        )
+
+
+async def report_metrics(scheduler: FetchScheduler, interval: float = 5.0):
+    """定期输出调度器状态，直到被取消"""
+    while True:
+        await asyncio.sleep(interval)
+        m = scheduler.metrics()
+        rates = ', '.join(f'{host} {rate:g}/s' for host, rate in m.host_rates.items())
+        logger.info(f"调度: 进行中 {m.in_flight}, 排队 {m.queued}, 等待重试 {m.retrying}, "
+                    f"完成 {m.completed}, 失败 {m.failed}, 重试 {m.retries}, "
+                    f"实际 {m.requests_per_second:.2f} 请求/秒 (限速 {rates or '-'})")
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import logging
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Iterable, Tuple
+
+from browser_pool import BrowserPool
+from subtitle_engine import validate_file
+from golden import check_golden, format_difference, FAILING_STATUSES
+from test_download import (
+    create_test_context, cleanup_context, download_subtitles, DownloadOutcome,
+    video_id_from_url, SUBTITLE_TYPE_IDS, SUBTITLE_FORMATS, GOLDEN_DIR
+)
+
+logger = logging.getLogger(__name__)
+
+# 场景使用的视频（离线夹具中只有这一个视频）
+VIDEO_ID = os.environ.get('YTSD_SCENARIO_VIDEO', 'oc6RV5c1yd0')
+
+# 同一个视频的各种URL写法；watch 为规范写法，其余写法只跑一个类型和格式的组合
+URL_FORMS = {
+    'watch': 'https://www.youtube.com/watch?v={id}',
+    'youtu.be': 'https://youtu.be/{id}',
+    'youtu.be-timestamp': 'https://youtu.be/{id}?t=42',
+    'shorts': 'https://www.youtube.com/shorts/{id}',
+    'embed': 'https://www.youtube.com/embed/{id}',
+    'mobile': 'https://m.youtube.com/watch?v={id}',
+    'timestamp': 'https://www.youtube.com/watch?v={id}&t=42s',
+    'playlist': 'https://www.youtube.com/watch?v={id}&list=PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf&index=2',
+}
+
+# 扩展应当显示错误而不下载的输入
+INVALID_URLS = {
+    'other-site': 'https://invalid-url.com',
+    'no-video-id': 'https://www.youtube.com/watch',
+    'not-a-url': 'not a url',
+}
+
+# 单个场景的默认超时（秒），包含打开选项页和等待下载
+DEFAULT_CASE_TIMEOUT = 60.0
+
+# 默认并行的页面数
+DEFAULT_WORKERS = int(os.environ.get('YTSD_WORKERS', 4))
+
+
+@dataclass(frozen=True)
+class DownloadCase:
+    """一个下载场景：URL、字幕类型、格式，以及预期下载成功还是显示错误"""
+    id: str
+    url: str
+    subtitle_type: str = 'auto'
+    fmt: str = 'txt'
+    expect_error: bool = False
+
+
+@dataclass
+class CaseResult:
+    """一个场景的判定结果和耗时（秒）"""
+    case: DownloadCase
+    passed: bool
+    reason: str
+    elapsed: float
+    outcome: Optional[DownloadOutcome] = None
+
+
+def build_cases(video_id: str = VIDEO_ID,
+                subtitle_types: Iterable[str] = tuple(SUBTITLE_TYPE_IDS),
+                formats: Iterable[str] = SUBTITLE_FORMATS) -> List[DownloadCase]:
+    """场景表：规范URL上的类型 × 格式全组合，每种其他URL写法一个组合，以及无效URL"""
+    subtitle_types, formats = tuple(subtitle_types), tuple(formats)
+    cases = [DownloadCase(f'watch-{subtitle_type}-{fmt}', URL_FORMS['watch'].format(id=video_id),
+                          subtitle_type, fmt)
+             for subtitle_type in subtitle_types for fmt in formats]
+    cases += [DownloadCase(f'{form}-auto-txt', template.format(id=video_id))
+              for form, template in URL_FORMS.items() if form != 'watch']
+    cases += [DownloadCase(f'invalid-{name}', url, expect_error=True)
+              for name, url in INVALID_URLS.items()]
+    return cases
+
+
+CASES = build_cases()
+
+
+def judge(case: DownloadCase, outcome: DownloadOutcome) -> Tuple[bool, str]:
+    """按与原来的顺序测试相同的规则判定一个场景"""
+    status = outcome.status_text
+    if case.expect_error:
+        if outcome.success:
+            return False, f"无效URL却下载了文件: {outcome.path}"
+        if "error" in outcome.status_class or "无效" in status or "错误" in status:
+            return True, f"显示错误: {status}"
+        return False, f"错误消息不符合预期: {status}"
+
+    if outcome.success and outcome.path:
+        report = validate_file(outcome.path)
+        if not report.ok:
+            return False, f"字幕文件校验失败: {'; '.join(report.errors)}"
+        if GOLDEN_DIR:
+            # 同一视频的各种URL写法共用一个基准，自动和手动字幕各有自己的基准
+            comparison = check_golden(outcome.path, GOLDEN_DIR, video_id_from_url(case.url) or VIDEO_ID,
+                                      case.subtitle_type, case.fmt)
+            if comparison.status in FAILING_STATUSES:
+                details = '; '.join(format_difference(d) for d in comparison.differences[:5])
+                return False, f"与基准文件不一致: {comparison.error or details}"
+        return True, f"{report.format}, {report.cue_count} 条字幕"
+    if "success" in outcome.status_class or "成功" in status:
+        # 与原来的测试一致：状态显示成功但没有找到文件时只警告
+        return True, "状态显示成功，但未找到下载的字幕文件"
+    # 扩展正常工作但视频没有这种字幕
+    if "找不到字幕信息" in status:
+        return True, "视频没有可用字幕"
+    return False, f"字幕下载失败，状态: {status}"
+
+
+async def run_case(pool: Optional[BrowserPool], case: DownloadCase,
+                   timeout: float = DEFAULT_CASE_TIMEOUT, **context_kwargs) -> CaseResult:
+    """在独立的页面上运行一个场景；异常记为失败，不影响其他场景"""
+    started = time.perf_counter()
+    outcome = None
+    try:
+        context = await create_test_context(pool=pool, **context_kwargs)
+        try:
+            outcome = await download_subtitles(context, case.url, case.subtitle_type, case.fmt, timeout)
+            passed, reason = judge(case, outcome)
+        finally:
+            await cleanup_context(context)
+    except Exception as e:
+        logger.debug(traceback.format_exc())
+        passed, reason = False, f"{type(e).__name__}: {e}"
+    result = CaseResult(case, passed, reason, time.perf_counter() - started, outcome)
+    logger.info(f"{'✓' if passed else '❌'} {case.id} ({result.elapsed:.2f}s): {reason}")
+    return result
+
+
+async def run_cases(pool: Optional[BrowserPool], cases: Iterable[DownloadCase],
+                    workers: int = DEFAULT_WORKERS, timeout: float = DEFAULT_CASE_TIMEOUT,
+                    **context_kwargs) -> Dict[str, CaseResult]:
+    """用 workers 个并行的页面运行所有场景，返回按场景ID索引的结果
+
+    每个场景从浏览器池借用自己的页面和下载目录；池的页面数决定实际的并行度。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for case in cases:
+        queue.put_nowait(case)
+    total = queue.qsize()
+    results: Dict[str, CaseResult] = {}
+
+    async def worker():
+        while not queue.empty():
+            case = queue.get_nowait()
+            results[case.id] = await run_case(pool, case, timeout, **context_kwargs)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers, total)))))
+    report_timings(results.values(), time.perf_counter() - started)
+    return results
+
+
+def report_timings(results: Iterable[CaseResult], wall_time: float):
+    """记录每个场景的耗时，以及总耗时相对串行运行的加速比"""
+    results = sorted(results, key=lambda result: result.elapsed, reverse=True)
+    if not results:
+        return
+    serial = sum(result.elapsed for result in results)
+    passed = sum(1 for result in results if result.passed)
+    logger.info(f"场景: {passed}/{len(results)} 通过, 总耗时 {wall_time:.1f}s, "
+                f"串行合计 {serial:.1f}s, 加速 {serial / wall_time if wall_time else 0:.1f}x")
+    for result in results:
+        timings = ', '.join(f'{phase} {value:.2f}s' for phase, value in
+                            (result.outcome.timings.items() if result.outcome else ()))
+        logger.info(f"  {result.case.id:<28} {result.elapsed:6.2f}s  {timings}")
@@ -0,0 +1,628 @@
+import argparse
+import bisect
+import itertools
+import json
+import mmap
+import os
+import re
+import struct
+import logging
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
+
+from subtitle_engine import iter_cues, format_timestamp
+
+logger = logging.getLogger(__name__)
+
+# 默认索引目录
+INDEX_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'search_index'))
+
+MANIFEST_NAME = 'index.json'
+# 写入时才需要的文件表（每个已索引文件一项），查询时不读取
+FILES_NAME = 'files_{generation:06d}.json'
+SEGMENT_MAGIC = b'YTSX'
+SEGMENT_VERSION = 1
+
+# 文件头：magic, 版本, 词数, 文档数, 各区段偏移（词表、文档表、字符串、倒排、字幕时间表、跳表）
+HEADER = struct.Struct('<4sIQQQQQQQQ')
+# 词表项：词偏移, 词长度, 倒排偏移, 倒排长度, 文档频率, 跳表偏移, 跳表项数
+LEX_ENTRY = struct.Struct('<QIQIIQI')
+# 文档表项：字幕时间表偏移, 名称偏移, 名称长度
+DOC_ENTRY = struct.Struct('<QQI')
+# 跳表项：块之前的最后一个文档号, 块在倒排列表中的字节偏移
+SKIP_ENTRY = struct.Struct('<iI')
+
+# 倒排列表每隔多少个文档记录一个跳表项
+SKIP_INTERVAL = 64
+
+# 每个段最多包含的文档数，限制建索引时的内存
+DEFAULT_SEGMENT_DOCS = 5000
+
+# 同一视频同一轨道有多个文件时，优先索引有时间信息的格式
+FORMAT_PRIORITY = {'srt': 0, 'vtt': 1, 'json3': 2, 'srv3': 3, 'txt': 4}
+
+# 多轨导出 / 打包使用的文件名：<视频ID>.<轨道>.<格式>
+_EXPORT_NAME_RE = re.compile(r'^(?P<video_id>[\w-]{11})\.(?P<track>.+)\.(?P<fmt>\w+)$')
+
+# 中日韩文字逐字作为词，其余按单词切分
+_CJK = '぀-ヿ㐀-䶿一-鿿가-힯'
+_TOKEN_RE = re.compile(f'[{_CJK}]|[^\\W{_CJK}]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """NFKC 规范化并忽略大小写后切分为词"""
+    return _TOKEN_RE.findall(unicodedata.normalize('NFKC', text).casefold())
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(buf, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+@dataclass
+class SourceFile:
+    """待索引的字幕文件"""
+    path: str
+    video_id: str
+    track: str
+    format: str
+
+    @property
+    def key(self) -> str:
+        return f'{self.video_id}\t{self.track}'
+
+
+def source_file(path: str) -> Optional[SourceFile]:
+    """根据文件名确定视频ID、轨道和格式；不是字幕文件时返回 None"""
+    name = os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    fmt = ext[1:].lower()
+    if fmt not in FORMAT_PRIORITY:
+        return None
+    match = _EXPORT_NAME_RE.match(name)
+    if match:
+        return SourceFile(os.path.abspath(path), match.group('video_id'), match.group('track'), fmt)
+    return SourceFile(os.path.abspath(path), stem, '', fmt)
+
+
+def discover(paths: Iterable[str]) -> List[SourceFile]:
+    """遍历目录找出字幕文件"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    source = source_file(os.path.join(root, name))
+                    if source is not None:
+                        found.append(source)
+        else:
+            source = source_file(path)
+            if source is not None:
+                found.append(source)
+    return found
+
+
+@dataclass
+class Hit:
+    """一个匹配：视频、轨道和匹配开始处字幕的时间"""
+    video_id: str
+    track: str
+    path: str
+    start_ms: int
+
+    @property
+    def timestamp(self) -> str:
+        return format_timestamp(self.start_ms)
+
+
+class SegmentWriter:
+    """在内存中为一批文档建立倒排，然后一次写出为一个只读段文件"""
+
+    def __init__(self):
+        self.docs: List[Tuple[str, bytes]] = []
+        # 词 -> [上一个文档号, 文档频率, 倒排字节, 跳表]
+        self.terms: Dict[str, list] = {}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, source: SourceFile) -> int:
+        """索引一个文件，返回文档号"""
+        doc = len(self.docs)
+        positions: Dict[str, List[int]] = {}
+        cue_table = bytearray()
+        cue_count = 0
+        position = last_cue_position = last_start = 0
+        cue_entries = bytearray()
+        for cue in iter_cues(source.path, source.format):
+            tokens = tokenize(cue.text)
+            if not tokens:
+                continue
+            _encode_varint(position - last_cue_position, cue_entries)
+            _encode_varint(_zigzag(cue.start_ms - last_start), cue_entries)
+            last_cue_position, last_start = position, cue.start_ms
+            cue_count += 1
+            for token in tokens:
+                positions.setdefault(token, []).append(position)
+                position += 1
+        _encode_varint(cue_count, cue_table)
+        cue_table += cue_entries
+        name = f'{source.video_id}\0{source.track}\0{source.path}'.encode('utf-8')
+        self.docs.append((name, bytes(cue_table)))
+
+        for token, token_positions in positions.items():
+            entry = self.terms.get(token)
+            if entry is None:
+                entry = self.terms[token] = [-1, 0, bytearray(), bytearray()]
+            previous_doc, doc_freq, postings, skips = entry
+            if doc_freq and doc_freq % SKIP_INTERVAL == 0:
+                skips += SKIP_ENTRY.pack(previous_doc, len(postings))
+            encoded = bytearray()
+            last = 0
+            for value in token_positions:
+                _encode_varint(value - last, encoded)
+                last = value
+            _encode_varint(doc - previous_doc, postings)
+            _encode_varint(len(token_positions), postings)
+            _encode_varint(len(encoded), postings)
+            postings += encoded
+            entry[0], entry[1] = doc, doc_freq + 1
+        return doc
+
+    def write(self, path: str):
+        """写出段文件：先写临时文件再替换，读者不会看到写了一半的段"""
+        strings = bytearray()
+        postings = bytearray()
+        skips = bytearray()
+        cues = bytearray()
+        lex = bytearray()
+        for term in sorted(self.terms, key=lambda t: t.encode('utf-8')):
+            _, doc_freq, term_postings, term_skips = self.terms[term]
+            encoded = term.encode('utf-8')
+            lex += LEX_ENTRY.pack(len(strings), len(encoded), len(postings), len(term_postings),
+                                  doc_freq, len(skips), len(term_skips) // SKIP_ENTRY.size)
+            strings += encoded
+            postings += term_postings
+            skips += term_skips
+        docs = bytearray()
+        for name, cue_table in self.docs:
+            docs += DOC_ENTRY.pack(len(cues), len(strings), len(name))
+            strings += name
+            cues += cue_table
+
+        lex_off = HEADER.size
+        docs_off = lex_off + len(lex)
+        strings_off = docs_off + len(docs)
+        postings_off = strings_off + len(strings)
+        cues_off = postings_off + len(postings)
+        skips_off = cues_off + len(cues)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, len(self.terms), len(self.docs),
+                                lex_off, docs_off, strings_off, postings_off, cues_off, skips_off))
+            for section in (lex, docs, strings, postings, cues, skips):
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class _PostingCursor:
+    """按文档号递增地在一个词的倒排列表中查找，借助跳表跳过不相关的文档"""
+
+    def __init__(self, segment: 'Segment', entry: tuple):
+        _, _, post_off, post_len, self.doc_freq, skip_off, skip_count = entry
+        self.segment = segment
+        self.start = segment.postings_off + post_off
+        self.end = self.start + post_len
+        self.skips_start = segment.skips_off + skip_off
+        self.skip_count = skip_count
+        self.pos = self.start
+        self.doc = -1
+        # 最近一次 seek 停下的块，文档号不小于上一次的 target
+        self.current: Optional[Tuple[int, int, int]] = None
+
+    def _skip_to(self, target: int):
+        # 二分查找最后一个“块前文档号”小于 target 的跳表项
+        lo, hi = 0, self.skip_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            previous_doc, _ = SKIP_ENTRY.unpack_from(self.segment.buf, self.skips_start + mid * SKIP_ENTRY.size)
+            if previous_doc < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo:
+            previous_doc, offset = SKIP_ENTRY.unpack_from(
+                self.segment.buf, self.skips_start + (lo - 1) * SKIP_ENTRY.size)
+            if previous_doc > self.doc:
+                self.doc, self.pos = previous_doc, self.start + offset
+
+    def __iter__(self) -> Iterator[Tuple[int, int, int]]:
+        """依次给出 (文档号, 位置数, 位置数据偏移)"""
+        while True:
+            block = self._next()
+            if block is None:
+                return
+            yield block
+
+    def _next(self) -> Optional[Tuple[int, int, int]]:
+        if self.pos >= self.end:
+            return None
+        buf = self.segment.buf
+        delta, pos = _decode_varint(buf, self.pos)
+        count, pos = _decode_varint(buf, pos)
+        length, pos = _decode_varint(buf, pos)
+        self.doc += delta
+        self.pos = pos + length
+        return self.doc, count, pos
+
+    def seek(self, target: int) -> Optional[Tuple[int, int, int]]:
+        """前进到第一个文档号不小于 target 的块，target 必须递增；不含 target 时返回 None"""
+        if self.current is not None and self.current[0] >= target:
+            return self.current if self.current[0] == target else None
+        if self.skip_count:
+            self._skip_to(target)
+        while True:
+            block = self._next()
+            self.current = block
+            if block is None:
+                return None
+            if block[0] >= target:
+                return block if block[0] == target else None
+
+
+class Segment:
+    """只读段：mmap 打开，查询时只读取用到的词表项、倒排和文档"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.term_count, self.doc_count, self.lex_off, self.docs_off,
+         self.strings_off, self.postings_off, self.cues_off, self.skips_off) = HEADER.unpack_from(self.buf, 0)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            self.close()
+            raise ValueError(f'不是索引段文件或版本不兼容: {path}')
+
+    def close(self):
+        self.buf.close()
+        self._file.close()
+
+    def _term_at(self, index: int) -> bytes:
+        term_off, term_len = struct.unpack_from('<QI', self.buf, self.lex_off + index * LEX_ENTRY.size)
+        start = self.strings_off + term_off
+        return self.buf[start:start + term_len]
+
+    def lookup(self, term: str) -> Optional[tuple]:
+        """二分查找词表，返回词表项"""
+        target = term.encode('utf-8')
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.term_count and self._term_at(lo) == target:
+            return LEX_ENTRY.unpack_from(self.buf, self.lex_off + lo * LEX_ENTRY.size)
+        return None
+
+    def positions(self, count: int, offset: int) -> List[int]:
+        values = []
+        value = 0
+        for _ in range(count):
+            delta, offset = _decode_varint(self.buf, offset)
+            value += delta
+            values.append(value)
+        return values
+
+    def document(self, doc: int) -> Tuple[str, str, str]:
+        _, name_off, name_len = DOC_ENTRY.unpack_from(self.buf, self.docs_off + doc * DOC_ENTRY.size)
+        start = self.strings_off + name_off
+        video_id, track, path = self.buf[start:start + name_len].decode('utf-8').split('\0')
+        return video_id, track, path
+
+    def cue_table(self, doc: int) -> Tuple[List[int], List[int]]:
+        """一个文档的字幕时间表：每条字幕第一个词的位置和开始时间"""
+        cue_off, _, _ = DOC_ENTRY.unpack_from(self.buf, self.docs_off + doc * DOC_ENTRY.size)
+        pos = self.cues_off + cue_off
+        count, pos = _decode_varint(self.buf, pos)
+        first_positions, starts = [], []
+        position = start = 0
+        for _ in range(count):
+            delta, pos = _decode_varint(self.buf, pos)
+            ms, pos = _decode_varint(self.buf, pos)
+            position += delta
+            start += _unzigzag(ms)
+            first_positions.append(position)
+            starts.append(start)
+        return first_positions, starts
+
+    def search(self, tokens: List[str], phrase: bool = True,
+               deleted: Iterable[int] = ()) -> Iterator[Tuple[int, List[int]]]:
+        """给出 (文档号, 匹配开始位置列表)；phrase 为 False 时要求所有词出现在同一条字幕中"""
+        entries = []
+        for token in dict.fromkeys(tokens):
+            entry = self.lookup(token)
+            if entry is None:
+                return
+            entries.append((token, entry))
+        # 从文档频率最低的词开始求交集
+        entries.sort(key=lambda item: item[1][4])
+        rarest_token, rarest_entry = entries[0]
+        deleted = set(deleted)
+        cursors = [(token, _PostingCursor(self, entry)) for token, entry in entries[1:]]
+
+        # 逐个解码最稀有词的倒排，调用方停止迭代时不再读取剩余部分
+        for doc, count, offset in _PostingCursor(self, rarest_entry):
+            if doc in deleted:
+                continue
+            doc_positions = {rarest_token: self.positions(count, offset)}
+            for token, cursor in cursors:
+                block = cursor.seek(doc)
+                if block is None:
+                    break
+                doc_positions[token] = self.positions(block[1], block[2])
+            else:
+                if phrase:
+                    sets = [set(doc_positions[token]) for token in tokens]
+                    starts = [p for p in doc_positions[tokens[0]]
+                              if all(p + i in sets[i] for i in range(1, len(tokens)))]
+                else:
+                    first_positions, _ = self.cue_table(doc)
+                    cue_sets = [{bisect.bisect_right(first_positions, p) - 1 for p in doc_positions[token]}
+                                for token in doc_positions]
+                    common = set.intersection(*cue_sets)
+                    starts = [first_positions[index] for index in sorted(common)]
+                if starts:
+                    yield doc, starts
+
+
+class SearchIndex:
+    """磁盘上的字幕全文索引：多个只读段加一个清单
+
+    新文件写成新的段，已索引的文件内容变化时旧文档标记为删除；compact() 把所有有效文件重建为一个段。
+    同一时间只应有一个进程写入索引。
+
+    清单只记录查询需要的段和已删除文档；每个已索引文件的记录在单独的文件表中，只在写入时读取。
+    文件表每次保存都写成新的文件，再原子地替换清单指向它，两者不会不一致。
+    """
+
+    def __init__(self, root: str = INDEX_ROOT, segment_docs: int = DEFAULT_SEGMENT_DOCS):
+        self.root = root
+        self.segment_docs = segment_docs
+        self.manifest = self._load_manifest()
+        self._files: Optional[Dict[str, Dict]] = self.manifest.pop('files', None)
+        self._segments: Dict[str, Segment] = {}
+
+    def _load_manifest(self) -> Dict:
+        path = os.path.join(self.root, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        return {'next_segment': 0, 'generation': 0, 'files_table': None, 'segments': [], 'deleted': {}}
+
+    @property
+    def files(self) -> Dict[str, Dict]:
+        """已索引文件的记录：路径 -> {key, format, size, mtime_ns, segment, doc}，第一次使用时读取"""
+        if self._files is None:
+            name = self.manifest.get('files_table')
+            self._files = {}
+            if name:
+                with open(os.path.join(self.root, name), encoding='utf-8') as f:
+                    self._files = json.load(f)
+        return self._files
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        previous = self.manifest.get('files_table')
+        generation = self.manifest.get('generation', 0) + 1
+        files_name = FILES_NAME.format(generation=generation)
+        files_path = os.path.join(self.root, files_name)
+        with open(f'{files_path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.files, f, ensure_ascii=False)
+        os.replace(f'{files_path}.tmp', files_path)
+        self.manifest.update(generation=generation, files_table=files_name)
+        path = os.path.join(self.root, MANIFEST_NAME)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(f'{path}.tmp', path)
+        if previous and previous != files_name:
+            os.remove(os.path.join(self.root, previous))
+
+    def close(self):
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def segment(self, name: str) -> Segment:
+        if name not in self._segments:
+            self._segments[name] = Segment(os.path.join(self.root, name))
+        return self._segments[name]
+
+    def _pending(self, sources: List[SourceFile]) -> List[SourceFile]:
+        """筛选出新增或内容变化的文件；同一视频轨道只保留优先级最高的格式"""
+        files = self.files
+        by_key = {record['key']: (path, record) for path, record in files.items()}
+        chosen: Dict[str, SourceFile] = {}
+        for source in sources:
+            current = chosen.get(source.key)
+            if current is None or FORMAT_PRIORITY[source.format] < FORMAT_PRIORITY[current.format]:
+                chosen[source.key] = source
+
+        pending = []
+        for key, source in chosen.items():
+            stat = os.stat(source.path)
+            existing = by_key.get(key)
+            if existing is not None:
+                path, record = existing
+                if path == source.path and record['size'] == stat.st_size and \
+                        record['mtime_ns'] == stat.st_mtime_ns:
+                    continue
+                if path != source.path and os.path.exists(path) and \
+                        FORMAT_PRIORITY[record['format']] <= FORMAT_PRIORITY[source.format]:
+                    continue
+            pending.append(source)
+        return pending
+
+    def _forget(self, key: str):
+        """把同一视频轨道的旧文档标记为删除"""
+        files = self.files
+        for path, record in list(files.items()):
+            if record['key'] == key:
+                self.manifest['deleted'].setdefault(record['segment'], []).append(record['doc'])
+                del files[path]
+
+    def add(self, paths: Iterable[str]) -> int:
+        """索引新增或变化的文件，返回索引的文件数"""
+        pending = self._pending(discover(paths))
+        writer = SegmentWriter()
+        batch: List[Tuple[SourceFile, int]] = []
+        added = 0
+        for source in pending:
+            try:
+                doc = writer.add(source)
+            except (OSError, ValueError, SyntaxError) as e:
+                logger.warning(f"⚠️ 跳过无法解析的文件 {source.path}: {e}")
+                continue
+            batch.append((source, doc))
+            if len(writer) >= self.segment_docs:
+                added += self._flush(writer, batch)
+                writer, batch = SegmentWriter(), []
+        if batch:
+            added += self._flush(writer, batch)
+        return added
+
+    def _flush(self, writer: SegmentWriter, batch: List[Tuple[SourceFile, int]]) -> int:
+        os.makedirs(self.root, exist_ok=True)
+        name = f"seg_{self.manifest['next_segment']:06d}.idx"
+        writer.write(os.path.join(self.root, name))
+        self.manifest['next_segment'] += 1
+        self.manifest['segments'].append(name)
+        for source, doc in batch:
+            self._forget(source.key)
+            stat = os.stat(source.path)
+            self.files[source.path] = {
+                'key': source.key, 'format': source.format, 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns, 'segment': name, 'doc': doc,
+            }
+        self._save_manifest()
+        logger.info(f"✓ 写入索引段 {name}: {len(batch)} 个文件, {len(writer.terms)} 个词")
+        return len(batch)
+
+    def compact(self) -> int:
+        """把所有仍然存在的文件重建为新的段，并删除旧段"""
+        paths = [path for path in self.files if os.path.exists(path)]
+        old_segments = list(self.manifest['segments'])
+        self.close()
+        self.manifest.update(segments=[], deleted={})
+        self._files = {}
+        added = self.add(paths)
+        if not added:
+            # 没有写出新段时也要更新清单，不再指向即将删除的段
+            self._save_manifest()
+        for name in old_segments:
+            os.remove(os.path.join(self.root, name))
+        return added
+
+    def iter_hits(self, query: str, phrase: bool = True) -> Iterator[Hit]:
+        """按索引顺序（段、文档、时间）逐个给出匹配，调用方够用时可以提前停止"""
+        tokens = tokenize(query)
+        if not tokens:
+            return
+        for name in self.manifest['segments']:
+            segment = self.segment(name)
+            for doc, starts in segment.search(tokens, phrase, self.manifest['deleted'].get(name, ())):
+                video_id, track, path = segment.document(doc)
+                first_positions, start_times = segment.cue_table(doc)
+                for position in starts:
+                    cue = bisect.bisect_right(first_positions, position) - 1
+                    yield Hit(video_id, track, path, start_times[max(cue, 0)])
+
+    def search(self, query: str, phrase: bool = True, limit: Optional[int] = 100) -> List[Hit]:
+        """查询短语（或 phrase=False 时同一条字幕中的所有词），最多返回 limit 个匹配"""
+        return list(itertools.islice(self.iter_hits(query, phrase), limit))
+
+    def stats(self) -> Dict:
+        segments = [self.segment(name) for name in self.manifest['segments']]
+        deleted = sum(len(docs) for docs in self.manifest['deleted'].values())
+        return {
+            'segments': len(segments),
+            'documents': sum(segment.doc_count for segment in segments) - deleted,
+            'deleted': deleted,
+            'terms': sum(segment.term_count for segment in segments),
+            'bytes': sum(os.path.getsize(segment.path) for segment in segments),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='为下载的字幕建立全文索引，查询短语出现的视频和时间')
+    parser.add_argument('--index', default=INDEX_ROOT, help='索引目录')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='索引新增或变化的字幕文件')
+    add.add_argument('paths', nargs='+', help='字幕文件或目录')
+    add.add_argument('--segment-docs', type=int, default=DEFAULT_SEGMENT_DOCS, help='每个段最多的文件数')
+
+    query = commands.add_parser('query', help='查询')
+    query.add_argument('text')
+    query.add_argument('--any-order', action='store_true', help='不要求相邻，只要求出现在同一条字幕中')
+    query.add_argument('--limit', type=int, default=20)
+
+    commands.add_parser('compact', help='把所有段合并为一个')
+    commands.add_parser('stats', help='索引统计')
+    args = parser.parse_args(argv)
+
+    with SearchIndex(args.index, getattr(args, 'segment_docs', DEFAULT_SEGMENT_DOCS)) as index:
+        if args.command == 'add':
+            started = time.perf_counter()
+            added = index.add(args.paths)
+            logger.info(f"索引了 {added} 个文件, 耗时 {time.perf_counter() - started:.2f}s")
+        elif args.command == 'query':
+            started = time.perf_counter()
+            hits = index.search(args.text, phrase=not args.any_order, limit=args.limit)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            for hit in hits:
+                print(f"{hit.video_id}\t{hit.track}\t{hit.timestamp}\t{hit.path}")
+            logger.info(f"{len(hits)} 个结果, 耗时 {elapsed_ms:.1f}ms")
+            return 0 if hits else 1
+        elif args.command == 'compact':
+            index.compact()
+        print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
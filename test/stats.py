@@ -0,0 +1,11 @@
+import math
+from typing import Optional, List
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
@@ -0,0 +1,9 @@
+"""字幕参考实现：流式解析 WebVTT / SRT / TXT / YouTube json3 / srv3，并流式写出 VTT / SRT / TXT"""
+from .cues import Cue, parse_timestamp, format_timestamp
+from .readers import read_vtt, read_srt, read_txt, read_json3, read_srv3
+from .store import CueStore, merge_rolling
+from .writers import write_vtt, write_srt, write_txt
+from .convert import (
+    READERS, WRITERS, TIMED_FORMATS, ValidationReport,
+    detect_format, iter_cues, write_cues, convert, validate_file, benchmark
+)
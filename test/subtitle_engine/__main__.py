@@ -0,0 +1,54 @@
+import argparse
+import json
+import sys
+
+from .convert import WRITERS, convert, validate_file, benchmark
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m subtitle_engine', description='字幕转换、校验和基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = sub.add_parser('convert', help='转换字幕格式')
+    convert_parser.add_argument('src')
+    convert_parser.add_argument('dst')
+    convert_parser.add_argument('--from', dest='src_format')
+    convert_parser.add_argument('--to', dest='dst_format', choices=list(WRITERS))
+    convert_parser.add_argument('--dedupe', action='store_true', help='合并自动字幕的滚动重复')
+
+    validate_parser = sub.add_parser('validate', help='校验字幕文件')
+    validate_parser.add_argument('paths', nargs='+')
+
+    bench_parser = sub.add_parser('bench', help='测量转换吞吐量')
+    bench_parser.add_argument('paths', nargs='+')
+    bench_parser.add_argument('--to', dest='dst_formats', nargs='+', choices=list(WRITERS))
+    bench_parser.add_argument('--repeat', type=int, default=3)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        count = convert(args.src, args.dst, args.src_format, args.dst_format, args.dedupe)
+        print(f'{count} 条字幕 -> {args.dst}')
+        return 0
+
+    if args.command == 'validate':
+        failed = 0
+        for path in args.paths:
+            report = validate_file(path)
+            status = '✓' if report.ok else '❌'
+            print(f'{status} {path}: {report.format}, {report.cue_count} 条字幕')
+            for message in report.errors + report.warnings:
+                print(f'    {message}')
+            failed += not report.ok
+        return 1 if failed else 0
+
+    results = []
+    for path in args.paths:
+        results.extend(benchmark(path, args.dst_formats, args.repeat))
+    json.dump(results, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, List, Dict, Any
+
+from .cues import Cue
+from .store import merge_rolling
+from .readers import read_vtt, read_srt, read_txt, read_json3, read_srv3
+from .writers import write_vtt, write_srt, write_txt
+
+# 输入格式 -> (读取函数, 是否以二进制打开)
+READERS = {
+    'vtt': (read_vtt, False),
+    'srt': (read_srt, False),
+    'txt': (read_txt, False),
+    'json3': (read_json3, True),
+    'srv3': (read_srv3, True),
+}
+
+# 输出格式（与扩展提供的格式一致）
+WRITERS = {
+    'vtt': write_vtt,
+    'srt': write_srt,
+    'txt': write_txt,
+}
+
+# 有时间信息的格式
+TIMED_FORMATS = {'vtt', 'srt', 'json3', 'srv3'}
+
+_EXTENSIONS = {
+    '.vtt': 'vtt', '.srt': 'srt', '.txt': 'txt',
+    '.json3': 'json3', '.json': 'json3',
+    '.srv3': 'srv3', '.srv1': 'srv3', '.xml': 'srv3',
+}
+
+
+def detect_format(path: str) -> str:
+    """根据扩展名（必要时根据内容开头）判断字幕格式"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in _EXTENSIONS:
+        return _EXTENSIONS[ext]
+    with open(path, 'rb') as f:
+        head = f.read(64).lstrip(b'\xef\xbb\xbf \t\r\n')
+    if head.startswith(b'WEBVTT'):
+        return 'vtt'
+    if head.startswith(b'{'):
+        return 'json3'
+    if head.startswith(b'<'):
+        return 'srv3'
+    if head[:1].isdigit():
+        return 'srt'
+    return 'txt'
+
+
+def iter_cues(path: str, fmt: Optional[str] = None) -> Iterator[Cue]:
+    """逐条读取字幕文件，文件在迭代结束后关闭"""
+    fmt = fmt or detect_format(path)
+    reader, binary = READERS[fmt]
+    if binary:
+        with open(path, 'rb') as f:
+            yield from reader(f)
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            yield from reader(f)
+
+
+def write_cues(cues, path: str, fmt: Optional[str] = None) -> int:
+    """逐条写出字幕到文件（UTF-8，无 BOM），返回写出的字幕条数"""
+    fmt = fmt or detect_format(path)
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        return WRITERS[fmt](cues, f)
+
+
+def convert(src: str, dst: str,
+            src_format: Optional[str] = None,
+            dst_format: Optional[str] = None,
+            dedupe: bool = False) -> int:
+    """流式转换字幕格式，内存占用与字幕条数无关；dedupe 为 True 时合并滚动字幕"""
+    cues = iter_cues(src, src_format)
+    if dedupe:
+        cues = merge_rolling(cues)
+    return write_cues(cues, dst, dst_format)
+
+
+@dataclass
+class ValidationReport:
+    """字幕文件的校验结果"""
+    path: str
+    format: str
+    cue_count: int = 0
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors and self.cue_count > 0
+
+
+# 每类问题最多记录的条数
+MAX_ISSUES = 20
+
+
+def validate_file(path: str, fmt: Optional[str] = None) -> ValidationReport:
+    """用参考实现解析下载的字幕文件，检查是否可解析、时间是否合法"""
+    fmt = fmt or detect_format(path)
+    report = ValidationReport(path=path, format=fmt)
+    previous_start = -1
+    try:
+        for cue in iter_cues(path, fmt):
+            report.cue_count += 1
+            if fmt not in TIMED_FORMATS:
+                continue
+            if cue.end_ms < cue.start_ms and len(report.errors) < MAX_ISSUES:
+                report.errors.append(f"第 {report.cue_count} 条字幕结束时间早于开始时间")
+            if cue.start_ms < previous_start and len(report.warnings) < MAX_ISSUES:
+                report.warnings.append(f"第 {report.cue_count} 条字幕开始时间倒退")
+            previous_start = cue.start_ms
+    except (ValueError, SyntaxError) as e:
+        report.errors.append(f"解析失败（第 {report.cue_count + 1} 条附近）: {e}")
+    if report.cue_count == 0 and not report.errors:
+        report.errors.append("文件中没有字幕")
+    return report
+
+
+class _CountingSink:
+    """只统计写入字符数的输出，用于基准测试"""
+
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, text: str) -> int:
+        self.chars += len(text)
+        return len(text)
+
+
+def benchmark(path: str, dst_formats: Optional[List[str]] = None,
+              repeat: int = 3) -> List[Dict[str, Any]]:
+    """测量每种格式组合的转换吞吐量（MB/s，按输入文件大小计算）"""
+    src_format = detect_format(path)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    results = []
+    for dst_format in dst_formats or list(WRITERS):
+        timings = []
+        cue_count = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cue_count = WRITERS[dst_format](iter_cues(path, src_format), _CountingSink())
+            timings.append(time.perf_counter() - started)
+        best = min(timings)
+        results.append({
+            'path': path,
+            'pair': f'{src_format}->{dst_format}',
+            'cues': cue_count,
+            'input_mb': round(size_mb, 3),
+            'best_s': round(best, 4),
+            'mb_per_s': round(size_mb / best, 2) if best else None,
+        })
+    return results
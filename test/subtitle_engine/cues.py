@@ -0,0 +1,35 @@
+import re
+from typing import NamedTuple
+
+# 时间戳：[hh:]mm:ss.mmm（VTT）或 hh:mm:ss,mmm（SRT）
+_TIMESTAMP_RE = re.compile(r'^(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{1,3})$')
+
+
+class Cue(NamedTuple):
+    """一条字幕：开始/结束时间（毫秒）和文本"""
+    start_ms: int
+    end_ms: int
+    text: str
+
+    @property
+    def duration_ms(self) -> int:
+        return self.end_ms - self.start_ms
+
+
+def parse_timestamp(value: str) -> int:
+    """把 VTT / SRT 时间戳解析为毫秒"""
+    match = _TIMESTAMP_RE.match(value.strip())
+    if not match:
+        raise ValueError(f"无效的时间戳: {value!r}")
+    hours, minutes, seconds, millis = match.groups()
+    return (int(hours or 0) * 3600000 + int(minutes) * 60000
+            + int(seconds) * 1000 + int(millis.ljust(3, '0')))
+
+
+def format_timestamp(ms: int, separator: str = '.') -> str:
+    """把毫秒格式化为 hh:mm:ss.mmm（SRT 使用 ',' 作为分隔符）"""
+    ms = max(0, int(ms))
+    hours, ms = divmod(ms, 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}'
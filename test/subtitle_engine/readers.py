@@ -0,0 +1,194 @@
+import codecs
+import html
+import json
+import re
+import xml.etree.ElementTree as ET
+from typing import Iterator, Iterable, IO, List
+
+from .cues import Cue, parse_timestamp
+
+# VTT 行内标签，例如 YouTube 自动字幕中的 <00:00:01.000><c> word</c>
+_TAG_RE = re.compile(r'<[^>]*>')
+
+# json 数组元素之间的空白和逗号
+_SEPARATOR_RE = re.compile(r'[\s,]*')
+
+# 流式读取 json3 时每次读取的字符数
+CHUNK_SIZE = 64 * 1024
+
+
+def _clean_text(lines: List[str]) -> str:
+    """去掉行内标签并还原 HTML 实体"""
+    return html.unescape(_TAG_RE.sub('', '\n'.join(lines))).strip()
+
+
+def _parse_timing(line: str):
+    """解析 '00:00:01.000 --> 00:00:02.000 align:start' 形式的时间行"""
+    start, _, rest = line.partition('-->')
+    end = rest.strip().split(None, 1)[0] if rest.strip() else ''
+    return parse_timestamp(start), parse_timestamp(end)
+
+
+def read_vtt(lines: Iterable[str]) -> Iterator[Cue]:
+    """逐条解析 WebVTT"""
+    block: List[str] = []
+    header_done = False
+    for raw in lines:
+        line = raw.rstrip('\r\n').lstrip('\ufeff')
+        if line.strip():
+            block.append(line)
+            continue
+        if not block:
+            continue
+        if not header_done:
+            # 第一个块是 WEBVTT 头部（可能带 Kind / Language 等元数据）
+            header_done = True
+            if block[0].startswith('WEBVTT'):
+                block = []
+                continue
+        cue = _vtt_block(block)
+        block = []
+        if cue:
+            yield cue
+    if block and (header_done or not block[0].startswith('WEBVTT')):
+        cue = _vtt_block(block)
+        if cue:
+            yield cue
+
+
+def _vtt_block(block: List[str]):
+    if block[0].startswith(('NOTE', 'STYLE', 'REGION')):
+        return None
+    # 可选的 cue 标识行
+    if '-->' not in block[0]:
+        block = block[1:]
+    if not block or '-->' not in block[0]:
+        return None
+    start, end = _parse_timing(block[0])
+    return Cue(start, end, _clean_text(block[1:]))
+
+
+def read_srt(lines: Iterable[str]) -> Iterator[Cue]:
+    """逐条解析 SRT"""
+    block: List[str] = []
+    for raw in lines:
+        line = raw.rstrip('\r\n').lstrip('\ufeff')
+        if line.strip():
+            block.append(line)
+            continue
+        if block:
+            cue = _srt_block(block)
+            block = []
+            if cue:
+                yield cue
+    if block:
+        cue = _srt_block(block)
+        if cue:
+            yield cue
+
+
+def _srt_block(block: List[str]):
+    # 第一行是序号，可能缺失
+    if '-->' not in block[0]:
+        block = block[1:]
+    if not block or '-->' not in block[0]:
+        return None
+    start, end = _parse_timing(block[0].replace(',', '.'))
+    return Cue(start, end, _clean_text(block[1:]))
+
+
+def read_txt(lines: Iterable[str]) -> Iterator[Cue]:
+    """TXT 没有时间信息，每个非空行作为一条时间为 0 的字幕"""
+    for raw in lines:
+        text = raw.strip().lstrip('\ufeff')
+        if text:
+            yield Cue(0, 0, text)
+
+
+def _iter_json_array(fp: IO, key: str) -> Iterator[dict]:
+    """流式读取顶层对象中 key 对应数组的元素，内存只与单个元素大小有关"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = fp.read(CHUNK_SIZE)
+        if isinstance(chunk, bytes):
+            chunk = text_decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            eof = True
+        # 丢弃已经消费的部分，避免缓冲区无限增长
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    marker = f'"{key}"'
+    while marker not in buffer:
+        if eof:
+            return
+        # 只保留可能包含被截断标记的尾部
+        pos = max(0, len(buffer) - len(marker))
+        fill()
+    pos = buffer.index(marker) + len(marker)
+    while '[' not in buffer[pos:]:
+        if eof:
+            raise ValueError(f"json3 中 {key} 不是数组")
+        fill()
+    pos = buffer.index('[', pos) + 1
+
+    while True:
+        pos = _SEPARATOR_RE.match(buffer, pos).end()
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("json3 数组未结束")
+            fill()
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            item, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if eof:
+                raise
+            fill()
+            continue
+        yield item
+
+
+def read_json3(fp: IO) -> Iterator[Cue]:
+    """流式解析 YouTube json3 字幕"""
+    for event in _iter_json_array(fp, 'events'):
+        segs = event.get('segs')
+        if not segs:
+            continue
+        text = ''.join(seg.get('utf8', '') for seg in segs).strip()
+        if not text:
+            continue
+        start = int(event.get('tStartMs', 0))
+        yield Cue(start, start + int(event.get('dDurationMs', 0)), text)
+
+
+def read_srv3(fp: IO) -> Iterator[Cue]:
+    """流式解析 YouTube srv3（<p t= d=>）以及旧版 srv1（<text start= dur=>）XML 字幕"""
+    parents = []
+    for event, elem in ET.iterparse(fp, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag == 'p':
+            start = int(elem.get('t', 0))
+            end = start + int(elem.get('d', 0))
+        elif elem.tag == 'text':
+            start = int(round(float(elem.get('start', 0)) * 1000))
+            end = start + int(round(float(elem.get('dur', 0)) * 1000))
+        else:
+            continue
+        text = html.unescape(''.join(elem.itertext())).strip()
+        # 处理完立即从父节点移除，保持内存恒定
+        if parents:
+            parents[-1].remove(elem)
+        if text:
+            yield Cue(start, end, text)
@@ -0,0 +1,181 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, Optional, List
+
+from .cues import Cue
+
+# 判断滚动重叠时最多比较的单词数
+MAX_OVERLAP_WORDS = 64
+
+# 少于这个单词数的重合需要满足整行重复才认为是滚动字幕
+MIN_OVERLAP_WORDS = 2
+
+# 结束时间最大值树每个节点覆盖的子节点数
+_BLOCK = 32
+
+
+class CueStore:
+    """基于并行数组的紧凑字幕容器
+
+    开始/结束时间存放在 array('q') 中，所有文本以 UTF-8 拼接在同一个 bytearray 里，
+    第 i 条字幕的文本为 text[offsets[i]:offsets[i + 1]]。
+    """
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.offsets = array('Q', [0])
+        self.text = bytearray()
+        # 结束时间的多层块最大值：第 k 层的第 j 项是第 k-1 层第 j 块（_BLOCK 项）的最大值，
+        # 第 0 层就是 ends；查找覆盖某个时间的字幕时整块跳过结束得早的字幕
+        self._levels: List[array] = [self.ends]
+
+    @classmethod
+    def from_cues(cls, cues: Iterable[Cue]) -> 'CueStore':
+        """从字幕迭代器构建容器"""
+        store = cls()
+        store.extend(cues)
+        return store
+
+    def append(self, start_ms: int, end_ms: int, text: str):
+        """追加一条字幕，要求按开始时间顺序追加"""
+        if self.starts and start_ms < self.starts[-1]:
+            raise ValueError(f"字幕必须按开始时间顺序追加: {start_ms} < {self.starts[-1]}")
+        self.starts.append(start_ms)
+        self.ends.append(end_ms)
+        self._index_end(len(self.ends) - 1, end_ms)
+        self.text += text.encode('utf-8')
+        self.offsets.append(len(self.text))
+
+    def _index_end(self, index: int, end_ms: int):
+        """把新追加的结束时间计入各层的块最大值"""
+        level = 1
+        while len(self._levels[level - 1]) > 1:
+            below = self._levels[level - 1]
+            index //= _BLOCK
+            if level == len(self._levels):
+                self._levels.append(array('q', (max(below[j:j + _BLOCK]) for j in range(0, len(below), _BLOCK))))
+            else:
+                values = self._levels[level]
+                if index == len(values):
+                    values.append(end_ms)
+                elif end_ms > values[index]:
+                    values[index] = end_ms
+            level += 1
+
+    def extend(self, cues: Iterable[Cue]):
+        """追加多条字幕"""
+        for cue in cues:
+            self.append(cue.start_ms, cue.end_ms, cue.text)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def text_at(self, index: int) -> str:
+        """第 index 条字幕的文本"""
+        return self.text[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def __getitem__(self, index: int) -> Cue:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Cue(self.starts[index], self.ends[index], self.text_at(index))
+
+    def __iter__(self) -> Iterator[Cue]:
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def nbytes(self) -> int:
+        """数据占用的字节数"""
+        arrays = [self.starts, self.offsets] + self._levels
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.text)
+
+    def index_at(self, t_ms: int) -> Optional[int]:
+        """二分查找时间 t 正在显示的字幕下标（有重叠时取开始最晚的一条）"""
+        index = bisect_right(self.starts, t_ms) - 1
+        return self._last_ending_after(index, t_ms) if index >= 0 else None
+
+    def _last_ending_after(self, index: int, t_ms: int) -> Optional[int]:
+        """下标不超过 index、结束时间晚于 t 的最后一条字幕，O(log n)
+
+        先在 index 所在的块中向前找，找不到时上升一层，整块跳过最大结束时间不晚于 t 的块；
+        找到的块再逐层下降到其中最后一条符合条件的字幕。
+        """
+        level, pos = 0, index
+        while pos >= 0:
+            values = self._levels[level]
+            lo = pos - pos % _BLOCK
+            for k in range(pos, lo - 1, -1):
+                if values[k] > t_ms:
+                    while level > 0:
+                        level -= 1
+                        values = self._levels[level]
+                        k = next(c for c in range(min((k + 1) * _BLOCK, len(values)) - 1, k * _BLOCK - 1, -1)
+                                 if values[c] > t_ms)
+                    return k
+            if level + 1 == len(self._levels):
+                return None
+            level, pos = level + 1, lo // _BLOCK - 1
+        return None
+
+    def cue_at(self, t_ms: int) -> Optional[Cue]:
+        """时间 t 正在显示的字幕"""
+        index = self.index_at(t_ms)
+        return None if index is None else self[index]
+
+    def dedupe(self) -> 'CueStore':
+        """合并自动字幕的滚动重复并折叠相邻的相同文本，返回新的容器"""
+        return CueStore.from_cues(merge_rolling(self))
+
+
+def _overlap_words(previous: List[str], current: List[str]) -> int:
+    """previous 的后缀与 current 的前缀重合的最大单词数"""
+    limit = min(len(previous), len(current), MAX_OVERLAP_WORDS)
+    for size in range(limit, 0, -1):
+        if previous[-size:] == current[:size]:
+            return size
+    return 0
+
+
+def _is_rolling_overlap(previous: Cue, current: Cue, previous_words: List[str], overlap: int) -> bool:
+    """判断单词重合是否来自滚动字幕，避免误删手动字幕中碰巧相同的词"""
+    if overlap == len(previous_words) or overlap >= MIN_OVERLAP_WORDS:
+        return True
+    # 两行滚动窗口：上一条的最后一行成为这一条的第一行
+    return previous.text.rsplit('\n', 1)[-1].strip() == current.text.split('\n', 1)[0].strip()
+
+
+def merge_rolling(cues: Iterable[Cue]) -> Iterator[Cue]:
+    """线性地合并滚动字幕：只保留每条字幕相对上一条新增的单词
+
+    自动生成的字幕中，每一条往往重复上一条的内容再加几个词；
+    与上一条相同或完全被上一条包含的字幕只延长上一条的结束时间。
+    """
+    pending: Optional[Cue] = None
+    previous: Optional[Cue] = None
+    previous_words: List[str] = []
+    for cue in cues:
+        words = cue.text.split()
+        if not words:
+            continue
+        overlap = 0
+        if previous is not None:
+            overlap = _overlap_words(previous_words, words)
+            if overlap and not _is_rolling_overlap(previous, cue, previous_words, overlap):
+                overlap = 0
+            if overlap == 0 and f" {' '.join(words)} " in f" {' '.join(previous_words)} ":
+                # 完全被上一条包含
+                overlap = len(words)
+        new_words = words[overlap:]
+        previous, previous_words = cue, words
+        if not new_words:
+            if pending is not None:
+                pending = pending._replace(end_ms=max(pending.end_ms, cue.end_ms))
+            continue
+        if pending is not None:
+            yield pending
+        pending = Cue(cue.start_ms, cue.end_ms, ' '.join(new_words))
+    if pending is not None:
+        yield pending
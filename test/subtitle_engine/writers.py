@@ -0,0 +1,34 @@
+from typing import Iterable, IO
+
+from .cues import Cue, format_timestamp
+
+
+def write_vtt(cues: Iterable[Cue], fp: IO) -> int:
+    """逐条写出 WebVTT，返回写出的字幕条数"""
+    fp.write('WEBVTT\n\n')
+    count = 0
+    for cue in cues:
+        fp.write(f'{format_timestamp(cue.start_ms)} --> {format_timestamp(cue.end_ms)}\n'
+                 f'{cue.text}\n\n')
+        count += 1
+    return count
+
+
+def write_srt(cues: Iterable[Cue], fp: IO) -> int:
+    """逐条写出 SRT，返回写出的字幕条数"""
+    count = 0
+    for cue in cues:
+        count += 1
+        fp.write(f'{count}\n'
+                 f'{format_timestamp(cue.start_ms, ",")} --> {format_timestamp(cue.end_ms, ",")}\n'
+                 f'{cue.text}\n\n')
+    return count
+
+
+def write_txt(cues: Iterable[Cue], fp: IO) -> int:
+    """逐条写出纯文本，每条字幕一行，返回写出的字幕条数"""
+    count = 0
+    for cue in cues:
+        fp.write(cue.text.replace('\n', ' ') + '\n')
+        count += 1
+    return count
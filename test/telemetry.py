@@ -0,0 +1,310 @@
+import asyncio
+import functools
+import json
+import os
+import re
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from typing import Optional, Any, Dict, List, Tuple, TextIO
+
+logger = logging.getLogger(__name__)
+
+# 默认输出目录
+TELEMETRY_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'telemetry'))
+
+EVENTS_NAME = 'events.jsonl'
+PROMETHEUS_NAME = 'metrics.prom'
+
+# 阶段耗时直方图的桶上限（秒）
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 写入 Prometheus 指标的标签；URL 和视频ID只出现在事件中，避免指标基数无限增长
+METRIC_LABELS = ('format', 'subtitle_type', 'profile')
+
+# 两次写出 Prometheus 文件的最短间隔（秒）
+FLUSH_INTERVAL = 1.0
+
+OK = 'ok'
+FAILED = 'failed'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+CANCELLED = 'cancelled'
+
+
+@dataclass
+class Event:
+    """一个阶段结束时的事件；ts 为 time.monotonic()，time 为墙上时间，duration 单位为秒"""
+    name: str
+    outcome: str
+    ts: float
+    time: float
+    duration: Optional[float] = None
+    run_id: str = ''
+    labels: Dict[str, str] = field(default_factory=dict)
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Span:
+    """phase() 中正在计时的阶段，可以在结束前修改结果和附加字段"""
+    name: str
+    labels: Dict[str, str]
+    started: float
+    outcome: str = OK
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def _format_labels(pairs: List[Tuple[str, str]]) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_prometheus(text: str) -> List[Tuple[str, Dict[str, str], float]]:
+    """解析 Prometheus 文本格式中的样本行"""
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        match = _SAMPLE_RE.match(line.strip())
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        samples.append((name, {key: _unescape(val) for key, val in _LABEL_RE.findall(labels or '')},
+                        float(value)))
+    return samples
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def inc(self, labels: Dict[str, str], amount: float = 1.0):
+        key = self.key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key in sorted(self.values):
+            lines.append(f'{self.name}{_format_labels(list(zip(self.label_names, key)))} '
+                         f'{_format_value(self.values[key])}')
+        return lines
+
+    def restore(self, name: str, labels: Dict[str, str], value: float):
+        if name == self.name:
+            self.values[self.key(labels)] = value
+
+
+class Histogram:
+    """累计桶计数的直方图，与 Prometheus 的表示相同"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # 每组标签：[各个桶的累计计数..., +Inf 计数, 总和]
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def _series(self, key: Tuple[str, ...]) -> List[float]:
+        if key not in self.values:
+            self.values[key] = [0.0] * (len(self.buckets) + 2)
+        return self.values[key]
+
+    def observe(self, labels: Dict[str, str], value: float):
+        series = self._series(self.key(labels))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key in sorted(self.values):
+            series = self.values[key]
+            pairs = list(zip(self.label_names, key))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", _format_value(bound))])} '
+                             f'{_format_value(count)}')
+            lines.append(f'{self.name}_bucket{_format_labels(pairs + [("le", "+Inf")])} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_sum{_format_labels(pairs)} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{_format_labels(pairs)} {_format_value(series[-2])}')
+        return lines
+
+    def restore(self, name: str, labels: Dict[str, str], value: float):
+        if name == f'{self.name}_bucket':
+            le = labels.get('le')
+            series = self._series(self.key(labels))
+            if le == '+Inf':
+                series[-2] = value
+            else:
+                for index, bound in enumerate(self.buckets):
+                    if float(le) == bound:
+                        series[index] = value
+        elif name == f'{self.name}_sum':
+            self._series(self.key(labels))[-1] = value
+
+
+class MetricsRegistry:
+    """所有阶段共用的计数器和耗时直方图"""
+
+    def __init__(self):
+        self.events = Counter('ytsd_phase_events_total', '按阶段和结果统计的事件数',
+                              ('phase', 'outcome') + METRIC_LABELS)
+        self.durations = Histogram('ytsd_phase_duration_seconds', '阶段耗时（秒）',
+                                   ('phase',) + METRIC_LABELS)
+        self.last_event = 0.0
+
+    def record(self, event: Event):
+        labels = dict(event.labels, phase=event.name, outcome=event.outcome)
+        self.events.inc(labels)
+        if event.duration is not None:
+            self.durations.observe(labels, event.duration)
+        self.last_event = event.time
+
+    def render(self) -> str:
+        lines = self.events.render() + self.durations.render() + [
+            '# HELP ytsd_last_event_timestamp_seconds 最后一个事件的时间（Unix 秒）',
+            '# TYPE ytsd_last_event_timestamp_seconds gauge',
+            f'ytsd_last_event_timestamp_seconds {_format_value(round(self.last_event, 3))}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def load(self, text: str):
+        """从上次写出的文件恢复计数，使计数器在多次运行之间单调递增"""
+        for name, labels, value in parse_prometheus(text):
+            self.events.restore(name, labels, value)
+            self.durations.restore(name, labels, value)
+            if name == 'ytsd_last_event_timestamp_seconds':
+                self.last_event = value
+
+
+class Telemetry:
+    """把每个阶段的事件写入 JSONL，并把计数器和直方图写成 Prometheus 文本格式
+
+    未调用 configure() 时所有方法都是空操作。
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory: Optional[str] = None
+        self.run_id = ''
+        self.metrics = MetricsRegistry()
+        self._events: Optional[TextIO] = None
+        self._last_flush = 0.0
+
+    @property
+    def prometheus_path(self) -> Optional[str]:
+        return os.path.join(self.directory, PROMETHEUS_NAME) if self.directory else None
+
+    def configure(self, directory: str = TELEMETRY_ROOT, run_id: Optional[str] = None) -> 'Telemetry':
+        if self.enabled and os.path.abspath(directory) == os.path.abspath(self.directory):
+            return self
+        self.close()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.run_id = run_id or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.metrics = MetricsRegistry()
+        if os.path.exists(self.prometheus_path):
+            with open(self.prometheus_path, encoding='utf-8') as f:
+                self.metrics.load(f.read())
+        self._events = open(os.path.join(directory, EVENTS_NAME), 'a', encoding='utf-8')
+        self.enabled = True
+        logger.info(f"遥测输出: {directory} (run {self.run_id})")
+        return self
+
+    def emit(self, name: str, duration: Optional[float] = None, outcome: str = OK,
+             labels: Optional[Dict[str, Any]] = None, **fields) -> Optional[Event]:
+        """记录一个事件，duration 为 None 时只计数"""
+        if not self.enabled:
+            return None
+        event = Event(name=name, outcome=outcome, ts=time.monotonic(), time=time.time(),
+                      duration=duration, run_id=self.run_id,
+                      labels={key: str(value) for key, value in (labels or {}).items() if value is not None},
+                      fields={key: value for key, value in fields.items() if value is not None})
+        self._events.write(json.dumps(asdict(event), ensure_ascii=False) + '\n')
+        self._events.flush()
+        self.metrics.record(event)
+        if event.ts - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+        return event
+
+    @contextmanager
+    def phase(self, name: str, **labels):
+        """对代码块计时并在结束时记录事件；异常按类型记为 timeout / cancelled / error 后重新抛出"""
+        span = Span(name, labels, time.monotonic())
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.outcome = CANCELLED
+            raise
+        except asyncio.TimeoutError as e:
+            span.outcome = TIMEOUT
+            span.fields.setdefault('error', str(e))
+            raise
+        except Exception as e:
+            span.outcome = ERROR
+            span.fields.setdefault('error', f'{type(e).__name__}: {e}')
+            raise
+        finally:
+            self.emit(name, time.monotonic() - span.started, span.outcome, span.labels, **span.fields)
+
+    def timed(self, name: str):
+        """给协程函数计时的装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with self.phase(name):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def flush(self):
+        """原子地重写 Prometheus 文件"""
+        if not self.enabled:
+            return
+        tmp_path = f'{self.prometheus_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self.prometheus_path)
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if not self.enabled:
+            return
+        self.flush()
+        self._events.close()
+        self._events = None
+        self.enabled = False
+
+
+# 整个进程共用的实例
+telemetry = Telemetry()
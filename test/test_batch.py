@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import batch
+from batch import Journal, JournalRecord, read_urls, journal_key, run_batch
+from test_download import DownloadOutcome
+
+
+class FakePool:
+    async def start(self):
+        return self
+
+    async def close(self):
+        pass
+
+
+def test_read_urls_skips_comments_and_duplicates():
+    """忽略空行和注释，保持顺序去重"""
+    lines = ['# channel\n', 'https://y/1\n', '\n', '  https://y/2  \n', 'https://y/1\n']
+    assert read_urls(lines) == ['https://y/1', 'https://y/2']
+
+
+def test_journal_recovers_from_truncated_line(tmp_path):
+    """被杀掉时写了一半的最后一行会被忽略，新记录从新的一行开始"""
+    path = tmp_path / 'journal.jsonl'
+    ok = JournalRecord(url='https://y/1', subtitle_type='auto', format='txt', ok=True)
+    failed = JournalRecord(url='https://y/2', subtitle_type='auto', format='txt', ok=False)
+    path.write_text(json.dumps(ok.__dict__) + '\n' + json.dumps(failed.__dict__) + '\n{"url": "https://y/3", "su')
+
+    journal = Journal(str(path))
+    assert journal.completed() == {ok.key}
+    assert journal.completed(include_failed=True) == {ok.key, failed.key}
+    with journal:
+        journal.append(JournalRecord(url='https://y/3', subtitle_type='auto', format='txt', ok=True))
+    assert journal_key('https://y/3', 'auto', 'txt') in journal.completed()
+
+
+def test_run_batch_resumes_from_journal(tmp_path, fake_downloads):
+    """已成功的URL被跳过，失败的URL在恢复时重试，文件移动到输出目录"""
+    calls = []
+
+    async def fake_download_subtitles(context, url, subtitle_type, fmt, timeout, open_page):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        if url.endswith('bad'):
+            return DownloadOutcome(success=False, status_text='找不到字幕')
+        source = tmp_path / 'lease' / f'{url[-1]}_subtitles.{fmt}'
+        source.parent.mkdir(exist_ok=True)
+        source.write_text(url)
+        return DownloadOutcome(success=True, status_text='下载成功', path=str(source))
+
+    fake_downloads(batch, fake_download_subtitles)
+
+    journal_path = str(tmp_path / 'journal.jsonl')
+    output = tmp_path / 'out'
+    urls = ['https://y/1', 'https://y/2', 'https://y/bad']
+    summary = asyncio.run(run_batch(urls[:2], journal_path, str(output), concurrency=2, pool=FakePool()))
+    assert summary['ok'] == 2 and sorted(calls) == urls[:2]
+    assert (output / '1_subtitles.txt').read_text() == 'https://y/1'
+
+    calls.clear()
+    summary = asyncio.run(run_batch(urls, journal_path, str(output), concurrency=2, pool=FakePool()))
+    assert calls == ['https://y/bad'] and summary['failed'] == 1
+
+    calls.clear()
+    asyncio.run(run_batch(urls, journal_path, str(output), pool=FakePool()))
+    assert calls == ['https://y/bad']
+    records = Journal(journal_path).load()
+    assert len(records) == 4 and records[0].sha256
+
+
+def test_run_batch_retries_throttled_urls(tmp_path, fake_downloads):
+    """429 的URL按 Retry-After 退避后重试，日志只记录最终结果"""
+    attempts = []
+
+    async def fake_download_subtitles(context, url, subtitle_type, fmt, timeout, open_page):
+        attempts.append(url)
+        if len(attempts) == 1:
+            return DownloadOutcome(success=False, status_text='请求过多', http_status=429, retry_after=0.05)
+        source = tmp_path / 'lease' / f'{url[-1]}_subtitles.{fmt}'
+        source.parent.mkdir(exist_ok=True)
+        source.write_text(url)
+        return DownloadOutcome(success=True, status_text='下载成功', path=str(source))
+
+    fake_downloads(batch, fake_download_subtitles)
+
+    journal_path = str(tmp_path / 'journal.jsonl')
+    summary = asyncio.run(run_batch(['https://y/1'], journal_path, str(tmp_path / 'out'), pool=FakePool()))
+    assert attempts == ['https://y/1', 'https://y/1']
+    assert summary['ok'] == 1 and summary['scheduler']['retries'] == 1
+    records = Journal(journal_path).load()
+    assert len(records) == 1 and records[0].attempts == 2
+
+
+def test_run_batch_postprocesses_while_downloading(tmp_path, fake_downloads):
+    """下载完成的文件交给后处理进程池，汇总中包含后处理结果"""
+    async def fake_download_subtitles(context, url, subtitle_type, fmt, timeout, open_page):
+        source = tmp_path / 'lease' / f'{url[-1]}_subtitles.{fmt}'
+        source.parent.mkdir(exist_ok=True)
+        source.write_text(f'1\n00:00:01,000 --> 00:00:02,000\n{url}\n')
+        return DownloadOutcome(success=True, status_text='下载成功', path=str(source))
+
+    fake_downloads(batch, fake_download_subtitles)
+
+    processed = tmp_path / 'processed'
+    summary = asyncio.run(run_batch(['https://y/1', 'https://y/2'], str(tmp_path / 'journal.jsonl'),
+                                    str(tmp_path / 'out'), fmt='srt', concurrency=2, pool=FakePool(),
+                                    postprocess_dir=str(processed), postprocess_workers=2))
+    assert summary['postprocess']['ok'] == 2
+    assert (processed / '1_subtitles.vtt').exists() and (processed / '2_subtitles.txt').exists()
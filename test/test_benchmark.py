@@ -0,0 +1,29 @@
+from benchmark import summarize, compare
+from stats import percentile
+
+
+def make_results(p50, p95, failures=0):
+    return {'scenarios': {'vid/auto/txt': {
+        'failures': failures,
+        'phases': {'download_complete': {'n': 5, 'p50': p50, 'p95': p95, 'max': p95}},
+    }}}
+
+
+def test_percentile_and_summary():
+    """最近秩百分位数"""
+    values = [0.5, 0.1, 0.4, 0.2, 0.3]
+    assert percentile(values, 50) == 0.3
+    assert percentile(values, 95) == 0.5
+    assert percentile([], 50) is None
+    assert summarize(values) == {'n': 5, 'p50': 0.3, 'p95': 0.5, 'max': 0.5}
+
+
+def test_compare_flags_regressions_over_threshold():
+    """超过相对阈值和最小绝对差值的变化才算回退"""
+    baseline = make_results(1.0, 2.0)
+    assert compare(make_results(1.1, 2.1), baseline, threshold=0.2) == []
+    regressions = compare(make_results(1.5, 2.1), baseline, threshold=0.2)
+    assert len(regressions) == 1 and 'p50' in regressions[0]
+    # 绝对差值太小视为噪声
+    assert compare(make_results(0.03, 0.03), make_results(0.01, 0.01), threshold=0.2) == []
+    assert compare(make_results(1.0, 2.0, failures=1), baseline)
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import browser_daemon
+from browser_daemon import (
+    BrowserDaemon, ClientLock, DaemonState, attach, daemon_available, endpoint_alive,
+    read_state, src_fingerprint, write_state
+)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.healthy = True
+
+    async def send(self, method, params=None):
+        if not self.healthy:
+            raise ConnectionError('browser gone')
+        return {'product': 'HeadlessChrome'}
+
+
+class FakePage:
+    def __init__(self, browser):
+        self.browser = browser
+        self.url = ''
+
+    async def goto(self, url):
+        if not self.browser.extension_loaded:
+            raise RuntimeError(f'net::ERR_BLOCKED_BY_CLIENT at {url}')
+        self.url = url
+
+    async def evaluate(self, script):
+        return json.dumps({'manifest_version': 3})
+
+    async def close(self):
+        self.browser.open_pages -= 1
+
+
+class FakeBrowser:
+    def __init__(self, index):
+        self.wsEndpoint = f'ws://127.0.0.1:9/devtools/browser/{index}'
+        self._connection = FakeConnection()
+        # 扩展是否加载与 service worker target 是否存在无关
+        self.extension_loaded = True
+        self.open_pages = 0
+
+    async def newPage(self):
+        self.open_pages += 1
+        return FakePage(self)
+
+
+class FakePool:
+    """代替 BrowserPool，记录启动和关闭次数"""
+
+    def __init__(self):
+        self.starts = 0
+        self.closes = 0
+        self.browsers = []
+        # 接下来这么多次启动失败
+        self.failures = 0
+
+    async def start(self):
+        self.starts += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('Browser closed unexpectedly')
+        self.browsers = [type('Pooled', (), {'browser': FakeBrowser(self.starts)})()]
+
+    async def close(self):
+        self.closes += 1
+
+
+def serve_version(ws_endpoint):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({'webSocketDebuggerUrl': ws_endpoint.format(port=self.server.server_port)}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_src_fingerprint_changes_with_sources(tmp_path):
+    (tmp_path / 'manifest.json').write_text('{}', encoding='utf-8')
+    before = src_fingerprint(str(tmp_path))
+    assert before == src_fingerprint(str(tmp_path))
+    (tmp_path / 'background.js').write_text('// v2', encoding='utf-8')
+    assert src_fingerprint(str(tmp_path)) != before
+
+
+def test_client_lock_is_exclusive_and_expires(tmp_path):
+    first, second = ClientLock(str(tmp_path)), ClientLock(str(tmp_path))
+    assert first.acquire()
+    assert not second.acquire()
+    assert second.locked()
+    first.release()
+    assert second.acquire()
+
+    # 持有者异常退出（不再刷新）留下的锁过期后可以重新获取
+    second._released.set()
+    second.held = False
+    old = time.time() - browser_daemon.STALE_LOCK_SECONDS - 1
+    os.utime(second.path, (old, old))
+    third = ClientLock(str(tmp_path))
+    assert third.acquire()
+    third.release()
+
+
+def test_client_lock_heartbeat_keeps_long_sessions_locked(tmp_path):
+    """持有者定期刷新锁，持有时间超过 STALE_LOCK_SECONDS 也不会被其他客户端抢走"""
+    lock = ClientLock(str(tmp_path), heartbeat=0.05)
+    assert lock.acquire()
+    try:
+        old = time.time() - browser_daemon.STALE_LOCK_SECONDS - 1
+        os.utime(lock.path, (old, old))
+        deadline = time.time() + 5
+        while time.time() - os.path.getmtime(lock.path) > browser_daemon.STALE_LOCK_SECONDS:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert not ClientLock(str(tmp_path)).acquire()
+    finally:
+        lock.release()
+    assert not os.path.exists(lock.path)
+
+
+def test_availability_requires_live_matching_endpoint(tmp_path, monkeypatch):
+    monkeypatch.delenv(browser_daemon.DISABLE_ENV, raising=False)
+    root = str(tmp_path)
+    assert not daemon_available(root, str(tmp_path / 'src'))
+
+    server = serve_version('ws://127.0.0.1:{port}/devtools/browser/abc')
+    try:
+        endpoint = f'ws://127.0.0.1:{server.server_port}/devtools/browser/abc'
+        assert endpoint_alive(endpoint)
+        assert not endpoint_alive(endpoint.replace('abc', 'other'))
+        write_state(DaemonState(endpoint, os.getpid(), str(tmp_path / 'src'), '', True, time.time()), root)
+        assert read_state(root).ws_endpoint == endpoint
+        assert daemon_available(root, str(tmp_path / 'src'))
+        # 加载的是另一份扩展，或正被其他客户端使用时不可用
+        assert not daemon_available(root, str(tmp_path / 'other'))
+        lock = ClientLock(root)
+        lock.acquire()
+        assert not daemon_available(root, str(tmp_path / 'src'))
+        assert asyncio.run(attach(root, str(tmp_path / 'src'))) is None
+        lock.release()
+        monkeypatch.setenv(browser_daemon.DISABLE_ENV, '1')
+        assert not daemon_available(root, str(tmp_path / 'src'))
+    finally:
+        server.shutdown()
+
+
+def test_daemon_restarts_on_source_change_and_failed_health_check(tmp_path):
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'manifest.json').write_text('{}', encoding='utf-8')
+
+    async def run():
+        daemon = BrowserDaemon(str(tmp_path / 'daemon'), extension_path=str(src))
+        daemon.pool = FakePool()
+        await daemon.start()
+        first_endpoint = read_state(daemon.root).ws_endpoint
+
+        await daemon.check()
+        assert daemon.pool.starts == 1
+
+        # 客户端持有锁时推迟重启，锁释放后的检查中再重启
+        (src / 'background.js').write_text('// changed', encoding='utf-8')
+        lock = ClientLock(daemon.root)
+        assert lock.acquire()
+        await daemon.check()
+        assert daemon.pool.starts == 1 and daemon.pending_restart
+        lock.release()
+        await daemon.check()
+        assert (daemon.pool.starts, daemon.pool.closes) == (2, 1)
+        state = read_state(daemon.root)
+        assert state.ws_endpoint != first_endpoint
+        assert state.restarts == 1
+
+        daemon.browser._connection.healthy = False
+        await daemon.check()
+        assert daemon.pool.starts == 3
+
+        # 健康检查打开的临时页面都会关闭
+        await daemon.check()
+        assert daemon.pool.starts == 3 and daemon.browser.open_pages == 0
+        daemon.browser.extension_loaded = False
+        await daemon.check()
+        assert daemon.pool.starts == 4
+
+    asyncio.run(run())
+
+
+def test_daemon_retries_failed_restart_with_backoff(tmp_path, monkeypatch):
+    """重启失败时守护进程不退出，按指数退避在之后的检查中重试"""
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'manifest.json').write_text('{}', encoding='utf-8')
+    now = [1000.0]
+    monkeypatch.setattr(browser_daemon.time, 'monotonic', lambda: now[0])
+
+    async def run():
+        daemon = BrowserDaemon(str(tmp_path / 'daemon'), extension_path=str(src))
+        daemon.pool = FakePool()
+        await daemon.start()
+
+        daemon.browser._connection.healthy = False
+        daemon.pool.failures = 2
+        await daemon.check()
+        assert daemon.pool.starts == 2 and daemon.restart_failures == 1
+
+        # 退避期间不重试
+        now[0] += browser_daemon.RESTART_BACKOFF - 1
+        await daemon.check()
+        assert daemon.pool.starts == 2
+
+        now[0] += 1
+        await daemon.check()
+        assert daemon.pool.starts == 3 and daemon.restart_failures == 2
+
+        now[0] += 2 * browser_daemon.RESTART_BACKOFF
+        await daemon.check()
+        assert daemon.pool.starts == 4
+        assert daemon.pending_restart is None and daemon.restart_failures == 0
+        assert read_state(daemon.root).restarts == 3
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import json
+import zipfile
+
+from batch import Journal, JournalRecord, bundle_journal
+from bundle import BundleWriter, MANIFEST_NAME, read_manifest, verify_bundle
+from corpus import CorpusSpec, generate_cues
+
+
+def test_bundle_is_deterministic_and_verifies(tmp_path):
+    """同样的输入得到相同的压缩包，清单最后写入，流式校验通过"""
+    cues = list(generate_cues(CorpusSpec('pathological', 60)))
+
+    def build(path):
+        with BundleWriter(str(path)) as bundle:
+            for fmt in ('srt', 'vtt', 'txt'):
+                bundle.write_cues('abcdefghijk', 'en', fmt, cues)
+        return path.read_bytes()
+
+    first, second = build(tmp_path / 'a.zip'), build(tmp_path / 'b.zip')
+    assert first == second
+
+    names = zipfile.ZipFile(tmp_path / 'a.zip').namelist()
+    assert names == ['abcdefghijk.en.srt', 'abcdefghijk.en.vtt', 'abcdefghijk.en.txt', MANIFEST_NAME]
+    manifest = read_manifest(str(tmp_path / 'a.zip'))
+    assert [entry['format'] for entry in manifest['entries']] == ['srt', 'vtt', 'txt']
+    assert all(entry['video_id'] == 'abcdefghijk' and entry['track'] == 'en' for entry in manifest['entries'])
+
+    report = verify_bundle(str(tmp_path / 'a.zip'))
+    assert report.ok, report.errors
+    assert report.entries == 3
+    assert not (tmp_path / 'a.zip.tmp').exists()
+
+
+def test_verify_detects_mismatch(tmp_path):
+    """条目内容与清单不一致、缺少条目时报告错误"""
+    path = tmp_path / 'bad.zip'
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('x.en.srt', '1\n00:00:00,000 --> 00:00:01,000\nhi\n\n')
+        zf.writestr(MANIFEST_NAME, json.dumps({'version': 1, 'entries': [
+            {'name': 'x.en.srt', 'video_id': 'x', 'track': 'en', 'format': 'srt', 'sha256': '0' * 64, 'size': 1},
+            {'name': 'x.de.srt', 'video_id': 'x', 'track': 'de', 'format': 'srt', 'sha256': '0' * 64, 'size': 1},
+        ]}))
+    report = verify_bundle(str(path))
+    assert not report.ok
+    assert any('x.de.srt' in error for error in report.errors)
+    assert any('SHA-256' in error for error in report.errors)
+    assert any('大小' in error for error in report.errors)
+
+
+def test_failed_bundle_leaves_no_archive(tmp_path):
+    """写入中途出错时不留下压缩包"""
+    path = tmp_path / 'out.zip'
+    try:
+        with BundleWriter(str(path)) as bundle:
+            bundle.write_cues('x', 'en', 'srt', [])
+            bundle.write_cues('x', 'en', 'srt', [])
+    except ValueError:
+        pass
+    assert not path.exists()
+    assert not (tmp_path / 'out.zip.tmp').exists()
+
+
+def test_bundle_journal_packs_successful_downloads(tmp_path):
+    """批量下载的日志中成功的文件按确定的条目名打包"""
+    journal = Journal(str(tmp_path / 'journal.jsonl'))
+    with journal:
+        for index, video_id in enumerate(['bbbbbbbbbbb', 'aaaaaaaaaaa']):
+            path = tmp_path / f'{video_id}.txt'
+            path.write_text(f'line {index}\n', encoding='utf-8')
+            journal.append(JournalRecord(url=f'https://www.youtube.com/watch?v={video_id}',
+                                         subtitle_type='auto', format='txt', ok=True, path=str(path)))
+        journal.append(JournalRecord(url='https://www.youtube.com/watch?v=ccccccccccc',
+                                     subtitle_type='auto', format='txt', ok=False))
+
+    entries = bundle_journal(journal, str(tmp_path / 'batch.zip'))
+    assert [entry.name for entry in entries] == ['aaaaaaaaaaa.auto.txt', 'bbbbbbbbbbb.auto.txt']
+    assert verify_bundle(str(tmp_path / 'batch.zip')).ok
@@ -0,0 +1,121 @@
+import asyncio
+import os
+
+from pyee import EventEmitter
+
+from cdp_waits import DownloadWaiter, WaitTimeout
+
+
+class FakeBrowser:
+    """只提供 CDP 事件连接的假浏览器"""
+
+    def __init__(self):
+        self._connection = EventEmitter()
+
+
+def test_download_waiter_completes_on_cdp_events(tmp_path):
+    """收到 downloadProgress completed 后立即返回，并报告耗时"""
+    async def run():
+        browser = FakeBrowser()
+        waiter = DownloadWaiter(browser, str(tmp_path)).start()
+        connection = browser._connection
+        connection.emit('Browser.downloadWillBegin', {
+            'guid': 'g1', 'suggestedFilename': 'abc_subtitles.txt', 'url': 'blob:x'})
+        # 其他文件的下载事件应被忽略
+        connection.emit('Browser.downloadWillBegin', {
+            'guid': 'g2', 'suggestedFilename': 'other.bin', 'url': 'blob:y'})
+        (tmp_path / 'abc_subtitles.txt').write_text('hello')
+        connection.emit('Browser.downloadProgress', {
+            'guid': 'g1', 'state': 'completed', 'receivedBytes': 5, 'totalBytes': 5})
+        began = await waiter.wait_began(1)
+        result = await waiter.wait(1)
+        return began, result
+
+    began, result = asyncio.run(run())
+    assert began.value.suggested_filename == 'abc_subtitles.txt'
+    assert result.value.path == os.path.join(str(tmp_path), 'abc_subtitles.txt')
+    assert result.value.received_bytes == 5
+    assert result.elapsed >= 0
+
+
+def test_download_waiter_falls_back_to_downloads_watcher(tmp_path):
+    """没有 CDP 事件时由目录监视器发现新文件，忽略 .crdownload 和已有文件"""
+    (tmp_path / 'old_subtitles.srt').write_text('old')
+
+    async def run():
+        waiter = DownloadWaiter(FakeBrowser(), str(tmp_path)).start()
+        (tmp_path / 'new_subtitles.vtt.crdownload').write_text('partial')
+        await asyncio.sleep(0.2)
+        (tmp_path / 'new_subtitles.vtt').write_text('WEBVTT')
+        return await waiter.wait(2)
+
+    result = asyncio.run(run())
+    assert result.value.suggested_filename == 'new_subtitles.vtt'
+
+
+def test_download_waiter_times_out(tmp_path):
+    """超时时抛出 WaitTimeout 并携带实际等待时间"""
+    async def run():
+        waiter = DownloadWaiter(FakeBrowser(), str(tmp_path)).start()
+        return await waiter.wait(0.2)
+
+    try:
+        asyncio.run(run())
+    except WaitTimeout as e:
+        assert e.elapsed >= 0.2
+    else:
+        raise AssertionError('应当超时')
+
+
+def test_download_waiter_ignores_downloads_after_seal(tmp_path):
+    """seal() 之后开始的下载属于同一浏览器的其他页面，不应使这个等待器完成"""
+    async def run():
+        browser = FakeBrowser()
+        waiter = DownloadWaiter(browser, str(tmp_path)).start()
+        connection = browser._connection
+        connection.emit('Browser.downloadWillBegin', {
+            'guid': 'mine', 'suggestedFilename': 'a_subtitles.txt', 'url': 'blob:x'})
+        waiter.seal()
+        connection.emit('Browser.downloadWillBegin', {
+            'guid': 'other', 'suggestedFilename': 'b_subtitles.txt', 'url': 'blob:y'})
+        connection.emit('Browser.downloadProgress', {'guid': 'other', 'state': 'completed'})
+        (tmp_path / 'a_subtitles.txt').write_text('hello')
+        connection.emit('Browser.downloadProgress', {'guid': 'mine', 'state': 'completed'})
+        return await waiter.wait(1)
+
+    result = asyncio.run(run())
+    assert result.value.suggested_filename == 'a_subtitles.txt'
+
+
+def test_download_waiter_ignores_other_frames(tmp_path):
+    """同一浏览器中其他页面发起的下载按 frameId 忽略"""
+    async def run():
+        browser = FakeBrowser()
+        waiter = DownloadWaiter(browser, str(tmp_path), frame_id='page-a').start()
+        connection = browser._connection
+        connection.emit('Browser.downloadWillBegin', {
+            'guid': 'b', 'frameId': 'page-b', 'suggestedFilename': 'b_subtitles.txt'})
+        connection.emit('Browser.downloadProgress', {'guid': 'b', 'state': 'completed'})
+        connection.emit('Browser.downloadWillBegin', {
+            'guid': 'a', 'frameId': 'page-a', 'suggestedFilename': 'a_subtitles.txt'})
+        (tmp_path / 'a_subtitles.txt').write_text('hello')
+        connection.emit('Browser.downloadProgress', {'guid': 'a', 'state': 'completed'})
+        return await waiter.wait(1)
+
+    result = asyncio.run(run())
+    assert result.value.suggested_filename == 'a_subtitles.txt'
+    assert result.value.guid == 'a'
+
+
+def test_download_waiter_stop_is_idempotent(tmp_path):
+    """点击失败时调用方直接 stop()，之后再次 stop() 或从未 start() 都不出错"""
+    async def run():
+        browser = FakeBrowser()
+        DownloadWaiter(browser, str(tmp_path)).stop()
+        waiter = DownloadWaiter(browser, str(tmp_path)).start()
+        waiter.stop()
+        waiter.stop()
+        return browser._connection.listeners('Browser.downloadWillBegin'), waiter.watcher._fd
+
+    listeners, fd = asyncio.run(run())
+    assert listeners == [] and fd is None
@@ -0,0 +1,69 @@
+import os
+
+from corpus import CorpusSpec, generate_cues, generate_video, linearity, STYLES
+from fixture_server import FixtureServer
+from subtitle_engine import iter_cues, validate_file, merge_rolling
+
+
+def read_bytes(video_dir):
+    timedtext = os.path.join(video_dir, 'timedtext')
+    return {name: open(os.path.join(timedtext, name), 'rb').read() for name in sorted(os.listdir(timedtext))}
+
+
+def test_generation_is_deterministic(tmp_path):
+    """相同参数生成完全相同的文件和视频ID"""
+    spec = CorpusSpec('manual', 120, seed=7)
+    first = read_bytes(generate_video(spec, str(tmp_path / 'a')))
+    second = read_bytes(generate_video(CorpusSpec('manual', 120, seed=7), str(tmp_path / 'b')))
+    assert first == second
+    assert CorpusSpec('manual', 120, seed=8).video_id != spec.video_id
+    assert len(spec.video_id) == 11
+
+
+def test_every_style_and_format_parses(tmp_path):
+    """所有风格、格式、自动 / 手动轨道都能被参考实现解析，条数一致"""
+    for style in STYLES:
+        spec = CorpusSpec(style, 180)
+        video_dir = generate_video(spec, str(tmp_path))
+        for name in os.listdir(os.path.join(video_dir, 'timedtext')):
+            path = os.path.join(video_dir, 'timedtext', name)
+            assert validate_file(path).ok, (style, name)
+            assert sum(1 for _ in iter_cues(path)) == spec.cue_count, (style, name)
+
+
+def test_pathological_cases_present():
+    """病态风格包含零长度、重叠、相同开始时间和超长单条字幕"""
+    cues = list(generate_cues(CorpusSpec('pathological', 600)))
+    assert any(cue.start_ms == cue.end_ms for cue in cues)
+    assert any(b.start_ms < a.end_ms for a, b in zip(cues, cues[1:]))
+    assert any(b.start_ms == a.start_ms for a, b in zip(cues, cues[1:]))
+    assert max(len(cue.text) for cue in cues) > 32 * 1024
+    assert all(b.start_ms >= a.start_ms for a, b in zip(cues, cues[1:]))
+
+
+def test_rolling_vtt_dedupes_back_to_lines(tmp_path):
+    """自动字幕 VTT 的两行滚动窗口经过去重后还原为原始单词序列"""
+    spec = CorpusSpec('rolling', 120)
+    video_dir = generate_video(spec, str(tmp_path))
+    words = ' '.join(cue.text for cue in generate_cues(spec)).split()
+    merged = merge_rolling(iter_cues(os.path.join(video_dir, 'timedtext', 'en.asr.vtt')))
+    assert ' '.join(cue.text for cue in merged).split() == words
+
+
+def test_fixture_server_serves_generated_video(tmp_path):
+    """生成的目录可以直接交给夹具服务器"""
+    spec = CorpusSpec('cjk', 60)
+    generate_video(spec, str(tmp_path))
+    server = FixtureServer(str(tmp_path))
+    tracks = server.caption_tracks(spec.video_id)
+    assert [track.get('kind') for track in tracks] == ['asr', None]
+    response = server._timedtext({'v': spec.video_id, 'lang': 'zh-Hans', 'kind': 'asr', 'fmt': 'json3'})
+    assert response.status == 200 and b'"events"' in response.body
+
+
+def test_linearity_ratio():
+    """单位耗时之比"""
+    points = [{'cues': 100, 'seconds': 0.1}, {'cues': 10000, 'seconds': 10.0}, {'cues': 1000, 'seconds': 1.2}]
+    assert linearity(points) == 1.0
+    assert linearity([{'cues': 100, 'seconds': 0.1}, {'cues': 1000, 'seconds': 3.0}]) == 3.0
+    assert linearity(points[:1]) is None
@@ -1,13 +1,31 @@
 import asyncio
 from pyppeteer import launch
 import os
+import re
 import logging
 import time
-import glob
 import shutil
 import traceback
-from dataclasses import dataclass
-from typing import Optional, Any
+from dataclasses import dataclass, field
+from typing import Optional, Any, Dict
+
+from cdp_waits import DownloadWaiter, StatusWatcher, ResponseWatcher, WaitTimeout, navigate_and_wait_load
+from extension_id import resolve_extension_id, options_page_url
+from fixture_server import FixtureServer, make_self_signed_context
+from profile_template import ensure_template, clone_profile
+from downloads_watcher import subtitle_files
+from tracing import PhaseTracer
+from network_cache import NetworkCache, NetworkInterceptor, attach_network_cache
+from heap_profile import HeapProfiler, MemoryBudget, MemoryReport, PROFILES_ROOT
+from perf_profiles import (
+    PerformanceProfile, ProfileSession, get_profile, install_jank_probe, collect_jank_probe
+)
+from telemetry import telemetry, FAILED
+from browser_daemon import ClientLock, attach as attach_daemon, detach as detach_daemon, daemon_available
+from browser_pool import (
+    BrowserPool, Lease, CHROME_PATH, EXTENSION_PATH, DOWNLOADS_ROOT,
+    build_launch_args, wait_for_extension_target, set_download_folder
+)
 
 # 配置日志
 logging.basicConfig(
@@ -24,6 +42,19 @@ class TestContext:
     extension_path: str
     extension_id: Optional[str] = None
     downloads_folder: Optional[str] = None
+    lease: Optional[Lease] = None
+    pool: Optional[BrowserPool] = None
+    # 设置后每次下载都会记录 CDP trace 和阶段汇总到这个目录
+    trace_dir: Optional[str] = None
+    # 录制 / 回放网络缓存时的请求拦截器
+    interceptor: Optional[NetworkInterceptor] = None
+    # 设置后每次下载都会采样扩展的 JS 堆，并按 memory_budget 检查
+    heap_profile_dir: Optional[str] = None
+    memory_budget: Optional[MemoryBudget] = None
+    # 连接到常驻浏览器守护进程时持有的客户端锁，清理时只断开连接
+    daemon_lock: Optional[ClientLock] = None
+    # 应用在选项页和扩展 service worker 上的 CPU / 网络限制
+    throttle: Optional[ProfileSession] = None
     
     def set_extension_id(self, extension_id: str):
         """设置扩展ID"""
@@ -33,66 +64,141 @@ class TestContext:
         """设置下载文件夹"""
         self.downloads_folder = downloads_folder
 
+@telemetry.timed('create_test_context')
 async def create_test_context(headless: bool = False,
-                             downloads_folder: Optional[str] = None) -> TestContext:
-    """创建测试上下文"""
+                             downloads_folder: Optional[str] = None,
+                             pool: Optional[BrowserPool] = None,
+                             fixture_server: Optional[FixtureServer] = None,
+                             profile_template: Optional[str] = None,
+                             trace_dir: Optional[str] = None,
+                             network_cache: Optional[NetworkCache] = None,
+                             cache_mode: str = 'passthrough',
+                             use_daemon: bool = True,
+                             perf_profile: Optional[str] = None) -> TestContext:
+    """创建测试上下文，传入浏览器池时从池中借用页面，传入夹具服务器时离线运行，
+    传入网络缓存时按 cache_mode 录制或回放 YouTube 请求，传入性能配置名时模拟对应的设备和网络；
+    浏览器守护进程可用时连接它的浏览器，否则自己启动"""
+    profile = get_profile(perf_profile)
+    if pool is not None:
+        lease = await pool.acquire()
+        context = TestContext(
+            browser=lease.browser,
+            page=lease.page,
+            extension_path=pool.extension_path,
+            downloads_folder=lease.downloads_folder,
+            lease=lease,
+            pool=pool,
+            trace_dir=trace_dir
+        )
+        return await _instrument_context(context, network_cache, cache_mode, profile)
+
     # 获取项目根目录
-    extension_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+    extension_path = EXTENSION_PATH
     
     # 设置下载文件夹
     if downloads_folder is None:
-        downloads_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), 'downloads'))
+        downloads_folder = DOWNLOADS_ROOT
     
     # 确保下载文件夹存在
     os.makedirs(downloads_folder, exist_ok=True)
+
+    # 离线模式需要把域名解析到本次的夹具服务器，不能使用守护进程的浏览器
+    attached = await attach_daemon(extension_path=extension_path) \
+        if use_daemon and fixture_server is None else None
+    if attached is not None:
+        browser, lock = attached
+        page = await browser.newPage()
+        await set_download_folder(browser, downloads_folder)
+        context = TestContext(
+            browser=browser,
+            page=page,
+            extension_path=extension_path,
+            downloads_folder=downloads_folder,
+            trace_dir=trace_dir,
+            daemon_lock=lock
+        )
+        return await _instrument_context(context, network_cache, cache_mode, profile)
+    
+    # 离线模式下把 YouTube 域名解析到本地夹具服务器，而不是走代理
+    user_data_dir = os.path.join(downloads_folder, "user_data")
+    if profile_template:
+        # 克隆预装扩展的配置文件模板，而不是让 Chrome 冷启动创建配置文件
+        clone_profile(profile_template, user_data_dir)
+    if fixture_server is not None:
+        args = build_launch_args(extension_path, user_data_dir, proxy_server=None,
+                                 extra_args=fixture_server.chrome_args())
+    else:
+        args = build_launch_args(extension_path, user_data_dir)
     
     # 启动浏览器
     browser = await launch(
         headless=headless,
-        executablePath="C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
-        args=[
-            '--no-sandbox',
-            f'--disable-extensions-except={extension_path}',
-            f'--load-extension={extension_path}',
-            '--disable-web-security',  # 允许跨源请求
-            f'--user-data-dir={os.path.join(downloads_folder, "user_data")}',
-            f'--download.default_directory={downloads_folder}',
-            '--proxy-server=192.168.1.16:10811'  # 添加代理服务器配置
-        ],
+        executablePath=CHROME_PATH,
+        args=args,
         defaultViewport={
             'width': 1280,
             'height': 800
         }
     )
     
+    # 等待插件加载
+    await wait_for_extension_target(browser)
+    
     # 创建新页面
     page = await browser.newPage()
     
     # 设置下载行为
-    await page._client.send('Page.setDownloadBehavior', {
-        'behavior': 'allow',
-        'downloadPath': downloads_folder
-    })
-    
-    await asyncio.sleep(2)  # 等待插件加载
+    await set_download_folder(browser, downloads_folder)
     
     # 创建测试上下文
     context = TestContext(
         browser=browser,
         page=page,
         extension_path=extension_path,
-        downloads_folder=downloads_folder
+        downloads_folder=downloads_folder,
+        trace_dir=trace_dir
     )
     
+    return await _instrument_context(context, network_cache, cache_mode, profile)
+
+async def _instrument_context(context: TestContext,
+                              network_cache: Optional[NetworkCache],
+                              cache_mode: str,
+                              profile: Optional[PerformanceProfile]) -> TestContext:
+    """挂上网络缓存拦截器，并应用性能配置"""
+    if network_cache is not None:
+        context.interceptor = await attach_network_cache(context.browser, context.page,
+                                                         network_cache, cache_mode)
+    if profile is not None:
+        context.throttle = await ProfileSession(context.browser, context.page, profile).apply()
     return context
 
+@telemetry.timed('cleanup')
 async def cleanup_context(context: TestContext):
     """清理测试上下文"""
-    logger.info("终止chrome进程...")
-    try:
-        await context.browser.close()
-    except Exception as e:
-        logger.warning(f"关闭浏览器时出错: {e}")
+    if context.throttle is not None:
+        await context.throttle.clear()
+        context.throttle = None
+    if context.interceptor is not None:
+        await context.interceptor.detach()
+        context.interceptor = None
+    if context.lease is not None:
+        # 池中借出的上下文只归还页面，浏览器保持运行
+        logger.info("归还浏览器池页面...")
+        await context.pool.release(context.lease)
+        return
+
+    if context.daemon_lock is not None:
+        # 守护进程的浏览器保持运行，重置状态后断开连接
+        logger.info("断开守护进程浏览器...")
+        await detach_daemon(context.browser, context.daemon_lock)
+        context.daemon_lock = None
+    else:
+        logger.info("终止chrome进程...")
+        try:
+            await context.browser.close()
+        except Exception as e:
+            logger.warning(f"关闭浏览器时出错: {e}")
     
     # 清理下载文件夹中的临时文件
     if context.downloads_folder and os.path.exists(context.downloads_folder):
@@ -101,7 +207,7 @@ async def cleanup_context(context: TestContext):
             await asyncio.sleep(1)
             
             # 删除下载的字幕文件
-            for path in glob.glob(os.path.join(context.downloads_folder, '*_subtitles.*')):
+            for path in subtitle_files(context.downloads_folder):
                 try:
                     os.remove(path)
                     logger.info(f"已删除文件: {path}")
@@ -119,130 +225,52 @@ async def cleanup_context(context: TestContext):
         except Exception as e:
             logger.warning(f"清理临时文件失败: {e}")
 
+@telemetry.timed('get_extension_id')
 async def get_extension_id(context: TestContext):
-    """获取扩展ID"""
+    """获取扩展ID：根据 manifest key 或解压路径直接计算，不再逐个探测标签页"""
     if context.extension_id:
         return context.extension_id
     
     try:
-        # 获取所有标签页 - targets() 直接返回列表，不需要 await
-        targets = context.browser.targets()
-        logger.info(f"找到 {len(targets)} 个标签页")
-        
-        # 尝试找到我们的扩展
-        extension_targets = []
-        
-        for i, target in enumerate(targets):
-            try:
-                target_type = target.type
-                target_url = target.url
-                logger.info(f"标签页 {i}: 类型={target_type}, URL={target_url}")
-                
-                # 收集所有扩展相关的标签页
-                if target_url.startswith('chrome-extension://'):
-                    extension_id = target_url.split('/')[2]
-                    extension_targets.append((extension_id, target))
-            except Exception as e:
-                logger.error(f"处理标签页 {i} 时出错: {e}")
-        
-        # 检查每个扩展ID，找到我们的扩展
-        for extension_id, target in extension_targets:
-            try:
-                # 尝试打开扩展的选项页面，看是否存在
-                options_url = f'chrome-extension://{extension_id}/views/options.html'
-                page = await context.browser.newPage()
-                
-                try:
-                    response = await page.goto(options_url, {'timeout': 2000})
-                    if response and response.ok:
-                        # 找到了我们的扩展
-                        try:
-                            await page.close()
-                        except Exception as e:
-                            logger.warning(f"关闭页面时出错: {e}")
-                        context.set_extension_id(extension_id)
-                        logger.info(f"找到我们的扩展ID: {extension_id}")
-                        return extension_id
-                except Exception as e:
-                    logger.warning(f"打开选项页面失败: {e}")
-                
-                # 尝试打开扩展的弹出窗口，看是否存在
-                popup_url = f'chrome-extension://{extension_id}/popup.html'
-                try:
-                    response = await page.goto(popup_url, {'timeout': 2000})
-                    if response and response.ok:
-                        # 找到了我们的扩展
-                        try:
-                            await page.close()
-                        except Exception as e:
-                            logger.warning(f"关闭页面时出错: {e}")
-                        context.set_extension_id(extension_id)
-                        logger.info(f"找到我们的扩展ID: {extension_id}")
-                        return extension_id
-                except Exception as e:
-                    logger.warning(f"打开弹出窗口失败: {e}")
-                
-                try:
-                    await page.close()
-                except Exception as e:
-                    logger.warning(f"关闭页面时出错: {e}")
-            except Exception as e:
-                logger.error(f"检查扩展 {extension_id} 时出错: {e}")
-        
-        # 如果没有找到我们的扩展，尝试使用加载的扩展路径
-        extension_path = context.extension_path
-        extension_manifest_path = os.path.join(extension_path, 'manifest.json')
+        extension_id = resolve_extension_id(context.extension_path)
         
-        if os.path.exists(extension_manifest_path):
-            logger.info(f"使用加载的扩展路径: {extension_path}")
-            # 使用第一个找到的扩展ID
-            if extension_targets:
-                extension_id = extension_targets[0][0]
-                context.set_extension_id(extension_id)
-                logger.info(f"使用第一个找到的扩展ID: {extension_id}")
-                return extension_id
+        # 只核对一下已有的 target，不打开任何页面
+        if not any(target.url.startswith(f'chrome-extension://{extension_id}/')
+                   for target in context.browser.targets()):
+            logger.warning(f"⚠️ 尚未发现扩展 {extension_id} 的 target，扩展可能还在加载")
         
-        raise Exception("无法找到我们的扩展")
+        context.set_extension_id(extension_id)
+        logger.info(f"找到我们的扩展ID: {extension_id}")
+        return extension_id
     except Exception as e:
         logger.error(f"获取扩展ID时出错: {e}")
         logger.error(traceback.format_exc())
         raise
 
+@telemetry.timed('options_page_open')
 async def open_extension_options_page(context: TestContext):
     """打开扩展选项页面"""
     try:
         extension_id = await get_extension_id(context)
         
-        # 尝试不同的可能的页面路径
-        possible_paths = [
-            f'chrome-extension://{extension_id}/views/options.html',
-            f'chrome-extension://{extension_id}/options.html',
-            f'chrome-extension://{extension_id}/popup.html',
-            f'chrome-extension://{extension_id}/index.html'
-        ]
-        
-        for path in possible_paths:
-            logger.info(f"尝试打开页面: {path}")
-            try:
-                await context.page.goto(path, {'timeout': 3000})
-                await asyncio.sleep(2)  # 等待页面加载
-                
-                # 检查页面是否加载成功
-                title = await context.page.title()
-                if title:
-                    logger.info(f"成功打开页面: {path}")
-                    logger.info(f"页面标题: {title}")
-                    logger.info(f"当前页面URL: {context.page.url}")
-                    return extension_id
-            except Exception as e:
-                logger.warning(f"打开页面 {path} 失败: {e}")
+        # 选项页面路径直接来自 manifest 的 options_ui.page，只需一次导航
+        options_url = options_page_url(context.extension_path, extension_id)
+        logger.info(f"打开页面: {options_url}")
+        try:
+            # 等待 Page.loadEventFired，而不是固定等待
+            await navigate_and_wait_load(context.page, options_url, timeout=10)
+            title = await context.page.title()
+            logger.info(f"成功打开页面: {options_url}")
+            logger.info(f"页面标题: {title}")
+            return extension_id
+        except Exception as e:
+            logger.warning(f"打开页面 {options_url} 失败: {e}")
         
-        # 如果所有路径都失败，尝试直接打开扩展的背景页面
+        # 如果打开失败，尝试直接与扩展通信
         logger.warning("无法打开扩展页面，尝试直接与扩展通信")
         
         # 打开一个空白页面
-        await context.page.goto('about:blank')
-        await asyncio.sleep(1)
+        await navigate_and_wait_load(context.page, 'about:blank')
         
         # 注入测试脚本
         await context.page.evaluate(f'''
@@ -273,168 +301,298 @@ async def open_extension_options_page(context: TestContext):
         logger.error(traceback.format_exc())
         raise
 
-async def test_download_subtitles(context: TestContext):
-    """测试下载字幕功能"""
-    logger.info("\n=== 测试下载字幕功能 ===\n")
-    
+async def wait_download_or_status(download_waiter: DownloadWaiter,
+                                  status_watcher: StatusWatcher,
+                                  timeout: float):
+    """等待下载完成；如果状态先显示失败则立即返回 None"""
+    download_task = asyncio.ensure_future(download_waiter.wait(timeout))
+    status_task = asyncio.ensure_future(status_watcher.wait(timeout))
+    try:
+        done, _ = await asyncio.wait([download_task, status_task],
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if download_task in done and download_task.exception() is None:
+            return download_task.result()
+        if status_task in done and status_task.exception() is None:
+            status = status_task.result().value
+            if "success" in status['className'] or "成功" in status['text']:
+                # 状态已显示成功，继续等待文件落盘
+                return await download_task
+        return None
+    except WaitTimeout as e:
+        logger.warning(f"⚠️ {e}")
+        return None
+    finally:
+        for task in (download_task, status_task):
+            if not task.done():
+                task.cancel()
+
+async def wait_download_began(download_waiter: DownloadWaiter,
+                              status_watcher: StatusWatcher,
+                              timeout: float):
+    """等待下载开始（目标目录此时已确定），或状态显示失败"""
+    began_task = asyncio.ensure_future(download_waiter.wait_began(timeout))
+    status_task = asyncio.ensure_future(status_watcher.wait(timeout))
+    try:
+        done, _ = await asyncio.wait([began_task, status_task],
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if began_task in done:
+            # 等待开始超时也在这里结束，由 wait_download_or_status 报告
+            began_task.exception()
+            return
+        if status_task.exception() is not None:
+            return
+        status = status_task.result().value
+        if "success" in status['className'] or "成功" in status['text']:
+            # 状态先显示成功时，下载可能还没开始
+            await began_task
+    except WaitTimeout as e:
+        logger.warning(f"⚠️ {e}")
+    finally:
+        for task in (began_task, status_task):
+            if not task.done():
+                task.cancel()
+
+# 字幕类型对应的单选框ID，格式的单选框ID与格式名相同
+SUBTITLE_TYPE_IDS = {'auto': 'autoGenerated', 'manual': 'manual'}
+SUBTITLE_FORMATS = ('vtt', 'srt', 'txt')
+
+# 设置后下载的文件要与这个目录中的同名基准文件逐条字幕一致（没有基准时记录为基准）
+GOLDEN_DIR = os.environ.get('YTSD_GOLDEN') or None
+
+@dataclass
+class DownloadOutcome:
+    """一次下载流程的结果和各阶段耗时（秒）"""
+    success: bool
+    status_text: str = ''
+    status_class: str = ''
+    path: Optional[str] = None
+    sha256: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    trace_summary: Optional[str] = None
+    memory: Optional[MemoryReport] = None
+    # 从点击到文件落盘期间选项页的交互性指标（长任务、帧间隔、输入延迟）
+    interactivity: Optional[Dict[str, Any]] = None
+    # 扩展收到的 429 / 5xx 响应状态码和 Retry-After（秒），用于调度器决定是否退避重试
+    http_status: Optional[int] = None
+    retry_after: Optional[float] = None
+
+async def read_status(context: TestContext) -> Dict[str, str]:
+    """读取 #status 的文本和 class"""
+    return await context.page.evaluate('''() => {
+        const el = document.querySelector('#status');
+        return el ? {text: el.textContent, className: el.className} : {text: '', className: ''};
+    }''')
+
+async def download_subtitles(context: TestContext,
+                             video_url: str,
+                             subtitle_type: str = 'auto',
+                             fmt: str = 'txt',
+                             timeout: float = 30.0,
+                             open_page: bool = True) -> DownloadOutcome:
+    """执行一次完整的下载流程：打开选项页、填写URL、选择类型和格式、点击下载并等待文件"""
+    label = f"{video_id_from_url(video_url) or 'download'}_{subtitle_type}_{fmt}"
+    tracer = None
+    if context.trace_dir:
+        tracer = await PhaseTracer(context.browser, context.page, label, context.trace_dir).start()
     try:
-        # 打开扩展选项页面
+        with telemetry.phase('download', **telemetry_labels(context, video_url, subtitle_type, fmt)) as span:
+            outcome = await _download_subtitles(context, video_url, subtitle_type, fmt,
+                                                timeout, open_page, tracer, label)
+            if not outcome.success:
+                span.outcome = FAILED
+            span.fields.update(status_text=outcome.status_text, http_status=outcome.http_status,
+                               path=outcome.path, sha256=outcome.sha256)
+    except Exception:
+        if tracer is not None:
+            await tracer.stop()
+        raise
+    if tracer is not None:
+        outcome.trace_summary = (await tracer.stop(outcome.timings)).summary_path
+    return outcome
+
+def telemetry_labels(context: TestContext, video_url: str, subtitle_type: str, fmt: str) -> Dict[str, str]:
+    """下载相关事件的标签"""
+    return {
+        'url': video_url,
+        'video_id': video_id_from_url(video_url),
+        'subtitle_type': subtitle_type,
+        'format': fmt,
+        'profile': context.throttle.profile.name if context.throttle is not None else None,
+    }
+
+def video_id_from_url(video_url: str) -> Optional[str]:
+    """从视频URL中取出视频ID"""
+    match = re.search(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})', video_url)
+    return match.group(1) if match else None
+
+async def _download_subtitles(context: TestContext,
+                              video_url: str,
+                              subtitle_type: str,
+                              fmt: str,
+                              timeout: float,
+                              open_page: bool,
+                              tracer: Optional[PhaseTracer],
+                              label: str) -> DownloadOutcome:
+    timings = {}
+    if open_page:
+        started = time.perf_counter()
         await open_extension_options_page(context)
-        
-        # 检查页面是否加载完成
-        title = await context.page.title()
-        logger.info(f"页面标题: {title}")
-        
-        # 检查输入框是否存在
-        video_url_input = await context.page.querySelector('#videoUrl')
-        if not video_url_input:
-            logger.error("❌ 无法找到视频URL输入框")
-            return False
-        
-        # 清空输入框并输入视频URL
-        await context.page.evaluate('document.getElementById("videoUrl").value = ""')
-        video_url = "https://www.youtube.com/watch?v=oc6RV5c1yd0"
-        await context.page.type('#videoUrl', video_url)
-        logger.info(f"输入视频URL: {video_url}")
-        
-        # 选择字幕类型 (auto)
-        auto_radio = await context.page.querySelector('#autoGenerated')
-        if auto_radio:
-            await context.page.evaluate('document.getElementById("autoGenerated").checked = true')
-            logger.info("选择字幕类型: 英文（自动生成）")
-        else:
-            logger.error("❌ 无法找到自动生成字幕选项")
-            return False
-        
-        # 选择输出格式 (txt)
-        txt_radio = await context.page.querySelector('#txt')
-        if txt_radio:
-            await context.page.evaluate('document.getElementById("txt").checked = true')
-            logger.info("选择输出格式: TXT")
-        else:
-            logger.error("❌ 无法找到TXT格式选项")
-            return False
-        
-        # 点击"下载字幕"按钮
-        download_button = await context.page.querySelector('#getSubtitles')
-        if download_button:
-            await download_button.click()
-            logger.info("点击'下载字幕'按钮")
-        else:
-            logger.error("❌ 无法找到'下载字幕'按钮")
-            return False
-        
-        # 等待下载开始
-        await asyncio.sleep(5)  # 给予足够的时间进行下载
-        
-        # 检查状态消息
-        status_element = await context.page.querySelector('#status')
-        if status_element:
-            status_text = await context.page.evaluate('(element) => element.textContent', status_element)
-            status_class = await context.page.evaluate('(element) => element.className', status_element)
-            logger.info(f"状态消息: {status_text}")
-            
-            # 检查是否成功
-            if "success" in status_class or "成功" in status_text:
-                logger.info("✓ 字幕下载成功")
-                
-                # 检查下载文件夹中是否有新的字幕文件
-                subtitle_files = glob.glob(os.path.join(context.downloads_folder, '*_subtitles.*'))
-                if subtitle_files:
-                    logger.info(f"✓ 找到下载的字幕文件: {os.path.basename(subtitle_files[0])}")
-                    return True
-                else:
-                    # 即使没有找到文件，但状态显示成功，也认为测试通过
-                    logger.warning("⚠️ 状态显示成功，但未找到下载的字幕文件")
-                    return True
-            # 特殊情况：找不到字幕信息也视为测试通过，因为这表明扩展正常工作但视频没有字幕
-            elif "找不到字幕信息" in status_text:
-                logger.info("✓ 扩展正常工作，但视频没有可用字幕")
-                return True
-            else:
-                logger.error(f"❌ 字幕下载失败，状态: {status_text}")
-                return False
+        timings['page_open'] = time.perf_counter() - started
+    
+    # 填写URL并选择字幕类型和格式
+    await context.page.evaluate('''(url, typeId, fmt) => {
+        const input = document.getElementById('videoUrl');
+        input.value = url;
+        input.dispatchEvent(new Event('input', {bubbles: true}));
+        document.getElementById(typeId).checked = true;
+        document.getElementById(fmt).checked = true;
+    }''', video_url, SUBTITLE_TYPE_IDS[subtitle_type], fmt)
+    
+    # 点击前注册状态变化监听；下载事件监听在点击前（持有下载通道时）才开始，
+    # 并只接受本页面发起的下载
+    download_waiter = DownloadWaiter(context.browser, context.downloads_folder,
+                                     frame_id=context.page.mainFrame._id)
+    status_watcher = await StatusWatcher(context.page).arm()
+    profiler = None
+    if context.heap_profile_dir:
+        # 基线在点击前记录，峰值减基线即为转换过程中的堆增长
+        profiler = await HeapProfiler(context.browser, context.page, label, context.heap_profile_dir).start()
+    if context.throttle is not None:
+        # service worker 空闲后会被终止，重启后的新 target 需要重新限制网络
+        await context.throttle.refresh_worker()
+    probing = await install_jank_probe(context.page)
+    responses = await ResponseWatcher(context.browser, context.page).start()
+    if tracer is not None:
+        await tracer.mark_click()
+    labels = telemetry_labels(context, video_url, subtitle_type, fmt)
+    try:
+        if context.lease is not None:
+            # 同一浏览器的其他页面可能在并行下载：下载开始前独占浏览器级的下载目录
+            async with context.pool.download_lane(context.lease):
+                download_waiter.start()
+                with telemetry.phase('click', **labels):
+                    await context.page.click('#getSubtitles')
+                await wait_download_began(download_waiter, status_watcher, timeout)
+            download_waiter.seal()
         else:
-            logger.error("❌ 无法找到状态元素")
-            return False
-        
-    except Exception as e:
-        logger.error(f"❌ 测试失败: {str(e)}")
-        logger.error(traceback.format_exc())
-        return False
+            download_waiter.start()
+            with telemetry.phase('click', **labels):
+                await context.page.click('#getSubtitles')
+        download = await wait_download_or_status(download_waiter, status_watcher, timeout)
+    except Exception:
+        # 点击或等待下载开始时出错：wait() 没有运行到，需要在这里移除监听并关闭目录监视
+        download_waiter.stop()
+        await responses.stop()
+        if profiler is not None:
+            await profiler.stop()
+        raise
+    http_error = await responses.stop()
+    interactivity = await collect_jank_probe(context.page) if probing else None
+    status = await read_status(context)
+    outcome = DownloadOutcome(
+        success=download is not None,
+        status_text=status['text'],
+        status_class=status['className'],
+        timings=timings,
+        interactivity=interactivity
+    )
+    if http_error is not None:
+        outcome.http_status = http_error.status
+        outcome.retry_after = http_error.retry_after
+    if download is not None:
+        info = download.value
+        outcome.path = info.path
+        outcome.sha256 = info.sha256
+        outcome.timings['download_begin'] = (
+            info.began_after if info.began_after is not None else info.completed_after)
+        outcome.timings['download_complete'] = download.elapsed
+        # 两个阶段都从点击开始计时
+        telemetry.emit('download_begin', outcome.timings['download_begin'], labels=labels)
+        telemetry.emit('download_complete', download.elapsed, labels=labels, bytes=info.received_bytes or None)
+        # 从打开选项页（或点击）到文件落盘的总耗时
+        outcome.timings['time_to_file'] = timings.get('page_open', 0.0) + download.elapsed
+    if profiler is not None:
+        outcome.memory = await profiler.stop(outcome.path, context.memory_budget)
+    return outcome
+
+# 内存测试使用的视频（长视频更容易暴露转换过程中的内存问题）和预算
+MEMORY_TEST_VIDEO = os.environ.get('YTSD_MEMORY_VIDEO', 'https://www.youtube.com/watch?v=oc6RV5c1yd0')
+DEFAULT_MEMORY_BUDGET = MemoryBudget(
+    peak_mb=float(os.environ.get('YTSD_MEMORY_PEAK_MB', 128)),
+    growth_per_output_mb=float(os.environ.get('YTSD_MEMORY_PER_MB', 20)),
+)
 
-async def test_invalid_url(context: TestContext):
-    """测试无效的URL"""
-    logger.info("\n=== 测试无效URL处理 ===\n")
+async def check_memory_budget(context: TestContext, timeout: float = 120.0):
+    """测试转换为 SRT / TXT 时扩展的 JS 堆峰值不超过预算"""
+    logger.info("\n=== 测试字幕转换内存 ===\n")
     
+    context.heap_profile_dir = context.heap_profile_dir or PROFILES_ROOT
+    context.memory_budget = context.memory_budget or DEFAULT_MEMORY_BUDGET
     try:
-        # 打开扩展选项页面
-        await open_extension_options_page(context)
-        
-        # 清空输入框并输入无效URL
-        await context.page.evaluate('document.getElementById("videoUrl").value = ""')
-        invalid_url = "https://invalid-url.com"
-        await context.page.type('#videoUrl', invalid_url)
-        logger.info(f"输入无效URL: {invalid_url}")
-        
-        # 点击"下载字幕"按钮
-        download_button = await context.page.querySelector('#getSubtitles')
-        if download_button:
-            await download_button.click()
-            logger.info("点击'下载字幕'按钮")
-        else:
-            logger.error("❌ 无法找到'下载字幕'按钮")
-            return False
-        
-        # 等待错误消息
-        await asyncio.sleep(2)
-        
-        # 检查错误消息
-        status_element = await context.page.querySelector('#status')
-        if status_element:
-            status_text = await context.page.evaluate('(element) => element.textContent', status_element)
-            status_class = await context.page.evaluate('(element) => element.className', status_element)
-            
-            logger.info(f"状态消息: {status_text}")
-            
-            # 检查是否显示错误
-            if "error" in status_class or "无效" in status_text or "错误" in status_text:
-                logger.info(f"✓ 成功检测到无效URL: {status_text}")
-                return True
+        passed = True
+        for fmt in ('srt', 'txt'):
+            outcome = await download_subtitles(context, MEMORY_TEST_VIDEO, 'auto', fmt, timeout)
+            if not outcome.success:
+                logger.error(f"❌ {fmt} 下载失败: {outcome.status_text}")
+                passed = False
+            elif outcome.memory is not None and outcome.memory.violations:
+                passed = False
             else:
-                logger.error(f"❌ 错误消息不符合预期: {status_text}")
-                return False
-        else:
-            logger.error("❌ 无法找到状态元素")
-            return False
-        
+                logger.info(f"✓ {fmt} 内存在预算内")
+        return passed
     except Exception as e:
         logger.error(f"❌ 测试失败: {str(e)}")
         logger.error(traceback.format_exc())
         return False
 
-async def run_tests():
-    """运行所有测试"""
-    logger.info("\n=== 开始 Chrome 扩展测试 ===\n")
+async def run_tests(pool_size: int = 1, offline: bool = False, use_template: bool = True,
+                    trace_dir: Optional[str] = None, cache_mode: str = 'passthrough',
+                    perf_profile: Optional[str] = None, telemetry_dir: Optional[str] = None,
+                    workers: int = 4):
+    """运行所有测试，offline 为 True 时使用本地夹具服务器代替 YouTube，trace_dir 不为空时记录 trace，
+    cache_mode 为 record / replay 时录制或回放网络缓存，perf_profile 为性能配置名时模拟对应的设备和网络，
+    telemetry_dir 不为空时把各阶段事件和指标写入该目录；场景表用 workers 个页面并行运行"""
+    # 场景表依赖本模块中的下载流程
+    from scenarios import CASES, run_cases
     
-    # 创建下载文件夹
-    downloads_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), 'downloads'))
-    os.makedirs(downloads_folder, exist_ok=True)
+    logger.info("\n=== 开始 Chrome 扩展测试 ===\n")
+    if telemetry_dir:
+        telemetry.configure(telemetry_dir)
     
-    context = None
+    fixture_server = None
+    if offline:
+        fixture_server = await FixtureServer(ssl_context=make_self_signed_context()).start()
+    pool = None
+    if fixture_server is None and daemon_available():
+        # 常驻浏览器守护进程可用时直接连接它，省去启动 Chrome 和加载扩展的时间；
+        # 守护进程同时只服务一个客户端，场景只能逐个运行
+        logger.info("使用浏览器守护进程")
+        workers = 1
+    else:
+        # 配置文件模板只在扩展源码变化后重新构建
+        profile_template = await ensure_template() if use_template else None
+        pool = BrowserPool(size=pool_size, headless=False, fixture_server=fixture_server,
+                           pages_per_browser=max(1, -(-workers // pool_size)),
+                           profile_template=profile_template)
+    network_cache = NetworkCache() if cache_mode != 'passthrough' else None
+    context_kwargs = dict(trace_dir=trace_dir, network_cache=network_cache, cache_mode=cache_mode,
+                          perf_profile=perf_profile)
     try:
-        context = await create_test_context(
-            headless=False,
-            downloads_folder=downloads_folder
-        )
+        if pool is not None:
+            await pool.start()
         
-        # 运行字幕下载测试
-        download_success = await test_download_subtitles(context)
+        # 相互独立的场景在各自借用的页面上并行运行
+        results = await run_cases(pool, CASES, workers, **context_kwargs)
+        passed = all(result.passed for result in results.values())
         
-        # 测试无效URL处理
-        invalid_url_success = await test_invalid_url(context)
+        # 内存测试需要独占浏览器，最后单独运行
+        context = await create_test_context(pool=pool, **context_kwargs)
+        try:
+            passed = await check_memory_budget(context) and passed
+        finally:
+            await cleanup_context(context)
         
-        if download_success and invalid_url_success:
+        if passed:
             logger.info("\n=== 所有测试通过 ===")
             return True
         else:
@@ -446,13 +604,24 @@ async def run_tests():
         logger.error(traceback.format_exc())
         return False
     finally:
-        if context:
-            await cleanup_context(context)
+        if pool is not None:
+            logger.info("终止chrome进程...")
+            await pool.close()
+        if fixture_server is not None:
+            await fixture_server.close()
+        if network_cache is not None:
+            network_cache.close()
+        telemetry.close()
 
 # 直接运行测试
 if __name__ == "__main__":
     try:
-        result = asyncio.run(run_tests())
+        result = asyncio.run(run_tests(offline=os.environ.get('YTSD_OFFLINE') == '1',
+                                       trace_dir=os.environ.get('YTSD_TRACE') or None,
+                                       cache_mode=os.environ.get('YTSD_CACHE', 'passthrough'),
+                                       perf_profile=os.environ.get('YTSD_PROFILE') or None,
+                                       telemetry_dir=os.environ.get('YTSD_TELEMETRY') or None,
+                                       workers=int(os.environ.get('YTSD_WORKERS', 4))))
         exit_code = 0 if result else 1
         exit(exit_code)
     except KeyboardInterrupt:
@@ -0,0 +1,51 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from downloads_watcher import DownloadsWatcher, SUBTITLE_RE, _load_libc
+
+
+def simulate_chrome_download(folder, name, content: bytes):
+    """模拟 Chrome：先写 .crdownload，再改名为最终文件名"""
+    partial = os.path.join(folder, name + '.crdownload')
+    with open(partial, 'wb') as f:
+        f.write(content)
+    os.rename(partial, os.path.join(folder, name))
+
+
+def collect(folder, use_inotify, count):
+    async def run():
+        async with DownloadsWatcher(str(folder), use_inotify=use_inotify) as watcher:
+            watcher.mark_click()
+            simulate_chrome_download(folder, 'abc_subtitles.txt', b'first')
+            simulate_chrome_download(folder, 'abc_subtitles (1).txt', b'second')
+            simulate_chrome_download(folder, 'ignored.bin', b'x')
+            return watcher.uses_inotify, [await watcher.next(2) for _ in range(count)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('use_inotify', [
+    pytest.param(True, marks=pytest.mark.skipif(_load_libc() is None, reason='需要 Linux inotify')),
+    False,
+])
+def test_reports_renamed_files_with_hash(tmp_path, use_inotify):
+    """改名完成即报告，包含大小、SHA-256 和距离点击的时间；重名后缀也能识别"""
+    (tmp_path / 'old_subtitles.vtt').write_text('existing')
+    uses_inotify, downloads = collect(tmp_path, use_inotify, 2)
+    assert uses_inotify == use_inotify
+    by_name = {d.name: d for d in downloads}
+    assert set(by_name) == {'abc_subtitles.txt', 'abc_subtitles (1).txt'}
+    first = by_name['abc_subtitles.txt']
+    assert first.size == 5
+    assert first.sha256 == hashlib.sha256(b'first').hexdigest()
+    assert first.since_click is not None and first.since_click >= 0
+
+
+def test_subtitle_pattern():
+    """只匹配最终的字幕文件名"""
+    assert SUBTITLE_RE.search('Some Title_subtitles.srt')
+    assert SUBTITLE_RE.search('Some Title_subtitles (12).vtt')
+    assert not SUBTITLE_RE.search('Some Title_subtitles.srt.crdownload')
+    assert not SUBTITLE_RE.search('notes.txt')
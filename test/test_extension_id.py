@@ -0,0 +1,37 @@
+import base64
+import json
+import os
+
+from extension_id import id_from_key, id_from_path, resolve_extension_id, options_page_url
+
+SRC_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+
+def test_id_format():
+    """扩展ID为 32 个 a-p 之间的字符"""
+    extension_id = id_from_path('/home/user/youtube_subtitle_downloader/src', 'linux')
+    assert len(extension_id) == 32
+    assert set(extension_id) <= set('abcdefghijklmnop')
+
+
+def test_windows_path_drive_letter_is_normalized():
+    """Windows 路径的盘符大小写不影响扩展ID，且与 POSIX 编码不同"""
+    lower = id_from_path('c:\\work\\youtube_subtitle_downloader\\src', 'win32')
+    upper = id_from_path('C:\\work\\youtube_subtitle_downloader\\src', 'win32')
+    assert lower == upper
+    assert upper != id_from_path('C:\\work\\youtube_subtitle_downloader\\src', 'linux')
+
+
+def test_manifest_key_takes_precedence(tmp_path):
+    """manifest 中固定了 key 时，扩展ID与路径无关"""
+    key = base64.b64encode(b'fake-der-public-key').decode('ascii')
+    manifest = {'manifest_version': 3, 'key': key, 'options_ui': {'page': 'views/options.html'}}
+    (tmp_path / 'manifest.json').write_text(json.dumps(manifest), encoding='utf-8')
+    assert resolve_extension_id(str(tmp_path)) == id_from_key(key)
+
+
+def test_options_url_comes_from_manifest():
+    """选项页面 URL 直接来自 options_ui.page"""
+    url = options_page_url(SRC_PATH, 'a' * 32)
+    assert url == f"chrome-extension://{'a' * 32}/views/options.html"
+    assert url.endswith(options_page_url(SRC_PATH).split('/', 3)[3])
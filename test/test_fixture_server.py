@@ -0,0 +1,108 @@
+import asyncio
+import json
+import time
+
+from fixture_server import FixtureServer
+
+
+async def fetch(server: FixtureServer, path: str, method: str = 'GET', body: bytes = b'',
+                host: str = 'www.youtube.com'):
+    """向夹具服务器发送一个原始 HTTP 请求，返回状态码、响应头和响应体"""
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: {host}\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    raw = await reader.read()
+    writer.close()
+    head, _, payload = raw.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split(' ')[1]), headers, payload
+
+
+def run_with_server(coro_factory):
+    async def run():
+        async with FixtureServer() as server:
+            return await coro_factory(server)
+    return asyncio.run(run())
+
+
+def test_serves_watch_player_and_timedtext():
+    """观看页内嵌 player response，timedtext 按 lang/kind/fmt 选择夹具"""
+    async def run(server):
+        status, _, watch = await fetch(server, '/watch?v=oc6RV5c1yd0')
+        assert status == 200
+        assert b'ytInitialPlayerResponse' in watch
+
+        body = json.dumps({'videoId': 'oc6RV5c1yd0'}).encode('utf-8')
+        status, _, player = await fetch(server, '/youtubei/v1/player', 'POST', body)
+        tracks = json.loads(player)['captions']['playerCaptionsTracklistRenderer']['captionTracks']
+        assert {t.get('kind', '') for t in tracks} == {'asr', ''}
+
+        status, headers, vtt = await fetch(
+            server, '/api/timedtext?v=oc6RV5c1yd0&lang=en&kind=asr&fmt=vtt')
+        assert status == 200 and vtt.startswith(b'WEBVTT')
+        assert headers['Content-Type'].startswith('text/vtt')
+
+        status, _, tracklist = await fetch(server, '/api/timedtext?v=oc6RV5c1yd0&type=list')
+        assert tracklist.count(b'<track ') == 2
+
+        status, _, _ = await fetch(server, '/watch?v=doesnotexist')
+        assert status == 404
+
+    run_with_server(run)
+
+
+def test_short_links_redirect_to_watch_page():
+    """离线模式下 youtu.be 也由夹具服务器处理，短链接重定向到观看页而不是访问真实网络"""
+    async def run(server):
+        assert 'MAP youtu.be ' in server.chrome_args()[0]
+        status, headers, _ = await fetch(server, '/oc6RV5c1yd0?t=42', host='youtu.be')
+        assert status == 303
+        assert headers['Location'] == 'https://www.youtube.com/watch?v=oc6RV5c1yd0&t=42'
+        status, _, _ = await fetch(server, '/doesnotexist', host='www.youtu.be')
+        assert status == 404
+
+    run_with_server(run)
+
+
+def test_error_injection_latency_and_truncation():
+    """注入 429（仅前两次）、延迟和截断响应体"""
+    async def run(server):
+        server.configure('timedtext', status=429, fail_times=2, retry_after=1)
+        path = '/api/timedtext?v=oc6RV5c1yd0&lang=en&fmt=json3'
+        statuses = []
+        for _ in range(3):
+            status, headers, _ = await fetch(server, path)
+            statuses.append(status)
+        assert statuses == [429, 429, 200]
+        assert [entry[3] for entry in server.request_log] == statuses
+
+        server.configure('timedtext', latency=0.2, truncate=0.5)
+        started = time.perf_counter()
+        status, headers, body = await fetch(server, path)
+        assert time.perf_counter() - started >= 0.2
+        assert len(body) == int(headers['Content-Length']) // 2
+
+    run_with_server(run)
+
+
+def test_broken_fixtures_and_bad_requests_get_error_responses(tmp_path):
+    """损坏的 player.json 返回 500，非对象的请求体返回 400，连接都会被应答并关闭"""
+    (tmp_path / 'brokenvideo').mkdir()
+    (tmp_path / 'brokenvideo' / 'player.json').write_text('{not json', encoding='utf-8')
+
+    async def run():
+        async with FixtureServer(fixtures_dir=str(tmp_path)) as server:
+            status, _, body = await asyncio.wait_for(fetch(server, '/watch?v=brokenvideo'), 5)
+            assert status == 500 and b'JSONDecodeError' in body
+            body = json.dumps({'videoId': 'brokenvideo'}).encode('utf-8')
+            status, _, _ = await asyncio.wait_for(fetch(server, '/youtubei/v1/player', 'POST', body), 5)
+            assert status == 500
+            status, _, _ = await asyncio.wait_for(fetch(server, '/youtubei/v1/player', 'POST', b'[1]'), 5)
+            assert status == 400
+            return [entry[1:] for entry in server.request_log]
+
+    log = asyncio.run(run())
+    assert log == [('error', '/watch', 500), ('error', '/youtubei/v1/player', 500),
+                   ('player', '/youtubei/v1/player', 400)]
@@ -0,0 +1,68 @@
+from golden import (
+    align_cues, compare_files, compare_trees, check_golden, pair_key, summarize,
+    MISSING, EXTRA, SHIFTED, REWORDED, IDENTICAL, EQUIVALENT, CHANGED, NO_OUTPUT, NEW
+)
+from subtitle_engine import Cue
+
+SRT = '1\n00:00:01,000 --> 00:00:02,000\nhello world\n\n2\n00:00:03,000 --> 00:00:04,000\nsecond line\n'
+VTT = '\ufeffWEBVTT\r\n\r\n00:00:01.020 --> 00:00:02.000\r\nhello  world\r\n\r\n00:00:03.000 --> 00:00:04.000\r\nsecond line\r\n'
+
+
+def test_align_reports_semantic_differences():
+    golden = [Cue(0, 1000, 'a'), Cue(1000, 2000, 'b'), Cue(2000, 3000, 'c'), Cue(3000, 4000, 'd')]
+    new = [Cue(0, 1000, 'a'), Cue(1500, 2500, 'b'), Cue(2500, 2600, 'inserted'),
+           Cue(3000, 4000, 'D!'), Cue(5000, 6000, 'e')]
+    kinds = [difference.kind for difference in align_cues(golden, new, tolerance_ms=50)]
+    # c 被替换为时间不同的新字幕：按开始时间先报告缺失再报告多出
+    assert kinds == [SHIFTED, MISSING, EXTRA, REWORDED, EXTRA]
+    assert align_cues(golden, golden) == []
+
+
+def test_untimed_alignment_finds_deletions():
+    golden = [Cue(0, 0, text) for text in 'abcd']
+    new = [Cue(0, 0, text) for text in 'abd']
+    assert [d.kind for d in align_cues(golden, new, timed=False)] == [MISSING]
+
+
+def test_compare_files_ignores_encoding_noise(tmp_path):
+    """BOM、换行符、编号和空白的差异不算变化，时间在容差内视为相同"""
+    golden = tmp_path / 'a.srt'
+    golden.write_text(SRT, encoding='utf-8')
+    same = tmp_path / 'b.srt'
+    same.write_text(SRT, encoding='utf-8')
+    converted = tmp_path / 'c.vtt'
+    converted.write_text(VTT, encoding='utf-8')
+    assert compare_files(str(golden), str(same)).status == IDENTICAL
+    assert compare_files(str(golden), str(converted)).status == EQUIVALENT
+    result = compare_files(str(golden), str(converted), tolerance_ms=10)
+    assert result.status == CHANGED and result.counts == {SHIFTED: 1}
+
+
+def test_compare_trees_pairs_by_video_track_format(tmp_path):
+    golden, new = tmp_path / 'golden', tmp_path / 'new'
+    (golden / 'x').mkdir(parents=True)
+    new.mkdir()
+    (golden / 'x' / 'abcdefghijk.en.srt').write_text(SRT, encoding='utf-8')
+    (new / 'abcdefghijk.en.srt').write_text(SRT.replace('second line', 'second lime'), encoding='utf-8')
+    (golden / 'gone_subtitles.txt').write_text('x\n', encoding='utf-8')
+    (new / 'fresh_subtitles.txt').write_text('y\n', encoding='utf-8')
+    assert pair_key(str(new / 'abcdefghijk.en.srt'), str(new)) == 'abcdefghijk/en/srt'
+    results = compare_trees(str(golden), str(new), workers=2)
+    assert summarize(results) == {CHANGED: 1, NO_OUTPUT: 1, NEW: 1}
+    changed = next(result for result in results if result.status == CHANGED)
+    assert changed.counts == {REWORDED: 1}
+
+
+def test_check_golden_keys_by_video_track_format(tmp_path):
+    """同名的自动 / 手动字幕各有自己的基准；已有基准时与它比较"""
+    golden = tmp_path / 'golden'
+    auto = tmp_path / 'auto' / 'video_subtitles.srt'
+    manual = tmp_path / 'manual' / 'video_subtitles.srt'
+    for path, text in ((auto, SRT), (manual, SRT.replace('second line', 'manual line'))):
+        path.parent.mkdir()
+        path.write_text(text, encoding='utf-8')
+    assert check_golden(str(auto), str(golden), 'oc6RV5c1yd0', 'auto', 'srt').status == NEW
+    assert check_golden(str(manual), str(golden), 'oc6RV5c1yd0', 'manual', 'srt').status == NEW
+    result = check_golden(str(auto), str(golden), 'oc6RV5c1yd0', 'auto', 'srt')
+    assert result.status == IDENTICAL and result.key == 'oc6RV5c1yd0/auto/srt'
+    assert sorted(p.name for p in golden.iterdir()) == ['oc6RV5c1yd0.auto.srt', 'oc6RV5c1yd0.manual.srt']
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from pyee import EventEmitter
+
+from heap_profile import HeapProfiler, MemoryBudget, MemoryReport, MB
+
+
+class FakeSession(EventEmitter):
+    """每次 getHeapUsage 返回逐渐增长的堆大小"""
+
+    def __init__(self, sizes):
+        super().__init__()
+        self.sizes = list(sizes)
+        self.detached = False
+
+    async def send(self, method, params=None):
+        if method == 'Runtime.getHeapUsage':
+            used = self.sizes.pop(0) if len(self.sizes) > 1 else self.sizes[0]
+            return {'usedSize': used, 'totalSize': used * 2}
+        if method == 'HeapProfiler.stopSampling':
+            return {'profile': {'head': {'callFrame': {}, 'selfSize': 0, 'children': []}, 'samples': []}}
+        return {}
+
+    async def detach(self):
+        self.detached = True
+
+
+class FakeTarget:
+    type = 'service_worker'
+    url = 'chrome-extension://abc/background.js'
+
+    def __init__(self, session):
+        self.session = session
+
+    async def createCDPSession(self):
+        return self.session
+
+
+class FakeBrowser:
+    def __init__(self, worker_session):
+        self.target = FakeTarget(worker_session)
+
+    def targets(self):
+        return [self.target]
+
+
+class FakePage:
+    def __init__(self, session):
+        self._client = session
+
+
+def test_budget_checks_peak_and_growth_per_output():
+    """堆峰值和每 MB 输出的增长分别检查，输出太小时不检查后者"""
+    report = MemoryReport(baselines={'service_worker': 10 * MB}, peaks={'service_worker': 70 * MB},
+                          output_bytes=2 * MB)
+    assert report.growth_per_output_mb == 30.0
+    assert MemoryBudget(peak_mb=100, growth_per_output_mb=40).check(report) == []
+    assert len(MemoryBudget(peak_mb=64, growth_per_output_mb=20).check(report)) == 2
+    report.output_bytes = 1024
+    assert MemoryBudget(growth_per_output_mb=20).check(report) == []
+
+
+def test_profiler_samples_worker_and_page(tmp_path):
+    """在 service worker 和选项页上采样，写出 heapprofile 和汇总"""
+    worker = FakeSession([10 * MB, 40 * MB, 90 * MB, 30 * MB])
+    page = FakeSession([5 * MB])
+    output = tmp_path / 'video_subtitles.srt'
+    output.write_bytes(b'x' * MB)
+
+    async def run():
+        profiler = await HeapProfiler(FakeBrowser(worker), FakePage(page), 'abc/auto', str(tmp_path),
+                                      poll_interval=0.01).start()
+        await asyncio.sleep(0.05)
+        return await profiler.stop(str(output), MemoryBudget(peak_mb=64))
+
+    report = asyncio.run(run())
+    assert report.peaks == {'service_worker': 90 * MB, 'options_page': 5 * MB}
+    assert report.growth_bytes == 80 * MB and report.growth_per_output_mb == 80.0
+    assert len(report.violations) == 1 and 'service_worker' in report.violations[0]
+    assert worker.detached
+    with open(report.profiles['service_worker']) as f:
+        assert 'head' in json.load(f)
+    summary = next(tmp_path.glob('*.memory.json'))
+    assert json.loads(summary.read_text())['peak_mb']['service_worker'] == 90.0
@@ -4,12 +4,19 @@ from pyppeteer import launch
 import os
 import logging
 import time
-import glob
 import shutil
 from pathlib import Path
 from dataclasses import dataclass
 from typing import Optional, List, Any
 
+from cdp_waits import navigate_and_wait_load
+from extension_id import resolve_extension_id, options_page_url
+from downloads_watcher import subtitle_files
+from browser_pool import (
+    BrowserPool, Lease, CHROME_PATH, EXTENSION_PATH, DOWNLOADS_ROOT,
+    build_launch_args, wait_for_extension_target, set_download_folder
+)
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +32,8 @@ class TestContext:
     extension_path: str
     extension_id: Optional[str] = None
     downloads_folder: Optional[str] = None
+    lease: Optional[Lease] = None
+    pool: Optional[BrowserPool] = None
     
     def set_extension_id(self, extension_id: str):
         """设置扩展ID"""
@@ -39,14 +48,26 @@ class ChromeExtensionTest:
     
     @staticmethod
     async def create_test_context(headless: bool = False,
-                                 downloads_folder: Optional[str] = None) -> TestContext:
-        """创建测试上下文"""
+                                 downloads_folder: Optional[str] = None,
+                                 pool: Optional[BrowserPool] = None) -> TestContext:
+        """创建测试上下文，传入浏览器池时从池中借用页面"""
+        if pool is not None:
+            lease = await pool.acquire()
+            return TestContext(
+                browser=lease.browser,
+                page=lease.page,
+                extension_path=pool.extension_path,
+                downloads_folder=lease.downloads_folder,
+                lease=lease,
+                pool=pool
+            )
+
         # 获取项目根目录
-        extension_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+        extension_path = EXTENSION_PATH
         
         # 设置下载文件夹
         if downloads_folder is None:
-            downloads_folder = os.path.abspath(os.path.join(os.path.dirname(__file__), 'downloads'))
+            downloads_folder = DOWNLOADS_ROOT
         
         # 确保下载文件夹存在
         os.makedirs(downloads_folder, exist_ok=True)
@@ -54,32 +75,22 @@ class ChromeExtensionTest:
         # 启动浏览器
         browser = await launch(
             headless=headless,
-            executablePath="C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
-            args=[
-                '--no-sandbox',
-                f'--disable-extensions-except={extension_path}',
-                f'--load-extension={extension_path}',
-                '--disable-web-security',  # 允许跨源请求
-                f'--user-data-dir={os.path.join(downloads_folder, "user_data")}',
-                f'--download.default_directory={downloads_folder}',
-                '--proxy-server=192.168.1.16:10811'  # 添加代理服务器配置
-            ],
+            executablePath=CHROME_PATH,
+            args=build_launch_args(extension_path, os.path.join(downloads_folder, "user_data")),
             defaultViewport={
                 'width': 1280,
                 'height': 800
             }
         )
         
+        # 等待插件加载
+        await wait_for_extension_target(browser)
+        
         # 创建新页面
         page = await browser.newPage()
         
         # 设置下载行为
-        await page._client.send('Page.setDownloadBehavior', {
-            'behavior': 'allow',
-            'downloadPath': downloads_folder
-        })
-        
-        await asyncio.sleep(2)  # 等待插件加载
+        await set_download_folder(browser, downloads_folder)
         
         # 创建测试上下文
         context = TestContext(
@@ -94,12 +105,17 @@ class ChromeExtensionTest:
     @staticmethod
     async def cleanup_context(context: TestContext):
         """清理测试上下文"""
+        if context.lease is not None:
+            # 池中借出的上下文只归还页面，浏览器保持运行
+            await context.pool.release(context.lease)
+            return
+
         await context.browser.close()
         
         # 清理下载文件夹中的临时文件
         if context.downloads_folder and os.path.exists(context.downloads_folder):
             try:
-                for path in glob.glob(os.path.join(context.downloads_folder, '*_subtitles.*')):
+                for path in subtitle_files(context.downloads_folder):
                     os.remove(path)
                 
                 user_data_dir = os.path.join(context.downloads_folder, "user_data")
@@ -123,22 +139,11 @@ class ChromeExtensionTest:
 
     @staticmethod
     async def get_extension_id(context: TestContext) -> str:
-        """获取扩展ID"""
+        """获取扩展ID：根据 manifest key 或解压路径直接计算"""
         if context.extension_id:
             return context.extension_id
-            
-        # 获取所有标签页
-        targets = await context.browser.targets()
-        background_target = next(
-            (t for t in targets if t.type == 'background_page' and t.url.startswith('chrome-extension://')),
-            None
-        )
-        
-        if not background_target:
-            raise Exception("无法获取扩展背景页面")
         
-        # 从URL中提取扩展ID
-        extension_id = background_target.url.split('/')[2]
+        extension_id = resolve_extension_id(context.extension_path)
         context.set_extension_id(extension_id)
         
         logger.info(f"获取到扩展ID: {extension_id}")
@@ -149,15 +154,15 @@ class ChromeExtensionTest:
         """打开扩展选项页面"""
         extension_id = await ChromeExtensionTest.get_extension_id(context)
         
-        # 打开扩展选项页面
-        options_url = f'chrome-extension://{extension_id}/views/options.html'
-        await context.page.goto(options_url)
-        await asyncio.sleep(2)  # 等待选项页面加载
+        # 打开扩展选项页面，等待 load 事件
+        options_url = options_page_url(context.extension_path, extension_id)
+        await navigate_and_wait_load(context.page, options_url)
         
         logger.info(f"成功打开扩展选项页面")
         return extension_id
 
 
+@pytest.mark.manual
 @pytest.mark.asyncio
 async def test_extension():
     """主测试函数"""
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import shutil
+
+from corpus import CorpusSpec, generate_cues, write_json3
+from fixture_server import FixtureServer, FIXTURES_DIR
+from bundle import BundleWriter, verify_bundle
+from multitrack import YouTubeClient, caption_tracks, select_tracks, export_video, export_videos, video_id_of
+from download_manifest import DownloadManifest, ADDED, UPDATED, UNCHANGED
+from downloads_watcher import sha256_file
+from subtitle_engine import validate_file
+
+VIDEO_ID = 'oc6RV5c1yd0'
+
+
+def make_fixtures(tmp_path):
+    """在录制的夹具上增加德语和日语手动轨道"""
+    root = tmp_path / 'fixtures'
+    shutil.copytree(os.path.join(FIXTURES_DIR, VIDEO_ID), root / VIDEO_ID)
+    player_path = root / VIDEO_ID / 'player.json'
+    player = json.loads(player_path.read_text(encoding='utf-8'))
+    tracks = player['captions']['playerCaptionsTracklistRenderer']['captionTracks']
+    for lang in ('de', 'ja'):
+        tracks.append({'baseUrl': f'https://www.youtube.com/api/timedtext?v={VIDEO_ID}&lang={lang}',
+                       'name': {'simpleText': lang}, 'languageCode': lang})
+        with open(root / VIDEO_ID / 'timedtext' / f'{lang}.json3', 'w', encoding='utf-8') as f:
+            write_json3(generate_cues(CorpusSpec('cjk' if lang == 'ja' else 'manual', 30)), f)
+    player_path.write_text(json.dumps(player), encoding='utf-8')
+    return str(root)
+
+
+def test_select_tracks_by_language_and_kind():
+    """语言前缀匹配，类型筛选"""
+    player = json.load(open(os.path.join(FIXTURES_DIR, VIDEO_ID, 'player.json'), encoding='utf-8'))
+    tracks = caption_tracks(player)
+    assert [track.key for track in tracks] == ['en.asr', 'en']
+    assert [track.key for track in select_tracks(tracks, ['en'], ['manual'])] == ['en']
+    assert select_tracks(tracks, ['de']) == []
+
+
+
+def test_video_id_of_accepts_ids_and_url_forms():
+    """与下载流程使用相同的URL解析；不是URL时原样作为视频ID"""
+    assert video_id_of(VIDEO_ID) == VIDEO_ID
+    assert video_id_of(f'https://www.youtube.com/embed/{VIDEO_ID}?start=3') == VIDEO_ID
+    assert video_id_of(f'https://www.youtube.com/live/{VIDEO_ID}') == VIDEO_ID
+    assert video_id_of(f'https://youtu.be/{VIDEO_ID}?t=42') == VIDEO_ID
+    # dev= 不是视频ID参数
+    assert video_id_of(f'https://www.youtube.com/watch?dev={VIDEO_ID}') != VIDEO_ID
+
+def test_export_fetches_player_once_per_video(tmp_path):
+    """player response 只获取一次，每条轨道只请求一次，所有格式都写出并通过校验"""
+    fixtures = make_fixtures(tmp_path)
+    output = tmp_path / 'out'
+
+    async def run():
+        async with FixtureServer(fixtures) as server:
+            client = YouTubeClient(server.origin, proxy_server=None)
+            files = await export_video(client, VIDEO_ID, formats=['srt', 'vtt', 'txt'], output_dir=str(output))
+            return files, list(server.request_log)
+
+    files, log = asyncio.run(run())
+    routes = [route for _, route, _, _ in log]
+    assert routes.count('watch') == 1
+    assert routes.count('timedtext') == 4
+    assert len(files) == 4 * 3
+    assert {exported.track for exported in files} == {'en.asr', 'en', 'de', 'ja'}
+    for exported in files:
+        assert os.path.basename(exported.path) == f'{VIDEO_ID}.{exported.track}.{exported.format}'
+        assert sha256_file(exported.path) == exported.sha256
+        assert validate_file(exported.path).ok
+    assert not any(name.endswith('.tmp') for name in os.listdir(output))
+
+
+def test_export_into_bundle(tmp_path):
+    """写入压缩包时不产生单独的文件，压缩包可以流式校验"""
+    fixtures = make_fixtures(tmp_path)
+    bundle_path = tmp_path / 'tracks.zip'
+
+    async def run():
+        async with FixtureServer(fixtures) as server:
+            client = YouTubeClient(server.origin, proxy_server=None)
+            with BundleWriter(str(bundle_path)) as bundle:
+                return await export_video(client, VIDEO_ID, languages=['de', 'ja'], formats=['srt', 'vtt'],
+                                          output_dir=str(tmp_path / 'out'), bundle=bundle)
+
+    files = asyncio.run(run())
+    assert sorted(exported.path for exported in files) == [
+        f'{VIDEO_ID}.de.srt', f'{VIDEO_ID}.de.vtt', f'{VIDEO_ID}.ja.srt', f'{VIDEO_ID}.ja.vtt']
+    assert not (tmp_path / 'out').exists()
+    report = verify_bundle(str(bundle_path))
+    assert report.ok, report.errors
+    assert report.entries == 4
+
+
+
+def test_export_videos_skips_failed_videos(tmp_path):
+    """一个视频获取失败时记录原因并跳过，其他视频照常导出到同一个压缩包"""
+    fixtures = make_fixtures(tmp_path)
+    bundle_path = tmp_path / 'tracks.zip'
+
+    async def run():
+        async with FixtureServer(fixtures) as server:
+            client = YouTubeClient(server.origin, proxy_server=None)
+            with BundleWriter(str(bundle_path)) as bundle:
+                return await export_videos(['missingvid0', VIDEO_ID], client, languages=['de'],
+                                           formats=['srt'], bundle=bundle)
+
+    files, failed = asyncio.run(run())
+    assert [exported.path for exported in files] == [f'{VIDEO_ID}.de.srt']
+    assert list(failed) == ['missingvid0'] and 'HTTPError' in failed['missingvid0']
+    assert verify_bundle(str(bundle_path)).ok
+
+def test_refresh_only_rewrites_changed_tracks(tmp_path):
+    """第二次刷新通过条件请求跳过未变化的轨道；上游变化的轨道重新写出，新增的格式只写新格式"""
+    fixtures = make_fixtures(tmp_path)
+    output = tmp_path / 'out'
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+
+    async def refresh(formats):
+        async with FixtureServer(fixtures) as server:
+            client = YouTubeClient(server.origin, proxy_server=None)
+            with DownloadManifest(manifest_path) as manifest:
+                files = await export_video(client, VIDEO_ID, languages=['de', 'ja'], formats=formats,
+                                           output_dir=str(output), manifest=manifest)
+            return {(exported.track, exported.format): exported.status for exported in files}, client
+
+    statuses, _ = asyncio.run(refresh(['srt', 'vtt']))
+    assert set(statuses.values()) == {ADDED}
+    de_srt = output / f'{VIDEO_ID}.de.srt'
+    mtime = de_srt.stat().st_mtime_ns
+
+    statuses, client = asyncio.run(refresh(['srt', 'vtt']))
+    assert set(statuses.values()) == {UNCHANGED}
+    assert client.not_modified == 2
+    assert de_srt.stat().st_mtime_ns == mtime
+
+    # 上游德语字幕变化；同时请求新的 txt 格式
+    with open(os.path.join(fixtures, VIDEO_ID, 'timedtext', 'de.json3'), 'w', encoding='utf-8') as f:
+        write_json3(generate_cues(CorpusSpec('manual', 45, seed=2)), f)
+    statuses, client = asyncio.run(refresh(['srt', 'vtt', 'txt']))
+    assert statuses == {
+        ('de', 'srt'): UPDATED, ('de', 'vtt'): UPDATED, ('de', 'txt'): ADDED,
+        ('ja', 'srt'): UNCHANGED, ('ja', 'vtt'): UNCHANGED, ('ja', 'txt'): ADDED,
+    }
+    assert client.not_modified == 0
+    assert validate_file(str(de_srt)).ok
+
+    # 输出文件被删除时即使上游没有变化也重新写出
+    de_srt.unlink()
+    statuses, _ = asyncio.run(refresh(['srt', 'vtt', 'txt']))
+    assert statuses[('de', 'srt')] == UPDATED
+    assert statuses[('de', 'vtt')] == UNCHANGED
+    assert de_srt.exists()
+
+
+def test_refresh_after_partial_refresh_rewrites_stale_formats(tmp_path):
+    """只刷新过部分格式后，各格式的记录不同步，不能用条件请求把旧内容的格式判为未变化"""
+    fixtures = make_fixtures(tmp_path)
+    output = tmp_path / 'out'
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+
+    async def refresh(formats):
+        async with FixtureServer(fixtures) as server:
+            client = YouTubeClient(server.origin, proxy_server=None)
+            with DownloadManifest(manifest_path) as manifest:
+                files = await export_video(client, VIDEO_ID, languages=['de'], formats=formats,
+                                           output_dir=str(output), manifest=manifest)
+                rows = manifest.get(VIDEO_ID, 'de')
+            return {exported.format: exported.status for exported in files}, rows, client
+
+    asyncio.run(refresh(['srt', 'vtt']))
+    de_vtt = output / f'{VIDEO_ID}.de.vtt'
+    original = de_vtt.read_text(encoding='utf-8')
+
+    with open(os.path.join(fixtures, VIDEO_ID, 'timedtext', 'de.json3'), 'w', encoding='utf-8') as f:
+        write_json3(generate_cues(CorpusSpec('manual', 45, seed=2)), f)
+    statuses, rows, _ = asyncio.run(refresh(['srt']))
+    assert statuses == {'srt': UPDATED}
+    # vtt 的记录仍是旧内容，不能带上新内容的验证信息
+    assert rows['vtt'].source_sha256 != rows['srt'].source_sha256
+    assert rows['vtt'].etag != rows['srt'].etag
+
+    statuses, rows, client = asyncio.run(refresh(['srt', 'vtt']))
+    assert statuses == {'srt': UNCHANGED, 'vtt': UPDATED}
+    assert client.not_modified == 0
+    assert de_vtt.read_text(encoding='utf-8') != original
+    assert rows['vtt'].source_sha256 == rows['srt'].source_sha256
+
+    statuses, _, client = asyncio.run(refresh(['srt', 'vtt']))
+    assert statuses == {'srt': UNCHANGED, 'vtt': UNCHANGED}
+    assert client.not_modified == 1
@@ -0,0 +1,86 @@
+import asyncio
+import base64
+
+from pyee import EventEmitter
+
+from network_cache import NetworkCache, NetworkInterceptor, cache_key, normalize_url
+
+
+def test_cache_key_ignores_volatile_params_and_body_fields():
+    """易变参数和无关请求体字段不影响缓存键"""
+    assert normalize_url('HTTPS://WWW.YouTube.com/api/timedtext?v=abc&lang=en&expire=1&signature=x#t') == \
+        'https://www.youtube.com/api/timedtext?lang=en&v=abc'
+    a = cache_key('GET', 'https://www.youtube.com/api/timedtext?lang=en&v=abc&ei=1')
+    b = cache_key('get', 'https://www.youtube.com/api/timedtext?v=abc&lang=en&ei=2')
+    assert a == b
+    assert a != cache_key('GET', 'https://www.youtube.com/api/timedtext?v=abc&lang=de')
+    player = 'https://www.youtube.com/youtubei/v1/player?key=k'
+    assert cache_key('POST', player, post_data='{"videoId": "abc", "context": {"client": {"visitorData": "1"}}}') == \
+        cache_key('POST', player, post_data='{"context": {"client": {"visitorData": "2"}}, "videoId": "abc"}')
+    assert cache_key('GET', player, {'Accept-Language': 'en'}) != cache_key('GET', player, {'Accept-Language': 'zh'})
+
+
+def test_lru_eviction_and_content_dedupe(tmp_path):
+    """相同内容只存一份；超过上限时淘汰最久未使用的项"""
+    with NetworkCache(str(tmp_path), max_bytes=25) as cache:
+        cache.put('a', 'u/a', 200, [('content-type', 'text/plain')], b'x' * 10)
+        cache.put('b', 'u/b', 200, [], b'x' * 10)
+        assert cache.total_bytes == 10 and len(cache) == 2
+        cache.put('c', 'u/c', 200, [], b'y' * 10)
+        assert cache.get('a').headers == [('content-type', 'text/plain')]
+        cache.put('d', 'u/d', 200, [], b'z' * 10)
+        # b 最久未使用但与 a 共享内容，淘汰 b 后 c 才释放出空间
+        assert cache.get('c') is None and cache.get('a') is not None
+        assert cache.total_bytes <= 25
+
+    with NetworkCache(str(tmp_path), max_bytes=25) as cache:
+        assert cache.get('d').body == b'z' * 10
+
+
+class FakeSession(EventEmitter):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def send(self, method, params=None):
+        self.sent.append((method, params))
+        if method == 'Fetch.getResponseBody':
+            return {'body': base64.b64encode(b'{"events": []}').decode(), 'base64Encoded': True}
+        return {}
+
+
+def paused(stage_response=False):
+    event = {'requestId': 'r1', 'request': {'method': 'GET', 'url': 'https://www.youtube.com/api/timedtext?v=abc'}}
+    if stage_response:
+        event.update(responseStatusCode=200, responseHeaders=[
+            {'name': 'Content-Type', 'value': 'application/json'}, {'name': 'Content-Encoding', 'value': 'br'}])
+    return event
+
+
+def test_record_then_replay(tmp_path):
+    """录制时保存响应并继续请求，回放时直接用缓存响应，未命中时请求失败"""
+    async def run():
+        cache = NetworkCache(str(tmp_path))
+        session = FakeSession()
+        recorder = await NetworkInterceptor(cache, 'record').attach(session)
+        session.emit('Fetch.requestPaused', paused(stage_response=True))
+        await recorder.detach()
+        assert ('Fetch.continueRequest', {'requestId': 'r1'}) in session.sent
+
+        session = FakeSession()
+        player = await NetworkInterceptor(cache, 'replay').attach(session)
+        session.emit('Fetch.requestPaused', paused())
+        miss = paused()
+        miss['request']['url'] += '&lang=fr'
+        session.emit('Fetch.requestPaused', miss)
+        await player.detach()
+        cache.close()
+        return session.sent, player
+
+    sent, player = asyncio.run(run())
+    assert sent[0][1]['patterns'][0]['requestStage'] == 'Request'
+    fulfilled = next(params for method, params in sent if method == 'Fetch.fulfillRequest')
+    assert base64.b64decode(fulfilled['body']) == b'{"events": []}'
+    assert fulfilled['responseHeaders'] == [{'name': 'Content-Type', 'value': 'application/json'}]
+    assert any(method == 'Fetch.failRequest' for method, _ in sent)
+    assert player.replayed == 1 and len(player.missed) == 1
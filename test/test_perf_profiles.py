@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from perf_profiles import (
+    PROFILES, NO_THROTTLING, ProfileSession, get_profile, summarize_interactivity
+)
+
+
+class FakeSession:
+    """记录发送的 CDP 命令"""
+
+    def __init__(self):
+        self.sent = []
+        self.detached = False
+
+    async def send(self, method, params=None):
+        self.sent.append((method, params))
+        return {}
+
+    async def detach(self):
+        self.detached = True
+
+
+class FakeTarget:
+    type = 'service_worker'
+    url = 'chrome-extension://abc/background.js'
+
+    def __init__(self):
+        self.session = FakeSession()
+
+    async def createCDPSession(self):
+        return self.session
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.target = FakeTarget()
+
+    def targets(self):
+        return [self.target]
+
+
+class FakePage:
+    def __init__(self):
+        self._client = FakeSession()
+        self.viewport = None
+        self.user_agent = None
+
+    async def setViewport(self, viewport):
+        self.viewport = viewport
+
+    async def setUserAgent(self, user_agent):
+        self.user_agent = user_agent
+
+    def isClosed(self):
+        return False
+
+
+def test_get_profile_is_case_insensitive():
+    assert get_profile('3g') is PROFILES['3G']
+    assert get_profile(None) is None
+    with pytest.raises(ValueError):
+        get_profile('dial-up')
+
+
+def test_session_throttles_page_and_worker_and_clears():
+    """CPU 降速作用于选项页，网络限制同时作用于 service worker；service worker 重启后重新附加"""
+    browser, page = FakeBrowser(), FakePage()
+    profile = PROFILES['kiwi-midrange']
+
+    async def run():
+        session = await ProfileSession(browser, page, profile).apply()
+        first = browser.target.session
+        # 同一个 target 不会重复附加
+        await session.refresh_worker()
+        browser.target = FakeTarget()
+        await session.refresh_worker()
+        await session.clear()
+        return first
+
+    first = asyncio.run(run())
+    assert page.viewport['isMobile'] and 'Mobile' in page.user_agent
+    methods = dict(page._client.sent[:2])
+    assert methods['Emulation.setCPUThrottlingRate'] == {'rate': 4.0}
+    assert methods['Network.emulateNetworkConditions']['latency'] == 150
+    assert [m for m, _ in first.sent].count('Network.emulateNetworkConditions') == 2
+    assert first.detached and browser.target.session.detached
+    assert page._client.sent[-1] == ('Network.emulateNetworkConditions', NO_THROTTLING)
+
+
+def test_cpu_only_profile_leaves_worker_alone():
+    browser, page = FakeBrowser(), FakePage()
+    asyncio.run(ProfileSession(browser, page, PROFILES['desktop']).apply())
+    assert browser.target.session.sent == []
+    assert [m for m, _ in page._client.sent] == ['Emulation.setCPUThrottlingRate']
+
+
+def test_summarize_interactivity():
+    raw = {'longTasks': [40, 120, 80], 'frameGaps': [16] * 18 + [70, 200],
+           'lags': [0, 3, 95], 'elapsed': 1234.56}
+    summary = summarize_interactivity(raw)
+    assert summary['long_tasks'] == 3
+    # 只有超过 50ms 的部分计入阻塞时间
+    assert summary['total_blocking_time_ms'] == 100
+    assert summary['max_long_task_ms'] == 120
+    assert summary['max_frame_gap_ms'] == 200 and summary['janky_frames'] == 2
+    # 与 benchmark 相同的最近秩百分位数：20 个间隔中的第 19 个
+    assert summary['p95_frame_gap_ms'] == 70
+    assert summary['max_input_delay_ms'] == 95
+    assert summarize_interactivity(None) is None
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+from postprocess import process_file, postprocess_paths, normalize_text, REPORT_NAME
+from subtitle_engine import iter_cues
+
+ROLLING_VTT = '''\ufeffWEBVTT
+
+00:00:01.000 --> 00:00:02.000
+hello   world
+
+00:00:02.000 --> 00:00:03.000
+hello world again
+
+00:00:04.000 --> 00:00:03.500
+  tail
+
+00:00:05.000 --> 00:00:06.000
+été
+'''
+
+
+def test_normalize_text():
+    assert normalize_text(' a \t b \n\n c ') == 'a b\nc'
+    assert normalize_text('e\u0301') == '\u00e9'
+
+
+def test_process_file_normalizes_dedupes_and_converts(tmp_path):
+    """去掉 BOM、合并滚动字幕、修正倒置的时间，并写出三种格式"""
+    source = tmp_path / 'video_subtitles.vtt'
+    source.write_text(ROLLING_VTT, encoding='utf-8')
+    result = process_file(str(source), str(tmp_path / 'out'))
+    assert result.ok and result.cues_in == 4 and result.fixed_timings == 1
+    assert set(result.outputs) == {'vtt', 'srt', 'txt'}
+    vtt = (tmp_path / 'out' / 'video_subtitles.vtt').read_bytes()
+    assert not vtt.startswith(b'\xef\xbb\xbf')
+    cues = list(iter_cues(result.outputs['srt']))
+    assert [cue.text for cue in cues] == ['hello world', 'again', 'tail', 'été']
+    assert cues[2].start_ms == cues[2].end_ms == 4000
+
+
+def test_txt_source_only_produces_txt(tmp_path):
+    source = tmp_path / 'video_subtitles.txt'
+    source.write_text('line one\nline two\n', encoding='utf-8')
+    result = process_file(str(source), str(tmp_path / 'out'))
+    assert result.ok and list(result.outputs) == ['txt'] and result.warnings
+
+
+def test_pipeline_streams_results_to_report(tmp_path):
+    """多个进程并行处理，逐个写入结果日志，无法解析的文件记为失败"""
+    paths = []
+    for index in range(4):
+        path = tmp_path / f'v{index}_subtitles.srt'
+        path.write_text(f'1\n00:00:01,000 --> 00:00:02,000\ncue {index}\n', encoding='utf-8')
+        paths.append(str(path))
+    broken = tmp_path / 'broken_subtitles.srt'
+    broken.write_text('1\nnot a timing\ntext\n', encoding='utf-8')
+    paths.append(str(broken))
+
+    output = tmp_path / 'out'
+    summary = asyncio.run(postprocess_paths(paths, str(output), workers=2, queue_size=1))
+    assert summary['files'] == 5 and summary['ok'] == 4 and summary['failed'] == 1
+    assert (output / 'v3_subtitles.vtt').exists()
+    lines = (output / REPORT_NAME).read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 5 and sum(json.loads(line)['ok'] for line in lines) == 4
@@ -0,0 +1,39 @@
+import time
+
+from profile_template import clone_profile, extension_fingerprint, METADATA_FILE
+
+
+def make_template(root):
+    template = root / 'template'
+    (template / 'Default' / 'Local Extension Settings').mkdir(parents=True)
+    (template / 'Default' / 'Preferences').write_text('{"extensions": {}}')
+    (template / 'Default' / 'Local Extension Settings' / '000005.ldb').write_bytes(b'sst')
+    (template / METADATA_FILE).write_text('{}')
+    return template
+
+
+def test_clone_is_independent_of_template(tmp_path):
+    """修改克隆不会影响模板，元数据文件不会被克隆"""
+    template = make_template(tmp_path)
+    clone = tmp_path / 'run' / 'user_data'
+    clone_profile(str(template), str(clone))
+
+    assert not (clone / METADATA_FILE).exists()
+    prefs = clone / 'Default' / 'Preferences'
+    prefs.write_text('{"changed": true}')
+    assert (template / 'Default' / 'Preferences').read_text() == '{"extensions": {}}'
+    assert (clone / 'Default' / 'Local Extension Settings' / '000005.ldb').read_bytes() == b'sst'
+
+    # 再次克隆会覆盖之前的目录
+    clone_profile(str(template), str(clone))
+    assert prefs.read_text() == '{"extensions": {}}'
+
+
+def test_fingerprint_tracks_extension_changes(tmp_path):
+    """扩展源码变化后指纹随之变化"""
+    (tmp_path / 'manifest.json').write_text('{}')
+    before = extension_fingerprint(str(tmp_path))
+    assert extension_fingerprint(str(tmp_path)) == before
+    time.sleep(0.01)
+    (tmp_path / 'background.js').write_text('// new')
+    assert extension_fingerprint(str(tmp_path)) != before
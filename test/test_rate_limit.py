@@ -0,0 +1,83 @@
+import asyncio
+
+from http_status import parse_retry_after, retryable_status
+from rate_limit import TokenBucket, HostLimiter, RetryPolicy, FetchScheduler, host_of
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_reserves_and_pauses():
+    """令牌用完后按速率排队；pause() 推迟发放，AIMD 调整速率"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, burst=2, min_rate=0.5, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now += 2.0
+    bucket.pause(10)
+    assert bucket.reserve() == 10.5
+    bucket.on_throttled()
+    bucket.on_throttled()
+    bucket.on_throttled()
+    assert bucket.rate == 0.5
+    bucket.on_success()
+    assert bucket.rate == 0.55
+
+
+def test_retry_policy_backoff_and_retry_after():
+    policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+    assert policy.delay(1, rng=lambda: 0.0) == 0.5
+    assert policy.delay(3, rng=lambda: 1.0) == 4.0
+    assert policy.delay(10, rng=lambda: 1.0) == 8.0
+    # Retry-After 是下限
+    assert policy.delay(1, retry_after=30, rng=lambda: 1.0) == 30
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:10 GMT', now=1445412480.0) == 10.0
+    assert parse_retry_after('soon') is None
+    assert retryable_status(429) and retryable_status(503) and not retryable_status(404)
+
+
+def test_youtube_aliases_share_one_bucket():
+    """youtu.be、m.youtube.com 等写法实际都请求 www.youtube.com，共用一个令牌桶"""
+    urls = ['https://youtu.be/oc6RV5c1yd0', 'https://m.youtube.com/watch?v=oc6RV5c1yd0',
+            'https://youtube.com/shorts/oc6RV5c1yd0', 'https://www.youtube.com/watch?v=oc6RV5c1yd0']
+    assert {host_of(url) for url in urls} == {'www.youtube.com'}
+    assert host_of('https://vimeo.com/1') == 'vimeo.com'
+    limiter = HostLimiter()
+    assert limiter.bucket(host_of(urls[0])) is limiter.bucket(host_of(urls[1]))
+
+
+def test_scheduler_retries_without_starving_fresh_urls():
+    """被限流的URL退避后重试，期间新URL照常出队；Retry-After 暂停整个域名"""
+    limiter = HostLimiter(rate=1000, burst=100)
+    scheduler = FetchScheduler(limiter, RetryPolicy(max_attempts=2, base_delay=0.05, max_delay=0.05))
+    for url in ('https://y.test/a', 'https://y.test/b', 'https://y.test/c'):
+        scheduler.submit(url)
+    order = []
+
+    async def worker():
+        while True:
+            job = await scheduler.next()
+            if job is None:
+                return
+            order.append(job.url)
+            throttled = job.url.endswith('a')
+            scheduler.finish(job, not throttled, 429 if throttled else None)
+
+    async def run():
+        await asyncio.gather(worker(), worker())
+
+    asyncio.run(run())
+    # a 第一次被限流，b、c 先完成，a 退避后重试一次，仍然失败
+    assert order == ['https://y.test/a', 'https://y.test/b', 'https://y.test/c', 'https://y.test/a']
+    metrics = scheduler.metrics()
+    assert (metrics.completed, metrics.failed, metrics.retries, metrics.throttled) == (2, 1, 1, 2)
+    assert metrics.in_flight == 0 and metrics.queued == 0 and metrics.retrying == 0
+    assert metrics.host_rates['y.test'] < 1000
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+
+import pytest
+
+import scenarios
+from scenarios import CASES, URL_FORMS, INVALID_URLS, DownloadCase, build_cases, judge, run_cases
+from test_download import DownloadOutcome, video_id_from_url, check_memory_budget
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.mark.asyncio(loop_scope='session')
+@pytest.mark.parametrize('case', CASES, ids=lambda case: case.id)
+async def test_scenario(case, scenario_results, record_property):
+    """场景在会话开始时已经并行运行，这里逐个报告结果和耗时"""
+    result = scenario_results[case.id]
+    record_property('elapsed', round(result.elapsed, 3))
+    assert result.passed, result.reason
+
+
+@pytest.mark.asyncio(loop_scope='session')
+async def test_memory_budget(context):
+    assert await check_memory_budget(context)
+
+
+def test_build_cases_covers_matrix_and_url_forms():
+    cases = build_cases('abcdefghijk')
+    ids = [case.id for case in cases]
+    assert len(ids) == len(set(ids))
+    assert len(cases) == 2 * 3 + (len(URL_FORMS) - 1) + len(INVALID_URLS)
+    assert {(case.subtitle_type, case.fmt) for case in cases if case.id.startswith('watch-')} == {
+        (subtitle_type, fmt) for subtitle_type in ('auto', 'manual') for fmt in ('vtt', 'srt', 'txt')}
+    for case in cases:
+        assert (video_id_from_url(case.url) == 'abcdefghijk') != case.expect_error, case.id
+
+
+def test_video_id_from_url_forms():
+    assert video_id_from_url('https://www.youtube.com/embed/oc6RV5c1yd0?start=3') == 'oc6RV5c1yd0'
+    assert video_id_from_url('https://www.youtube.com/live/oc6RV5c1yd0') == 'oc6RV5c1yd0'
+    assert video_id_from_url('https://www.youtube.com/watch?list=PL1&v=oc6RV5c1yd0') == 'oc6RV5c1yd0'
+    assert video_id_from_url('https://www.youtube.com/watch?dev=oc6RV5c1yd0') is None
+
+
+def test_judge(tmp_path):
+    path = tmp_path / 'video_subtitles.srt'
+    path.write_text('1\n00:00:01,000 --> 00:00:02,000\nhello\n', encoding='utf-8')
+    download = DownloadCase('watch-auto-srt', 'https://youtu.be/oc6RV5c1yd0', fmt='srt')
+    invalid = DownloadCase('invalid', 'https://invalid-url.com', expect_error=True)
+    assert judge(download, DownloadOutcome(True, '下载成功', 'success', path=str(path)))[0]
+    assert judge(download, DownloadOutcome(False, '找不到字幕信息', 'error'))[0]
+    assert not judge(download, DownloadOutcome(False, '网络错误', 'error'))[0]
+    path.write_text('1\nnot a timing\nhello\n', encoding='utf-8')
+    assert not judge(download, DownloadOutcome(True, '下载成功', 'success', path=str(path)))[0]
+    assert judge(invalid, DownloadOutcome(False, '无效的URL', 'error'))[0]
+    assert not judge(invalid, DownloadOutcome(False, '', ''))[0]
+
+
+def test_run_cases_runs_concurrently_and_isolates_failures(fake_downloads):
+    """各场景在独立的上下文中并行运行，一个场景出错不影响其他场景"""
+
+    async def fake_download(context, url, subtitle_type, fmt, timeout):
+        await asyncio.sleep(0.05)
+        if 'broken' in url:
+            raise RuntimeError('页面崩溃')
+        return DownloadOutcome(False, '无效的URL', 'error', timings={'page_open': 0.01})
+
+    contexts = fake_downloads(scenarios, fake_download)
+    cases = [DownloadCase(f'case-{index}', f'https://invalid-{index}.test', expect_error=True)
+             for index in range(7)] + [DownloadCase('broken', 'https://broken.test', expect_error=True)]
+
+    results = asyncio.run(run_cases(None, cases, workers=4))
+    assert contexts.peak == 4 and not contexts.active
+    assert [case_id for case_id, result in results.items() if not result.passed] == ['broken']
+    assert 'RuntimeError' in results['broken'].reason
+    assert all(result.elapsed >= 0.05 for result in results.values())
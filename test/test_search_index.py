@@ -0,0 +1,113 @@
+import os
+import random
+
+import search_index
+from search_index import SearchIndex, tokenize
+from subtitle_engine import Cue, write_cues
+
+
+def write_srt(path, lines, step_ms=2000):
+    write_cues([Cue(i * step_ms, (i + 1) * step_ms, text) for i, text in enumerate(lines)], str(path))
+
+
+def test_tokenize_normalizes_and_splits_cjk():
+    assert tokenize('Hello, WORLD! ｆｕｌｌ-width') == ['hello', 'world', 'full', 'width']
+    assert tokenize('字幕下载 test') == ['字', '幕', '下', '载', 'test']
+
+
+def test_phrase_query_returns_video_and_timestamp(tmp_path):
+    """短语可以跨越字幕边界，返回匹配开始处字幕的时间"""
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+    write_srt(downloads / 'aaaaaaaaaaa.en.srt', ['we choose to go', 'to the moon in this decade'])
+    write_srt(downloads / 'bbbbbbbbbbb.en.asr.srt', ['the moon is', 'not made of cheese', 'moon to the'])
+    # 同一轨道的 TXT 没有时间信息，不应重复索引
+    (downloads / 'aaaaaaaaaaa.en.txt').write_text('to the moon\n', encoding='utf-8')
+
+    with SearchIndex(str(tmp_path / 'index')) as index:
+        assert index.add([str(downloads)]) == 2
+        hits = index.search('To the Moon')
+        assert [(hit.video_id, hit.track, hit.start_ms) for hit in hits] == [('aaaaaaaaaaa', 'en', 2000)]
+        hits = index.search('go to the moon')
+        assert [(hit.video_id, hit.timestamp) for hit in hits] == [('aaaaaaaaaaa', '00:00:00.000')]
+        assert index.search('moon the') == []
+        hits = index.search('moon the', phrase=False)
+        assert [(hit.video_id, hit.start_ms) for hit in hits] == [
+            ('aaaaaaaaaaa', 2000), ('bbbbbbbbbbb', 0), ('bbbbbbbbbbb', 4000)]
+        assert index.search('cheese moon decade') == []
+
+
+def test_incremental_add_and_compact(tmp_path):
+    """只索引新增或变化的文件；变化的文件旧内容不再命中，compact 后结果不变"""
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+    first = downloads / 'aaaaaaaaaaa.en.srt'
+    write_srt(first, ['original words here'])
+    index_dir = str(tmp_path / 'index')
+    with SearchIndex(index_dir) as index:
+        assert index.add([str(downloads)]) == 1
+    write_srt(downloads / 'bbbbbbbbbbb.en.srt', ['original words again'])
+    with SearchIndex(index_dir) as index:
+        assert index.add([str(downloads)]) == 1
+        assert index.add([str(downloads)]) == 0
+        assert len(index.search('original words')) == 2
+
+    write_srt(first, ['replacement text'])
+    os.utime(first, ns=(0, 0))
+    with SearchIndex(index_dir) as index:
+        assert index.add([str(downloads)]) == 1
+        assert [hit.video_id for hit in index.search('original words')] == ['bbbbbbbbbbb']
+        assert [hit.video_id for hit in index.search('replacement')] == ['aaaaaaaaaaa']
+        assert index.stats()['segments'] == 3
+        index.compact()
+        stats = index.stats()
+        assert (stats['segments'], stats['documents'], stats['deleted']) == (1, 2, 0)
+        assert [hit.video_id for hit in index.search('original words')] == ['bbbbbbbbbbb']
+    assert sorted(os.listdir(index_dir)) == ['files_000004.json', 'index.json', 'seg_000003.idx']
+
+
+def test_query_reads_neither_file_table_nor_whole_postings(tmp_path, monkeypatch):
+    """查询不读取文件表；有 limit 时只解码用到的那部分倒排"""
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+    for n in range(200):
+        write_srt(downloads / f'v{n:010d}.en.srt', ['common words', 'more common words'])
+    index_dir = str(tmp_path / 'index')
+    with SearchIndex(index_dir) as index:
+        assert index.add([str(downloads)]) == 200
+
+    decoded = []
+    original_next = search_index._PostingCursor._next
+
+    def counting_next(cursor):
+        decoded.append(1)
+        return original_next(cursor)
+
+    monkeypatch.setattr(search_index._PostingCursor, '_next', counting_next)
+    with SearchIndex(index_dir) as index:
+        assert len(index.search('common', limit=5)) == 5
+        assert index._files is None
+    assert len(decoded) < 10
+
+
+def test_skip_lists_match_brute_force(tmp_path, monkeypatch):
+    """多段、跳表生效时查询结果与逐个文件扫描一致"""
+    monkeypatch.setattr(search_index, 'SKIP_INTERVAL', 4)
+    rng = random.Random(7)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'common']
+    downloads = tmp_path / 'downloads'
+    downloads.mkdir()
+    documents = {}
+    for n in range(120):
+        video_id = f'v{n:010d}'
+        lines = [' '.join(['common'] + rng.sample(words[:4], 2)) for _ in range(rng.randint(1, 4))]
+        documents[video_id] = lines
+        write_srt(downloads / f'{video_id}.en.srt', lines)
+
+    with SearchIndex(str(tmp_path / 'index'), segment_docs=50) as index:
+        assert index.add([str(downloads)]) == 120
+        assert index.stats()['segments'] == 3
+        for query in ('common alpha', 'alpha beta', 'delta gamma', 'common'):
+            expected = [(video_id, i * 2000) for video_id, lines in sorted(documents.items())
+                        for i, line in enumerate(lines) if f' {query} ' in f' {line} ']
+            assert [(hit.video_id, hit.start_ms) for hit in index.search(query, limit=None)] == expected
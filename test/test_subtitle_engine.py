@@ -0,0 +1,161 @@
+import io
+import json
+import os
+import tracemalloc
+
+import subtitle_engine
+from subtitle_engine import (
+    Cue, read_vtt, read_srt, read_json3, read_srv3, write_vtt, write_srt, write_txt,
+    convert, iter_cues, validate_file, parse_timestamp, format_timestamp, CueStore, merge_rolling
+)
+from subtitle_engine import readers
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'youtube', 'oc6RV5c1yd0', 'timedtext')
+
+
+def test_timestamps():
+    """VTT / SRT 时间戳的解析与格式化"""
+    assert parse_timestamp('01:02:03.456') == 3723456
+    assert parse_timestamp('02:03.4') == 123400
+    assert parse_timestamp('01:02:03,456') == 3723456
+    assert format_timestamp(3723456) == '01:02:03.456'
+    assert format_timestamp(3723456, ',') == '01:02:03,456'
+
+
+def test_vtt_with_youtube_inline_tags_and_metadata():
+    """解析带头部元数据、NOTE、cue 标识和行内时间标签的 VTT"""
+    text = (
+        '\ufeffWEBVTT\nKind: captions\nLanguage: en\n\n'
+        'NOTE generated\n\n'
+        'cue-1\n00:00:00.000 --> 00:00:01.500 align:start position:0%\n'
+        'hello<00:00:00.500><c> world</c> &amp; more\n\n'
+        '00:01.500 --> 00:03.000\nsecond\nline\n'
+    )
+    cues = list(read_vtt(io.StringIO(text)))
+    assert cues == [Cue(0, 1500, 'hello world & more'), Cue(1500, 3000, 'second\nline')]
+
+
+def test_srt_round_trip():
+    """SRT 写出后再读回内容不变"""
+    cues = [Cue(0, 1000, 'a'), Cue(1000, 2500, 'b\nc')]
+    out = io.StringIO()
+    assert write_srt(cues, out) == 2
+    assert out.getvalue().startswith('1\n00:00:00,000 --> 00:00:01,000\na\n\n2\n')
+    assert list(read_srt(io.StringIO(out.getvalue()))) == cues
+
+
+def test_fixture_formats_agree():
+    """同一轨道的 json3 / srv3 / vtt 解析结果一致"""
+    for track in ('en', 'en.asr'):
+        vtt = list(iter_cues(os.path.join(FIXTURE_DIR, f'{track}.vtt')))
+        assert list(iter_cues(os.path.join(FIXTURE_DIR, f'{track}.json3'))) == vtt
+        assert list(iter_cues(os.path.join(FIXTURE_DIR, f'{track}.srv3'))) == vtt
+
+
+def test_json3_streaming_across_chunk_boundaries(monkeypatch):
+    """json3 元素和多字节字符被切分到不同块时也能正确解析"""
+    monkeypatch.setattr(readers, 'CHUNK_SIZE', 7)
+    events = [{'tStartMs': 0, 'dDurationMs': 10, 'id': 1},
+              {'tStartMs': 0, 'dDurationMs': 1000, 'segs': [{'utf8': '你好'}, {'utf8': ' 世界'}]},
+              {'tStartMs': 1000, 'dDurationMs': 500, 'segs': [{'utf8': '\n'}]},
+              {'tStartMs': 1500, 'dDurationMs': 500, 'segs': [{'utf8': 'שלום'}]}]
+    data = json.dumps({'wireMagic': 'pb3', 'events': events}, ensure_ascii=False).encode('utf-8')
+    cues = list(read_json3(io.BytesIO(data)))
+    assert cues == [Cue(0, 1000, '你好 世界'), Cue(1500, 2000, 'שלום')]
+
+
+def test_srv1_and_srv3_xml():
+    """支持 srv3 的 <p t= d=> 和 srv1 的 <text start= dur=>"""
+    srv3 = b'<timedtext format="3"><body><p t="10" d="20"><s>a</s><s t="5"> b</s></p></body></timedtext>'
+    srv1 = b'<transcript><text start="1.5" dur="2">it&amp;#39;s</text></transcript>'
+    assert list(read_srv3(io.BytesIO(srv3))) == [Cue(10, 30, 'a b')]
+    assert list(read_srv3(io.BytesIO(srv1))) == [Cue(1500, 3500, "it's")]
+
+
+def test_convert_large_track_in_flat_memory(tmp_path):
+    """转换的内存峰值与字幕条数无关"""
+    src = tmp_path / 'long.vtt'
+    with open(src, 'w', encoding='utf-8') as f:
+        write_vtt((Cue(i * 1000, i * 1000 + 900, f'line number {i}') for i in range(20000)), f)
+
+    tracemalloc.start()
+    try:
+        count = convert(str(src), str(tmp_path / 'long.srt'))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert count == 20000
+    assert peak < 1024 * 1024
+
+    txt = io.StringIO()
+    write_txt(iter_cues(str(tmp_path / 'long.srt')), txt)
+    assert txt.getvalue().splitlines()[-1] == 'line number 19999'
+
+
+def test_validate_file(tmp_path):
+    """校验能发现空文件和结束时间早于开始时间的字幕"""
+    good = tmp_path / 'good_subtitles.srt'
+    good.write_text('1\n00:00:00,000 --> 00:00:01,000\nok\n', encoding='utf-8')
+    bad = tmp_path / 'bad_subtitles.vtt'
+    bad.write_text('WEBVTT\n\n00:00:02.000 --> 00:00:01.000\nbackwards\n', encoding='utf-8')
+    empty = tmp_path / 'empty_subtitles.txt'
+    empty.write_text('', encoding='utf-8')
+
+    assert validate_file(str(good)).ok
+    assert not validate_file(str(bad)).ok
+    assert not validate_file(str(empty)).ok
+    assert subtitle_engine.detect_format(str(good)) == 'srt'
+
+
+def test_cue_store_lookup_with_overlaps():
+    """二分查找正在显示的字幕，包括被长字幕覆盖的时间点"""
+    store = CueStore.from_cues([Cue(0, 10000, 'long'), Cue(1000, 2000, 'a'), Cue(3000, 4000, 'b'),
+                                Cue(20000, 21000, 'c')])
+    assert store.cue_at(1500).text == 'a'
+    assert store.cue_at(2500).text == 'long'
+    assert store.cue_at(15000) is None
+    assert store.cue_at(20500).text == 'c'
+    assert list(store)[1] == Cue(1000, 2000, 'a')
+    assert store[-1].text == 'c'
+
+
+def test_cue_store_lookup_after_long_early_cue_matches_brute_force():
+    """很长的早期字幕不会让之后的查找退化为线性扫描，结果与逐条比较一致"""
+    import random
+    rng = random.Random(3)
+    cues = [Cue(0, 10 ** 9, 'pathological')]
+    start = 0
+    for i in range(5000):
+        start += rng.randint(0, 1500)
+        cues.append(Cue(start, start + rng.choice([300, 900, 5000]), f'cue {i}'))
+    store = CueStore.from_cues(cues)
+    for t in [rng.randint(0, start + 10000) for _ in range(500)] + [0, start, 10 ** 9, 10 ** 9 + 1]:
+        expected = max((i for i, cue in enumerate(cues) if cue.start_ms <= t < cue.end_ms), default=None)
+        assert store.index_at(t) == expected, t
+    assert store.index_at(-1) is None
+
+
+def test_cue_store_is_compact():
+    """10 万条字幕只占用几 MB"""
+    store = CueStore.from_cues(Cue(i * 1000, i * 1000 + 900, f'word {i % 50}') for i in range(100000))
+    assert len(store) == 100000
+    assert store.nbytes < 5 * 1024 * 1024
+    assert store.cue_at(99999 * 1000 + 10).text == 'word 49'
+
+
+def test_merge_rolling_auto_captions():
+    """滚动字幕只保留新增的单词，相同的相邻字幕被折叠"""
+    rolling = [Cue(0, 2000, 'hello there'),
+               Cue(1000, 3000, 'hello there my friend'),
+               Cue(2000, 4000, 'hello there my friend'),
+               Cue(3000, 5000, 'my friend\nhow are you'),
+               Cue(4000, 6000, 'how are you\ntoday')]
+    store = CueStore.from_cues(rolling).dedupe()
+    assert [cue.text for cue in store] == ['hello there', 'my friend', 'how are you', 'today']
+    assert store[1] == Cue(1000, 4000, 'my friend')
+
+
+def test_merge_rolling_keeps_manual_boundary_words():
+    """手动字幕中碰巧首尾相同的单个词不会被当作滚动重复"""
+    manual = [Cue(0, 1000, 'I said no'), Cue(1000, 2000, 'no is the answer')]
+    assert list(merge_rolling(manual)) == manual
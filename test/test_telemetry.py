@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import pytest
+
+from telemetry import Telemetry, parse_prometheus, EVENTS_NAME, PROMETHEUS_NAME, TIMEOUT, ERROR
+
+
+def test_phase_events_and_prometheus_file(tmp_path):
+    """每个阶段写一条事件，计数器和直方图写成 Prometheus 文本格式"""
+    telemetry = Telemetry().configure(str(tmp_path), run_id='run-1')
+
+    @telemetry.timed('get_extension_id')
+    async def resolve():
+        return 'abc'
+
+    async def slow():
+        with telemetry.phase('download', url='https://y/1', format='srt', subtitle_type='auto'):
+            await asyncio.wait_for(asyncio.sleep(1), 0.01)
+
+    assert asyncio.run(resolve()) == 'abc'
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(slow())
+    with pytest.raises(ValueError):
+        with telemetry.phase('cleanup'):
+            raise ValueError('boom')
+    telemetry.emit('download_complete', 0.3, labels={'format': 'srt', 'subtitle_type': 'auto'}, bytes=10)
+    telemetry.close()
+
+    events = [json.loads(line) for line in (tmp_path / EVENTS_NAME).read_text(encoding='utf-8').splitlines()]
+    assert [event['name'] for event in events] == ['get_extension_id', 'download', 'cleanup', 'download_complete']
+    assert events[1]['outcome'] == TIMEOUT and events[1]['labels']['url'] == 'https://y/1'
+    assert events[2]['outcome'] == ERROR and 'boom' in events[2]['fields']['error']
+    assert all(event['run_id'] == 'run-1' and event['duration'] >= 0 for event in events)
+
+    samples = {(name, tuple(sorted(labels.items()))): value
+               for name, labels, value in parse_prometheus((tmp_path / PROMETHEUS_NAME).read_text(encoding='utf-8'))}
+    labels = (('format', 'srt'), ('phase', 'download_complete'), ('profile', ''), ('subtitle_type', 'auto'))
+    assert samples[('ytsd_phase_duration_seconds_count', labels)] == 1
+    assert samples[('ytsd_phase_duration_seconds_bucket', tuple(sorted(labels + (('le', '0.25'),))))] == 0
+    assert samples[('ytsd_phase_duration_seconds_bucket', tuple(sorted(labels + (('le', '0.5'),))))] == 1
+    # URL 不进入指标标签
+    assert not any('url' in dict(key[1]) for key in samples)
+
+
+def test_counters_accumulate_across_runs(tmp_path):
+    for run in range(2):
+        telemetry = Telemetry().configure(str(tmp_path))
+        telemetry.emit('download', 1.5, labels={'format': 'txt', 'subtitle_type': 'auto'})
+        telemetry.close()
+    samples = parse_prometheus((tmp_path / PROMETHEUS_NAME).read_text(encoding='utf-8'))
+    totals = [value for name, labels, value in samples if name == 'ytsd_phase_events_total']
+    sums = [value for name, labels, value in samples if name == 'ytsd_phase_duration_seconds_sum']
+    assert totals == [2] and sums == [3.0]
+
+
+def test_disabled_telemetry_is_a_no_op(tmp_path):
+    telemetry = Telemetry()
+    assert telemetry.emit('download', 1.0) is None
+    with telemetry.phase('click'):
+        pass
+    telemetry.close()
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from pyee import EventEmitter
+
+from tracing import PhaseTracer, NetworkRequest, summarize_trace, CLICK_MARK
+
+
+def user_timing(name, ph, ts, **extra):
+    return dict(cat='blink.user_timing', name=name, ph=ph, ts=ts, pid=1, tid=1, **extra)
+
+
+def test_summarize_trace_phases_relative_to_click():
+    """User Timing 的 measure 和成对 mark 汇总为阶段，网络请求补充没有标记的阶段"""
+    events = [
+        user_timing(CLICK_MARK, 'R', 1_000_000),
+        user_timing('ytsd:player', 'b', 1_010_000, id2={'local': '0x1'}),
+        user_timing('ytsd:player', 'e', 1_250_000, id2={'local': '0x1'}),
+        user_timing('ytsd:convert:start', 'R', 1_400_000),
+        user_timing('ytsd:convert:end', 'R', 1_430_000),
+        {'cat': 'devtools.timeline', 'name': 'FunctionCall', 'ph': 'X', 'ts': 900_000, 'dur': 10},
+    ]
+    requests = [
+        NetworkRequest('1', 'https://www.youtube.com/youtubei/v1/player?key=x', 'service_worker', 1.02, 1.24),
+        NetworkRequest('2', 'https://www.youtube.com/api/timedtext?v=x&fmt=json3', 'service_worker',
+                       1.26, 1.38, status=200, encoded_bytes=2048),
+        NetworkRequest('3', 'https://fonts.example/a.woff', 'options_page', 1.0, 1.1),
+    ]
+    summary = summarize_trace(events, requests, {'download_complete': 0.5})
+    phases = summary['phases']
+    assert phases['player'] == {'start_ms': 10.0, 'duration_ms': 240.0, 'source': 'user_timing'}
+    assert phases['convert']['duration_ms'] == 30.0
+    assert phases['fetch_timedtext']['start_ms'] == 260.0
+    assert phases['fetch_timedtext']['bytes'] == 2048
+    assert summary['slowest_phase'] == 'player'
+    assert list(phases) == ['player', 'fetch_player', 'fetch_timedtext', 'convert']
+    assert summary['harness'] == {'download_complete': 0.5}
+    assert len(summary['requests']) == 3
+
+
+class FakeConnection(EventEmitter):
+    async def send(self, method, params=None):
+        if method == 'Tracing.end':
+            self.emit('Tracing.dataCollected', {'value': [user_timing(CLICK_MARK, 'R', 5_000_000)]})
+            self.emit('Tracing.tracingComplete', {})
+        return {}
+
+
+class FakeBrowser:
+    def __init__(self):
+        self._connection = FakeConnection()
+
+    def targets(self):
+        return []
+
+
+class FakePage:
+    def __init__(self):
+        self._client = EventEmitter()
+        self.scripts = []
+
+    async def evaluate(self, script):
+        self.scripts.append(script)
+
+
+def test_phase_tracer_writes_trace_and_summary(tmp_path):
+    """记录选项页的网络请求，结束时写出 trace JSON 和汇总"""
+    async def run():
+        browser, page = FakeBrowser(), FakePage()
+        tracer = await PhaseTracer(browser, page, 'abc/auto', str(tmp_path)).start()
+        page._client.emit('Network.requestWillBeSent', {
+            'requestId': 'r1', 'timestamp': 5.0,
+            'request': {'url': 'https://www.youtube.com/api/timedtext?v=abc'}})
+        page._client.emit('Network.loadingFinished', {'requestId': 'r1', 'timestamp': 5.2,
+                                                      'encodedDataLength': 100})
+        await tracer.mark_click()
+        result = await tracer.stop({'download_complete': 0.3})
+        return page, result
+
+    page, result = asyncio.run(run())
+    assert CLICK_MARK in page.scripts[0]
+    with open(result.trace_path) as f:
+        trace = json.load(f)
+    assert trace['traceEvents'][0]['name'] == CLICK_MARK
+    assert result.summary['phases']['fetch_timedtext']['duration_ms'] == 200.0
+    with open(result.summary_path) as f:
+        assert json.load(f)['slowest_phase'] == 'fetch_timedtext'
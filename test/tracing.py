@@ -0,0 +1,318 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import logging
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Any, Dict, List, Iterable
+
+from browser_pool import extension_worker_target
+
+logger = logging.getLogger(__name__)
+
+# trace 和每次下载的阶段汇总输出目录
+TRACES_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), 'traces'))
+
+# 记录的 trace 类别：时间线、User Timing、V8 执行、网络加载
+TRACE_CATEGORIES = (
+    'devtools.timeline',
+    'disabled-by-default-devtools.timeline',
+    'blink.user_timing',
+    'v8.execute',
+    'loading',
+    'toplevel',
+)
+
+# 扩展发出的 User Timing 名称前缀：
+#   performance.measure('ytsd:<阶段>', ...) 或成对的 performance.mark('ytsd:<阶段>:start' / ':end')
+MARK_PREFIX = 'ytsd:'
+
+# 点击下载按钮时由测试在选项页写入的标记，作为各阶段偏移的零点
+CLICK_MARK = 'ytsd:harness:click'
+
+# 根据请求URL推断的网络阶段
+NETWORK_PHASES = (
+    ('player', re.compile(r'/youtubei/v1/player')),
+    ('timedtext', re.compile(r'/api/timedtext')),
+    ('watch_page', re.compile(r'/watch\b')),
+)
+
+# 等待 Tracing.tracingComplete 的超时时间（秒）
+TRACE_FLUSH_TIMEOUT = 10.0
+
+_trace_counter = itertools.count()
+
+
+def network_phase(url: str) -> Optional[str]:
+    """根据URL判断请求属于哪个阶段"""
+    for phase, pattern in NETWORK_PHASES:
+        if pattern.search(url):
+            return phase
+    return None
+
+
+@dataclass
+class NetworkRequest:
+    """一个网络请求的时间（CDP 单调时钟，秒）"""
+    request_id: str
+    url: str
+    source: str
+    started: float
+    finished: Optional[float] = None
+    status: Optional[int] = None
+    encoded_bytes: int = 0
+    failed: Optional[str] = None
+    timing: Optional[Dict[str, float]] = None
+
+    @property
+    def phase(self) -> Optional[str]:
+        return network_phase(self.url)
+
+
+@dataclass
+class TraceResult:
+    """一次下载的 trace 文件、汇总文件和汇总内容"""
+    trace_path: str
+    summary_path: str
+    summary: Dict = field(default_factory=dict)
+
+
+def _user_timing_name(event: Dict) -> Optional[str]:
+    name = event.get('name', '')
+    if 'blink.user_timing' in event.get('cat', '') and name.startswith(MARK_PREFIX):
+        return name
+    return None
+
+
+def summarize_trace(events: Iterable[Dict],
+                    requests: Iterable[NetworkRequest] = (),
+                    harness_timings: Optional[Dict[str, float]] = None) -> Dict:
+    """把 trace 事件和网络请求汇总为各阶段的开始偏移和耗时（毫秒，相对点击时刻）"""
+    events = list(events)
+    requests = list(requests)
+    timestamps = [event['ts'] for event in events if 'ts' in event]
+    origin = next((event['ts'] for event in events if _user_timing_name(event) == CLICK_MARK), None)
+    if origin is None:
+        origin = min(timestamps) if timestamps else 0
+
+    def offset_ms(ts_us: float) -> float:
+        return round((ts_us - origin) / 1000, 3)
+
+    phases: Dict[str, Dict] = {}
+    marks: List[Dict] = []
+    open_measures: Dict[Any, Dict] = {}
+    mark_starts: Dict[str, float] = {}
+    for event in sorted((e for e in events if _user_timing_name(e)), key=lambda e: e['ts']):
+        name = event['name']
+        phase = event.get('ph')
+        if phase == 'b':
+            open_measures[(name, event.get('id'), str(event.get('id2')))] = event
+        elif phase == 'e':
+            begin = open_measures.pop((name, event.get('id'), str(event.get('id2'))), None)
+            if begin is not None:
+                phases[name[len(MARK_PREFIX):]] = {
+                    'start_ms': offset_ms(begin['ts']),
+                    'duration_ms': round((event['ts'] - begin['ts']) / 1000, 3),
+                    'source': 'user_timing',
+                }
+        elif phase == 'X':
+            phases[name[len(MARK_PREFIX):]] = {
+                'start_ms': offset_ms(event['ts']),
+                'duration_ms': round(event.get('dur', 0) / 1000, 3),
+                'source': 'user_timing',
+            }
+        else:
+            marks.append({'name': name, 'offset_ms': offset_ms(event['ts'])})
+            if name.endswith(':start'):
+                mark_starts[name[len(MARK_PREFIX):-len(':start')]] = event['ts']
+            elif name.endswith(':end'):
+                stage = name[len(MARK_PREFIX):-len(':end')]
+                if stage in mark_starts and stage not in phases:
+                    start = mark_starts.pop(stage)
+                    phases[stage] = {
+                        'start_ms': offset_ms(start),
+                        'duration_ms': round((event['ts'] - start) / 1000, 3),
+                        'source': 'user_timing',
+                    }
+
+    network: Dict[str, Dict] = {}
+    for request in requests:
+        phase = request.phase
+        if phase is None or request.finished is None:
+            continue
+        start_us, end_us = request.started * 1e6, request.finished * 1e6
+        entry = network.setdefault(phase, {'start': start_us, 'end': end_us, 'requests': 0,
+                                           'bytes': 0, 'failed': 0})
+        entry['start'] = min(entry['start'], start_us)
+        entry['end'] = max(entry['end'], end_us)
+        entry['requests'] += 1
+        entry['bytes'] += request.encoded_bytes
+        entry['failed'] += request.failed is not None
+    for phase, entry in network.items():
+        # 扩展自己的 User Timing 优先，网络时间只补充没有标记的阶段
+        phases.setdefault(f'fetch_{phase}', {
+            'start_ms': offset_ms(entry['start']),
+            'duration_ms': round((entry['end'] - entry['start']) / 1000, 3),
+            'source': 'network',
+            'requests': entry['requests'],
+            'bytes': entry['bytes'],
+            'failed': entry['failed'],
+        })
+
+    slowest = max(phases.items(), key=lambda item: item[1]['duration_ms'], default=(None, None))[0]
+    return {
+        'phases': dict(sorted(phases.items(), key=lambda item: item[1]['start_ms'])),
+        'slowest_phase': slowest,
+        'marks': marks,
+        'harness': dict(harness_timings or {}),
+        'requests': [
+            {
+                'url': request.url,
+                'source': request.source,
+                'phase': request.phase,
+                'status': request.status,
+                'bytes': request.encoded_bytes,
+                'failed': request.failed,
+                'start_ms': offset_ms(request.started * 1e6),
+                'duration_ms': (round((request.finished - request.started) * 1000, 3)
+                                if request.finished is not None else None),
+                'timing': request.timing,
+            }
+            for request in requests
+        ],
+    }
+
+
+class PhaseTracer:
+    """附加到扩展 service worker 和选项页，记录一次下载的 CDP trace、网络时间和 User Timing
+
+    Tracing 在浏览器级别开启，可以同时覆盖 service worker 和选项页所在的进程；
+    同一个浏览器同时只能有一个 trace，已有 trace 在运行时只记录网络时间。
+    """
+
+    def __init__(self, browser: Any, page: Any, label: str = 'download',
+                 output_dir: str = TRACES_ROOT,
+                 categories: Iterable[str] = TRACE_CATEGORIES):
+        self.browser = browser
+        self.page = page
+        self.label = re.sub(r'[^\w.-]+', '_', label)
+        self.output_dir = output_dir
+        self.categories = list(categories)
+        self.requests: Dict[str, NetworkRequest] = {}
+        self.events: List[Dict] = []
+        self._tracing = False
+        self._complete: Optional[asyncio.Future] = None
+        self._worker_session = None
+        self._listeners: List[tuple] = []
+
+    def _listen(self, emitter: Any, event: str, handler):
+        emitter.on(event, handler)
+        self._listeners.append((emitter, event, handler))
+
+    def _watch_network(self, emitter: Any, source: str):
+        def key(event):
+            return f"{source}:{event['requestId']}"
+
+        def on_request(event):
+            self.requests[key(event)] = NetworkRequest(
+                request_id=event['requestId'], url=event['request']['url'],
+                source=source, started=event['timestamp'])
+
+        def on_response(event):
+            request = self.requests.get(key(event))
+            if request is not None:
+                request.status = event['response'].get('status')
+                request.timing = event['response'].get('timing')
+
+        def on_finished(event):
+            request = self.requests.get(key(event))
+            if request is not None:
+                request.finished = event['timestamp']
+                request.encoded_bytes = int(event.get('encodedDataLength', 0))
+
+        def on_failed(event):
+            request = self.requests.get(key(event))
+            if request is not None:
+                request.finished = event['timestamp']
+                request.failed = event.get('errorText', 'failed')
+
+        self._listen(emitter, 'Network.requestWillBeSent', on_request)
+        self._listen(emitter, 'Network.responseReceived', on_response)
+        self._listen(emitter, 'Network.loadingFinished', on_finished)
+        self._listen(emitter, 'Network.loadingFailed', on_failed)
+
+    async def start(self) -> 'PhaseTracer':
+        """开启浏览器级 trace，并在 service worker 和选项页上记录网络请求"""
+        connection = self.browser._connection
+        loop = asyncio.get_event_loop()
+        self._complete = loop.create_future()
+        self._listen(connection, 'Tracing.dataCollected', lambda event: self.events.extend(event['value']))
+        self._listen(connection, 'Tracing.tracingComplete',
+                     lambda event: self._complete.done() or self._complete.set_result(event))
+        try:
+            await connection.send('Tracing.start', {
+                'categories': ','.join(self.categories),
+                'transferMode': 'ReportEvents',
+            })
+            self._tracing = True
+        except Exception as e:
+            logger.warning(f"⚠️ 无法开启 trace（可能已有 trace 在运行）: {e}")
+
+        target = extension_worker_target(self.browser)
+        if target is not None:
+            try:
+                self._worker_session = await target.createCDPSession()
+                self._watch_network(self._worker_session, 'service_worker')
+                await self._worker_session.send('Network.enable')
+            except Exception as e:
+                logger.warning(f"⚠️ 无法附加到扩展 service worker: {e}")
+                self._worker_session = None
+        else:
+            logger.warning("⚠️ 没有找到扩展的 service worker target")
+        # 页面的 Network 域已由 pyppeteer 开启，只需监听事件
+        self._watch_network(self.page._client, 'options_page')
+        return self
+
+    async def mark_click(self):
+        """在选项页写入点击标记，作为各阶段偏移的零点"""
+        await self.page.evaluate(f"() => performance.mark('{CLICK_MARK}')")
+
+    async def stop(self, harness_timings: Optional[Dict[str, float]] = None) -> TraceResult:
+        """结束 trace，写出 Chrome trace JSON 和阶段汇总"""
+        try:
+            if self._tracing:
+                await self.browser._connection.send('Tracing.end')
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._complete), TRACE_FLUSH_TIMEOUT)
+                except asyncio.TimeoutError:
+                    logger.warning(f"⚠️ 等待 trace 数据超时 ({TRACE_FLUSH_TIMEOUT}s)")
+            if self._worker_session is not None:
+                try:
+                    await self._worker_session.detach()
+                except Exception as e:
+                    logger.warning(f"⚠️ 断开 service worker 会话时出错: {e}")
+        finally:
+            for emitter, event, handler in self._listeners:
+                emitter.remove_listener(event, handler)
+            self._listeners = []
+            self._tracing = False
+
+        requests = list(self.requests.values())
+        summary = summarize_trace(self.events, requests, harness_timings)
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.join(self.output_dir,
+                            f"{self.label}_{time.strftime('%Y%m%d_%H%M%S')}_{next(_trace_counter)}")
+        trace_path, summary_path = f'{stem}.trace.json', f'{stem}.summary.json'
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'traceEvents': self.events,
+                'metadata': {'label': self.label, 'network': [asdict(r) for r in requests]},
+            }, f)
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        phases = ', '.join(f"{name} {stats['duration_ms']:.0f}ms" for name, stats in summary['phases'].items())
+        logger.info(f"trace 已写入: {trace_path} ({phases or '没有阶段数据'})")
+        return TraceResult(trace_path=trace_path, summary_path=summary_path, summary=summary)